@@ -1,8 +1,16 @@
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
+from telegram.ext import (Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler,
+                          PicklePersistence, PersistenceInput)
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup 
 import asyncio
 import logging
-import requests 
+import time
+import html
+import json
+import os
+import secrets
+from urllib.parse import urlsplit
+from collections import OrderedDict
+import httpx
 
 # Configura o sistema de log para ver as mensagens do bot
 logging.basicConfig(
@@ -12,69 +20,322 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --- TOKEN DO SEU BOT DO TELEGRAM ---
-TELEGRAM_BOT_TOKEN = "TELEGRAM BOT" 
+# TELEGRAM_API_URL pode apontar para uma API falsa local (benchmarks/fake_bot_api.py)
+TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "TELEGRAM BOT")
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+
+# --- MODO DE RECEBIMENTO DAS ATUALIZAÇÕES ---
+# Sem TELEGRAM_WEBHOOK_URL o bot faz polling (getUpdates). Com ela (a URL
+# pública HTTPS, normalmente um proxy reverso com TLS na frente deste
+# processo), o bot registra o webhook no Telegram e recebe cada atualização
+# assim que ela acontece, por um listener HTTP local (uvicorn) no caminho da
+# URL. O Telegram manda o segredo no cabeçalho
+# X-Telegram-Bot-Api-Secret-Token; requisições sem ele são recusadas.
+WEBHOOK_URL = os.environ.get("TELEGRAM_WEBHOOK_URL", "")
+WEBHOOK_HOST = os.environ.get("TELEGRAM_WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORTA = int(os.environ.get("TELEGRAM_WEBHOOK_PORTA", "8443"))
+WEBHOOK_SEGREDO = os.environ.get("TELEGRAM_WEBHOOK_SEGREDO") or secrets.token_urlsafe(32)
+TAMANHO_MAX_ATUALIZACAO = 1024 * 1024
+# Só os tipos que os handlers tratam; o Telegram nem envia os demais
+ATUALIZACOES_PERMITIDAS = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# --- VÍNCULO CHAT -> VASO ---
+# O vaso escolhido com /vaso fica no chat_data, salvo neste arquivo: sem ele,
+# depois de reiniciar o bot todo chat voltaria para o vaso padrão e passaria a
+# definir a planta de outro vaso. Só o chat_data é persistido.
+ARQUIVO_PERSISTENCIA = os.environ.get("TELEGRAM_PERSISTENCIA", "telegram_bot_chats.pickle")
 
 # --- ENDEREÇO DO SEU SERVIDOR FLASK ---
 FLASK_SERVER_URL = "http://127.0.0.1:5000" 
 
-# --- DESCRIÇÕES E EMOJIS DAS PLANTAS ---
-# ATUALIZADO COM AS PLANTAS E DESCRIÇÕES DA SUA TABELA
-PLANT_DESCRIPTIONS = {
-    "Cacto": "Essas plantas fascinantes, que muitas vezes associamos a paisagens áridas e espinhosas, são verdadeiras campeãs da sobrevivência. Encantando o publico com cores e tamanhos diversos e sua incrível capacidade de sobrevivência.",
-    "Samambaia": "Com suas folhas delicadas e exuberantes, a samambaia é perfeita para ambientes com sombra ou luz indireta, trazendo frescor e um toque tropical.",
-    "Hortelã": "A hortelã é uma erva aromática vibrante, ideal para chás e culinária. Cresce bem em solo úmido e gosta de luz moderada, sendo fácil de cuidar.",
-    "Orquídea": "As orquídeas são símbolos de beleza e elegância. A maioria prefere luz indireta e alta umidade, florescendo com cuidado e atenção.",
-    "Nenhuma": "Nenhuma planta específica selecionada. Condições genéricas aplicadas."
-}
-
-# EMOJIS ATUALIZADOS PARA AS NOVAS PLANTAS
-PLANT_EMOJIS = {
-    "Cacto": "🌵",
-    "Samambaia": "🌿",
-    "Hortelã": "🍃",
-    "Orquídea": "🌸" 
-}
-
-# --- DEFINIÇÃO DOS TECLADOS INLINE ---
-
-# Teclado do Menu Principal
-def get_main_menu_keyboard():
-    keyboard = [
-        [InlineKeyboardButton("🪴 Gerenciar Vaso", callback_data="gerenciar_vaso")],
-        [InlineKeyboardButton("❓ Sobre o Bot", callback_data="sobre_o_bot")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-# Teclado do Menu de Gerenciamento do Vaso
-def get_manage_pot_keyboard():
-    keyboard = [
-        [InlineKeyboardButton("🌱 Selecionar Planta no Vaso", callback_data="selecionar_planta")],
-        [InlineKeyboardButton("📊 Status da Planta", callback_data="status_planta")],
-        [InlineKeyboardButton("💡 Dicas de Cultivo", callback_data="dicas_cultivo")],
-        [InlineKeyboardButton("↩️ Voltar ao Início", callback_data="selecionar_menu_principal")] 
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-# Teclado para seleção de plantas
-def get_plant_selection_keyboard():
+# --- CLIENTE HTTP ASSÍNCRONO PARA O SERVIDOR FLASK ---
+# Um único cliente compartilhado por todos os handlers: conexões keep-alive
+# reaproveitadas, limite de conexões simultâneas e timeouts, sem travar o
+# event loop do bot enquanto o servidor responde.
+TIMEOUT_SERVIDOR = httpx.Timeout(5.0, connect=2.0, pool=3.0)
+LIMITES_CONEXOES_SERVIDOR = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=30.0)
+# Quantas atualizações do Telegram o bot trata ao mesmo tempo
+MAX_ATUALIZACOES_SIMULTANEAS = 256
+
+cliente_servidor = None
+
+async def iniciar_cliente_servidor(application):
+    global cliente_servidor
+    cliente_servidor = httpx.AsyncClient(
+        base_url=FLASK_SERVER_URL,
+        timeout=TIMEOUT_SERVIDOR,
+        limits=LIMITES_CONEXOES_SERVIDOR,
+    )
+    # Já deixa o catálogo e os teclados dele prontos para o primeiro usuário
+    try:
+        status_code, _ = await buscar_catalogo_plantas()
+        if status_code != 200:
+            logger.warning(f"Catálogo de plantas indisponível na partida ({status_code}); será buscado no primeiro uso.")
+    except httpx.TransportError:
+        logger.warning("Servidor Flask fora do ar na partida; o catálogo será buscado no primeiro uso.")
+
+async def fechar_cliente_servidor(application):
+    if cliente_servidor is not None:
+        await cliente_servidor.aclose()
+
+# --- CACHE DE STATUS E DO CATÁLOGO DE PLANTAS ---
+# Toques repetidos em "📊 Status da Planta" dentro de TTL_STATUS são respondidos
+# localmente; depois disso o bot revalida com If-None-Match e o servidor só
+# responde 304 se o vaso não mudou. O catálogo de plantas (nomes, emojis,
+# descrições e faixas) é baixado uma vez e só de novo quando a versão anunciada
+# no status muda ou o TTL expira.
+TTL_STATUS = 5.0
+TTL_CATALOGO = 3600.0
+MAX_VASOS_EM_CACHE = 10000
+
+cache_status = OrderedDict()  # vaso_id -> (etag, dados, obtido_em)
+cache_catalogo = {"etag": None, "dados": None, "obtido_em": 0.0}
+
+async def buscar_status_vaso(vaso_id):
+    agora = time.monotonic()
+    em_cache = cache_status.get(vaso_id)
+    if em_cache is not None and agora - em_cache[2] < TTL_STATUS:
+        return 200, em_cache[1]
+
+    headers = {"If-None-Match": em_cache[0]} if em_cache is not None and em_cache[0] else {}
+    response = await cliente_servidor.get("/get_full_status", params={"vaso_id": vaso_id}, headers=headers)
+    if response.status_code == 304 and em_cache is not None:
+        cache_status[vaso_id] = (em_cache[0], em_cache[1], agora)
+        cache_status.move_to_end(vaso_id)
+        return 200, em_cache[1]
+
+    status_data = response.json()
+    if response.status_code != 200:
+        cache_status.pop(vaso_id, None)
+        return response.status_code, status_data
+
+    cache_status[vaso_id] = (response.headers.get("ETag"), status_data, agora)
+    cache_status.move_to_end(vaso_id)
+    while len(cache_status) > MAX_VASOS_EM_CACHE:
+        cache_status.popitem(last=False)
+
+    # O servidor anuncia a versão do catálogo em cada status: se mudou, a cópia local expira
+    catalogo = cache_catalogo["dados"]
+    if catalogo is not None and catalogo.get("versao") != status_data.get("versao_catalogo"):
+        cache_catalogo["obtido_em"] = 0.0
+    return 200, status_data
+
+async def buscar_catalogo_plantas():
+    agora = time.monotonic()
+    if cache_catalogo["dados"] is not None and agora - cache_catalogo["obtido_em"] < TTL_CATALOGO:
+        return 200, cache_catalogo["dados"]
+
+    headers = {"If-None-Match": cache_catalogo["etag"]} if cache_catalogo["etag"] else {}
+    response = await cliente_servidor.get("/plantas", headers=headers)
+    if response.status_code == 304 and cache_catalogo["dados"] is not None:
+        cache_catalogo["obtido_em"] = agora
+        return 200, cache_catalogo["dados"]
+
+    catalogo = response.json()
+    if response.status_code == 200:
+        cache_catalogo.update(etag=response.headers.get("ETag"), dados=catalogo, obtido_em=agora)
+        preparar_catalogo(catalogo)
+    return response.status_code, catalogo
+
+# --- VASO PADRÃO ---
+# Cada chat pode vincular o seu vaso com /vaso [ID]; sem vínculo usa-se este ID.
+VASO_ID_PADRAO = "padrao"
+
+# --- PLANTAS DO CATÁLOGO ---
+# Nomes, emojis e descrições vêm do servidor (/plantas), que lê o arquivo
+# plantas.json: adicionar uma espécie não exige mexer no bot. Com centenas de
+# plantas, a seleção e as dicas são paginadas.
+PLANTA_PADRAO = "Nenhuma"
+EMOJI_PADRAO = "🌱"
+PLANTAS_POR_PAGINA = 10
+DICAS_POR_PAGINA = 8
+
+# Teclados de seleção, páginas de dicas e descrições da versão atual do
+# catálogo, montados de uma vez quando ela chega (preparar_catalogo)
+conteudo_catalogo = {"versao": None, "selecao": (), "dicas": (), "descricoes": {}}
+
+def plantas_selecionaveis(catalogo):
+    return [nome for nome in catalogo.get("plantas", {}) if nome != PLANTA_PADRAO]
+
+def formatar_numero(valor):
+    return f"{valor:g}" if isinstance(valor, (int, float)) else str(valor)
+
+def descricao_da_planta(catalogo, nome_planta):
+    dados = catalogo.get("plantas", {}).get(nome_planta, {})
+    return dados.get("descricao") or "Descrição não encontrada."
+
+def total_de_paginas(quantidade, por_pagina):
+    return max(1, -(-quantidade // por_pagina))
+
+def botao_paginas(prefixo, pagina, total_paginas):
+    navegacao = []
+    if pagina > 0:
+        navegacao.append(InlineKeyboardButton("⬅️ Anteriores", callback_data=f"{prefixo}{pagina - 1}"))
+    if pagina < total_paginas - 1:
+        navegacao.append(InlineKeyboardButton("Próximas ➡️", callback_data=f"{prefixo}{pagina + 1}"))
+    return navegacao
+
+def pagina_do_callback(dados, prefixo):
+    try:
+        return max(0, int(dados[len(prefixo):]))
+    except ValueError:
+        return 0
+
+# --- ANÁLISE DO VASO (MÉDIAS, TENDÊNCIA E PREVISÃO DE REGA) ---
+# O status traz "analise": média e variação recentes, a velocidade com que a
+# umidade cai e o momento previsto (epoch) em que ela chega ao mínimo da planta.
+
+def formatar_duracao(segundos):
+    if segundos < 3600:
+        return f"~{max(1, round(segundos / 60))} min"
+    if segundos < 2 * 86400:
+        return f"~{round(segundos / 3600)} h"
+    return f"~{round(segundos / 86400)} dias"
+
+def montar_analise(analise):
+    if not analise:
+        return ""
+    linhas = []
+    if analise.get("umidade_media") is not None:
+        linhas.append(
+            f"📈 Umidade média recente: {formatar_numero(analise['umidade_media'])}% "
+            f"(última hora: {formatar_numero(analise.get('umidade_min_1h'))}% a {formatar_numero(analise.get('umidade_max_1h'))}%)"
+        )
+    tendencia = analise.get("umidade_tendencia_por_hora")
+    if tendencia is not None:
+        linhas.append(f"📉 Tendência da umidade: {tendencia:+.1f}% por hora")
+    previsao = analise.get("previsao_umidade_min")
+    if previsao is not None:
+        restante = previsao - time.time()
+        if restante <= 0:
+            linhas.append("🚿 A umidade já chegou ao mínimo desta planta.")
+        else:
+            linhas.append(f"⏳ Deve precisar de água em {formatar_duracao(restante)}.")
+    elif tendencia is not None:
+        linhas.append("⏳ Sem previsão de rega: umidade estável ou subindo.")
+    return "\n".join(linhas) + "\n" if linhas else ""
+
+# --- TECLADOS E TEXTOS FIXOS ---
+# Montados uma vez, ao carregar o módulo: os objetos do PTB são imutáveis e a
+# mesma instância serve para todas as respostas.
+
+TECLADO_MENU_PRINCIPAL = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🪴 Gerenciar Vaso", callback_data="gerenciar_vaso")],
+    [InlineKeyboardButton("❓ Sobre o Bot", callback_data="sobre_o_bot")]
+])
+
+TECLADO_GERENCIAR_VASO = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🌱 Selecionar Planta no Vaso", callback_data="selecionar_planta")],
+    [InlineKeyboardButton("📊 Status da Planta", callback_data="status_planta")],
+    [InlineKeyboardButton("💡 Dicas de Cultivo", callback_data="dicas_cultivo")],
+    [InlineKeyboardButton("↩️ Voltar ao Início", callback_data="selecionar_menu_principal")]
+])
+
+BOTAO_VOLTAR_GERENCIAMENTO = InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")
+TECLADO_VOLTAR_GERENCIAMENTO = InlineKeyboardMarkup([[BOTAO_VOLTAR_GERENCIAMENTO]])
+TECLADO_VOLTAR_INICIO = InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Início", callback_data="selecionar_menu_principal")]])
+
+MENSAGEM_BOAS_VINDAS = (
+    "BOAS VINDAS!\n"
+    "Agora você é dono de um vaso inteligente, pronto para começar?"
+)
+MENSAGEM_SOBRE = (
+    "Este é o seu Vaso Inteligente Bot! Desenvolvido para te ajudar a cuidar das suas plantas.\n"
+    "Ele monitora umidade e luminosidade e te avisa quando sua planta precisa de algo.\n\n"
+    "↩️ Voltar ao Início"
+)
+
+# --- TECLADOS E TEXTOS DO CATÁLOGO ---
+
+# Teclado para seleção de plantas (uma página do catálogo)
+def _montar_teclado_selecao(catalogo, plantas, pagina, total_paginas):
     keyboard_plants = []
-    for plant_name in PLANT_DESCRIPTIONS.keys():
-        if plant_name != "Nenhuma":
-            emoji = PLANT_EMOJIS.get(plant_name, "🌱")
-            keyboard_plants.append(
-                [InlineKeyboardButton(f"{emoji} {plant_name}", callback_data=f"PLANT_{plant_name}")]
-            )
-    keyboard_plants.append([InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]) 
+    for plant_name in plantas[pagina * PLANTAS_POR_PAGINA:(pagina + 1) * PLANTAS_POR_PAGINA]:
+        emoji = catalogo["plantas"][plant_name].get("emoji", EMOJI_PADRAO)
+        keyboard_plants.append(
+            [InlineKeyboardButton(f"{emoji} {plant_name}", callback_data=f"PLANT_{plant_name}")]
+        )
+    navegacao = botao_paginas("plantas_pag_", pagina, total_paginas)
+    if navegacao:
+        keyboard_plants.append(navegacao)
+    keyboard_plants.append([BOTAO_VOLTAR_GERENCIAMENTO])
     return InlineKeyboardMarkup(keyboard_plants)
 
+# Texto e teclado de uma página das dicas de cultivo
+def _montar_dicas(catalogo, plantas, pagina, total_paginas):
+    tips_list_messages = []
+    titulo = "💡 DICAS DE CULTIVO IDEAL POR PLANTA"
+    if total_paginas > 1:
+        titulo += f" ({pagina + 1}/{total_paginas})"
+    tips_list_messages.append(titulo + "\n")
+
+    for plant_name in plantas[pagina * DICAS_POR_PAGINA:(pagina + 1) * DICAS_POR_PAGINA]:
+        params = catalogo["plantas"][plant_name]
+        emoji = params.get("emoji", EMOJI_PADRAO)
+        umidade_min = formatar_numero(params.get("umidade_min", "N/A"))
+        umidade_max = formatar_numero(params.get("umidade_max", "N/A"))
+        luminosidade_min = formatar_numero(params.get("luminosidade_min", "N/A"))
+        luminosidade_max = formatar_numero(params.get("luminosidade_max", "N/A"))
+
+        tips_list_messages.append(
+            f"{emoji} <b>{html.escape(plant_name)}</b>\n" 
+            f"  💧 Umidade: {umidade_min}% a {umidade_max}%\n"
+            f"  ☀️ Luminosidade: {luminosidade_min} a {luminosidade_max}\n"
+        )
+
+    tips_message = "\n".join(tips_list_messages) + "\n↩️ Voltar ao Gerenciamento"
+    keyboard = []
+    navegacao = botao_paginas("dicas_pag_", pagina, total_paginas)
+    if navegacao:
+        keyboard.append(navegacao)
+    keyboard.append([BOTAO_VOLTAR_GERENCIAMENTO])
+    return tips_message, InlineKeyboardMarkup(keyboard)
+
+def _montar_descricao(catalogo, nome_planta):
+    return (
+        f"✨🌿✨ DESCRIÇÃO {nome_planta.upper()} ✨🌿✨\n\n"
+        f"{descricao_da_planta(catalogo, nome_planta)}\n\n"
+        f"💚💧☀️" 
+    )
+
+def preparar_catalogo(catalogo):
+    # Chamada a cada catálogo baixado; só monta algo quando a versão muda
+    if catalogo.get("versao") == conteudo_catalogo["versao"] and conteudo_catalogo["selecao"]:
+        return
+    plantas = plantas_selecionaveis(catalogo)
+    paginas_selecao = total_de_paginas(len(plantas), PLANTAS_POR_PAGINA)
+    paginas_dicas = total_de_paginas(len(plantas), DICAS_POR_PAGINA)
+    conteudo_catalogo.update(
+        versao=catalogo.get("versao"),
+        selecao=tuple(_montar_teclado_selecao(catalogo, plantas, pagina, paginas_selecao) for pagina in range(paginas_selecao)),
+        dicas=tuple(_montar_dicas(catalogo, plantas, pagina, paginas_dicas) for pagina in range(paginas_dicas)),
+        descricoes={nome: _montar_descricao(catalogo, nome) for nome in plantas},
+    )
+    logger.info(f"Catálogo {catalogo.get('versao')}: {len(plantas)} plantas, teclados e dicas montados.")
+
+def get_plant_selection_keyboard(catalogo, pagina=0):
+    preparar_catalogo(catalogo)
+    selecao = conteudo_catalogo["selecao"]
+    return selecao[min(pagina, len(selecao) - 1)]
+
+def montar_dicas(catalogo, pagina=0):
+    preparar_catalogo(catalogo)
+    dicas = conteudo_catalogo["dicas"]
+    return dicas[min(pagina, len(dicas) - 1)]
+
+def mensagem_descricao(catalogo, nome_planta):
+    preparar_catalogo(catalogo)
+    descricao = conteudo_catalogo["descricoes"].get(nome_planta)
+    return descricao if descricao is not None else _montar_descricao(catalogo, nome_planta)
+
+
+def get_vaso_id(context):
+    return context.chat_data.get("vaso_id", VASO_ID_PADRAO)
+
 
 # Função para o comando /start
 async def start(update: Update, context):
-    welcome_message = (
-        "BOAS VINDAS!\n"
-        "Agora você é dono de um vaso inteligente, pronto para começar?"
-    )
-    await update.message.reply_text(welcome_message, reply_markup=get_main_menu_keyboard())
+    await update.message.reply_text(MENSAGEM_BOAS_VINDAS, reply_markup=TECLADO_MENU_PRINCIPAL)
 
 # Função para lidar com callbacks dos botões
 async def button_callback(update: Update, context):
@@ -84,118 +345,107 @@ async def button_callback(update: Update, context):
     if query.data == "selecionar_menu_principal":
         await query.edit_message_text(
             "Bem-vindo(a) de volta ao menu principal!", 
-            reply_markup=get_main_menu_keyboard()
+            reply_markup=TECLADO_MENU_PRINCIPAL
         )
     elif query.data == "gerenciar_vaso":
         await query.edit_message_text(
             "O que você gostaria de fazer com seu vaso?", 
-            reply_markup=get_manage_pot_keyboard()
+            reply_markup=TECLADO_GERENCIAR_VASO
         )
     elif query.data == "sobre_o_bot":
-        await query.edit_message_text(
-            "Este é o seu Vaso Inteligente Bot! Desenvolvido para te ajudar a cuidar das suas plantas.\n"
-            "Ele monitora umidade e luminosidade e te avisa quando sua planta precisa de algo.\n\n"
-            "↩️ Voltar ao Início",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Início", callback_data="selecionar_menu_principal")]])
-        )
+        await query.edit_message_text(MENSAGEM_SOBRE, reply_markup=TECLADO_VOLTAR_INICIO)
 
-    elif query.data == "selecionar_planta":
-        await query.edit_message_text(
-            "Certo! Qual planta está no vaso agora? Escolha uma das opções abaixo:", 
-            reply_markup=get_plant_selection_keyboard()
-        )
+    elif query.data == "selecionar_planta" or query.data.startswith("plantas_pag_"):
+        pagina = pagina_do_callback(query.data, "plantas_pag_") if query.data != "selecionar_planta" else 0
+        try:
+            status_code, catalogo = await buscar_catalogo_plantas()
+            if status_code == 200:
+                await query.edit_message_text(
+                    "Certo! Qual planta está no vaso agora? Escolha uma das opções abaixo:", 
+                    reply_markup=get_plant_selection_keyboard(catalogo, pagina)
+                )
+            else:
+                await query.edit_message_text(
+                    f"❌ Erro ao obter a lista de plantas do servidor: {catalogo.get('message', 'Erro desconhecido.')}\n\n↩️ Voltar ao Gerenciamento",
+                    reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
+                )
+                logger.error(f"Erro do servidor Flask ao obter plantas ({status_code}): {catalogo.get('message')}")
+        except httpx.TransportError:
+            await query.edit_message_text(
+                '❌ Não foi possível conectar ao servidor para obter a lista de plantas. Verifique se ele está rodando.\n\n↩️ Voltar ao Gerenciamento',
+                reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
+            )
+            logger.error("Erro de conexão com o servidor Flask ao obter plantas.")
     elif query.data == "status_planta":
         try:
-            response = requests.get(f"{FLASK_SERVER_URL}/get_full_status")
-            status_data = response.json()
+            status_code, status_data = await buscar_status_vaso(get_vaso_id(context))
 
-            if response.status_code == 200:
+            if status_code == 200:
                 plant_name = status_data.get("planta_selecionada", "Nenhuma")
                 humidity = status_data.get("umidade_atual", 0)
                 luminosity = status_data.get("luminosidade_atual", 0)
                 instruction = status_data.get("instrucao_para_lcd", "Aguardando dados...")
 
                 status_message = (
-                    f"📊 STATUS ATUAL DO VASO\n\n"
+                    f"📊 STATUS ATUAL DO VASO ({status_data.get('vaso_id', get_vaso_id(context))})\n\n"
                     f"🌱 Planta: {plant_name}\n"
                     f"💧 Umidade: {humidity}%\n"
                     f"☀️ Luminosidade: {luminosity}\n"
-                    f"💬 Instrução para o LCD: {instruction}\n\n"
+                    f"💬 Instrução para o LCD: {instruction}\n"
+                    f"{montar_analise(status_data.get('analise'))}\n"
                     "↩️ Voltar ao Gerenciamento"
                 )
                 await query.edit_message_text(
                     status_message,
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                    reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
                 )
             else:
                 await query.edit_message_text(
                     f"❌ Erro ao obter status do servidor: {status_data.get('message', 'Erro desconhecido.')}\n\n↩️ Voltar ao Gerenciamento",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                    reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
                 )
-                logger.error(f"Erro do servidor Flask ao obter status ({response.status_code}): {status_data.get('message')}")
-        except requests.exceptions.ConnectionError:
+                logger.error(f"Erro do servidor Flask ao obter status ({status_code}): {status_data.get('message')}")
+        except httpx.TransportError:
             await query.edit_message_text(
                 '❌ Não foi possível conectar ao servidor para obter o status. Verifique se ele está rodando.\n\n↩️ Voltar ao Gerenciamento',
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
             )
             logger.error("Erro de conexão com o servidor Flask ao obter status.")
         except Exception as e:
             await query.edit_message_text(
                 f'❌ Ocorreu um erro inesperado ao obter o status: {e}\n\n↩️ Voltar ao Gerenciamento',
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
             )
             logger.error(f"Erro inesperado no bot ao obter status: {e}")
 
-    elif query.data == "dicas_cultivo":
+    elif query.data == "dicas_cultivo" or query.data.startswith("dicas_pag_"):
+        pagina = pagina_do_callback(query.data, "dicas_pag_") if query.data != "dicas_cultivo" else 0
         try:
-            response = requests.get(f"{FLASK_SERVER_URL}/get_full_status")
-            status_data = response.json()
-
-            if response.status_code == 200:
-                all_plant_params = status_data.get("parametros_todas_plantas", {}) 
-                
-                tips_list_messages = []
-                tips_list_messages.append("💡 DICAS DE CULTIVO IDEAL POR PLANTA\n")
-
-                for plant_name, params in all_plant_params.items():
-                    if plant_name == "Nenhuma": 
-                        continue
-                    
-                    emoji = PLANT_EMOJIS.get(plant_name, "🌱")
-                    umidade_min = params.get("umidade_min", "N/A")
-                    umidade_max = params.get("umidade_max", "N/A")
-                    luminosidade_min = params.get("luminosidade_min", "N/A")
-                    luminosidade_max = params.get("luminosidade_max", "N/A")
-
-                    tips_list_messages.append(
-                        f"{emoji} <b>{plant_name}</b>\n" 
-                        f"  💧 Umidade: {umidade_min}% a {umidade_max}%\n"
-                        f"  ☀️ Luminosidade: {luminosidade_min} a {luminosidade_max}\n"
-                    )
-                
-                tips_message = "\n".join(tips_list_messages) + "\n↩️ Voltar ao Gerenciamento"
-                
+            status_code, status_data = await buscar_catalogo_plantas()
+
+            if status_code == 200:
+                tips_message, teclado = montar_dicas(status_data, pagina)
                 await query.edit_message_text(
                     tips_message,
                     parse_mode='HTML', 
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                    reply_markup=teclado
                 )
             else:
                 await query.edit_message_text(
                     f"❌ Erro ao obter dicas do servidor: {status_data.get('message', 'Erro desconhecido.')}\n\n↩️ Voltar ao Gerenciamento",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                    reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
                 )
-                logger.error(f"Erro do servidor Flask ao obter dicas ({response.status_code}): {status_data.get('message')}")
-        except requests.exceptions.ConnectionError:
+                logger.error(f"Erro do servidor Flask ao obter dicas ({status_code}): {status_data.get('message')}")
+        except httpx.TransportError:
             await query.edit_message_text(
                 '❌ Não foi possível conectar ao servidor para obter as dicas. Verifique se ele está rodando.\n\n↩️ Voltar ao Gerenciamento',
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
             )
             logger.error("Erro de conexão com o servidor Flask ao obter dicas.")
         except Exception as e:
             await query.edit_message_text(
                 f'❌ Ocorreu um erro inesperado ao obter as dicas: {e}\n\n↩️ Voltar ao Gerenciamento',
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
             )
             logger.error(f"Erro inesperado no bot ao obter dicas: {e}")
     
@@ -206,41 +456,44 @@ async def button_callback(update: Update, context):
         logger.info(f"Seleção de planta via botão: {nome_planta} do chat ID: {user_chat_id}")
 
         try:
-            response = requests.post(
-                f"{FLASK_SERVER_URL}/set_plant",
-                json={"planta": nome_planta, "chat_id": user_chat_id} 
+            response = await cliente_servidor.post(
+                "/set_plant",
+                json={"planta": nome_planta, "chat_id": user_chat_id, "vaso_id": get_vaso_id(context)} 
             )
             response_data = response.json() 
 
             if response.status_code == 200: 
+                cache_status.pop(get_vaso_id(context), None)
                 await query.edit_message_text(
                     f'✅ Planta definida para {nome_planta}!. Alertas de necessidades disponíveis no chat.\n\n↩️ Voltar ao Gerenciamento',
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
-                )
-                description_text = PLANT_DESCRIPTIONS.get(nome_planta, "Descrição não encontrada.")
-                charmed_description = (
-                    f"✨🌿✨ DESCRIÇÃO {nome_planta.upper()} ✨🌿✨\n\n"
-                    f"{description_text}\n\n"
-                    f"💚💧☀️" 
+                    reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
                 )
-                await context.bot.send_message(chat_id=user_chat_id, text=charmed_description)
+                # A planta já foi definida: sem o catálogo, só a descrição fica faltando
+                status_code, catalogo = await buscar_catalogo_plantas()
+                if status_code == 200:
+                    await context.bot.send_message(chat_id=user_chat_id, text=mensagem_descricao(catalogo, nome_planta))
+                else:
+                    await context.bot.send_message(
+                        chat_id=user_chat_id,
+                        text=f'❌ Erro ao obter a descrição da planta: {catalogo.get("message", "Erro desconhecido.")}'
+                    )
                 logger.info(f"Servidor Flask respondeu: {response_data.get('message')}")
             else: 
                 await query.edit_message_text(
                     f'❌ Erro ao definir planta: {response_data.get("message", "Erro desconhecido.")}\n\n↩️ Voltar ao Gerenciamento',
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                    reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
                 )
                 logger.error(f"Erro do servidor Flask ({response.status_code}): {response_data.get('message')}")
-        except requests.exceptions.ConnectionError as e:
+        except httpx.TransportError as e:
             await query.edit_message_text(
                 '❌ Não foi possível conectar ao servidor. Verifique se ele está rodando.\n\n↩️ Voltar ao Gerenciamento',
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
             )
             logger.error(f"Erro de conexão com o servidor Flask: {e}")
         except Exception as e:
             await query.edit_message_text(
                 f'❌ Ocorreu um erro inesperado: {e}\n\n↩️ Voltar ao Gerenciamento',
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Voltar ao Gerenciamento", callback_data="gerenciar_vaso")]])
+                reply_markup=TECLADO_VOLTAR_GERENCIAMENTO
             )
             logger.error(f"Erro inesperado no bot: {e}")
 
@@ -259,33 +512,33 @@ async def definir_planta(update: Update, context):
     user_chat_id = update.effective_chat.id 
     logger.info(f"Comando /planta recebido: {nome_planta} do chat ID: {user_chat_id}")
 
-    if nome_planta not in PLANT_DESCRIPTIONS or nome_planta == "Nenhuma":
-        await update.message.reply_text(
-            f"Planta '{nome_planta}' não reconhecida. Plantas disponíveis: {', '.join(PLANT_DESCRIPTIONS.keys() - {'Nenhuma'})}."
-        )
-        return
-
     try:
-        response = requests.post(
-            f"{FLASK_SERVER_URL}/set_plant",
-            json={"planta": nome_planta, "chat_id": user_chat_id} 
+        status_code, catalogo = await buscar_catalogo_plantas()
+        if status_code != 200:
+            await update.message.reply_text(f'❌ Erro ao obter a lista de plantas: {catalogo.get("message", "Erro desconhecido.")}')
+            return
+        plantas = plantas_selecionaveis(catalogo)
+        if nome_planta not in plantas:
+            await update.message.reply_text(
+                f"Planta '{nome_planta}' não reconhecida. Plantas disponíveis: {', '.join(plantas)}."[:4096]
+            )
+            return
+
+        response = await cliente_servidor.post(
+            "/set_plant",
+            json={"planta": nome_planta, "chat_id": user_chat_id, "vaso_id": get_vaso_id(context)} 
         )
         response_data = response.json() 
 
         if response.status_code == 200: 
+            cache_status.pop(get_vaso_id(context), None)
             await update.message.reply_text(f'✅ Planta definida para {nome_planta}!. Alertas de necessidades disponíveis no chat.')
-            description_text = PLANT_DESCRIPTIONS.get(nome_planta, "Descrição não encontrada.")
-            charmed_description = (
-                f"✨🌿✨ DESCRIÇÃO {nome_planta.upper()} ✨🌿✨\n\n"
-                f"{description_text}\n\n"
-                f"💚💧☀️" 
-            )
-            await context.bot.send_message(chat_id=user_chat_id, text=charmed_description)
+            await context.bot.send_message(chat_id=user_chat_id, text=mensagem_descricao(catalogo, nome_planta))
             logger.info(f"Servidor Flask respondeu: {response_data.get('message')}")
         else: 
             await update.message.reply_text(f'❌ Erro ao definir planta: {response_data.get("message", "Erro desconhecido.")}')
             logger.error(f"Erro do servidor Flask ({response.status_code}): {response_data.get('message')}")
-    except requests.exceptions.ConnectionError as e:
+    except httpx.TransportError as e:
         await update.message.reply_text(
             '❌ Não foi possível conectar ao servidor. Verifique se ele está rodando.'
         )
@@ -294,22 +547,143 @@ async def definir_planta(update: Update, context):
         await update.message.reply_text(f'❌ Ocorreu um erro inesperado: {e}')
         logger.error(f"Erro inesperado no bot: {e}")
 
+# Função para o comando /vaso [ID do Vaso] - vincula este chat a um vaso da frota
+async def definir_vaso(update: Update, context):
+    if not context.args:
+        await update.message.reply_text(
+            f'Vaso atual deste chat: {get_vaso_id(context)}.\n'
+            'Para trocar, use o formato: /vaso [ID do Vaso]. Ex: /vaso sala-01'
+        )
+        return
+
+    vaso_id = " ".join(context.args).strip()
+    if len(vaso_id) > 64:
+        await update.message.reply_text('❌ ID de vaso muito longo (máximo de 64 caracteres).')
+        return
+
+    context.chat_data["vaso_id"] = vaso_id
+    # Grava na hora, sem esperar o salvamento periódico nem o encerramento
+    await context.application.update_persistence()
+    logger.info(f"Chat ID {update.effective_chat.id} vinculado ao vaso {vaso_id}")
+    await update.message.reply_text(
+        f'✅ Este chat agora acompanha o vaso {vaso_id}. Use /planta ou o menu para definir a planta.'
+    )
+
 # Função para lidar com mensagens de texto que não são comandos
 async def eco(update: Update, context):
     await update.message.reply_text(
-        f'Eu só entendo comandos como /start ou /planta. Você disse: "{update.message.text}"'
+        f'Eu só entendo comandos como /start, /planta ou /vaso. Você disse: "{update.message.text}"'
     )
 
+# --- LISTENER DO WEBHOOK ---
+# App ASGI mínimo: confere caminho, método e segredo, entrega a atualização à
+# fila do Application (os handlers rodam como no polling) e responde 200 na
+# hora, sem esperar o handler terminar.
+
+def criar_app_webhook(application, caminho):
+    async def responder(send, status):
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-length", b"0")]})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] != caminho:
+            await responder(send, 404)
+            return
+        if scope["method"] != "POST":
+            await responder(send, 405)
+            return
+        segredo = dict(scope["headers"]).get(b"x-telegram-bot-api-secret-token", b"")
+        if not secrets.compare_digest(segredo, WEBHOOK_SEGREDO.encode("utf-8")):
+            logger.warning("Webhook: requisição com segredo inválido recusada.")
+            await responder(send, 403)
+            return
+
+        partes = []
+        tamanho = 0
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "http.disconnect":
+                return
+            partes.append(mensagem.get("body", b""))
+            tamanho += len(partes[-1])
+            if tamanho > TAMANHO_MAX_ATUALIZACAO:
+                await responder(send, 413)
+                return
+            if not mensagem.get("more_body", False):
+                break
+        try:
+            update = Update.de_json(json.loads(b"".join(partes)), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Webhook: atualização inválida recebida: {e}")
+            await responder(send, 400)
+            return
+        await application.update_queue.put(update)
+        await responder(send, 200)
+
+    return app
+
+async def executar_webhook(application):
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("O modo webhook precisa do uvicorn: pip install uvicorn")
+
+    caminho = urlsplit(WEBHOOK_URL).path or "/"
+    servidor = uvicorn.Server(uvicorn.Config(
+        criar_app_webhook(application, caminho),
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORTA,
+        lifespan="off",
+        access_log=False,
+        log_level="warning",
+    ))
+    # post_init/post_shutdown só são chamados por run_polling/run_webhook
+    await application.initialize()
+    await iniciar_cliente_servidor(application)
+    try:
+        await application.bot.set_webhook(WEBHOOK_URL, allowed_updates=ATUALIZACOES_PERMITIDAS, secret_token=WEBHOOK_SEGREDO)
+        await application.start()
+        logger.info(f"Webhook registrado em {WEBHOOK_URL}; ouvindo em {WEBHOOK_HOST}:{WEBHOOK_PORTA}{caminho}")
+        # Até SIGINT/SIGTERM (o uvicorn trata os sinais)
+        await servidor.serve()
+    finally:
+        if application.running:
+            await application.stop()
+        await fechar_cliente_servidor(application)
+        await application.shutdown()
+
 def main():
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build() 
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .concurrent_updates(MAX_ATUALIZACOES_SIMULTANEAS)
+        .post_init(iniciar_cliente_servidor)
+        .post_shutdown(fechar_cliente_servidor)
+        .persistence(PicklePersistence(
+            ARQUIVO_PERSISTENCIA,
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=False, callback_data=False),
+        ))
+    )
+    if WEBHOOK_URL:
+        # Sem Updater: as atualizações chegam pelo listener próprio
+        builder = builder.updater(None)
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("planta", definir_planta)) 
+    application.add_handler(CommandHandler("vaso", definir_vaso))
     
     application.add_handler(CallbackQueryHandler(button_callback)) 
 
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, eco))
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        asyncio.run(executar_webhook(application))
+    else:
+        # run_polling remove um webhook registrado antes de começar
+        application.run_polling(allowed_updates=ATUALIZACOES_PERMITIDAS)
 
 if __name__ == "__main__":
     main()
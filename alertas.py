@@ -0,0 +1,107 @@
+import math
+
+# --- HISTERESE E DEBOUNCE DOS ALERTAS ---
+# Cada vaso tem uma pequena máquina de estados por sensor:
+#   1. Histerese: depois de sair da faixa ideal, a leitura só volta a ser
+#      "ideal" quando passa do limite por uma margem (a banda de histerese).
+#      Uma umidade oscilando em cima do umidade_min não troca de estado a cada
+#      amostra. O LCD segue esse estado imediatamente. A faixa crítica
+#      opcional de cada sensor usa a mesma banda.
+#   2. Permanência mínima: uma mudança de estado só é confirmada para o
+#      Telegram depois de se manter por permanencia_min_s segundos.
+#   3. Intervalo entre alertas: o mesmo alerta não é reenviado antes de
+#      intervalo_alertas_s segundos, mesmo que a condição vá e volte.
+# A deduplicação é feita pelo estado (códigos -2 a 2), não pelo texto, então
+# a simples mudança do valor lido não gera uma nova mensagem.
+
+HISTERESE_UMIDADE_PADRAO = 3.0
+HISTERESE_LUMINOSIDADE_PADRAO = 25.0
+PERMANENCIA_MIN_PADRAO = 30.0
+INTERVALO_ALERTAS_PADRAO = 1800.0
+
+ESTADO_IDEAL = (0, 0)
+
+
+def aplicar_histerese(anterior, valor, minimo, maximo, histerese, critico_min=-math.inf, critico_max=math.inf):
+    # -2/2: fora da faixa crítica; -1/1: fora da faixa ideal; 0: ideal
+    if valor < critico_min or (anterior <= -2 and valor < critico_min + histerese):
+        return -2
+    if valor > critico_max or (anterior >= 2 and valor > critico_max - histerese):
+        return 2
+    if valor < minimo:
+        return -1
+    if valor > maximo:
+        return 1
+    if anterior < 0 and valor < minimo + histerese:
+        return -1
+    if anterior > 0 and valor > maximo - histerese:
+        return 1
+    return 0
+
+
+class EstadoAlertas:
+    __slots__ = (
+        "codigo_umidade", "codigo_luz",
+        "candidato", "candidato_desde",
+        "confirmado", "notificado",
+        "ultimos_alertas",
+    )
+
+    def __init__(self):
+        self.codigo_umidade = 0
+        self.codigo_luz = 0
+        self.candidato = None
+        self.candidato_desde = 0.0
+        self.confirmado = None   # None: ainda sem estado confirmado (notifica o primeiro na hora)
+        self.notificado = None
+        self.ultimos_alertas = {}  # estado -> ts do último envio
+
+    def observar(self, codigo_umidade, codigo_luz, ts):
+        # Registra os códigos já filtrados pela histerese; a contagem da
+        # permanência recomeça sempre que o estado muda.
+        self.codigo_umidade = codigo_umidade
+        self.codigo_luz = codigo_luz
+        atual = (codigo_umidade, codigo_luz)
+        if atual != self.candidato:
+            self.candidato = atual
+            self.candidato_desde = ts
+
+    def avancar(self, codigo_umidade, codigo_luz, ts, permanencia_min, intervalo_alertas):
+        # Devolve o estado a notificar agora, ou None se nada deve ser enviado.
+        self.observar(codigo_umidade, codigo_luz, ts)
+        if self.candidato != self.confirmado:
+            if self.confirmado is None or ts - self.candidato_desde >= permanencia_min:
+                self.confirmado = self.candidato
+
+        if self.confirmado is None or self.confirmado == self.notificado:
+            return None
+        if self.confirmado != ESTADO_IDEAL:
+            ultimo_envio = self.ultimos_alertas.get(self.confirmado)
+            if ultimo_envio is not None and ts - ultimo_envio < intervalo_alertas:
+                return None
+
+        self.notificado = self.confirmado
+        self.ultimos_alertas[self.confirmado] = ts
+        return self.confirmado
+
+    # --- Persistência ---
+    # Guarda o último estado notificado e os envios recentes, para que um
+    # reinício do servidor não reenvie alertas que o usuário já recebeu.
+
+    def exportar(self):
+        return {
+            "codigo_umidade": self.codigo_umidade,
+            "codigo_luz": self.codigo_luz,
+            "notificado": list(self.notificado) if self.notificado is not None else None,
+            "ultimos_alertas": [[u, l, ts] for (u, l), ts in self.ultimos_alertas.items()],
+        }
+
+    @classmethod
+    def importar(cls, dados):
+        estado = cls()
+        estado.codigo_umidade = dados["codigo_umidade"]
+        estado.codigo_luz = dados["codigo_luz"]
+        if dados["notificado"] is not None:
+            estado.notificado = estado.confirmado = tuple(dados["notificado"])
+        estado.ultimos_alertas = {(u, l): ts for u, l, ts in dados["ultimos_alertas"]}
+        return estado
@@ -1,239 +1,112 @@
-from flask import Flask, request, jsonify
-from telegram import Bot
-import asyncio
+from flask import Flask, request, jsonify, g
 import threading
 import logging
-import queue 
+import time
+import servico_vaso
+from log_assincrono import configurar_log
+from gateway_mqtt import iniciar_gateway_mqtt, encerrar_gateway_mqtt
+from servico_vaso import registrar_requisicao, ROTA_DESCONHECIDA, start_telegram_worker, iniciar_persistencia, encerrar_persistencia, iniciar_vigia_catalogo, TIPOS_NDJSON, TIPO_CONTEUDO_QUADRO, carregar_lote_ndjson, carregar_lote_json
 
 # --- Configurações Iniciais do Flask e Logging ---
 app = Flask(__name__)
 
-# Configura o sistema de log para ver as mensagens do servidor
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO 
-)
+# Configura o sistema de log: gravação em thread separada e amostragem das rotas
+# mais chamadas (log_assincrono.py)
+configurar_log(logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- CONFIGURAÇÕES DO TELEGRAM ---
-TELEGRAM_BOT_TOKEN = 'YOUR TELEGRAM TOKEN' 
-bot = Bot(token=TELEGRAM_BOT_TOKEN) 
-
-TELEGRAM_CHAT_ID = 'CHAT ID' 
-
-# --- VARIÁVEIS DE ESTADO DO VASO ---
-estado_vaso = {
-    "planta_selecionada": "Nenhuma", 
-    "umidade_atual": 0,
-    "luminosidade_atual": 0,
-    "instrucao_para_lcd": "Aguardando dados...", 
-    "ultima_notificacao_telegram": "",
-    "chat_id_notificacao": None 
-}
-
-# --- PARÂMETROS DAS PLANTAS ---
-parametros_plantas = {
-    "Cacto": {
-        "umidade_min": 10,  
-        "umidade_max": 25,  
-        "luminosidade_min": 700, 
-        "luminosidade_max": 1000
-    },
-    "Samambaia": {
-        "umidade_min": 70,  
-        "umidade_max": 85,
-        "luminosidade_min": 150, 
-        "luminosidade_max": 400
-    },
-    "Hortelã": {
-        "umidade_min": 55,  
-        "umidade_max": 75,
-        "luminosidade_min": 350, 
-        "luminosidade_max": 650
-    },
-    "Orquídea": { 
-        "umidade_min": 40,  
-        "umidade_max": 60,  
-        "luminosidade_min": 450, 
-        "luminosidade_max": 750
-    },
-    "Nenhuma": { 
-        "umidade_min": 0, "umidade_max": 100,
-        "luminosidade_min": 0, "luminosidade_max": 1000
-    }
-}
-
-# --- FILA DE MENSAGENS PARA O TELEGRAM E WORKER DEDICADO ---
-telegram_message_queue = queue.Queue() 
-
-async def enviar_mensagem_telegram(chat_id, mensagem):
-    try:
-        await bot.send_message(chat_id=chat_id, text=mensagem)
-        logger.info(f"Mensagem Telegram enviada para {chat_id}: {mensagem}")
-    except Exception as e:
-        logger.error(f"Erro ao enviar mensagem Telegram para {chat_id}: {e}")
-
-async def telegram_worker():
-    logger.info("Worker do Telegram iniciado.")
-    while True:
-        try:
-            chat_id, message = await asyncio.to_thread(telegram_message_queue.get)
-            if chat_id is None: 
-                logger.info("Sinal de parada recebido para o worker do Telegram.")
-                break
-            await enviar_mensagem_telegram(chat_id, message)
-            telegram_message_queue.task_done() 
-        except Exception as e:
-            logger.error(f"Erro no worker do Telegram: {e}")
-
-def start_telegram_worker():
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(telegram_worker())
-    loop.close() 
-
-# --- LÓGICA DE DECISÃO DA PLANTA ---
-def tomar_decisao_planta():
-    planta = estado_vaso["planta_selecionada"]
-    umidade = estado_vaso["umidade_atual"]
-    luminosidade = estado_vaso["luminosidade_atual"]
-    chat_id_para_notificar = estado_vaso["chat_id_notificacao"] 
-
-    if chat_id_para_notificar is None:
-        logger.warning("Nenhum chat ID configurado para notificações. Mensagem não será enviada para o Telegram.")
-        return estado_vaso["instrucao_para_lcd"]
-
-    params = parametros_plantas.get(planta, parametros_plantas["Nenhuma"])
-
-    instrucoes_lcd = [] 
-    notificacoes_telegram = [] 
-
-    # Lógica de Umidade
-    if umidade < params["umidade_min"]:
-        instrucoes_lcd.append("mais agua")
-        notificacoes_telegram.append(f"🚨 Atenção! Sua {planta} precisa ser regada. Umidade atual: {umidade}%.")
-    elif umidade > params["umidade_max"]:
-        instrucoes_lcd.append("menos agua")
-        notificacoes_telegram.append(f"💧 Excesso de água! Sua {planta} está com umidade muito alta: {umidade}%.")
-    else:
-        instrucoes_lcd.append("umidade ideal")
-
-    # Lógica de Luminosidade
-    if luminosidade < params["luminosidade_min"]:
-        instrucoes_lcd.append("mais sol")
-        notificacoes_telegram.append(f"☀️ Sua {planta} precisa de mais luz. Luminosidade atual: {luminosidade}.")
-    elif luminosidade > params["luminosidade_max"]:
-        instrucoes_lcd.append("menos sol")
-        notificacoes_telegram.append(f"🔥 Sua {planta} está pegando muito sol. Luminosidade atual: {luminosidade}.")
-    else:
-        instrucoes_lcd.append("luz ideal") # ALTERADO AQUI!
-
-    # Define a instrução final para o LCD
-    instrucao_final_lcd = ", ".join(instrucoes_lcd) 
-    estado_vaso["instrucao_para_lcd"] = instrucao_final_lcd
-
-    # Lógica para as notificações do Telegram
-    if not notificacoes_telegram:
-        if estado_vaso["ultima_notificacao_telegram"] != "✅ Tudo certo!":
-            notificacao_telegram_final = f"✅ Sua {planta} está com condições perfeitas agora!"
-            estado_vaso["ultima_notificacao_telegram"] = "✅ Tudo certo!"
-            telegram_message_queue.put((chat_id_para_notificar, notificacao_telegram_final))
-            logger.info(f"Mensagem de 'tudo certo' enfileirada para Telegram (Chat ID: {chat_id_para_notificar}).")
-    else:
-        notificacao_telegram_final = "\n".join(notificacoes_telegram) 
-        if notificacao_telegram_final != estado_vaso["ultima_notificacao_telegram"]:
-            telegram_message_queue.put((chat_id_para_notificar, notificacao_telegram_final))
-            estado_vaso["ultima_notificacao_telegram"] = notificacao_telegram_final
-            logger.info(f"Mensagem enfileirada para Telegram (Chat ID: {chat_id_para_notificar}): '{notificacao_telegram_final}'")
-
-
-    logger.info(f"Decisão para {planta}: {instrucao_final_lcd}.")
-    return instrucao_final_lcd
+# Estado, parâmetros das plantas, fila do Telegram e lógica de decisão ficam em
+# servico_vaso.py, compartilhados com o modo assíncrono (servidor_asgi.py).
+
+def _responder(resultado):
+    corpo, status, *cabecalhos = resultado
+    cabecalhos = cabecalhos[0] if cabecalhos else {}
+    if corpo is None:
+        return "", status, cabecalhos
+    if isinstance(corpo, (str, bytes)):
+        # Texto já formatado (ex.: /metrics) ou quadro binário; o Content-Type vem nos cabeçalhos
+        return corpo, status, cabecalhos
+    return jsonify(corpo), status, cabecalhos
+
+# Latência e status de cada requisição para /metrics, rotulados pela regra da
+# rota (nunca pela URL crua)
+@app.before_request
+def _marcar_inicio():
+    g.inicio_requisicao = time.perf_counter()
+
+@app.after_request
+def _registrar_requisicao(resposta):
+    rota = request.url_rule.rule if request.url_rule is not None else ROTA_DESCONHECIDA
+    registrar_requisicao(rota, resposta.status_code, time.perf_counter() - g.inicio_requisicao)
+    return resposta
 
 # --- ROTAS DA API FLASK ---
 
 @app.route('/update_sensor_data', methods=['POST'])
 def update_sensor_data():
-    logger.info(f"CONFIRMAÇÃO: Conexão recebida do ESP32 no IP {request.remote_addr}")
-
-    data = request.json
-    if not data:
-        logger.warning("Requisição /update_sensor_data: Nenhum dado JSON recebido.")
-        return jsonify({"status": "error", "message": "Nenhum dado JSON recebido"}), 400
-
-    umidade = data.get('umidade')
-    luminosidade = data.get('luminosidade')
-
-    if umidade is None or luminosidade is None:
-        logger.warning(f"Requisição /update_sensor_data: Dados ausentes - umidade={umidade}, luminosidade={luminosidade}")
-        return jsonify({"status": "error", "message": "Dados de umidade ou luminosidade ausentes"}), 400
-
-    try:
-        estado_vaso["umidade_atual"] = float(umidade)
-        estado_vaso["luminosidade_atual"] = float(luminosidade)
-        logger.info(f"--> Dados recebidos: Umidade={umidade}%, Luminosidade={luminosidade}")
+    if request.mimetype == TIPO_CONTEUDO_QUADRO:
+        return _responder(servico_vaso.processar_quadro(request.get_data(cache=False), request.remote_addr))
+    return _responder(servico_vaso.processar_leitura(request.get_json(silent=True), request.remote_addr))
 
-        instrucao = tomar_decisao_planta()
 
-        return jsonify({"status": "success", "message": "Dados recebidos", "instrucao": instrucao})
-    except ValueError:
-        logger.error(f"Requisição /update_sensor_data: Valores inválidos - umidade={umidade}, luminosidade={luminosidade}")
-        return jsonify({"status": "error", "message": "Valores de umidade/luminosidade inválidos"}), 400
+@app.route('/update_sensor_data_batch', methods=['POST'])
+def update_sensor_data_batch():
+    if request.mimetype in TIPOS_NDJSON:
+        carregar = lambda: carregar_lote_ndjson(request.stream)
+    else:
+        carregar = lambda: carregar_lote_json(request.get_json(silent=True))
+    return _responder(servico_vaso.processar_lote(carregar, request.remote_addr))
 
 
 @app.route('/get_instruction', methods=['GET'])
 def get_instruction():
-    instrucao = estado_vaso["instrucao_para_lcd"]
-    logger.info(f"ESP32 solicitou instrução para LCD: '{instrucao}'")
-    return jsonify({"instrucao": instrucao})
+    return _responder(servico_vaso.obter_instrucao(request.args))
 
 @app.route('/get_full_status', methods=['GET'])
 def get_full_status():
-    planta_selecionada = estado_vaso["planta_selecionada"]
-    
-    current_status = {
-        "planta_selecionada": planta_selecionada,
-        "umidade_atual": estado_vaso["umidade_atual"],
-        "luminosidade_atual": estado_vaso["luminosidade_atual"],
-        "instrucao_para_lcd": estado_vaso["instrucao_para_lcd"],
-        "parametros_todas_plantas": parametros_plantas
-    }
-    logger.info(f"Bot solicitou status completo: {current_status}")
-    return jsonify(current_status)
+    return _responder(servico_vaso.obter_status_completo(request.args, request.headers.get('If-None-Match')))
+
+@app.route('/plantas', methods=['GET'])
+def get_plantas():
+    return _responder(servico_vaso.obter_catalogo(request.headers.get('If-None-Match')))
 
 
 @app.route('/set_plant', methods=['POST'])
 def set_plant():
-    data = request.json
-    if not data or 'planta' not in data or 'chat_id' not in data:
-        logger.warning("Requisição /set_plant: Dados ausentes (planta ou chat_id).")
-        return jsonify({"status": "error", "message": "Nome da planta ou chat_id ausente"}), 400
+    return _responder(servico_vaso.definir_planta(request.get_json(silent=True)))
 
-    nova_planta = data['planta'].strip()
-    novo_chat_id = data['chat_id']
+@app.route('/status', methods=['GET'])
+def get_status():
+    return _responder(servico_vaso.obter_status(request.args))
 
-    if nova_planta in parametros_plantas:
-        estado_vaso["planta_selecionada"] = nova_planta
-        estado_vaso["chat_id_notificacao"] = novo_chat_id
+@app.route('/history', methods=['GET'])
+def get_history():
+    return _responder(servico_vaso.obter_historico(request.args))
 
-        estado_vaso["ultima_notificacao_telegram"] = "Planta definida e notificações ativadas para este chat."
-        logger.info(f"Planta selecionada atualizada para: {nova_planta}. Notificações para chat ID: {novo_chat_id}")
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return _responder(servico_vaso.exportar_metricas())
 
-        tomar_decisao_planta()
-        return jsonify({"status": "success", "message": f"Planta definida para {nova_planta}. O bot enviará a confirmação."})
-    else:
-        logger.warning(f"Requisição /set_plant: Planta '{nova_planta}' não encontrada nos parâmetros.")
-        return jsonify({"status": "error", "message": f"Planta '{nova_planta}' não encontrada na base de dados. Plantas disponíveis: {', '.join(parametros_plantas.keys())}"}), 404
+@app.route('/perfilador', methods=['GET'])
+def get_perfilador():
+    return _responder(servico_vaso.obter_perfilador(request.args))
 
-@app.route('/status', methods=['GET'])
-def get_status():
-    logger.info("Requisição /status: Retornando estado atual.")
-    return jsonify(estado_vaso)
+@app.route('/perfilador/controle', methods=['POST'])
+def controlar_perfilador():
+    return _responder(servico_vaso.controlar_perfilador(request.get_json(silent=True)))
 
 # --- INICIALIZAÇÃO DO SERVIDOR FLASK ---
 if __name__ == '__main__':
+    iniciar_persistencia()
+    iniciar_vigia_catalogo()
+    iniciar_gateway_mqtt()
+
     telegram_thread = threading.Thread(target=start_telegram_worker, daemon=True)
     telegram_thread.start()
     logger.info("Thread do worker do Telegram iniciada.")
 
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    try:
+        app.run(host='0.0.0.0', port=5000, debug=False)
+    finally:
+        encerrar_gateway_mqtt()
+        encerrar_persistencia()
@@ -0,0 +1,126 @@
+import numpy as np
+
+# --- AVALIAÇÃO VETORIZADA DE LEITURAS EM LOTE ---
+# Os limites de cada perfil do catálogo viram colunas NumPy (uma posição por
+# planta, na ordem de PerfilPlanta.indice) e as leituras de um lote viram
+# colunas de umidade/luminosidade. A classificação de todas as leituras é feita
+# em uma única passada de comparações.
+#
+# Códigos de classificação (iguais aos da avaliação individual):
+#   -2 = abaixo da faixa crítica, -1 = abaixo do mínimo, 0 = dentro da faixa,
+#    1 = acima do máximo, 2 = acima da faixa crítica
+#
+# Com os códigos anteriores de cada vaso, aplica também a histerese (alertas.py):
+# quem já estava fora de uma faixa só volta para dentro depois de passar da banda.
+#
+# Várias leituras do mesmo vaso (lote, quadro binário, simulador de limites)
+# precisam da histerese encadeada: o código de cada leitura parte do código da
+# leitura anterior, como no caminho individual. classificar_encadeado faz isso
+# sem laço por leitura:
+#   1. classificar_lote é chamada com cada um dos 5 códigos anteriores
+#      possíveis, o que dá a função "código anterior -> código novo" de cada
+#      leitura (uma linha de 5 índices);
+#   2. o código de cada leitura é a composição dessas funções desde a primeira
+#      leitura do vaso, calculada por dobramento (log2 passos de
+#      take_along_axis). Leituras seguidas com a mesma função viram uma só (a
+#      histerese é idempotente) e o dobramento para quando todas as
+#      composições já são constantes.
+
+NUM_CODIGOS = 5
+PESOS_FUNCAO = NUM_CODIGOS ** np.arange(NUM_CODIGOS - 1, -1, -1, dtype=np.int16)
+
+
+class TabelaLimites:
+    def __init__(self, perfis):
+        # Cada sensor vira 5 colunas: mínimo, máximo, histerese, crítico mínimo e crítico máximo
+        for sensor in ("umidade", "luminosidade"):
+            colunas = np.array([getattr(perfil, sensor) for perfil in perfis], dtype=np.float64).reshape(-1, 5)
+            setattr(self, sensor, tuple(colunas.T.copy()))
+
+
+def _classificar_coluna(valores, limites, indices_planta, anteriores):
+    minimos, maximos, histereses, criticos_min, criticos_max = (coluna[indices_planta] for coluna in limites)
+    if anteriores is None:
+        anteriores = np.zeros(len(valores), dtype=np.int8)
+    else:
+        anteriores = np.asarray(anteriores, dtype=np.int8)
+
+    # Atribuições da menor para a maior prioridade, na ordem inversa de aplicar_histerese
+    codigos = np.zeros(len(valores), dtype=np.int8)
+    codigos[(anteriores > 0) & (valores > maximos - histereses)] = 1
+    codigos[(anteriores < 0) & (valores < minimos + histereses)] = -1
+    codigos[valores > maximos] = 1
+    codigos[valores < minimos] = -1
+    codigos[(valores > criticos_max) | ((anteriores >= 2) & (valores > criticos_max - histereses))] = 2
+    codigos[(valores < criticos_min) | ((anteriores <= -2) & (valores < criticos_min + histereses))] = -2
+    return codigos
+
+
+def classificar_lote(tabela, indices_planta, umidades, luminosidades,
+                     anteriores_umidade=None, anteriores_luz=None):
+    indices_planta = np.asarray(indices_planta, dtype=np.intp)
+    umidades = np.asarray(umidades, dtype=np.float64)
+    luminosidades = np.asarray(luminosidades, dtype=np.float64)
+
+    codigos_umidade = _classificar_coluna(umidades, tabela.umidade, indices_planta, anteriores_umidade)
+    codigos_luz = _classificar_coluna(luminosidades, tabela.luminosidade, indices_planta, anteriores_luz)
+
+    return codigos_umidade, codigos_luz
+
+
+# --- HISTERESE ENCADEADA ---
+
+def funcoes_histerese(tabela, indices_planta, umidades, luminosidades):
+    # Linha i, coluna p + 2: índice (código + 2) da leitura i se o código
+    # anterior do sensor for p
+    funcoes_umidade = np.empty((len(umidades), NUM_CODIGOS), dtype=np.int8)
+    funcoes_luz = np.empty((len(umidades), NUM_CODIGOS), dtype=np.int8)
+    for anterior in range(-2, 3):
+        codigos_umidade, codigos_luz = classificar_lote(tabela, indices_planta, umidades, luminosidades, anterior, anterior)
+        funcoes_umidade[:, anterior + 2] = codigos_umidade + 2
+        funcoes_luz[:, anterior + 2] = codigos_luz + 2
+    return funcoes_umidade, funcoes_luz
+
+
+def encadear_histerese(funcoes, inicios, anteriores):
+    # Índice do código de cada leitura, partindo do índice `anteriores` de cada
+    # vaso (um por trecho começando em `inicios`). Altera `funcoes`.
+    quantidade = len(funcoes)
+    # A primeira leitura de cada vaso vira uma função constante: nenhuma
+    # composição atravessa a fronteira entre vasos
+    funcoes[inicios] = funcoes[inicios, anteriores][:, None]
+
+    identificadores = funcoes @ PESOS_FUNCAO
+    novo = np.ones(quantidade, dtype=bool)
+    novo[1:] = identificadores[1:] != identificadores[:-1]
+    novo[inicios] = True
+    trechos = np.flatnonzero(novo)
+    composta = funcoes[trechos]
+
+    passo = 1
+    while passo < len(composta):
+        if (composta == composta[:, :1]).all():
+            break
+        composta[passo:] = np.take_along_axis(composta[passo:], composta[:-passo].astype(np.intp), axis=1)
+        passo *= 2
+    return np.repeat(composta[:, 0], np.diff(np.append(trechos, quantidade)))
+
+
+def classificar_encadeado(tabela, indices_planta, umidades, luminosidades, inicios, anteriores_umidade, anteriores_luz):
+    # Leituras agrupadas por vaso, cada vaso na ordem de chegada; `inicios` é a
+    # posição da primeira leitura de cada vaso e os anteriores são os códigos
+    # do vaso antes delas (um por vaso). Devolve os códigos de cada leitura.
+    indices_planta = np.asarray(indices_planta, dtype=np.intp)
+    inicios = np.asarray(inicios, dtype=np.intp)
+    anteriores_umidade = np.asarray(anteriores_umidade, dtype=np.int8)
+    anteriores_luz = np.asarray(anteriores_luz, dtype=np.int8)
+    if len(inicios) == len(umidades):
+        # Uma leitura por vaso: nada a encadear
+        return classificar_lote(tabela, indices_planta, umidades, luminosidades, anteriores_umidade, anteriores_luz)
+
+    umidades = np.asarray(umidades, dtype=np.float64)
+    luminosidades = np.asarray(luminosidades, dtype=np.float64)
+    funcoes_umidade, funcoes_luz = funcoes_histerese(tabela, indices_planta, umidades, luminosidades)
+    codigos_umidade = encadear_histerese(funcoes_umidade, inicios, anteriores_umidade.astype(np.intp) + 2) - 2
+    codigos_luz = encadear_histerese(funcoes_luz, inicios, anteriores_luz.astype(np.intp) + 2) - 2
+    return codigos_umidade, codigos_luz
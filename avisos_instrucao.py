@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+# --- AVISOS DE MUDANÇA DE INSTRUÇÃO (LONG-POLL E SSE) ---
+# Quem quer ser avisado quando a instrução do LCD de um vaso muda (um ESP32 em
+# long-poll, um cliente SSE de um vaso ou de um chat) cria uma Assinatura no
+# event loop do servidor ASGI e fica esperando o evento dela, sem thread e sem
+# requisições enquanto nada muda.
+#
+# A lógica de decisão chama publicar() quando a instrução muda. Sem assinantes
+# para o vaso ou para o chat dele, o custo são duas consultas a dicionário. Os
+# dicionários só são alterados no event loop; publicações vindas de outra
+# thread são repassadas com call_soon_threadsafe.
+#
+# Cada assinatura guarda só o último aviso de cada vaso: mudanças em rajada
+# enquanto o cliente ainda recebe a anterior viram um único aviso.
+#
+# ao_publicar(vaso_id), se definido, é chamado a cada mudança, de qualquer
+# thread e com o lock do vaso adquirido (o gateway MQTT só anota o vaso).
+
+
+class Assinatura:
+    __slots__ = ("vaso_id", "chat_id", "tipo", "evento", "avisos", "encerrada")
+
+    def __init__(self, vaso_id, chat_id, tipo):
+        self.vaso_id = vaso_id
+        self.chat_id = chat_id
+        self.tipo = tipo
+        self.evento = asyncio.Event()
+        self.avisos = {}   # vaso_id -> (vaso_id, marca, instrucao, planta)
+        self.encerrada = False
+
+    def encerrar(self):
+        # Cliente desconectou: acorda quem espera para liberar a conexão
+        self.encerrada = True
+        self.evento.set()
+
+    def retirar_avisos(self):
+        avisos = list(self.avisos.values())
+        self.avisos.clear()
+        self.evento.clear()
+        return avisos
+
+
+class AvisosInstrucao:
+    def __init__(self):
+        self._por_vaso = {}   # vaso_id -> set de Assinatura
+        self._por_chat = {}   # chat_id -> set de Assinatura
+        self._loop = None
+        self._thread_loop = None
+        self.conexoes = {}    # tipo ("long_poll", "sse") -> assinaturas abertas
+        self.ao_publicar = None
+
+    def vincular_loop(self):
+        self._loop = asyncio.get_running_loop()
+        self._thread_loop = threading.get_ident()
+
+    def total(self):
+        return sum(self.conexoes.values())
+
+    def assinar(self, tipo, vaso_id=None, chat_id=None):
+        assinatura = Assinatura(vaso_id, chat_id, tipo)
+        if vaso_id is not None:
+            self._por_vaso.setdefault(vaso_id, set()).add(assinatura)
+        if chat_id is not None:
+            self._por_chat.setdefault(chat_id, set()).add(assinatura)
+        self.conexoes[tipo] = self.conexoes.get(tipo, 0) + 1
+        return assinatura
+
+    def cancelar(self, assinatura):
+        for indice, chave in ((self._por_vaso, assinatura.vaso_id), (self._por_chat, assinatura.chat_id)):
+            assinaturas = indice.get(chave)
+            if assinaturas is not None:
+                assinaturas.discard(assinatura)
+                if not assinaturas:
+                    del indice[chave]
+        self.conexoes[assinatura.tipo] -= 1
+
+    def publicar(self, vaso_id, chat_id, marca, instrucao, planta):
+        if self.ao_publicar is not None:
+            self.ao_publicar(vaso_id)
+        if vaso_id not in self._por_vaso and (chat_id is None or chat_id not in self._por_chat):
+            return
+        aviso = (vaso_id, marca, instrucao, planta)
+        if threading.get_ident() == self._thread_loop:
+            self._entregar(chat_id, aviso)
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(self._entregar, chat_id, aviso)
+
+    def _entregar(self, chat_id, aviso):
+        alvos = list(self._por_vaso.get(aviso[0], ()))
+        if chat_id is not None:
+            alvos.extend(self._por_chat.get(chat_id, ()))
+        for assinatura in alvos:
+            assinatura.avisos[aviso[0]] = aviso
+            assinatura.evento.set()
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from util_bench import ConexaoHTTP, porta_livre, iniciar_servidor, encerrar, percentil
+from fake_bot_api import FakeBotAPI
+from carga_frota import rss_mb, TOKEN_BENCH
+
+# --- BENCHMARK DOS AVISOS POR LONG-POLL ---
+# Estaciona N conexões em /aguardar_instrucao (uma por vaso) no servidor ASGI,
+# mede a memória do servidor antes e depois, e então muda a instrução de todos
+# os vasos com leituras novas, medindo o tempo entre a leitura e a resposta do
+# long-poll de cada vaso. Compara também quantas requisições a frota faria em
+# polling de /get_instruction no mesmo período.
+#
+#   python benchmarks/bench_avisos.py --vasos 3000
+
+PLANTA = "Samambaia"
+LEITURA_IDEAL = {"umidade": 78, "luminosidade": 300}
+LEITURA_SECA = {"umidade": 60, "luminosidade": 300}
+
+
+async def preparar_vasos(porta, vasos, conexoes_preparo=50):
+    async def preparar(indices):
+        conexao = ConexaoHTTP("127.0.0.1", porta)
+        try:
+            for i in indices:
+                vaso_id = f"aviso-{i}"
+                await conexao.requisitar("POST", "/set_plant", {"vaso_id": vaso_id, "planta": PLANTA, "chat_id": 700000 + i})
+                await conexao.requisitar("POST", "/update_sensor_data", dict(LEITURA_IDEAL, vaso_id=vaso_id))
+        finally:
+            await conexao.fechar()
+
+    await asyncio.gather(*(preparar(range(inicio, vasos, conexoes_preparo)) for inicio in range(conexoes_preparo)))
+
+
+async def estacionar(porta, vaso_id, timeout, prontos, acordados):
+    conexao = ConexaoHTTP("127.0.0.1", porta)
+    try:
+        _, _, dados = await conexao.requisitar("GET", f"/get_instruction?vaso_id={vaso_id}")
+        versao = json.loads(dados)["versao_instrucao"]
+        prontos.append(vaso_id)
+        status, _, dados = await conexao.requisitar("GET", f"/aguardar_instrucao?vaso_id={vaso_id}&versao={versao}&timeout={timeout}")
+        acordados[vaso_id] = (time.monotonic(), status, json.loads(dados) if dados else None)
+    finally:
+        await conexao.fechar()
+
+
+async def executar(porta, pid, args):
+    await preparar_vasos(porta, args.vasos)
+    rss_inicial = rss_mb(pid)
+
+    prontos = []
+    acordados = {}
+    esperas = [asyncio.create_task(estacionar(porta, f"aviso-{i}", args.timeout, prontos, acordados)) for i in range(args.vasos)]
+    while len(prontos) < args.vasos:
+        await asyncio.sleep(0.1)
+    # Dá tempo para as últimas requisições de long-poll chegarem ao servidor
+    await asyncio.sleep(args.estacionado)
+    rss_estacionado = rss_mb(pid)
+
+    # Muda a instrução de todos os vasos e guarda quando cada leitura saiu
+    enviadas = {}
+    conexao = ConexaoHTTP("127.0.0.1", porta)
+    inicio = time.monotonic()
+    try:
+        for i in range(args.vasos):
+            vaso_id = f"aviso-{i}"
+            enviadas[vaso_id] = time.monotonic()
+            await conexao.requisitar("POST", "/update_sensor_data", dict(LEITURA_SECA, vaso_id=vaso_id))
+    finally:
+        await conexao.fechar()
+    duracao_mudancas = time.monotonic() - inicio
+    await asyncio.wait(esperas, timeout=args.timeout + 5)
+
+    atrasos = sorted(momento - enviadas[vaso_id] for vaso_id, (momento, status, _) in acordados.items() if status == 200)
+    return {
+        "vasos": args.vasos,
+        "acordados": len(atrasos),
+        "sem_aviso": args.vasos - len(atrasos),
+        "rss_inicial_mb": rss_inicial,
+        "rss_estacionado_mb": rss_estacionado,
+        "kb_por_conexao": (rss_estacionado - rss_inicial) * 1024 / args.vasos if rss_inicial and rss_estacionado else None,
+        "mudancas_por_s": args.vasos / duracao_mudancas,
+        "atraso_p50_ms": percentil(atrasos, 50) * 1000,
+        "atraso_p99_ms": percentil(atrasos, 99) * 1000,
+        "atraso_max_ms": (atrasos[-1] if atrasos else 0.0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conexões de long-poll estacionadas no servidor ASGI")
+    parser.add_argument("--vasos", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=60.0, help="timeout do long-poll de cada vaso")
+    parser.add_argument("--estacionado", type=float, default=2.0, help="segundos com todas as conexões paradas antes das mudanças")
+    parser.add_argument("--intervalo-polling", type=float, default=5.0, help="intervalo de polling usado na comparação")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    api = FakeBotAPI(latencia=0.0).iniciar()
+    porta = porta_livre()
+    processo = iniciar_servidor("asgi", porta, {"TELEGRAM_API_URL": api.url_base, "TELEGRAM_BOT_TOKEN": TOKEN_BENCH})
+    try:
+        resultado = asyncio.run(executar(porta, processo.pid, args))
+    finally:
+        encerrar(processo)
+        api.parar()
+
+    print(f"{resultado['vasos']} conexões estacionadas: RSS {resultado['rss_inicial_mb']:.1f} MB -> "
+          f"{resultado['rss_estacionado_mb']:.1f} MB ({resultado['kb_por_conexao']:.1f} KB por conexão)")
+    print(f"Mudanças enviadas a {resultado['mudancas_por_s']:.0f}/s; {resultado['acordados']} long-polls acordados, "
+          f"{resultado['sem_aviso']} sem aviso | atraso p50 {resultado['atraso_p50_ms']:.1f} ms, "
+          f"p99 {resultado['atraso_p99_ms']:.1f} ms, máx {resultado['atraso_max_ms']:.1f} ms")
+    por_minuto_polling = resultado["vasos"] * 60 / args.intervalo_polling
+    por_minuto_long_poll = resultado["vasos"] * 60 / args.timeout
+    print(f"Requisições por minuto com a frota parada: polling a cada {args.intervalo_polling:g}s = {por_minuto_polling:.0f}, "
+          f"long-poll de {args.timeout:g}s = {por_minuto_long_poll:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import concurrent.futures
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_bot_api import FakeBotAPI
+from util_bench import RAIZ_PROJETO, porta_livre, aguardar_porta, encerrar, resumo_latencias
+
+# --- BENCHMARK DO BOT: POLLING x WEBHOOK ---
+# Sobe o Telegram_Bot.py contra a API falsa do Telegram e mede o tempo entre a
+# atualização ficar disponível na API (injetar_atualizacao) e a resposta do
+# bot chegar a ela: /start (sendMessage com o menu) e o toque em "Gerenciar
+# Vaso" (answerCallbackQuery + editMessageText). Primeiro uma atualização por
+# vez, depois rajadas de chats simultâneos.
+#
+#   python benchmarks/bench_bot.py --atualizacoes 300 --simultaneos 20
+#
+# Os handlers medidos não consultam o servidor do vaso, que não precisa estar no ar.
+
+TOKEN = "123456:bench"
+SEGREDO = "segredo-do-benchmark"
+
+
+def atualizacao_start(chat_id):
+    return {"message": {
+        "message_id": 1, "date": int(time.time()), "text": "/start",
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    }}
+
+
+def atualizacao_callback(chat_id):
+    return {"callback_query": {
+        "id": str(chat_id), "chat_instance": str(chat_id), "data": "gerenciar_vaso",
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+        "message": {
+            "message_id": 2, "date": int(time.time()), "text": "menu",
+            "chat": {"id": chat_id, "type": "private"},
+        },
+    }}
+
+
+def iniciar_bot(modo, api):
+    env = dict(os.environ)
+    env.update(TELEGRAM_BOT_TOKEN=TOKEN, TELEGRAM_API_URL=api.url_base, PYTHONPATH=RAIZ_PROJETO)
+    porta = None
+    if modo == "webhook":
+        porta = porta_livre()
+        env.update(
+            TELEGRAM_WEBHOOK_URL=f"http://127.0.0.1:{porta}/telegram",
+            TELEGRAM_WEBHOOK_PORTA=str(porta),
+            TELEGRAM_WEBHOOK_SEGREDO=SEGREDO,
+        )
+    processo = subprocess.Popen(
+        [sys.executable, "-c", "import logging, Telegram_Bot; logging.disable(logging.WARNING); Telegram_Bot.main()"],
+        cwd=RAIZ_PROJETO, env=env,
+    )
+    if modo == "webhook":
+        aguardar_porta(porta)
+        limite = time.monotonic() + 15
+        while api.webhook is None and time.monotonic() < limite:
+            time.sleep(0.05)
+    # Aquecimento: garante que o bot já está recebendo e respondendo
+    for chat_id in (-1, -2):
+        inicio = time.perf_counter()
+        api.injetar_atualizacao(atualizacao_start(chat_id))
+        if api.aguardar_resposta(chat_id, inicio, timeout=20) is None:
+            encerrar(processo)
+            raise RuntimeError(f"O bot em modo {modo} não respondeu")
+    return processo
+
+
+def medir(api, chat_inicial, quantidade, simultaneos):
+    # Devolve as latências (s) de `quantidade` atualizações, `simultaneos` de cada vez
+    def uma(chat_id):
+        montar = atualizacao_start if chat_id % 2 else atualizacao_callback
+        inicio = time.perf_counter()
+        api.injetar_atualizacao(montar(chat_id))
+        resposta = api.aguardar_resposta(chat_id, inicio)
+        return None if resposta is None else resposta - inicio
+
+    latencias = []
+    falhas = 0
+    inicio = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=simultaneos) as pool:
+        for latencia in pool.map(uma, range(chat_inicial, chat_inicial + quantidade)):
+            if latencia is None:
+                falhas += 1
+            else:
+                latencias.append(latencia)
+    resultado = resumo_latencias(latencias, time.monotonic() - inicio)
+    resultado["falhas"] = falhas
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara polling e webhook no bot do Telegram")
+    parser.add_argument("--atualizacoes", type=int, default=200)
+    parser.add_argument("--simultaneos", type=int, default=20, help="chats ao mesmo tempo na segunda rodada")
+    parser.add_argument("--latencia-api", type=float, default=0.0, help="atraso por chamada na API falsa, em segundos")
+    args = parser.parse_args()
+
+    for modo in ("polling", "webhook"):
+        api = FakeBotAPI(latencia=args.latencia_api, aplicar_limites=False).iniciar()
+        processo = iniciar_bot(modo, api)
+        try:
+            for simultaneos in (1, args.simultaneos):
+                r = medir(api, 1000, args.atualizacoes, simultaneos)
+                print(f"{modo:8s} {simultaneos:3d} simultâneos: p50 {r['p50_ms']:.1f} ms | p95 {r['p95_ms']:.1f} ms | "
+                      f"p99 {r['p99_ms']:.1f} ms | {r['req_por_s']:.0f} atualizações/s | falhas {r['falhas']}")
+        finally:
+            encerrar(processo)
+            api.parar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
+
+from fake_bot_api import FakeBotAPI
+from fila_telegram import FilaTelegram
+from despachante_telegram import DespachanteTelegram
+
+# --- BENCHMARK DO DESPACHANTE DO TELEGRAM ---
+# Dispara uma rajada de alertas (C chats x A alertas cada) contra a API falsa do
+# Telegram, que simula latência, erros 5xx e o controle de flood (429). Compara o
+# envio serial antigo (uma mensagem por vez) com o DespachanteTelegram.
+#
+# Uso: python benchmarks/bench_despachante.py --chats 200 --alertas 3 --latencia 0.05
+
+
+async def serial(bot, rajada):
+    # Comportamento anterior: uma mensagem por vez, sem limites nem retentativas
+    falhas = 0
+    for chat_id, mensagem in rajada:
+        try:
+            await bot.send_message(chat_id=chat_id, text=mensagem)
+        except TelegramError:
+            falhas += 1
+    return {"falhas": falhas}
+
+
+async def despachante(bot, rajada, envios):
+    fila = FilaTelegram(limite=len(rajada) + 1)
+    fila.vincular_loop()
+    desp = DespachanteTelegram(bot, fila, envios_simultaneos=envios, timeout_encerramento=600)
+    for item in rajada:
+        fila.put(item)
+    fila.put((None, None))
+    await desp.executar()
+    return {"falhas": desp.falhas, "mescladas": desp.mescladas, "retentativas": desp.retentativas}
+
+
+def executar(modo, args):
+    api = FakeBotAPI(latencia=args.latencia, taxa_5xx=args.taxa_5xx).iniciar()
+    try:
+        bot = Bot("123:bench", base_url=api.url_base, request=HTTPXRequest(connection_pool_size=args.envios))
+        rajada = [(1000 + c, f"🚨 Alerta {a} do vaso {c}") for a in range(args.alertas) for c in range(args.chats)]
+        inicio = time.perf_counter()
+        if modo == "serial":
+            resultado = asyncio.run(serial(bot, rajada))
+        else:
+            resultado = asyncio.run(despachante(bot, rajada, args.envios))
+        duracao = time.perf_counter() - inicio
+        estatisticas = api.estatisticas()
+    finally:
+        api.parar()
+    resultado.update({
+        "modo": modo,
+        "alertas": len(rajada),
+        "duracao_s": duracao,
+        "mensagens_entregues": estatisticas["mensagens"],
+        "respostas_429": estatisticas["429"],
+        "respostas_5xx": estatisticas["5xx"],
+    })
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara envio serial e DespachanteTelegram contra a API falsa")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--alertas", type=int, default=3, help="alertas por chat na rajada")
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--taxa-5xx", type=float, default=0.02)
+    parser.add_argument("--envios", type=int, default=8, help="envios simultâneos do despachante")
+    parser.add_argument("--saida", help="arquivo JSON com os resultados")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    resultados = []
+    for modo in ("serial", "despachante"):
+        resultado = executar(modo, args)
+        resultados.append(resultado)
+        print(f"{modo:>11} | {resultado['alertas']} alertas em {resultado['duracao_s']:.2f}s | "
+              f"{resultado['mensagens_entregues']} mensagens entregues | 429: {resultado['respostas_429']} | "
+              f"5xx: {resultado['respostas_5xx']} | falhas: {resultado['falhas']}", flush=True)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from fake_bot_api import FakeBotAPI
+from fila_telegram import FilaTelegram, POLITICAS, POLITICA_DISCO
+from despachante_telegram import DespachanteTelegram
+
+# --- BENCHMARK DA FILA DO TELEGRAM DURANTE UMA QUEDA DA API ---
+# A API falsa responde 5xx a tudo enquanto uma thread enfileira uma rajada de
+# alertas (C chats); depois a API volta e a fila é esvaziada. Para cada
+# política da FilaTelegram mede o pico de memória alocada (tracemalloc) durante
+# a queda, o que foi descartado, mesclado ou transbordado para o disco, e
+# quantos alertas chegaram ao Telegram depois da volta. "ilimitada" é o
+# comportamento anterior: fila e despachante sem limite.
+#
+#   python benchmarks/bench_fila_telegram.py --alertas 50000 --chats 1000 --limite 10000
+
+
+async def cenario(politica, args, api):
+    bot = Bot("123:bench", base_url=api.url_base, request=HTTPXRequest(connection_pool_size=args.envios))
+    diretorio = tempfile.mkdtemp(prefix="bench-fila-") if politica == POLITICA_DISCO else None
+    if politica == "ilimitada":
+        fila = FilaTelegram(limite=args.alertas + 1)
+        max_pendentes = None
+    else:
+        fila = FilaTelegram(limite=args.limite, politica=politica, diretorio_transbordo=diretorio)
+        max_pendentes = args.max_pendentes
+    fila.vincular_loop()
+    concluidas = [0]
+
+    def ao_concluir(chat_id, quantidade):
+        concluidas[0] += quantidade
+
+    despachante = DespachanteTelegram(bot, fila, envios_simultaneos=args.envios, taxa_global=1000.0, rajada_global=100,
+                                      taxa_por_chat=1000.0, rajada_por_chat=10, backoff_base=0.2, backoff_max=1.0,
+                                      timeout_encerramento=120, ao_concluir=ao_concluir, max_pendentes=max_pendentes)
+    tarefa = asyncio.create_task(despachante.executar())
+
+    api.taxa_5xx = 1.0
+    tracemalloc.start()
+    produtor = threading.Thread(target=lambda: [
+        fila.put((1000 + indice % args.chats, f"🚨 Atenção! Sua planta {indice % args.chats} precisa ser regada. Umidade atual: {indice % 40}%."))
+        for indice in range(args.alertas)])
+    inicio = time.perf_counter()
+    produtor.start()
+    while produtor.is_alive():
+        await asyncio.sleep(0.05)
+    enfileirar = time.perf_counter() - inicio
+    pressao = fila.pressao()
+    await asyncio.sleep(args.queda)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    api.taxa_5xx = 0.0
+    inicio = time.perf_counter()
+    while fila.qsize() or despachante.pendentes():
+        await asyncio.sleep(0.05)
+    esvaziar = time.perf_counter() - inicio
+    fila.put((None, None))
+    await tarefa
+    fila.fechar()
+    if diretorio:
+        shutil.rmtree(diretorio, ignore_errors=True)
+    return {
+        "pico_mb": pico / 1e6, "enfileirar_s": enfileirar, "esvaziar_s": esvaziar, "pressao": pressao,
+        "descartadas": fila.descartadas, "mescladas": fila.mescladas + despachante.mescladas,
+        "disco": fila.transbordadas, "concluidas": concluidas[0], "falhas": despachante.falhas,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória e perdas da fila do Telegram durante uma queda da API")
+    parser.add_argument("--alertas", type=int, default=50000)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--limite", type=int, default=10000, help="mensagens em memória na FilaTelegram")
+    parser.add_argument("--max-pendentes", type=int, default=1000, help="mensagens com o despachante")
+    parser.add_argument("--queda", type=float, default=2.0, help="segundos de queda depois da rajada")
+    parser.add_argument("--envios", type=int, default=8)
+    parser.add_argument("--politicas", default=",".join(("ilimitada",) + POLITICAS))
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    for politica in args.politicas.split(","):
+        api = FakeBotAPI(aplicar_limites=False).iniciar()
+        try:
+            r = asyncio.run(cenario(politica, args, api))
+            entregues = api.estatisticas()["mensagens"]
+        finally:
+            api.parar()
+        print(f"{politica:18s} pico {r['pico_mb']:7.1f} MB | pressão {r['pressao']:5.2f} | enfileirar {r['enfileirar_s']:.2f}s | "
+              f"esvaziar {r['esvaziar_s']:.2f}s | descartadas {r['descartadas']} | mescladas {r['mescladas']} | "
+              f"disco {r['disco']} | concluídas {r['concluidas']} | falhas {r['falhas']} | mensagens entregues {entregues}")
+
+
+if __name__ == "__main__":
+    main()
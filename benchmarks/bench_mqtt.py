@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from util_bench import ConexaoHTTP, porta_livre, iniciar_servidor, encerrar, resumo_latencias
+from fake_bot_api import FakeBotAPI
+from broker_mqtt_local import BrokerMQTTLocal, ClienteMQTT
+
+# --- BENCHMARK DO GATEWAY MQTT x POST POR LEITURA ---
+# Sobe o broker local e o servidor ASGI com o gateway MQTT ligado e simula N
+# vasos ao mesmo tempo, cada um enviando R leituras que alternam entre seco e
+# encharcado (cada leitura muda a instrução do LCD):
+#   - mqtt: conexão persistente por vaso; publica a leitura em
+#     vaso/<id>/leituras e espera a instrução nova em vaso/<id>/instrucao;
+#   - http: como o firmware atual, uma conexão nova para o POST
+#     /update_sensor_data e outra para o GET /get_instruction.
+# Mede a latência da leitura até a instrução nova (p50/p95/p99), a vazão e o
+# tempo de CPU do servidor por leitura (de /proc, só no Linux).
+#
+#   python benchmarks/bench_mqtt.py --vasos 500 --leituras 20
+
+TOKEN_BENCH = "123:bench"
+PREFIXO = "vaso"
+TIMEOUT_INSTRUCAO = 10.0
+
+
+def cpu_processo(pid):
+    # utime + stime em segundos; None fora do Linux
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def leitura(indice):
+    return {"umidade": 5.0 if indice % 2 == 0 else 95.0, "luminosidade": 500.0}
+
+
+async def preparar_vasos(porta, vasos, planta):
+    # Planta e uma primeira leitura: cada vaso já tem instrução (retida no broker) antes da medição
+    conexao = ConexaoHTTP("127.0.0.1", porta)
+    for vaso_id in vasos:
+        await conexao.requisitar("POST", "/set_plant", {"vaso_id": vaso_id, "planta": planta, "chat_id": 1000})
+        await conexao.requisitar("POST", "/update_sensor_data", dict(leitura(1), vaso_id=vaso_id))
+    await conexao.fechar()
+
+
+async def vaso_mqtt(porta_broker, vaso_id, leituras, latencias, falhas):
+    cliente = await ClienteMQTT(f"esp32-{vaso_id}").conectar("127.0.0.1", porta_broker)
+    await cliente.assinar(f"{PREFIXO}/{vaso_id}/instrucao")
+    # A instrução retida chega logo depois da assinatura
+    try:
+        await asyncio.wait_for(cliente.mensagens.get(), TIMEOUT_INSTRUCAO)
+    except asyncio.TimeoutError:
+        falhas.append(vaso_id)
+    topico = f"{PREFIXO}/{vaso_id}/leituras"
+    for indice in range(leituras):
+        inicio = time.perf_counter()
+        await cliente.publicar(topico, json.dumps(leitura(indice)).encode("utf-8"))
+        try:
+            await asyncio.wait_for(cliente.mensagens.get(), TIMEOUT_INSTRUCAO)
+            latencias.append(time.perf_counter() - inicio)
+        except asyncio.TimeoutError:
+            falhas.append(vaso_id)
+    await cliente.fechar()
+
+
+async def vaso_http(porta, vaso_id, leituras, latencias, falhas):
+    for indice in range(leituras):
+        inicio = time.perf_counter()
+        try:
+            for metodo, caminho, corpo in (("POST", "/update_sensor_data", dict(leitura(indice), vaso_id=vaso_id)),
+                                           ("GET", f"/get_instruction?vaso_id={vaso_id}", b"")):
+                conexao = ConexaoHTTP("127.0.0.1", porta)
+                status = (await conexao.requisitar(metodo, caminho, corpo))[0]
+                await conexao.fechar()
+                if status != 200:
+                    raise ConnectionError(f"status {status}")
+            latencias.append(time.perf_counter() - inicio)
+        except (ConnectionError, OSError):
+            falhas.append(vaso_id)
+
+
+async def rodada(modo, args, porta, porta_broker, pid):
+    vasos = [f"{modo}{numero}" for numero in range(args.vasos)]
+    await preparar_vasos(porta, vasos, args.planta)
+    await asyncio.sleep(0.5)
+    latencias = []
+    falhas = []
+    cpu_inicio = cpu_processo(pid)
+    inicio = time.perf_counter()
+    if modo == "mqtt":
+        tarefas = [vaso_mqtt(porta_broker, vaso_id, args.leituras, latencias, falhas) for vaso_id in vasos]
+    else:
+        tarefas = [vaso_http(porta, vaso_id, args.leituras, latencias, falhas) for vaso_id in vasos]
+    await asyncio.gather(*tarefas)
+    duracao = time.perf_counter() - inicio
+    cpu_fim = cpu_processo(pid)
+    resultado = resumo_latencias(latencias, duracao)
+    resultado["falhas"] = len(falhas)
+    resultado["cpu_us"] = None if cpu_inicio is None else (cpu_fim - cpu_inicio) / max(1, len(latencias)) * 1e6
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o gateway MQTT com um POST HTTP por leitura")
+    parser.add_argument("--vasos", type=int, default=500)
+    parser.add_argument("--leituras", type=int, default=20, help="leituras por vaso")
+    parser.add_argument("--planta", default="Cacto")
+    args = parser.parse_args()
+
+    broker = BrokerMQTTLocal().iniciar()
+    api = FakeBotAPI(aplicar_limites=False).iniciar()
+    porta = porta_livre()
+    ambiente = {"VASO_MQTT_BROKER": "127.0.0.1", "VASO_MQTT_PORTA": str(broker.porta), "VASO_MQTT_PREFIXO": PREFIXO,
+                "TELEGRAM_API_URL": api.url_base, "TELEGRAM_BOT_TOKEN": TOKEN_BENCH}
+    processo = iniciar_servidor("asgi", porta, ambiente)
+    try:
+        limite = time.monotonic() + 15
+        while not broker.assinado(f"{PREFIXO}/+/leituras"):
+            if time.monotonic() > limite:
+                raise RuntimeError("O gateway MQTT do servidor não assinou as leituras")
+            time.sleep(0.05)
+        for modo in ("mqtt", "http"):
+            r = asyncio.run(rodada(modo, args, porta, broker.porta, processo.pid))
+            cpu = "n/d" if r["cpu_us"] is None else f"{r['cpu_us']:.0f} us"
+            print(f"{modo:4s} {args.vasos} vasos: p50 {r['p50_ms']:.1f} ms | p95 {r['p95_ms']:.1f} ms | p99 {r['p99_ms']:.1f} ms | "
+                  f"{r['req_por_s']:.0f} leituras/s | CPU do servidor {cpu}/leitura | falhas {r['falhas']}")
+    finally:
+        encerrar(processo)
+        api.parar()
+        broker.parar()
+
+
+if __name__ == "__main__":
+    main()
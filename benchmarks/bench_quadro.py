@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util_bench import ConexaoHTTP, porta_livre, iniciar_servidor, encerrar, resumo_latencias
+from quadro_binario import ler_quadro, montar_quadro, ler_resposta, TIPO_CONTEUDO_QUADRO
+
+# --- BENCHMARK: QUADRO BINÁRIO x JSON EM /update_sensor_data ---
+# 1. Custo de interpretar o corpo (uma leitura e um lote de amostras), em processo.
+# 2. Bytes no fio: corpo da requisição e da resposta em cada formato.
+# 3. Com --http, vazão de ponta a ponta contra o servidor ASGI.
+#
+#   python benchmarks/bench_quadro.py --http
+
+VASO_ID = "padrao"
+
+
+def corpo_json(amostras):
+    if len(amostras) == 1:
+        _, umidade, luminosidade = amostras[0]
+        return json.dumps({"vaso_id": VASO_ID, "umidade": umidade, "luminosidade": luminosidade}).encode("utf-8")
+    return json.dumps({"vaso_id": VASO_ID, "leituras": [
+        {"ts": ts, "umidade": umidade, "luminosidade": luminosidade} for ts, umidade, luminosidade in amostras
+    ]}).encode("utf-8")
+
+
+# O que processar_leitura/processar_lote fazem com o JSON antes da decisão
+def interpretar_json(corpo):
+    dados = json.loads(corpo)
+    if "leituras" not in dados:
+        return dados.get("vaso_id"), [(0.0, float(dados["umidade"]), float(dados["luminosidade"]))]
+    return dados.get("vaso_id"), [(float(l["ts"]), float(l["umidade"]), float(l["luminosidade"])) for l in dados["leituras"]]
+
+
+def interpretar_quadro(corpo):
+    quadro = ler_quadro(corpo, 10000)
+    if quadro.quantidade == 1:
+        return quadro.vaso_id, quadro.amostra()
+    return quadro.vaso_id, quadro.colunas(time.time())
+
+
+def medir_interpretacao(amostras, repeticoes):
+    corpos = {"json": corpo_json(amostras), "quadro": montar_quadro(VASO_ID, amostras)}
+    funcoes = {"json": interpretar_json, "quadro": interpretar_quadro}
+    resultado = {}
+    for formato, corpo in corpos.items():
+        funcao = funcoes[formato]
+        melhor = min(timeit.repeat(lambda: funcao(corpo), number=repeticoes, repeat=5)) / repeticoes
+        resultado[formato] = {"bytes": len(corpo), "us_por_corpo": melhor * 1e6, "us_por_amostra": melhor * 1e6 / len(amostras)}
+    return resultado
+
+
+async def medir_http(porta, formato, conexoes, duracao):
+    amostras = [(0, 55.5, 420.0)]
+    corpo = montar_quadro(VASO_ID, amostras) if formato == "quadro" else corpo_json(amostras)
+    tipo = TIPO_CONTEUDO_QUADRO if formato == "quadro" else "application/json"
+    latencias = []
+    tamanhos = []
+
+    async def cliente(indice):
+        conexao = ConexaoHTTP("127.0.0.1", porta)
+        limite = time.monotonic() + duracao
+        try:
+            while time.monotonic() < limite:
+                inicio = time.perf_counter()
+                status, _, dados = await conexao.requisitar("POST", "/update_sensor_data", corpo, tipo=tipo)
+                latencias.append(time.perf_counter() - inicio)
+                if not tamanhos:
+                    tamanhos.append(len(dados))
+                    if formato == "quadro":
+                        tamanhos.append(ler_resposta(dados)[3])
+        finally:
+            await conexao.fechar()
+
+    inicio = time.monotonic()
+    await asyncio.gather(*(cliente(i) for i in range(conexoes)))
+    resultado = resumo_latencias(latencias, time.monotonic() - inicio)
+    resultado["bytes_resposta"] = tamanhos[0] if tamanhos else 0
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o quadro binário com o JSON em /update_sensor_data")
+    parser.add_argument("--amostras-lote", type=int, default=100, help="amostras no corpo com várias leituras")
+    parser.add_argument("--repeticoes", type=int, default=2000)
+    parser.add_argument("--http", action="store_true", help="mede também a vazão contra o servidor ASGI")
+    parser.add_argument("--conexoes", type=int, default=32)
+    parser.add_argument("--duracao", type=float, default=5.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    agora = int(time.time())
+    cenarios = {
+        "1 leitura": [(0, 55.5, 420.0)],
+        f"{args.amostras_lote} amostras": [(agora - 5 * i, 40 + (i % 30) * 0.25, 300 + i % 200) for i in range(args.amostras_lote)],
+    }
+    for nome, amostras in cenarios.items():
+        resultado = medir_interpretacao(amostras, max(1, args.repeticoes // len(amostras)))
+        j, q = resultado["json"], resultado["quadro"]
+        print(f"{nome}: JSON {j['bytes']} B, {j['us_por_corpo']:.2f} us ({j['us_por_amostra']:.3f} us/amostra) | "
+              f"quadro {q['bytes']} B, {q['us_por_corpo']:.2f} us ({q['us_por_amostra']:.3f} us/amostra) | "
+              f"{j['bytes'] / q['bytes']:.1f}x menos bytes, {j['us_por_corpo'] / q['us_por_corpo']:.1f}x mais rápido")
+
+    if not args.http:
+        return
+    porta = porta_livre()
+    processo = iniciar_servidor("asgi", porta)
+    try:
+        for formato in ("json", "quadro"):
+            resultado = asyncio.run(medir_http(porta, formato, args.conexoes, args.duracao))
+            print(f"HTTP {formato:6s}: {resultado['req_por_s']:.0f} req/s | p50 {resultado['p50_ms']:.2f} ms | "
+                  f"p99 {resultado['p99_ms']:.2f} ms | resposta {resultado['bytes_resposta']} B")
+    finally:
+        encerrar(processo)
+
+
+if __name__ == "__main__":
+    main()
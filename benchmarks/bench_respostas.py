@@ -0,0 +1,93 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import timeit
+
+os.environ.setdefault("VASO_DB_PATH", "")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import servico_vaso
+
+# --- BENCHMARK DAS RESPOSTAS PRÉ-SERIALIZADAS ---
+# Custo por chamada de /get_instruction, /status e /get_full_status na camada
+# de serviço, incluindo a serialização do corpo em JSON (que antes ficava com o
+# servidor HTTP): servido do cache contra remontado a cada chamada (o caminho
+# anterior, com o lock e o json.dumps). Depois, leitores em threads enquanto
+# outra thread registra leituras do mesmo vaso.
+#
+#   python benchmarks/bench_respostas.py --repeticoes 20000 --leitores 4
+
+
+def preparar_vaso():
+    planta = servico_vaso.catalogo.nomes[0]
+    servico_vaso.definir_planta({"vaso_id": "bench", "planta": planta, "chat_id": 1})
+    for passo in range(120):
+        servico_vaso.processar_leitura({"vaso_id": "bench", "umidade": 40 + passo % 20, "luminosidade": 500}, "127.0.0.1")
+    return servico_vaso.registro_vasos.obter("bench")
+
+
+def corpo_bytes(resultado):
+    corpo = resultado[0]
+    return corpo if isinstance(corpo, bytes) else json.dumps(corpo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede as rotas de leitura com e sem o cache de respostas")
+    parser.add_argument("--repeticoes", type=int, default=20000)
+    parser.add_argument("--leitores", type=int, default=4, help="threads lendo durante a rodada com escritas")
+    parser.add_argument("--segundos", type=float, default=2.0)
+    parser.add_argument("--escritas-por-s", type=float, default=20.0)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    vaso = preparar_vaso()
+    argumentos = {"vaso_id": "bench"}
+    rotas = {
+        "/get_instruction": lambda: servico_vaso.obter_instrucao(argumentos),
+        "/status": lambda: servico_vaso.obter_status(argumentos),
+        "/get_full_status": lambda: servico_vaso.obter_status_completo(argumentos),
+    }
+    for rota, chamar in rotas.items():
+        em_cache = min(timeit.repeat(lambda: corpo_bytes(chamar()), number=args.repeticoes, repeat=5)) / args.repeticoes
+
+        def sem_cache():
+            vaso.respostas.clear()
+            return corpo_bytes(chamar())
+
+        remontada = min(timeit.repeat(sem_cache, number=args.repeticoes, repeat=5)) / args.repeticoes
+        print(f"{rota:17s} cache {em_cache * 1e6:6.2f} us | remontada {remontada * 1e6:6.2f} us | {remontada / em_cache:.1f}x")
+
+    # Leitores x escritor no mesmo vaso
+    parar = threading.Event()
+    contagens = []
+
+    def leitor():
+        lidas = 0
+        while not parar.is_set():
+            corpo_bytes(servico_vaso.obter_status_completo(argumentos))
+            lidas += 1
+        contagens.append(lidas)
+
+    def escritor():
+        passo = 0
+        while not parar.is_set():
+            servico_vaso.processar_leitura({"vaso_id": "bench", "umidade": 40 + passo % 20, "luminosidade": 500}, "127.0.0.1")
+            passo += 1
+            time.sleep(1 / args.escritas_por_s)
+
+    threads = [threading.Thread(target=leitor) for _ in range(args.leitores)] + [threading.Thread(target=escritor)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.segundos)
+    parar.set()
+    for thread in threads:
+        thread.join()
+    print(f"{args.leitores} leitores com {args.escritas_por_s:g} escritas/s: {sum(contagens) / args.segundos:.0f} leituras/s de /get_full_status")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from historico import HistoricoVaso
+from tendencias import TendenciasVaso, recalcular_frota
+
+# --- BENCHMARK: TENDÊNCIAS POR VASO ---
+# 1. Custo por leitura de TendenciasVaso.adicionar e de montar o resumo.
+# 2. Reconstrução depois de restaurar o banco: recalcular_frota (vetorizado
+#    sobre os agregados de minuto da frota inteira) contra repassar os mesmos
+#    agregados vaso a vaso por TendenciasVaso.adicionar.
+#
+#   python benchmarks/bench_tendencias.py --vasos 1000 --horas 6
+
+
+def montar_frota(vasos, horas, intervalo):
+    historicos = []
+    fim = time.time()
+    leituras = int(horas * 3600 / intervalo)
+    for indice in range(vasos):
+        historico = HistoricoVaso()
+        queda = (1 + indice % 5) / 3600
+        for passo in range(leituras):
+            ts = fim - (leituras - passo) * intervalo
+            historico.adicionar(ts, 80 - passo * intervalo * queda, 300 + passo % 200)
+        historicos.append(historico)
+    return historicos
+
+
+def repassar_vaso_a_vaso(historicos):
+    resultado = []
+    for historico in historicos:
+        tendencias = TendenciasVaso()
+        for minuto in historico.niveis["minuto"].ordenados():
+            tendencias.adicionar(float(minuto["ts"]), float(minuto["umidade_media"]), float(minuto["luminosidade_media"]))
+        resultado.append(tendencias)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o custo das tendências por vaso")
+    parser.add_argument("--vasos", type=int, default=500)
+    parser.add_argument("--horas", type=float, default=6.0, help="histórico por vaso (os agregados de minuto guardam 6 h)")
+    parser.add_argument("--intervalo", type=float, default=30.0, help="segundos entre leituras ao montar a frota")
+    parser.add_argument("--repeticoes", type=int, default=20000)
+    args = parser.parse_args()
+
+    tendencias = TendenciasVaso()
+    inicio = time.time() - 3600
+    for passo in range(720):
+        tendencias.adicionar(inicio + 5 * passo, 70 - passo * 0.01, 400.0)
+    relogio = [inicio + 3600]
+
+    def uma_leitura():
+        relogio[0] += 5
+        tendencias.adicionar(relogio[0], 60.0, 400.0)
+
+    por_leitura = min(timeit.repeat(uma_leitura, number=args.repeticoes, repeat=5)) / args.repeticoes
+    por_resumo = min(timeit.repeat(lambda: tendencias.resumo(40.0), number=args.repeticoes // 10, repeat=5)) / (args.repeticoes // 10)
+    print(f"adicionar: {por_leitura * 1e6:.2f} us/leitura | resumo: {por_resumo * 1e6:.2f} us")
+
+    print(f"Montando {args.vasos} vasos com {args.horas:g} h de histórico...")
+    historicos = montar_frota(args.vasos, args.horas, args.intervalo)
+
+    inicio = time.perf_counter()
+    recalcular_frota(historicos)
+    vetorizado = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    repassar_vaso_a_vaso(historicos)
+    repasse = time.perf_counter() - inicio
+
+    print(f"recalcular_frota: {vetorizado * 1000:.1f} ms | vaso a vaso: {repasse * 1000:.1f} ms | "
+          f"{repasse / vetorizado:.1f}x mais rápido")
+
+
+if __name__ == "__main__":
+    main()
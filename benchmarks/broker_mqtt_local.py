@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+import logging
+import struct
+import threading
+
+# --- BROKER MQTT LOCAL ---
+# Um broker MQTT 3.1.1 mínimo, em memória, para testar o gateway MQTT
+# (gateway_mqtt.py) e rodar o benchmark sem instalar um broker de verdade:
+# CONNECT, PUBLISH com QoS 0 e 1, SUBSCRIBE/UNSUBSCRIBE com os curingas + e #,
+# mensagens retidas, PINGREQ e DISCONNECT. Sem sessões persistentes, will,
+# QoS 2 ou autenticação (usuário e senha são aceitos e ignorados). A entrega
+# com QoS 1 para os assinantes não espera o PUBACK.
+#
+#   python benchmarks/broker_mqtt_local.py --porta 1883
+#
+# Também traz ClienteMQTT, um cliente asyncio do mesmo subconjunto: o
+# benchmark simula milhares de dispositivos com ele, sem uma thread por
+# conexão como o paho.
+
+logger = logging.getLogger(__name__)
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+# --- CODIFICAÇÃO DOS PACOTES ---
+
+def pacote(tipo, flags, corpo):
+    tamanho = len(corpo)
+    cabecalho = bytearray([tipo << 4 | flags])
+    while True:
+        byte = tamanho % 128
+        tamanho //= 128
+        cabecalho.append(byte | 0x80 if tamanho else byte)
+        if not tamanho:
+            return bytes(cabecalho) + corpo
+
+def texto(valor):
+    dados = valor.encode("utf-8")
+    return struct.pack("!H", len(dados)) + dados
+
+def ler_texto(dados, posicao):
+    tamanho, = struct.unpack_from("!H", dados, posicao)
+    posicao += 2
+    return dados[posicao:posicao + tamanho].decode("utf-8"), posicao + tamanho
+
+async def ler_pacote(leitor):
+    primeiro = (await leitor.readexactly(1))[0]
+    tamanho = 0
+    multiplicador = 1
+    while True:
+        byte = (await leitor.readexactly(1))[0]
+        tamanho += (byte & 0x7F) * multiplicador
+        if not byte & 0x80:
+            break
+        multiplicador *= 128
+    corpo = await leitor.readexactly(tamanho) if tamanho else b""
+    return primeiro >> 4, primeiro & 0x0F, corpo
+
+def montar_publish(topico, payload, qos=0, retain=False, id_pacote=0):
+    corpo = texto(topico) + (struct.pack("!H", id_pacote) if qos else b"") + payload
+    return pacote(PUBLISH, qos << 1 | int(retain), corpo)
+
+def ler_publish(flags, corpo):
+    qos = flags >> 1 & 0x03
+    topico, posicao = ler_texto(corpo, 0)
+    id_pacote = 0
+    if qos:
+        id_pacote, = struct.unpack_from("!H", corpo, posicao)
+        posicao += 2
+    return topico, corpo[posicao:], qos, bool(flags & 0x01), id_pacote
+
+def filtro_casa(filtro, topico):
+    partes_filtro = filtro.split("/")
+    partes_topico = topico.split("/")
+    for posicao, parte in enumerate(partes_filtro):
+        if parte == "#":
+            return True
+        if posicao >= len(partes_topico) or (parte != "+" and parte != partes_topico[posicao]):
+            return False
+    return len(partes_filtro) == len(partes_topico)
+
+
+# --- BROKER ---
+
+class Conexao:
+    __slots__ = ('escritor', 'cliente_id', 'filtros', 'proximo_id')
+
+    def __init__(self, escritor):
+        self.escritor = escritor
+        self.cliente_id = None
+        self.filtros = {}  # filtro -> qos concedido
+        self.proximo_id = 0
+
+    def enviar(self, topico, payload, qos, retain=False):
+        id_pacote = 0
+        if qos:
+            self.proximo_id = self.proximo_id % 65535 + 1
+            id_pacote = self.proximo_id
+        self.escritor.write(montar_publish(topico, payload, qos, retain, id_pacote))
+
+
+class BrokerMQTTLocal:
+    def __init__(self, host="127.0.0.1", porta=0):
+        self.host = host
+        self.porta = porta
+        self._exatas = {}     # tópico sem curinga -> {conexão: qos}
+        self._curingas = {}   # filtro com + ou # -> {conexão: qos}
+        self._retidas = {}    # tópico -> (payload, qos)
+        self._clientes = {}   # cliente_id -> conexão
+        self._loop = None
+        self._servidor = None
+        self._thread = None
+        self.conexoes = 0
+        self.publicacoes = 0
+        self.entregues = 0
+
+    # --- Início e fim (o broker roda em uma thread com o próprio event loop) ---
+
+    def iniciar(self):
+        pronto = threading.Event()
+
+        def executar():
+            self._loop = asyncio.new_event_loop()
+            self._servidor = self._loop.run_until_complete(
+                asyncio.start_server(self._atender, self.host, self.porta, backlog=4096))
+            self.porta = self._servidor.sockets[0].getsockname()[1]
+            pronto.set()
+            self._loop.run_forever()
+            self._servidor.close()
+            self._loop.run_until_complete(self._servidor.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=executar, name="broker-mqtt-local", daemon=True)
+        self._thread.start()
+        pronto.wait()
+        return self
+
+    def parar(self):
+        def fechar():
+            for conexao in list(self._clientes.values()):
+                conexao.escritor.close()
+            self._loop.stop()
+        self._loop.call_soon_threadsafe(fechar)
+        self._thread.join(5)
+
+    def estatisticas(self):
+        return {"conexoes": self.conexoes, "publicacoes": self.publicacoes, "entregues": self.entregues,
+                "retidas": len(self._retidas)}
+
+    def assinado(self, filtro):
+        return bool(self._exatas.get(filtro) or self._curingas.get(filtro))
+
+    def retida(self, topico):
+        mensagem = self._retidas.get(topico)
+        return None if mensagem is None else mensagem[0]
+
+    # --- Conexões ---
+
+    async def _atender(self, leitor, escritor):
+        conexao = Conexao(escritor)
+        try:
+            tipo, _, corpo = await ler_pacote(leitor)
+            if tipo != CONNECT:
+                return
+            self._conectar(conexao, corpo)
+            while True:
+                tipo, flags, corpo = await ler_pacote(leitor)
+                if tipo == PUBLISH:
+                    topico, payload, qos, retain, id_pacote = ler_publish(flags, corpo)
+                    if qos:
+                        escritor.write(pacote(PUBACK, 0, struct.pack("!H", id_pacote)))
+                    self._publicar(topico, payload, qos, retain)
+                elif tipo == SUBSCRIBE:
+                    self._assinar(conexao, corpo)
+                elif tipo == UNSUBSCRIBE:
+                    self._cancelar(conexao, corpo)
+                elif tipo == PINGREQ:
+                    escritor.write(pacote(PINGRESP, 0, b""))
+                elif tipo == DISCONNECT:
+                    return
+                # PUBACK dos assinantes: nada a fazer
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, struct.error):
+            pass
+        finally:
+            self._desconectar(conexao)
+            escritor.close()
+
+    def _conectar(self, conexao, corpo):
+        _, posicao = ler_texto(corpo, 0)  # "MQTT"
+        posicao += 4  # nível, flags e keepalive
+        conexao.cliente_id, _ = ler_texto(corpo, posicao)
+        anterior = self._clientes.get(conexao.cliente_id)
+        if anterior is not None:
+            # Mesmo cliente_id: a conexão antiga é derrubada, como manda a especificação
+            anterior.escritor.close()
+            self._desconectar(anterior)
+        self._clientes[conexao.cliente_id] = conexao
+        self.conexoes += 1
+        conexao.escritor.write(pacote(CONNACK, 0, b"\x00\x00"))
+
+    def _desconectar(self, conexao):
+        for filtro in conexao.filtros:
+            indice = self._curingas if "+" in filtro or "#" in filtro else self._exatas
+            assinantes = indice.get(filtro)
+            if assinantes is not None:
+                assinantes.pop(conexao, None)
+                if not assinantes:
+                    del indice[filtro]
+        conexao.filtros = {}
+        if self._clientes.get(conexao.cliente_id) is conexao:
+            del self._clientes[conexao.cliente_id]
+
+    def _assinar(self, conexao, corpo):
+        id_pacote, = struct.unpack_from("!H", corpo, 0)
+        posicao = 2
+        concedidos = bytearray()
+        novos = []
+        while posicao < len(corpo):
+            filtro, posicao = ler_texto(corpo, posicao)
+            qos = min(corpo[posicao], 1)
+            posicao += 1
+            indice = self._curingas if "+" in filtro or "#" in filtro else self._exatas
+            indice.setdefault(filtro, {})[conexao] = qos
+            conexao.filtros[filtro] = qos
+            concedidos.append(qos)
+            novos.append((filtro, qos))
+        conexao.escritor.write(pacote(SUBACK, 0, struct.pack("!H", id_pacote) + bytes(concedidos)))
+        # Mensagens retidas que casam com os novos filtros
+        for filtro, qos in novos:
+            if filtro in self._retidas:
+                payload, qos_retida = self._retidas[filtro]
+                conexao.enviar(filtro, payload, min(qos, qos_retida), retain=True)
+            elif "+" in filtro or "#" in filtro:
+                for topico, (payload, qos_retida) in self._retidas.items():
+                    if filtro_casa(filtro, topico):
+                        conexao.enviar(topico, payload, min(qos, qos_retida), retain=True)
+
+    def _cancelar(self, conexao, corpo):
+        id_pacote, = struct.unpack_from("!H", corpo, 0)
+        posicao = 2
+        while posicao < len(corpo):
+            filtro, posicao = ler_texto(corpo, posicao)
+            indice = self._curingas if "+" in filtro or "#" in filtro else self._exatas
+            assinantes = indice.get(filtro)
+            if assinantes is not None:
+                assinantes.pop(conexao, None)
+                if not assinantes:
+                    del indice[filtro]
+            conexao.filtros.pop(filtro, None)
+        conexao.escritor.write(pacote(UNSUBACK, 0, struct.pack("!H", id_pacote)))
+
+    def _publicar(self, topico, payload, qos, retain):
+        self.publicacoes += 1
+        if retain:
+            # Payload vazio apaga a mensagem retida
+            if payload:
+                self._retidas[topico] = (payload, qos)
+            else:
+                self._retidas.pop(topico, None)
+        for conexao, qos_assinatura in self._exatas.get(topico, {}).items():
+            conexao.enviar(topico, payload, min(qos, qos_assinatura))
+            self.entregues += 1
+        for filtro, assinantes in self._curingas.items():
+            if filtro_casa(filtro, topico):
+                for conexao, qos_assinatura in assinantes.items():
+                    conexao.enviar(topico, payload, min(qos, qos_assinatura))
+                    self.entregues += 1
+
+
+# --- CLIENTE ASYNCIO ---
+# Só o necessário para simular dispositivos: conecta, assina, publica e entrega
+# as mensagens recebidas em uma asyncio.Queue de (tópico, payload, retain).
+
+class ClienteMQTT:
+    def __init__(self, cliente_id, keepalive=60):
+        self.cliente_id = cliente_id
+        self.keepalive = keepalive
+        self.mensagens = asyncio.Queue()
+        self._leitor = None
+        self._escritor = None
+        self._tarefa = None
+        self._proximo_id = 0
+        self._respostas = {}  # id do pacote -> future do SUBACK/PUBACK
+
+    async def conectar(self, host, porta):
+        self._leitor, self._escritor = await asyncio.open_connection(host, porta)
+        corpo = texto("MQTT") + bytes([4, 0x02]) + struct.pack("!H", self.keepalive) + texto(self.cliente_id)
+        self._escritor.write(pacote(CONNECT, 0, corpo))
+        tipo, _, resposta = await ler_pacote(self._leitor)
+        if tipo != CONNACK or resposta[1] != 0:
+            raise ConnectionError(f"Broker recusou a conexão de {self.cliente_id}")
+        self._tarefa = asyncio.create_task(self._receber())
+        return self
+
+    def _novo_id(self):
+        self._proximo_id = self._proximo_id % 65535 + 1
+        futuro = asyncio.get_running_loop().create_future()
+        self._respostas[self._proximo_id] = futuro
+        return self._proximo_id, futuro
+
+    async def assinar(self, filtro, qos=1):
+        id_pacote, futuro = self._novo_id()
+        self._escritor.write(pacote(SUBSCRIBE, 0x02, struct.pack("!H", id_pacote) + texto(filtro) + bytes([qos])))
+        await futuro
+
+    async def publicar(self, topico, payload, qos=0, retain=False):
+        if not qos:
+            self._escritor.write(montar_publish(topico, payload, 0, retain))
+            return
+        id_pacote, futuro = self._novo_id()
+        self._escritor.write(montar_publish(topico, payload, qos, retain, id_pacote))
+        await futuro
+
+    async def _receber(self):
+        try:
+            while True:
+                tipo, flags, corpo = await ler_pacote(self._leitor)
+                if tipo == PUBLISH:
+                    topico, payload, qos, retain, id_pacote = ler_publish(flags, corpo)
+                    if qos:
+                        self._escritor.write(pacote(PUBACK, 0, struct.pack("!H", id_pacote)))
+                    self.mensagens.put_nowait((topico, payload, retain))
+                elif tipo in (SUBACK, PUBACK):
+                    futuro = self._respostas.pop(struct.unpack_from("!H", corpo, 0)[0], None)
+                    if futuro is not None and not futuro.done():
+                        futuro.set_result(None)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def fechar(self):
+        if self._escritor is None:
+            return
+        try:
+            self._escritor.write(pacote(DISCONNECT, 0, b""))
+            self._escritor.close()
+            await self._escritor.wait_closed()
+        except ConnectionError:
+            pass
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broker MQTT mínimo, em memória, para testes locais")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=1883)
+    args = parser.parse_args()
+    broker = BrokerMQTTLocal(args.host, args.porta).iniciar()
+    print(f"Broker MQTT local em {args.host}:{broker.porta} (Ctrl+C para sair)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broker.parar()
+
+
+if __name__ == "__main__":
+    main()
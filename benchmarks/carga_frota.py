@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+from util_bench import SERVIDORES, ConexaoHTTP, porta_livre, iniciar_servidor, encerrar, resumo_latencias, percentil
+from fake_bot_api import FakeBotAPI
+
+# --- TESTE DE CARGA: FROTA DE ESP32 + USUÁRIOS DO BOT ---
+# Sobe o servidor (Flask ou ASGI) apontando o Telegram para a API falsa local e
+# simula, ao mesmo tempo:
+#   - N vasos virtuais no ritmo do firmware: POST /update_sensor_data seguido
+#     de GET /get_instruction a cada --intervalo-vaso segundos, com leituras em
+#     passeio aleatório (cruzam as faixas das plantas de vez em quando);
+#   - M usuários do bot: GET /get_full_status (com If-None-Match, como o bot) e,
+#     de vez em quando, POST /set_plant, que gera uma mensagem no Telegram.
+# Mede vazão e latência (p50/p95/p99) por rota, o atraso da fila do Telegram
+# (do /set_plant até a mensagem chegar à API falsa) e a memória (RSS) do
+# servidor ao longo do teste. O resultado sai em JSON e pode ser comparado com
+# um resultado anterior (--comparar) para detectar regressões.
+#
+# Uso: python benchmarks/carga_frota.py --modo asgi --vasos 500 --usuarios 50 --duracao 30 --saida resultado.json
+#      python benchmarks/carga_frota.py --modo asgi --comparar resultado.json
+
+TOKEN_BENCH = "123:bench"
+PLANTAS_PADRAO = ["Cacto", "Samambaia", "Hortelã", "Orquídea"]
+INTERVALO_AMOSTRA_MEMORIA = 0.5
+ESPERA_ESTAVEL = 3.0
+
+# Métricas comparadas com --comparar: (caminho no JSON, True se maior é melhor)
+METRICAS_REGRESSAO = (
+    (("total", "req_por_s"), True),
+    (("total", "p95_ms"), False),
+    (("total", "p99_ms"), False),
+    (("telegram", "atraso_p95_ms"), False),
+    (("memoria", "crescimento_mb"), False),
+)
+
+
+def rss_mb(pid):
+    # Memória residente do processo, lida de /proc (Linux); None em outros sistemas
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+async def amostrar_memoria(pid, amostras, parar):
+    while not parar.is_set():
+        valor = rss_mb(pid)
+        if valor is not None:
+            amostras.append((time.monotonic(), valor))
+        try:
+            await asyncio.wait_for(parar.wait(), INTERVALO_AMOSTRA_MEMORIA)
+        except asyncio.TimeoutError:
+            pass
+
+
+def registrar(latencias, rota, inicio):
+    latencias.setdefault(rota, []).append(time.perf_counter() - inicio)
+
+
+async def requisitar(conexao, metodo, caminho, corpo, latencias, erros, rota, cabecalhos=None):
+    inicio = time.perf_counter()
+    try:
+        status, cabecalhos_resposta, dados = await conexao.requisitar(metodo, caminho, corpo, cabecalhos=cabecalhos)
+    except ConnectionError as e:
+        erros.append((rota, str(e)))
+        return None, {}, b""
+    if status not in (200, 304):
+        erros.append((rota, status))
+    else:
+        registrar(latencias, rota, inicio)
+    return status, cabecalhos_resposta, dados
+
+
+async def vaso_virtual(conexao, vaso_id, args, limite, latencias, erros):
+    umidade = random.uniform(20, 80)
+    luminosidade = random.uniform(200, 800)
+    # Os vasos não começam todos juntos, como uma frota real
+    await asyncio.sleep(random.uniform(0, args.intervalo_vaso))
+    while time.monotonic() < limite:
+        inicio_ciclo = time.monotonic()
+        umidade = min(100.0, max(0.0, umidade + random.gauss(0, 3)))
+        luminosidade = min(1000.0, max(0.0, luminosidade + random.gauss(0, 40)))
+        leitura = {"vaso_id": vaso_id, "umidade": round(umidade), "luminosidade": round(luminosidade)}
+        await requisitar(conexao, "POST", "/update_sensor_data", leitura, latencias, erros, "/update_sensor_data")
+        await requisitar(conexao, "GET", f"/get_instruction?vaso_id={vaso_id}", b"", latencias, erros, "/get_instruction")
+        espera = args.intervalo_vaso - (time.monotonic() - inicio_ciclo)
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+async def usuario_virtual(conexao, chat_id, vaso_id, plantas, args, limite, latencias, erros, envios):
+    etag = None
+    await asyncio.sleep(random.uniform(0, args.intervalo_usuario))
+    while time.monotonic() < limite:
+        inicio_ciclo = time.monotonic()
+        if etag is None or random.random() < args.prob_troca:
+            corpo = {"planta": random.choice(plantas), "chat_id": chat_id, "vaso_id": vaso_id}
+            enviado_em = time.time()
+            status, _, _ = await requisitar(conexao, "POST", "/set_plant", corpo, latencias, erros, "/set_plant")
+            if status == 200:
+                envios.setdefault(chat_id, []).append(enviado_em)
+        cabecalhos = {"If-None-Match": etag} if etag else None
+        status, cabecalhos_resposta, _ = await requisitar(
+            conexao, "GET", f"/get_full_status?vaso_id={vaso_id}", b"", latencias, erros, "/get_full_status", cabecalhos)
+        if status == 200:
+            etag = cabecalhos_resposta.get("etag")
+        espera = args.intervalo_usuario - (time.monotonic() - inicio_ciclo)
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+async def buscar_plantas(porta):
+    conexao = ConexaoHTTP("127.0.0.1", porta)
+    try:
+        status, _, dados = await conexao.requisitar("GET", "/plantas")
+    finally:
+        await conexao.fechar()
+    if status != 200:
+        return PLANTAS_PADRAO
+    return [nome for nome in json.loads(dados)["plantas"] if nome != "Nenhuma"] or PLANTAS_PADRAO
+
+
+async def executar_carga(porta, pid, args):
+    plantas = await buscar_plantas(porta)
+    conexoes_vasos = [ConexaoHTTP("127.0.0.1", porta) for _ in range(args.vasos)]
+    conexoes_usuarios = [ConexaoHTTP("127.0.0.1", porta) for _ in range(args.usuarios)]
+    await asyncio.gather(*(conexao.abrir() for conexao in conexoes_vasos + conexoes_usuarios))
+
+    latencias = {}
+    erros = []
+    envios = {}
+    memoria = []
+    parar_memoria = asyncio.Event()
+    monitor = asyncio.create_task(amostrar_memoria(pid, memoria, parar_memoria))
+
+    inicio = time.monotonic()
+    limite = inicio + args.duracao
+    try:
+        await asyncio.gather(
+            *(vaso_virtual(conexao, f"frota-{i}", args, limite, latencias, erros)
+              for i, conexao in enumerate(conexoes_vasos)),
+            *(usuario_virtual(conexao, 500000 + i, f"frota-{i % max(args.vasos, 1)}", plantas, args, limite, latencias, erros, envios)
+              for i, conexao in enumerate(conexoes_usuarios)),
+        )
+    finally:
+        duracao = time.monotonic() - inicio
+        await asyncio.gather(*(conexao.fechar() for conexao in conexoes_vasos + conexoes_usuarios))
+    return latencias, erros, envios, memoria, duracao, parar_memoria, monitor
+
+
+def aguardar_telegram(api, timeout):
+    # Espera a fila do servidor esvaziar: nenhuma mensagem nova por
+    # ESPERA_ESTAVEL segundos seguidos (cobre uma pausa de 429 do despachante)
+    limite = time.monotonic() + timeout
+    ultimo_total = -1
+    estavel_desde = time.monotonic()
+    while time.monotonic() < limite:
+        total = len(api.mensagens)
+        if total != ultimo_total:
+            ultimo_total = total
+            estavel_desde = time.monotonic()
+        elif time.monotonic() - estavel_desde >= ESPERA_ESTAVEL:
+            return
+        time.sleep(0.2)
+
+
+def atrasos_telegram(envios, mensagens):
+    # Cada mensagem recebida pela API falsa cobre os /set_plant do mesmo chat
+    # enviados antes dela e ainda não cobertos (o despachante pode juntar vários
+    # numa mensagem só). O atraso conta a partir do mais antigo deles.
+    recebidas = {}
+    for recebida_em, chat_id, _ in mensagens:
+        recebidas.setdefault(chat_id, []).append(recebida_em)
+    atrasos = []
+    sem_entrega = 0
+    for chat_id, tempos_envio in envios.items():
+        pendentes = list(tempos_envio)
+        for recebida_em in sorted(recebidas.get(chat_id, [])):
+            cobertos = [t for t in pendentes if t <= recebida_em]
+            if cobertos:
+                atrasos.append(recebida_em - cobertos[0])
+                pendentes = pendentes[len(cobertos):]
+        sem_entrega += len(pendentes)
+    return sorted(atrasos), sem_entrega
+
+
+def montar_resultado(args, latencias, erros, envios, memoria, duracao, api):
+    todas = [latencia for valores in latencias.values() for latencia in valores]
+    rotas = {rota: resumo_latencias(valores, duracao) for rota, valores in sorted(latencias.items())}
+    atrasos, sem_entrega = atrasos_telegram(envios, list(api.mensagens))
+    estatisticas_api = api.estatisticas()
+    valores_memoria = [valor for _, valor in memoria]
+
+    total = resumo_latencias(todas, duracao)
+    total["erros"] = len(erros)
+    return {
+        "python": sys.version,
+        "configuracao": {
+            "modo": args.modo,
+            "vasos": args.vasos,
+            "usuarios": args.usuarios,
+            "duracao_s": args.duracao,
+            "intervalo_vaso_s": args.intervalo_vaso,
+            "intervalo_usuario_s": args.intervalo_usuario,
+            "prob_troca": args.prob_troca,
+            "latencia_telegram_s": args.latencia_telegram,
+            "banco": bool(args.banco),
+        },
+        "total": total,
+        "rotas": rotas,
+        "telegram": {
+            "set_plant_enviados": sum(len(tempos) for tempos in envios.values()),
+            "mensagens_recebidas": estatisticas_api["mensagens"],
+            "sem_entrega": sem_entrega,
+            "respostas_429": estatisticas_api["429"],
+            "atraso_p50_ms": percentil(atrasos, 50) * 1000,
+            "atraso_p95_ms": percentil(atrasos, 95) * 1000,
+            "atraso_p99_ms": percentil(atrasos, 99) * 1000,
+            "atraso_max_ms": (atrasos[-1] if atrasos else 0.0) * 1000,
+        },
+        "memoria": {
+            "rss_inicio_mb": valores_memoria[0] if valores_memoria else None,
+            "rss_fim_mb": valores_memoria[-1] if valores_memoria else None,
+            "rss_pico_mb": max(valores_memoria) if valores_memoria else None,
+            "crescimento_mb": (valores_memoria[-1] - valores_memoria[0]) if valores_memoria else None,
+            "amostras": len(valores_memoria),
+        },
+    }
+
+
+def comparar_com_base(resultado, base, tolerancia):
+    # Devolve a lista de regressões acima da tolerância (fração, ex.: 0.2 = 20%)
+    regressoes = []
+    for caminho, maior_melhor in METRICAS_REGRESSAO:
+        atual, anterior = resultado, base
+        for chave in caminho:
+            atual = atual.get(chave) if isinstance(atual, dict) else None
+            anterior = anterior.get(chave) if isinstance(anterior, dict) else None
+        if atual is None or anterior is None:
+            continue
+        nome = ".".join(caminho)
+        if caminho == ("memoria", "crescimento_mb"):
+            # Crescimento pequeno é ruído do alocador; compara só acima de 5 MB
+            piorou = atual > max(anterior, 0) * (1 + tolerancia) + 5
+        elif maior_melhor:
+            piorou = atual < anterior * (1 - tolerancia)
+        else:
+            piorou = atual > anterior * (1 + tolerancia)
+        if piorou:
+            regressoes.append(f"{nome}: {anterior:.2f} -> {atual:.2f}")
+    return regressoes
+
+
+def imprimir(resultado):
+    total = resultado["total"]
+    print(f"Total: {total['requisicoes']} requisições, {total['req_por_s']:.1f} req/s | p50 {total['p50_ms']:.2f} ms | "
+          f"p95 {total['p95_ms']:.2f} ms | p99 {total['p99_ms']:.2f} ms | erros {total['erros']}")
+    for rota, resumo in resultado["rotas"].items():
+        print(f"  {rota:<22} {resumo['requisicoes']:>8} req | {resumo['req_por_s']:>8.1f} req/s | "
+              f"p50 {resumo['p50_ms']:>7.2f} ms | p95 {resumo['p95_ms']:>7.2f} ms | p99 {resumo['p99_ms']:>7.2f} ms")
+    telegram = resultado["telegram"]
+    print(f"Telegram: {telegram['set_plant_enviados']} /set_plant, {telegram['mensagens_recebidas']} mensagens recebidas, "
+          f"{telegram['sem_entrega']} sem entrega, 429: {telegram['respostas_429']} | atraso p50 {telegram['atraso_p50_ms']:.0f} ms, "
+          f"p95 {telegram['atraso_p95_ms']:.0f} ms, máx {telegram['atraso_max_ms']:.0f} ms")
+    memoria = resultado["memoria"]
+    if memoria["rss_inicio_mb"] is not None:
+        print(f"Memória do servidor: {memoria['rss_inicio_mb']:.1f} MB -> {memoria['rss_fim_mb']:.1f} MB "
+              f"(pico {memoria['rss_pico_mb']:.1f} MB, crescimento {memoria['crescimento_mb']:+.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga com vasos e usuários do bot virtuais")
+    parser.add_argument("--modo", choices=sorted(SERVIDORES), default="asgi")
+    parser.add_argument("--vasos", type=int, default=200)
+    parser.add_argument("--usuarios", type=int, default=20)
+    parser.add_argument("--duracao", type=float, default=30.0)
+    parser.add_argument("--intervalo-vaso", type=float, default=5.0, help="segundos entre ciclos de cada vaso (firmware: 5)")
+    parser.add_argument("--intervalo-usuario", type=float, default=2.0, help="segundos entre consultas de cada usuário")
+    parser.add_argument("--prob-troca", type=float, default=0.05, help="chance de um usuário trocar a planta a cada consulta")
+    parser.add_argument("--latencia-telegram", type=float, default=0.05, help="latência simulada da API do Telegram")
+    parser.add_argument("--espera-telegram", type=float, default=30.0, help="tempo máximo para a fila do Telegram esvaziar no fim")
+    parser.add_argument("--banco", action="store_true", help="liga a persistência em SQLite (arquivo temporário)")
+    parser.add_argument("--saida", help="arquivo JSON com o resultado")
+    parser.add_argument("--comparar", help="resultado JSON anterior; sai com código 1 se houver regressão")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora aceita em relação ao --comparar (0.2 = 20%%)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    api = FakeBotAPI(latencia=args.latencia_telegram).iniciar()
+    porta = porta_livre()
+    caminho_banco = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"carga_{porta}.db") if args.banco else ""
+    ambiente = {"TELEGRAM_API_URL": api.url_base, "TELEGRAM_BOT_TOKEN": TOKEN_BENCH, "VASO_DB_PATH": caminho_banco}
+    processo = iniciar_servidor(args.modo, porta, ambiente)
+    try:
+        async def rodar():
+            latencias, erros, envios, memoria, duracao, parar_memoria, monitor = await executar_carga(porta, processo.pid, args)
+            # A memória continua sendo amostrada enquanto a fila do Telegram esvazia
+            await asyncio.to_thread(aguardar_telegram, api, args.espera_telegram)
+            parar_memoria.set()
+            await monitor
+            return latencias, erros, envios, memoria, duracao
+
+        latencias, erros, envios, memoria, duracao = asyncio.run(rodar())
+        resultado = montar_resultado(args, latencias, erros, envios, memoria, duracao, api)
+    finally:
+        encerrar(processo)
+        api.parar()
+        if caminho_banco:
+            for sufixo in ("", "-wal", "-shm"):
+                if os.path.exists(caminho_banco + sufixo):
+                    os.remove(caminho_banco + sufixo)
+
+    imprimir(resultado)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        if base.get("configuracao") != resultado["configuracao"]:
+            print(f"Aviso: {args.comparar} foi gerado com outra configuração; a comparação pode não ser justa.")
+        regressoes = comparar_com_base(resultado, base, args.tolerancia)
+        if regressoes:
+            print("REGRESSÕES em relação a " + args.comparar + ":")
+            for regressao in regressoes:
+                print("  " + regressao)
+            sys.exit(1)
+        print(f"Sem regressões em relação a {args.comparar} (tolerância {args.tolerancia:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
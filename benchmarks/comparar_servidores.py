@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from util_bench import SERVIDORES, ConexaoHTTP, porta_livre, iniciar_servidor, encerrar, resumo_latencias
+
+# --- COMPARAÇÃO FLASK x ASGI ---
+# Sobe cada modo do servidor e simula N vasos com conexões keep-alive, cada um
+# repetindo o ciclo do firmware (POST /update_sensor_data + GET /get_instruction)
+# sem pausa. Mede vazão e latência (p50/p95/p99) por modo e por número de vasos.
+#
+# Uso: python benchmarks/comparar_servidores.py --vasos 50 500 2000 --duracao 15
+
+
+async def vaso_virtual(conexao, vaso_id, limite, latencias, erros):
+    while time.monotonic() < limite:
+        leitura = {"vaso_id": vaso_id, "umidade": random.randint(0, 100), "luminosidade": random.randint(0, 1000)}
+        for metodo, caminho, corpo in (
+            ("POST", "/update_sensor_data", leitura),
+            ("GET", f"/get_instruction?vaso_id={vaso_id}", b""),
+        ):
+            inicio = time.perf_counter()
+            try:
+                status, _, _ = await conexao.requisitar(metodo, caminho, corpo)
+            except ConnectionError as e:
+                erros.append(str(e))
+                continue
+            if status != 200:
+                erros.append(status)
+                continue
+            latencias.append(time.perf_counter() - inicio)
+
+
+async def medir(porta, vasos, duracao):
+    # Uma conexão keep-alive por vaso, como um ESP32 com HTTPClient persistente
+    conexoes = [ConexaoHTTP("127.0.0.1", porta) for _ in range(vasos)]
+    await asyncio.gather(*(conexao.abrir() for conexao in conexoes))
+    latencias = []
+    erros = []
+    inicio = time.monotonic()
+    limite = inicio + duracao
+    try:
+        await asyncio.gather(*(vaso_virtual(conexao, f"bench-{i}", limite, latencias, erros) for i, conexao in enumerate(conexoes)))
+    finally:
+        await asyncio.gather(*(conexao.fechar() for conexao in conexoes))
+    resultado = resumo_latencias(latencias, time.monotonic() - inicio)
+    resultado["erros"] = len(erros)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara vazão e latência dos modos Flask e ASGI")
+    parser.add_argument("--vasos", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--duracao", type=float, default=10.0)
+    parser.add_argument("--modos", nargs="+", choices=sorted(SERVIDORES), default=["flask", "asgi"])
+    parser.add_argument("--saida", help="arquivo JSON com os resultados")
+    args = parser.parse_args()
+
+    resultados = []
+    for modo in args.modos:
+        porta = porta_livre()
+        processo = iniciar_servidor(modo, porta)
+        try:
+            for vasos in args.vasos:
+                resultado = asyncio.run(medir(porta, vasos, args.duracao))
+                resultado.update({"modo": modo, "vasos": vasos})
+                resultados.append(resultado)
+                print(f"{modo:>6} | {vasos:>6} vasos | {resultado['req_por_s']:>9.1f} req/s | "
+                      f"p50 {resultado['p50_ms']:>7.2f} ms | p95 {resultado['p95_ms']:>7.2f} ms | "
+                      f"p99 {resultado['p99_ms']:>7.2f} ms | erros {resultado['erros']}", flush=True)
+        finally:
+            encerrar(processo)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version, "duracao_s": args.duracao, "resultados": resultados}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("VASO_DB_PATH", "")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import servico_vaso
+from alertas import aplicar_histerese
+from avaliacao_lote import classificar_encadeado
+from quadro_binario import montar_quadro
+
+# --- CONFERÊNCIA: LOTE x QUADRO x LEITURA INDIVIDUAL ---
+# A histerese, a permanência mínima e o intervalo entre alertas dependem da
+# ordem das leituras, e o lote e os quadros binários os avaliam de forma
+# vetorizada. Este script manda as mesmas leituras (passeios aleatórios que
+# cruzam as faixas das plantas) por três caminhos, cada um com seus vasos:
+#   - individual: um quadro de uma amostra por leitura (o caminho de
+#     processar_leitura, registrar_leitura + tomar_decisao_planta, com o ts
+#     da leitura);
+#   - lote: processar_lote com as leituras de todos os vasos intercaladas, em
+#     pedaços de tamanho aleatório;
+#   - quadro: quadros binários de várias amostras por vaso.
+# No fim, instrução do LCD, códigos, máquina de alertas, última notificação e
+# mensagens enfileiradas para o Telegram precisam ser iguais vaso a vaso.
+# Também confere classificar_encadeado (usado pelo lote, pelos quadros e pelo
+# modo multiprocesso) contra aplicar_histerese leitura a leitura.
+#
+#   python benchmarks/conferir_decisoes.py --vasos 40 --leituras 300 --semente 1
+#
+# Sai com código 1 se algum caminho divergir.
+
+CAMINHOS = ("individual", "lote", "quadro")
+INTERVALO_LEITURAS = 30  # segundos entre leituras de um vaso
+
+
+def passeio(aleatorio, leituras):
+    # Umidade em passos de 0,5 e luz inteira: valores exatos no quadro binário
+    umidade = aleatorio.uniform(0, 100)
+    luz = aleatorio.uniform(0, 2000)
+    valores = []
+    for _ in range(leituras):
+        umidade = min(100.0, max(0.0, umidade + aleatorio.gauss(0, 4)))
+        luz = min(3000.0, max(0.0, luz + aleatorio.gauss(0, 80)))
+        valores.append((round(umidade * 2) / 2, float(round(luz))))
+    return valores
+
+
+def estado(vaso):
+    alertas = vaso.alertas
+    return {
+        "instrucao": vaso.instrucao_para_lcd,
+        "versao_instrucao": vaso.versao_instrucao,
+        "codigos": servico_vaso.codigos_anteriores(vaso),
+        "alertas": None if alertas is None else (alertas.candidato, alertas.candidato_desde, alertas.confirmado,
+                                                 alertas.notificado, alertas.ultimos_alertas),
+        "notificacao": vaso.ultima_notificacao_telegram,
+        "umidade": vaso.umidade_atual,
+        "luminosidade": vaso.luminosidade_atual,
+    }
+
+
+def conferir_servico(args, aleatorio):
+    inicio = int(time.time()) - args.leituras * INTERVALO_LEITURAS - 60
+    plantas = servico_vaso.catalogo.nomes
+    series = {}
+    for numero in range(args.vasos):
+        valores = passeio(aleatorio, args.leituras)
+        series[numero] = [(inicio + indice * INTERVALO_LEITURAS, umidade, luz) for indice, (umidade, luz) in enumerate(valores)]
+
+    enviadas = {}
+    servico_vaso.enfileirar_telegram = lambda chat_id, mensagem: enviadas.setdefault(chat_id, []).append(mensagem)
+    for numero in series:
+        planta = plantas[numero % len(plantas)]
+        for posicao, caminho in enumerate(CAMINHOS):
+            servico_vaso.definir_planta({"vaso_id": f"{caminho}-{numero}", "planta": planta,
+                                         "chat_id": numero * len(CAMINHOS) + posicao})
+
+    # Individual
+    for numero, amostras in series.items():
+        for amostra in amostras:
+            servico_vaso.processar_quadro(montar_quadro(f"individual-{numero}", [amostra]), "conferencia")
+
+    # Lote: leituras de todos os vasos intercaladas, na ordem de cada vaso
+    intercaladas = []
+    for indice in range(args.leituras):
+        for numero, amostras in series.items():
+            ts, umidade, luz = amostras[indice]
+            intercaladas.append({"vaso_id": f"lote-{numero}", "ts": ts, "umidade": umidade, "luminosidade": luz})
+    posicao = 0
+    while posicao < len(intercaladas):
+        tamanho = aleatorio.randint(1, 4 * args.vasos)
+        parte = intercaladas[posicao:posicao + tamanho]
+        servico_vaso.processar_lote(lambda: (parte, None), "conferencia")
+        posicao += tamanho
+
+    # Quadros de várias amostras
+    for numero, amostras in series.items():
+        posicao = 0
+        while posicao < len(amostras):
+            tamanho = aleatorio.randint(1, 50)
+            servico_vaso.processar_quadro(montar_quadro(f"quadro-{numero}", amostras[posicao:posicao + tamanho]), "conferencia")
+            posicao += tamanho
+
+    divergencias = 0
+    for numero in series:
+        referencia = estado(servico_vaso.registro_vasos.obter(f"individual-{numero}"))
+        mensagens_referencia = enviadas.get(numero * len(CAMINHOS), [])
+        for posicao, caminho in enumerate(CAMINHOS[1:], start=1):
+            atual = estado(servico_vaso.registro_vasos.obter(f"{caminho}-{numero}"))
+            mensagens = enviadas.get(numero * len(CAMINHOS) + posicao, [])
+            for campo, valor in referencia.items():
+                if atual[campo] != valor:
+                    divergencias += 1
+                    print(f"vaso {numero} ({caminho}): {campo} = {atual[campo]!r}, individual = {valor!r}")
+            if mensagens != mensagens_referencia:
+                divergencias += 1
+                print(f"vaso {numero} ({caminho}): {len(mensagens)} mensagens ao Telegram, individual = {len(mensagens_referencia)}")
+    total = sum(len(mensagens) for mensagens in enviadas.values())
+    print(f"serviço: {args.vasos} vasos x {args.leituras} leituras por caminho, {total} mensagens ao Telegram, {divergencias} divergências")
+    return divergencias
+
+
+def conferir_encadeamento(args, aleatorio):
+    catalogo = servico_vaso.catalogo
+    divergencias = 0
+    for _ in range(args.rodadas):
+        quantidades = [aleatorio.randint(1, 60) for _ in range(aleatorio.randint(1, 30))]
+        indices, umidades, luzes, inicios, anteriores_umidade, anteriores_luz, esperados = [], [], [], [], [], [], []
+        for quantidade in quantidades:
+            perfil = catalogo.perfil_de(aleatorio.choice(catalogo.nomes))
+            codigo_umidade, codigo_luz = aleatorio.randint(-2, 2), aleatorio.randint(-2, 2)
+            inicios.append(len(umidades))
+            anteriores_umidade.append(codigo_umidade)
+            anteriores_luz.append(codigo_luz)
+            for umidade, luz in passeio(aleatorio, quantidade):
+                codigo_umidade = aplicar_histerese(codigo_umidade, umidade, *perfil.umidade)
+                codigo_luz = aplicar_histerese(codigo_luz, luz, *perfil.luminosidade)
+                indices.append(perfil.indice)
+                umidades.append(umidade)
+                luzes.append(luz)
+                esperados.append((codigo_umidade, codigo_luz))
+        codigos_umidade, codigos_luz = classificar_encadeado(catalogo.tabela, indices, umidades, luzes, inicios,
+                                                             anteriores_umidade, anteriores_luz)
+        if list(zip(codigos_umidade.tolist(), codigos_luz.tolist())) != esperados:
+            divergencias += 1
+    print(f"classificar_encadeado: {args.rodadas} rodadas contra aplicar_histerese, {divergencias} divergências")
+    return divergencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confere que lote, quadro e leitura individual chegam às mesmas decisões")
+    parser.add_argument("--vasos", type=int, default=40)
+    parser.add_argument("--leituras", type=int, default=300, help="leituras por vaso")
+    parser.add_argument("--rodadas", type=int, default=200, help="rodadas da conferência de classificar_encadeado")
+    parser.add_argument("--semente", type=int, default=None)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    semente = random.randrange(1 << 30) if args.semente is None else args.semente
+    print(f"semente {semente}")
+    aleatorio = random.Random(semente)
+    divergencias = conferir_encadeamento(args, aleatorio) + conferir_servico(args, aleatorio)
+    sys.exit(1 if divergencias else 0)
+
+
+if __name__ == "__main__":
+    main()
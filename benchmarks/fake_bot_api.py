@@ -0,0 +1,297 @@
+import argparse
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# --- API DO TELEGRAM FALSA (LOCAL) ---
+# Substituto local de https://api.telegram.org para testes e benchmarks. Aceita
+# getMe e sendMessage, guarda as mensagens recebidas e imita o controle de flood
+# do Telegram (1 msg/s por chat e ~30 msg/s no total), devolvendo 429 com
+# retry_after quando os limites são excedidos. Também pode injetar latência e
+# erros 5xx aleatórios.
+#
+# Para o lado do bot (Telegram_Bot.py) também entrega atualizações injetadas com
+# injetar_atualizacao(): por getUpdates (long-poll) ou, depois de um setWebhook,
+# com um POST na URL registrada, como o Telegram faz. answerCallbackQuery e
+# editMessageText são aceitos e, como sendMessage, ficam em "respostas" com o
+# instante (perf_counter) de chegada, para medir atualização -> resposta.
+#
+# Aponte o servidor para ela com TELEGRAM_API_URL=http://127.0.0.1:<porta>/bot
+# Uso avulso: python benchmarks/fake_bot_api.py --porta 8081 --taxa-5xx 0.05
+
+
+class FakeBotAPI:
+    def __init__(self, porta=0, latencia=0.0, taxa_5xx=0.0, limite_global=30, limite_por_chat=1.0, aplicar_limites=True):
+        self.latencia = latencia
+        self.taxa_5xx = taxa_5xx
+        self.limite_global = limite_global
+        self.limite_por_chat = limite_por_chat
+        self.aplicar_limites = aplicar_limites
+        self.mensagens = []  # (recebida_em, chat_id, texto)
+        self.contadores = {"sendMessage": 0, "429": 0, "5xx": 0}
+        self._lock = threading.Lock()
+        self._envios_globais = []
+        self._ultimo_envio_chat = {}
+        self._proximo_id = 1
+        self.respostas = {}  # chat_id -> [(perf_counter, método), ...]
+        self._condicao = threading.Condition(self._lock)
+        self._atualizacoes = []  # pendentes para getUpdates
+        self._proximo_update_id = 1
+        self.webhook = None  # (url, segredo) depois de setWebhook
+        self._entregas = queue.Queue()
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", porta), self._criar_handler())
+        self._servidor.daemon_threads = True
+        self._thread = None
+
+    @property
+    def porta(self):
+        return self._servidor.server_address[1]
+
+    @property
+    def url_base(self):
+        return f"http://127.0.0.1:{self.porta}/bot"
+
+    def iniciar(self, conexoes_webhook=4):
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._thread.start()
+        for _ in range(conexoes_webhook):
+            threading.Thread(target=self._entregar_webhook, daemon=True).start()
+        return self
+
+    def parar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    # --- Atualizações para o bot ---
+
+    def injetar_atualizacao(self, atualizacao):
+        # atualizacao: dict de Update sem update_id; devolve o update_id dado
+        with self._lock:
+            atualizacao = dict(atualizacao, update_id=self._proximo_update_id)
+            self._proximo_update_id += 1
+            if self.webhook is None:
+                self._atualizacoes.append(atualizacao)
+                self._condicao.notify_all()
+                return atualizacao["update_id"]
+        self._entregas.put(atualizacao)
+        return atualizacao["update_id"]
+
+    def aguardar_resposta(self, chat_id, desde, timeout=10.0):
+        # Instante (perf_counter) da primeira resposta ao chat depois de `desde`, ou None
+        limite = time.monotonic() + timeout
+        with self._condicao:
+            while True:
+                for instante, _ in self.respostas.get(chat_id, ()):
+                    if instante >= desde:
+                        return instante
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return None
+                self._condicao.wait(restante)
+
+    def _obter_atualizacoes(self, parametros):
+        offset = int(parametros.get("offset") or 0)
+        espera = float(parametros.get("timeout") or 0)
+        limite = time.monotonic() + espera
+        with self._condicao:
+            # offset confirma (descarta) as atualizações anteriores
+            self._atualizacoes = [a for a in self._atualizacoes if a["update_id"] >= offset]
+            while not self._atualizacoes:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._condicao.wait(restante)
+            return list(self._atualizacoes)
+
+    def _entregar_webhook(self):
+        # Uma conexão keep-alive por thread, como as max_connections do Telegram
+        conexao = None
+        while True:
+            atualizacao = self._entregas.get()
+            webhook = self.webhook
+            if webhook is None:
+                continue
+            url, segredo = webhook
+            partes = urlsplit(url)
+            corpo = json.dumps(atualizacao).encode("utf-8")
+            cabecalhos = {"Content-Type": "application/json"}
+            if segredo:
+                cabecalhos["X-Telegram-Bot-Api-Secret-Token"] = segredo
+            if self.latencia:
+                time.sleep(self.latencia)
+            for _ in range(2):
+                try:
+                    if conexao is None:
+                        conexao = http.client.HTTPConnection(partes.hostname, partes.port, timeout=10)
+                    conexao.request("POST", partes.path or "/", corpo, cabecalhos)
+                    conexao.getresponse().read()
+                    break
+                except (OSError, http.client.HTTPException):
+                    conexao.close()
+                    conexao = None
+
+    def _registrar_resposta(self, chat_id, metodo):
+        with self._condicao:
+            self.respostas.setdefault(chat_id, []).append((time.perf_counter(), metodo))
+            self._condicao.notify_all()
+
+    def estatisticas(self):
+        with self._lock:
+            por_chat = {}
+            for _, chat_id, _ in self.mensagens:
+                por_chat[chat_id] = por_chat.get(chat_id, 0) + 1
+            return dict(self.contadores, mensagens=len(self.mensagens), chats=len(por_chat))
+
+    # --- Regras da API ---
+
+    def _verificar_limites(self, chat_id, agora):
+        # Devolve o retry_after (em segundos) se o envio estourar algum limite
+        if not self.aplicar_limites:
+            return 0
+        self._envios_globais = [t for t in self._envios_globais if agora - t < 1.0]
+        if len(self._envios_globais) >= self.limite_global:
+            return 1
+        ultimo = self._ultimo_envio_chat.get(chat_id)
+        if ultimo is not None and agora - ultimo < 1.0 / self.limite_por_chat:
+            return 1
+        self._envios_globais.append(agora)
+        self._ultimo_envio_chat[chat_id] = agora
+        return 0
+
+    def tratar(self, metodo, parametros):
+        if metodo == "getUpdates":
+            # A latência conta no trajeto da resposta: o long-poll já estava aberto
+            atualizacoes = self._obter_atualizacoes(parametros)
+            if self.latencia:
+                time.sleep(self.latencia)
+            return 200, {"ok": True, "result": atualizacoes}
+        if self.latencia:
+            time.sleep(self.latencia)
+        if metodo == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Vaso", "username": "vaso_fake_bot"}}
+        if metodo == "setWebhook":
+            self.webhook = (parametros.get("url"), parametros.get("secret_token"))
+            return 200, {"ok": True, "result": True}
+        if metodo == "deleteWebhook":
+            self.webhook = None
+            return 200, {"ok": True, "result": True}
+        if metodo == "answerCallbackQuery":
+            return 200, {"ok": True, "result": True}
+        if metodo == "editMessageText":
+            chat_id = int(parametros.get("chat_id"))
+            self._registrar_resposta(chat_id, metodo)
+            return 200, {"ok": True, "result": {
+                "message_id": int(parametros.get("message_id")),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": parametros.get("text", ""),
+            }}
+        if metodo != "sendMessage":
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+        if self.taxa_5xx and random.random() < self.taxa_5xx:
+            with self._lock:
+                self.contadores["5xx"] += 1
+            return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+
+        chat_id = parametros.get("chat_id")
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        texto = parametros.get("text", "")
+        agora = time.monotonic()
+        with self._lock:
+            self.contadores["sendMessage"] += 1
+            retry_after = self._verificar_limites(chat_id, agora)
+            if retry_after:
+                self.contadores["429"] += 1
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }
+            self.mensagens.append((time.time(), chat_id, texto))
+            message_id = self._proximo_id
+            self._proximo_id += 1
+        self._registrar_resposta(chat_id, metodo)
+        return 200, {"ok": True, "result": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": texto,
+        }}
+
+    def _criar_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Cabeçalhos e corpo saem em writes separados: sem isso, o Nagle segura
+            # o corpo até o ACK atrasado do cliente (~40 ms por resposta)
+            disable_nagle_algorithm = True
+
+            def log_message(self, formato, *args):
+                pass
+
+            def _parametros(self):
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                corpo = self.rfile.read(tamanho) if tamanho else b""
+                parametros = dict(parse_qsl(urlsplit(self.path).query))
+                tipo = (self.headers.get("Content-Type") or "").split(";")[0].strip()
+                if tipo == "application/json" and corpo:
+                    parametros.update(json.loads(corpo))
+                elif corpo:
+                    parametros.update(parse_qsl(corpo.decode("utf-8")))
+                return parametros
+
+            def _responder(self, status, corpo):
+                dados = json.dumps(corpo).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(dados)))
+                    self.end_headers()
+                    self.wfile.write(dados)
+                except (BrokenPipeError, ConnectionResetError):
+                    # O cliente desistiu (ex.: long-poll de um bot que foi encerrado)
+                    self.close_connection = True
+
+            def _tratar(self):
+                caminho = urlsplit(self.path).path
+                parametros = self._parametros()
+                if caminho == "/_estatisticas":
+                    self._responder(200, api.estatisticas())
+                    return
+                # /bot<token>/<metodo>
+                metodo = caminho.rsplit("/", 1)[-1]
+                status, corpo = api.tratar(metodo, parametros)
+                self._responder(status, corpo)
+
+            do_GET = _tratar
+            do_POST = _tratar
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API do Telegram falsa para testes locais")
+    parser.add_argument("--porta", type=int, default=8081)
+    parser.add_argument("--latencia", type=float, default=0.0, help="atraso por chamada, em segundos")
+    parser.add_argument("--taxa-5xx", type=float, default=0.0, help="fração de sendMessage que falha com 502")
+    parser.add_argument("--sem-limites", action="store_true", help="não simula o controle de flood (429)")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.porta, args.latencia, args.taxa_5xx, aplicar_limites=not args.sem_limites).iniciar()
+    print(f"API falsa do Telegram em {api.url_base} (estatísticas em http://127.0.0.1:{api.porta}/_estatisticas)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.parar()
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+# --- UTILITÁRIOS COMPARTILHADOS PELOS BENCHMARKS ---
+
+RAIZ_PROJETO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Comandos que sobem cada modo do servidor em uma porta livre, com os logs INFO/WARNING
+# desligados para medir o servidor e não o terminal.
+CODIGO_FLASK = (
+    "import logging, threading, app_servidor, servico_vaso; logging.disable(logging.WARNING); "
+    "threading.Thread(target=servico_vaso.start_telegram_worker, daemon=True).start(); "
+    "app_servidor.app.run(host='127.0.0.1', port={porta}, threaded=True)"
+)
+CODIGO_ASGI = (
+    "import logging, uvicorn, servidor_asgi; logging.disable(logging.WARNING); "
+    "uvicorn.run(servidor_asgi.app, host='127.0.0.1', port={porta}, backlog=4096, "
+    "timeout_keep_alive=75, access_log=False, log_level='warning')"
+)
+# Um processo HTTP por núcleo (VASO_BENCH_PROCESSOS muda a quantidade); o
+# logging.disable do processo principal vale também para os filhos
+CODIGO_MULTIPROCESSO = (
+    "import logging, os, sys, servidor_multiprocesso; logging.disable(logging.WARNING); "
+    "sys.argv = ['servidor_multiprocesso', '--host', '127.0.0.1', '--porta', '{porta}', "
+    "'--processos', os.environ.get('VASO_BENCH_PROCESSOS', str(os.cpu_count() or 1))]; "
+    "servidor_multiprocesso.main()"
+)
+SERVIDORES = {"flask": CODIGO_FLASK, "asgi": CODIGO_ASGI, "multiprocesso": CODIGO_MULTIPROCESSO}
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def aguardar_porta(porta, timeout=15):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            with socket.create_connection(("127.0.0.1", porta), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Servidor não respondeu na porta {porta}")
+
+
+def iniciar_servidor(modo, porta, ambiente=None):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = RAIZ_PROJETO + os.pathsep + env.get("PYTHONPATH", "")
+    env["VASO_DB_PATH"] = ""  # servidor só em memória, salvo se "ambiente" pedir o banco
+    env.update(ambiente or {})
+    processo = subprocess.Popen(
+        [sys.executable, "-c", SERVIDORES[modo].format(porta=porta)],
+        cwd=RAIZ_PROJETO,
+        env=env,
+    )
+    try:
+        aguardar_porta(porta)
+    except RuntimeError:
+        processo.kill()
+        raise
+    return processo
+
+
+def encerrar(processo):
+    processo.terminate()
+    try:
+        processo.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    indice = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+
+def resumo_latencias(latencias, duracao):
+    ordenadas = sorted(latencias)
+    return {
+        "requisicoes": len(ordenadas),
+        "req_por_s": len(ordenadas) / duracao if duracao else 0.0,
+        "p50_ms": percentil(ordenadas, 50) * 1000,
+        "p95_ms": percentil(ordenadas, 95) * 1000,
+        "p99_ms": percentil(ordenadas, 99) * 1000,
+    }
+
+
+# --- CLIENTE HTTP/1.1 MÍNIMO COM KEEP-ALIVE ---
+# Os benchmarks precisam de um cliente mais leve que o servidor medido; um
+# cliente completo (httpx/requests) vira o gargalo bem antes do servidor.
+
+class ConexaoHTTP:
+    def __init__(self, host, porta):
+        self.host = host
+        self.porta = porta
+        self._leitor = None
+        self._escritor = None
+
+    async def abrir(self):
+        self._leitor, self._escritor = await asyncio.open_connection(self.host, self.porta)
+        sock = self._escritor.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def fechar(self):
+        if self._escritor is not None:
+            self._escritor.close()
+            try:
+                await self._escritor.wait_closed()
+            except OSError:
+                pass
+            self._escritor = None
+
+    async def requisitar(self, metodo, caminho, corpo=b"", tipo="application/json", cabecalhos=None):
+        if self._escritor is None:
+            await self.abrir()
+        if not isinstance(corpo, (bytes, bytearray)):
+            corpo = json.dumps(corpo).encode("utf-8")
+        extras = "".join(f"{nome}: {valor}\r\n" for nome, valor in (cabecalhos or {}).items())
+        cabecalho = (
+            f"{metodo} {caminho} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: {tipo}\r\nContent-Length: {len(corpo)}\r\n{extras}\r\n"
+        ).encode("latin-1")
+        self._escritor.write(cabecalho + corpo)
+        try:
+            linha_status = await self._leitor.readline()
+            if not linha_status:
+                raise ConnectionError("Conexão fechada pelo servidor")
+            status = int(linha_status.split()[1])
+            tamanho = 0
+            fechar = False
+            respostas_cabecalho = {}
+            while True:
+                linha = await self._leitor.readline()
+                if linha in (b"\r\n", b"\n", b""):
+                    break
+                nome, _, valor = linha.decode("latin-1").partition(":")
+                nome = nome.strip().lower()
+                respostas_cabecalho[nome] = valor.strip()
+                if nome == "content-length":
+                    tamanho = int(valor)
+                elif nome == "connection" and valor.strip().lower() == "close":
+                    fechar = True
+            dados = await self._leitor.readexactly(tamanho) if tamanho else b""
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            await self.fechar()
+            raise ConnectionError(f"Falha na requisição {metodo} {caminho}")
+        if fechar:
+            await self.fechar()
+        return status, respostas_cabecalho, dados
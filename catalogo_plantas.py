@@ -0,0 +1,166 @@
+import hashlib
+import json
+import math
+import os
+
+from alertas import (HISTERESE_UMIDADE_PADRAO, HISTERESE_LUMINOSIDADE_PADRAO,
+                     PERMANENCIA_MIN_PADRAO, INTERVALO_ALERTAS_PADRAO)
+from avaliacao_lote import TabelaLimites
+
+# --- CATÁLOGO DE PLANTAS (plantas.json) ---
+# Os perfis das plantas ficam em um arquivo JSON fora do código. Ao carregar,
+# cada perfil é validado e compilado em um PerfilPlanta com os limites já
+# resolvidos (padrões aplicados, tuplas na ordem usada por aplicar_histerese) e
+# numa TabelaLimites para o caminho em lote. A decisão de cada leitura só lê
+# atributos do perfil, sem procurar nada em dicionários.
+#
+# Um CatalogoPlantas compilado nunca é alterado: recarregar o arquivo cria um
+# catálogo novo (com "geracao" maior) que substitui o anterior de uma vez.
+#
+# Formato de cada planta em "plantas":
+#   umidade_min, umidade_max, luminosidade_min, luminosidade_max  (obrigatórios)
+#   umidade_critica_min/max, luminosidade_critica_min/max         (faixa crítica, opcional)
+#   histerese_umidade, histerese_luminosidade                     (bandas de histerese)
+#   permanencia_min_s, intervalo_alertas_s                        (debounce dos alertas)
+#   emoji, descricao                                              (usados pelo bot)
+
+PLANTA_PADRAO = "Nenhuma"
+SENSORES = ("umidade", "luminosidade")
+HISTERESES_PADRAO = {"umidade": HISTERESE_UMIDADE_PADRAO, "luminosidade": HISTERESE_LUMINOSIDADE_PADRAO}
+# O bot usa "PLANT_<nome>" como callback_data, que o Telegram limita a 64 bytes
+TAMANHO_MAX_NOME = 58
+EMOJI_PADRAO = "🌱"
+
+
+class PerfilPlanta:
+    __slots__ = (
+        "nome", "indice", "geracao",
+        "umidade", "luminosidade",   # (mínimo, máximo, histerese, crítico mínimo, crítico máximo)
+        "permanencia_min", "intervalo_alertas",
+    )
+
+
+class CatalogoPlantas:
+    def __init__(self, perfis, publico, versao, geracao):
+        self.perfis = tuple(perfis)
+        self.indices = {perfil.nome: perfil.indice for perfil in self.perfis}
+        self.nomes = tuple(self.indices)
+        self.padrao = self.perfis[self.indices[PLANTA_PADRAO]]
+        self.tabela = TabelaLimites(self.perfis)
+        self.publico = publico   # o que /plantas devolve
+        self.versao = versao
+        self.geracao = geracao
+
+    def __len__(self):
+        return len(self.perfis)
+
+    def __contains__(self, nome):
+        return nome in self.indices
+
+    def perfil_de(self, nome):
+        indice = self.indices.get(nome)
+        return self.padrao if indice is None else self.perfis[indice]
+
+
+def _numero(planta, dados, campo, padrao=None):
+    valor = dados.get(campo, padrao)
+    if valor is None:
+        raise ValueError(f"planta '{planta}': campo '{campo}' ausente")
+    if campo not in dados:
+        # Padrões como o ±inf dos limites críticos não vêm do arquivo
+        return float(valor)
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        raise ValueError(f"planta '{planta}': campo '{campo}' deve ser um número")
+    # O JSON aceita Infinity/NaN e inteiros enormes (float() dá OverflowError);
+    # nenhum deles é um limite utilizável nem volta como JSON válido em /plantas
+    try:
+        numero = float(valor)
+    except OverflowError:
+        numero = math.inf
+    if not math.isfinite(numero):
+        raise ValueError(f"planta '{planta}': campo '{campo}' deve ser um número finito")
+    return numero
+
+
+def _compilar_sensor(planta, dados, sensor):
+    minimo = _numero(planta, dados, f"{sensor}_min")
+    maximo = _numero(planta, dados, f"{sensor}_max")
+    histerese = _numero(planta, dados, f"histerese_{sensor}", HISTERESES_PADRAO[sensor])
+    critico_min = _numero(planta, dados, f"{sensor}_critica_min", -math.inf)
+    critico_max = _numero(planta, dados, f"{sensor}_critica_max", math.inf)
+    if not critico_min <= minimo <= maximo <= critico_max:
+        raise ValueError(f"planta '{planta}': faixas de {sensor} fora de ordem (crítica_min <= min <= max <= crítica_max)")
+    if histerese < 0:
+        raise ValueError(f"planta '{planta}': histerese de {sensor} negativa")
+    return (minimo, maximo, histerese, critico_min, critico_max)
+
+
+def compilar_perfil(nome, campos, indice=0, geracao=0):
+    # ValueError se os campos não formarem um perfil válido (também usado pelo
+    # simulador_limites.py para cada combinação de limites)
+    if not isinstance(campos, dict):
+        raise ValueError(f"planta '{nome}': o perfil deve ser um objeto")
+
+    perfil = PerfilPlanta()
+    perfil.nome = nome
+    perfil.indice = indice
+    perfil.geracao = geracao
+    perfil.umidade = _compilar_sensor(nome, campos, "umidade")
+    perfil.luminosidade = _compilar_sensor(nome, campos, "luminosidade")
+    perfil.permanencia_min = _numero(nome, campos, "permanencia_min_s", PERMANENCIA_MIN_PADRAO)
+    perfil.intervalo_alertas = _numero(nome, campos, "intervalo_alertas_s", INTERVALO_ALERTAS_PADRAO)
+    return perfil
+
+
+def compilar_catalogo(dados, versao, geracao):
+    plantas = dados.get("plantas") if isinstance(dados, dict) else None
+    if not isinstance(plantas, dict) or not plantas:
+        raise ValueError("o catálogo precisa de um objeto 'plantas' não vazio")
+    if PLANTA_PADRAO not in plantas:
+        raise ValueError(f"o catálogo precisa da planta '{PLANTA_PADRAO}'")
+
+    perfis = []
+    publico = {}
+    for indice, (nome, campos) in enumerate(plantas.items()):
+        if not nome or nome != nome.strip() or len(nome.encode("utf-8")) > TAMANHO_MAX_NOME:
+            raise ValueError(f"nome de planta inválido: {nome!r}")
+        perfil = compilar_perfil(nome, campos, indice, geracao)
+        perfis.append(perfil)
+
+        # Versão pública: os valores efetivos (com os padrões), sem infinitos
+        resumo = {"emoji": str(campos.get("emoji", EMOJI_PADRAO)), "descricao": str(campos.get("descricao", ""))}
+        for sensor in SENSORES:
+            minimo, maximo, histerese, critico_min, critico_max = getattr(perfil, sensor)
+            resumo[f"{sensor}_min"] = minimo
+            resumo[f"{sensor}_max"] = maximo
+            resumo[f"histerese_{sensor}"] = histerese
+            if critico_min != -math.inf:
+                resumo[f"{sensor}_critica_min"] = critico_min
+            if critico_max != math.inf:
+                resumo[f"{sensor}_critica_max"] = critico_max
+        resumo["permanencia_min_s"] = perfil.permanencia_min
+        resumo["intervalo_alertas_s"] = perfil.intervalo_alertas
+        publico[nome] = resumo
+
+    return CatalogoPlantas(perfis, publico, versao, geracao)
+
+
+def carregar_catalogo(caminho, geracao=1):
+    # OSError se o arquivo não puder ser lido, ValueError se for inválido
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+    try:
+        dados = json.loads(conteudo)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON inválido: {e}") from e
+    versao = hashlib.sha1(conteudo).hexdigest()[:16]
+    return compilar_catalogo(dados, versao, geracao)
+
+
+def assinatura_arquivo(caminho):
+    # Muda quando o arquivo é regravado ou substituído (ex.: mv de um arquivo novo)
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    return (info.st_ino, info.st_mtime_ns, info.st_size)
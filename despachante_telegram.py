@@ -0,0 +1,310 @@
+import asyncio
+import collections
+import logging
+import random
+import time
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter, TelegramError
+
+# --- DESPACHANTE DE MENSAGENS DO TELEGRAM ---
+# Consome a FilaTelegram com vários envios simultâneos, respeitando os limites
+# do Telegram com baldes de tokens (um global e um por chat). Alertas de um
+# mesmo chat que se acumulam enquanto ele espera a sua vez saem juntos em uma
+# única mensagem. Só 429 (RetryAfter) e 5xx/rede (NetworkError, inclusive
+# TimedOut) são transitórias e retentadas com backoff; esgotadas as tentativas,
+# as mensagens voltam para a frente do chat (o 429 já pausa todos os envios; a
+# falha de rede pausa por backoff_max). Cada mensagem tem até max_rodadas dessas
+# voltas: depois disso é descartada e concluída como as recusadas. Qualquer outro erro
+# do Telegram (400, 403, token inválido, conflito...) descarta a mensagem na
+# hora. Um grupo que virou supergrupo (ChatMigrated) recebe a mensagem no id
+# novo, e ao_migrar(chat_antigo, chat_novo), se definido, atualiza os vasos.
+# Cada chat é atendido por um envio de cada vez, então a ordem é preservada.
+# ao_concluir(chat_id, quantidade), se definido, é chamado quando as mensagens
+# mais antigas do chat saem da fila de vez: entregues ou recusadas de forma
+# permanente.
+# observar_atraso(segundos), se definido, recebe para cada alerta entregue o
+# tempo entre a entrada na fila e o envio.
+# Com max_pendentes definido, o despachante para de tirar mensagens da fila
+# enquanto tiver essa quantidade esperando a vez: o acúmulo durante uma queda
+# da API fica na FilaTelegram, que é limitada e aplica a política de transbordo.
+# Depois de LIMIAR_ADIAMENTOS envios adiados seguidos, o despachante para de
+# tirar mensagens da fila e pede que ela não traga mais nada do transbordo em
+# disco até um envio voltar a ter resposta da API. As entradas vindas do disco
+# são confirmadas (fila.confirmar_disco) junto com o ao_concluir.
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_MAX_MENSAGEM = 4096
+SEPARADOR_MENSAGENS = "\n\n"
+MAX_BALDES_OCIOSOS = 10000
+INTERVALO_VERIFICAR_PARADA = 0.5  # segundos, enquanto espera vaga com max_pendentes
+LIMIAR_ADIAMENTOS = 3  # envios adiados seguidos até suspender a fila e o transbordo
+
+# Resultado de um envio
+ENTREGUE = 0
+RECUSADA = 1   # erro permanente (4xx que não o 429, token inválido...): a mensagem é descartada
+ADIADA = 2     # 429/5xx/rede em todas as tentativas: a mensagem volta para a fila do chat (até max_rodadas vezes)
+
+
+class BaldeDeTokens:
+    __slots__ = ("taxa", "capacidade", "tokens", "atualizado_em")
+
+    def __init__(self, taxa, capacidade, agora):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.tokens = capacidade
+        self.atualizado_em = agora
+
+    def _reabastecer(self, agora):
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado_em) * self.taxa)
+        self.atualizado_em = agora
+
+    def espera(self, agora):
+        self._reabastecer(agora)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.taxa
+
+    def consumir(self):
+        self.tokens -= 1
+
+    def cheio(self, agora):
+        self._reabastecer(agora)
+        return self.tokens >= self.capacidade
+
+
+class DespachanteTelegram:
+    def __init__(self, bot, fila, envios_simultaneos=8, taxa_global=20.0, rajada_global=10,
+                 taxa_por_chat=1.0, rajada_por_chat=1, max_tentativas=5, backoff_base=0.5,
+                 backoff_max=30.0, timeout_encerramento=10.0, ao_concluir=None,
+                 observar_atraso=None, max_pendentes=None, ao_migrar=None, max_rodadas=10):
+        self.bot = bot
+        self.fila = fila
+        self.envios_simultaneos = envios_simultaneos
+        self.taxa_por_chat = taxa_por_chat
+        self.rajada_por_chat = rajada_por_chat
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout_encerramento = timeout_encerramento
+        self.ao_concluir = ao_concluir
+        self.observar_atraso = observar_atraso
+        self.max_pendentes = max_pendentes
+        self.ao_migrar = ao_migrar
+        self.max_rodadas = max_rodadas
+
+        self._balde_global = BaldeDeTokens(taxa_global, rajada_global, time.monotonic())
+        self._baldes_chat = {}
+        self._pendentes = {}       # chat_id -> deque de (mensagem, enfileirada_em, quantidade, lote, rodadas) aguardando envio
+        self._quantidade_pendente = 0
+        self._agendados = set()    # chats na fila de prontos ou sendo atendidos
+        self._prontos = None
+        self._vaga = None
+        self._pausado_ate = 0.0
+        self._adiamentos_seguidos = 0
+        self._migrados = {}        # chat_id antigo -> id do supergrupo (ChatMigrated)
+
+        self.enviadas = 0
+        self.mescladas = 0
+        self.falhas = 0
+        self.retentativas = 0
+        self.adiadas = 0
+
+    def pendentes(self):
+        # Lido por /metrics de outra thread: um contador, sem percorrer os chats
+        return self._quantidade_pendente
+
+    def em_falha(self):
+        return self._adiamentos_seguidos >= LIMIAR_ADIAMENTOS
+
+    async def executar(self):
+        self._prontos = asyncio.Queue()
+        self._vaga = asyncio.Event()
+        envios = [asyncio.create_task(self._enviador()) for _ in range(self.envios_simultaneos)]
+        logger.info(f"Despachante do Telegram iniciado com {self.envios_simultaneos} envios simultâneos.")
+        try:
+            while True:
+                await self._aguardar_vaga()
+                (chat_id, mensagem), enfileirada_em, quantidade, lote = await self.fila.get_entrada()
+                if chat_id is None:
+                    logger.info("Sinal de parada recebido para o despachante do Telegram.")
+                    break
+                self._enfileirar(chat_id, mensagem, enfileirada_em, quantidade, lote)
+            await self._aguardar_esvaziar()
+        finally:
+            for envio in envios:
+                envio.cancel()
+            await asyncio.gather(*envios, return_exceptions=True)
+
+    async def _aguardar_vaga(self):
+        # Depois de pedida a parada, segue tirando da fila até o sinal. Em falha,
+        # só para enquanto houver mensagens pendentes para testar a API
+        while ((self.em_falha() and self._quantidade_pendente or self.max_pendentes is not None and self._quantidade_pendente >= self.max_pendentes)
+               and not self.fila.parada_pedida()):
+            self._vaga.clear()
+            try:
+                await asyncio.wait_for(self._vaga.wait(), INTERVALO_VERIFICAR_PARADA)
+            except asyncio.TimeoutError:
+                pass
+
+    def _enfileirar(self, chat_id, mensagem, enfileirada_em, quantidade=1, lote=None):
+        self._pendentes.setdefault(chat_id, collections.deque()).append((mensagem, enfileirada_em, quantidade, lote, 0))
+        self._quantidade_pendente += 1
+        if chat_id not in self._agendados:
+            self._agendados.add(chat_id)
+            self._prontos.put_nowait(chat_id)
+        if len(self._baldes_chat) > MAX_BALDES_OCIOSOS:
+            agora = time.monotonic()
+            for ocioso in [c for c, balde in self._baldes_chat.items() if c not in self._agendados and balde.cheio(agora)]:
+                del self._baldes_chat[ocioso]
+
+    async def _aguardar_esvaziar(self):
+        limite = time.monotonic() + self.timeout_encerramento
+        while self._agendados and time.monotonic() < limite:
+            await asyncio.sleep(0.05)
+        if self._agendados:
+            logger.warning(f"Despachante encerrado com {self.pendentes()} mensagens não enviadas.")
+
+    async def _enviador(self):
+        while True:
+            chat_id = await self._prontos.get()
+            try:
+                await self._atender_chat(chat_id)
+            except Exception as e:
+                logger.error(f"Erro no despachante do Telegram (chat {chat_id}): {e}")
+            if self._pendentes.get(chat_id):
+                # Chegaram mais alertas durante o envio: o chat volta para o fim da fila
+                self._prontos.put_nowait(chat_id)
+            else:
+                self._pendentes.pop(chat_id, None)
+                self._agendados.discard(chat_id)
+
+    async def _aguardar_vez(self, balde):
+        while True:
+            agora = time.monotonic()
+            espera = max(self._pausado_ate - agora, balde.espera(agora), self._balde_global.espera(agora))
+            if espera <= 0:
+                balde.consumir()
+                self._balde_global.consumir()
+                return
+            await asyncio.sleep(espera)
+
+    def _mesclar(self, chat_id):
+        # Junta todos os alertas pendentes do chat que couberem em uma mensagem;
+        # devolve também as entradas retiradas, para _devolver()
+        mensagens = self._pendentes[chat_id]
+        entradas = [mensagens.popleft()]
+        tamanho = len(entradas[0][0])
+        while mensagens and tamanho + len(SEPARADOR_MENSAGENS) + len(mensagens[0][0]) <= TAMANHO_MAX_MENSAGEM:
+            entradas.append(mensagens.popleft())
+            tamanho += len(SEPARADOR_MENSAGENS) + len(entradas[-1][0])
+        self.mescladas += len(entradas) - 1
+        self._quantidade_pendente -= len(entradas)
+        self._vaga.set()
+        mensagem = SEPARADOR_MENSAGENS.join(entrada[0] for entrada in entradas)[:TAMANHO_MAX_MENSAGEM]
+        return mensagem, entradas, sum(entrada[2] for entrada in entradas)
+
+    def _devolver(self, chat_id, entradas):
+        # Envio adiado: as entradas voltam, na ordem, para a frente do chat;
+        # devolve as que esgotaram max_rodadas (as mais antigas, sempre à frente)
+        entradas = [entrada[:4] + (entrada[4] + 1,) for entrada in entradas]
+        esgotadas = [entrada for entrada in entradas if entrada[4] >= self.max_rodadas]
+        voltam = entradas[len(esgotadas):]
+        self._pendentes.setdefault(chat_id, collections.deque()).extendleft(reversed(voltam))
+        self._quantidade_pendente += len(voltam)
+        self.adiadas += len(voltam)
+        return esgotadas
+
+    def _concluir(self, chat_id, entradas):
+        if self.ao_concluir is not None:
+            self.ao_concluir(chat_id, sum(entrada[2] for entrada in entradas))
+        for entrada in entradas:
+            if entrada[3] is not None:
+                self.fila.confirmar_disco(entrada[3])
+
+    async def _atender_chat(self, chat_id):
+        balde = self._baldes_chat.get(chat_id)
+        if balde is None:
+            balde = self._baldes_chat[chat_id] = BaldeDeTokens(self.taxa_por_chat, self.rajada_por_chat, time.monotonic())
+
+        # Espera a vez antes de mesclar: o que chegar durante a espera vai junto
+        await self._aguardar_vez(balde)
+        mensagem, entradas, _ = self._mesclar(chat_id)
+        resultado = await self._enviar(chat_id, balde, mensagem)
+        # Um envio cancelado no encerramento não conta: a mensagem fica pendente
+        if resultado == ADIADA:
+            # A API não respondeu a nenhuma tentativa: só o que esgotou
+            # max_rodadas é concluído; o resto volta e as linhas do banco ficam
+            esgotadas = self._devolver(chat_id, entradas)
+            if esgotadas:
+                self.falhas += 1
+                logger.error(f"{len(esgotadas)} mensagens para {chat_id} descartadas após {self.max_rodadas} rodadas de tentativas.")
+                self._concluir(chat_id, esgotadas)
+            self._adiamentos_seguidos += 1
+            if self._adiamentos_seguidos == LIMIAR_ADIAMENTOS:
+                logger.warning(f"{LIMIAR_ADIAMENTOS} envios ao Telegram adiados seguidos: fila e transbordo em disco suspensos.")
+                self.fila.suspender_disco(True)
+            if self.em_falha() and not self._quantidade_pendente:
+                # Nada sobrou para testar a API: volta a tirar da fila e do disco
+                self._retomar()
+            return
+        if self.em_falha():
+            logger.info("API do Telegram voltou a responder: fila e transbordo em disco retomados.")
+            self._retomar()
+        self._adiamentos_seguidos = 0
+        self._concluir(chat_id, entradas)
+        if resultado == ENTREGUE and self.observar_atraso is not None:
+            agora = time.monotonic()
+            for entrada in entradas:
+                self.observar_atraso(agora - entrada[1])
+
+    def _retomar(self):
+        self._adiamentos_seguidos = 0
+        self.fila.suspender_disco(False)
+        self._vaga.set()
+
+    async def _enviar(self, chat_id, balde, mensagem):
+        destino = self._migrados.get(chat_id, chat_id)
+        for tentativa in range(1, self.max_tentativas + 1):
+            if tentativa > 1:
+                await self._aguardar_vez(balde)
+            try:
+                await self.bot.send_message(chat_id=destino, text=mensagem)
+                self.enviadas += 1
+                logger.info(f"Mensagem Telegram enviada para {chat_id}: {mensagem}")
+                return ENTREGUE
+            except RetryAfter as e:
+                espera = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                # O 429 do Telegram vale para o bot todo: pausa todos os envios
+                self._pausado_ate = max(self._pausado_ate, time.monotonic() + espera)
+                logger.warning(f"Telegram pediu para aguardar {espera}s (chat {chat_id}, tentativa {tentativa}).")
+            except ChatMigrated as e:
+                if e.new_chat_id == destino:
+                    self.falhas += 1
+                    logger.error(f"Chat {chat_id} migrado para ele mesmo ({destino}); mensagem descartada.")
+                    return RECUSADA
+                # O grupo virou supergrupo: a próxima tentativa vai para o id novo
+                logger.warning(f"Chat {chat_id} migrou para {e.new_chat_id}; reenviando.")
+                self._migrados[chat_id] = destino = e.new_chat_id
+                if self.ao_migrar is not None:
+                    self.ao_migrar(chat_id, destino)
+            # BadRequest é subclasse de NetworkError no PTB: precisa vir antes
+            except (BadRequest, Forbidden) as e:
+                self.falhas += 1
+                logger.error(f"Erro ao enviar mensagem Telegram para {chat_id} (descartada): {e}")
+                return RECUSADA
+            except NetworkError as e:
+                espera = min(self.backoff_max, self.backoff_base * 2 ** (tentativa - 1)) * random.uniform(0.5, 1.0)
+                logger.warning(f"Falha ao enviar mensagem Telegram para {chat_id} (tentativa {tentativa}): {e}. Nova tentativa em {espera:.1f}s.")
+                await asyncio.sleep(espera)
+            except TelegramError as e:
+                self.falhas += 1
+                logger.error(f"Erro permanente ao enviar mensagem Telegram para {chat_id} (descartada): {e}")
+                return RECUSADA
+            if tentativa < self.max_tentativas:
+                self.retentativas += 1
+
+        # Só chega aqui com 429 (que já pausou os envios) ou falha de rede: a
+        # API está fora do alcance, então todos os envios esperam backoff_max
+        self._pausado_ate = max(self._pausado_ate, time.monotonic() + self.backoff_max)
+        logger.error(f"Erro ao enviar mensagem Telegram para {chat_id} após {self.max_tentativas} tentativas; "
+                     f"nova tentativa em {self.backoff_max:.0f}s.")
+        return ADIADA
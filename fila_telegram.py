@@ -0,0 +1,458 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+from despachante_telegram import TAMANHO_MAX_MENSAGEM, SEPARADOR_MENSAGENS
+
+# --- FILA DE MENSAGENS PARA O TELEGRAM ---
+# Recebe (chat_id, mensagem) de qualquer thread (rotas Flask) ou do próprio
+# event loop (servidor ASGI) e entrega ao consumidor assíncrono sem prender
+# uma thread em queue.get(). O consumidor só é acordado quando está esperando.
+# Cada item guarda o instante (time.monotonic) em que entrou na fila, para
+# medir o atraso até o envio.
+#
+# A fila guarda no máximo "limite" mensagens em memória. Com a API do Telegram
+# fora do ar as mensagens se acumulam aqui, e o que passar do limite segue a
+# política escolhida:
+#   "descartar_antigas": sai a mensagem mais antiga do mesmo chat (ou a mais
+#       antiga da fila, se o chat não tiver nenhuma esperando);
+#   "mesclar": a nova mensagem é anexada à última do mesmo chat, enquanto
+#       couber em uma mensagem do Telegram; senão, como "descartar_antigas";
+#   "disco": as mensagens passam a ser gravadas, na ordem, em segmentos no
+#       diretório de transbordo e voltam para a memória conforme a fila esvazia.
+# ao_descartar(chat_id, quantidade), se definido, é chamado para cada mensagem
+# descartada, como o ao_concluir do despachante. Uma entrada mesclada carrega a
+# quantidade de mensagens que representa.
+#
+# Os segmentos são só anexados (um registro por mensagem: tamanho de 4 bytes +
+# JSON). As mensagens voltam do disco em lotes, e cada entrada sabe de que lote
+# veio: o consumidor chama confirmar_disco(lote) quando ela sai de vez (entregue
+# ou recusada). A posição de leitura só é gravada, e os segmentos só são
+# apagados, quando todos os lotes até ali foram confirmados: se o processo cai,
+# retomar_transbordo() volta a entregar o que ainda não tinha saído. Com o
+# SQLite ligado ele é a fonte das mensagens pendentes e o transbordo é descartado.
+# suspender_disco(True) para de trazer lotes do disco (o despachante pede isso
+# enquanto a API do Telegram está fora do ar); as mensagens novas continuam
+# seguindo a política.
+#
+# pressao() é a fração do limite ocupada (memória + disco) e serve de sinal
+# para quem decide o que enfileirar.
+
+logger = logging.getLogger(__name__)
+
+POLITICA_DESCARTAR = "descartar_antigas"
+POLITICA_MESCLAR = "mesclar"
+POLITICA_DISCO = "disco"
+POLITICAS = (POLITICA_DESCARTAR, POLITICA_MESCLAR, POLITICA_DISCO)
+
+LIMITE_PADRAO = 10000
+LIMIAR_PRESSAO_PADRAO = 0.8
+TAMANHO_SEGMENTO = 8 * 1024 * 1024
+LOTE_DISCO = 1000  # mensagens trazidas do disco de cada vez
+EXTENSAO_SEGMENTO = ".seg"
+ARQUIVO_POSICAO = "posicao"
+CABECALHO = struct.Struct("<I")
+
+SINAL_PARADA = (None, None)
+
+
+class EntradaFila:
+    __slots__ = ("chat_id", "mensagem", "momento", "quantidade", "lote", "ativa")
+
+    def __init__(self, chat_id, mensagem, momento, quantidade, lote=None):
+        self.chat_id = chat_id
+        self.mensagem = mensagem
+        self.momento = momento
+        self.quantidade = quantidade
+        self.lote = lote  # lote do transbordo de onde veio (None: nunca foi ao disco)
+        self.ativa = True
+
+
+class FilaTelegram:
+    def __init__(self, limite=LIMITE_PADRAO, politica=POLITICA_DESCARTAR, diretorio_transbordo=None,
+                 limiar_pressao=LIMIAR_PRESSAO_PADRAO, ao_descartar=None):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de fila desconhecida: {politica} (use {', '.join(POLITICAS)})")
+        if politica == POLITICA_DISCO and not diretorio_transbordo:
+            raise ValueError("A política 'disco' precisa de um diretório de transbordo")
+        self.limite = max(1, limite)
+        self.politica = politica
+        self.diretorio = diretorio_transbordo
+        self.limiar_pressao = limiar_pressao
+        self.ao_descartar = ao_descartar
+
+        self._itens = collections.deque()   # EntradaFila na ordem de chegada (inativas são puladas)
+        self._por_chat = {}                  # chat_id -> deque das entradas ativas do chat
+        self._em_memoria = 0
+        self._inativas = 0
+        self._parada = False
+        self._lock = threading.Lock()
+        self._loop = None
+        self._evento = None
+        self._aguardando = False
+
+        # Transbordo em disco
+        self._no_disco = 0
+        self._segmento_escrita = 0
+        self._escritor = None
+        self._tamanho_escrita = 0
+        self._segmento_leitura = 0
+        self._posicao_leitura = 0
+        self._leitor = None
+        self._segmento_confirmado = 0
+        self._lotes = collections.OrderedDict()  # lote -> [entradas não confirmadas, (segmento, posição) depois dele]
+        self._proximo_lote = 0
+        self._disco_suspenso = False
+
+        self.descartadas = 0
+        self.mescladas = 0
+        self.transbordadas = 0
+
+    def qsize(self):
+        return self._em_memoria + self._no_disco
+
+    def empty(self):
+        return not self.qsize()
+
+    def em_disco(self):
+        return self._no_disco
+
+    def pressao(self):
+        # Passa de 1 quando há mensagens no disco
+        return (self._em_memoria + self._no_disco) / self.limite
+
+    def sob_pressao(self):
+        return self.pressao() >= self.limiar_pressao
+
+    def parada_pedida(self):
+        return self._parada
+
+    def suspender_disco(self, suspender):
+        with self._lock:
+            self._disco_suspenso = suspender
+            acordar = not suspender and self._aguardando and self._no_disco
+            if acordar:
+                self._aguardando = False
+        if acordar:
+            self._loop.call_soon_threadsafe(self._evento.set)
+
+    def confirmar_disco(self, lote):
+        # A entrada do lote saiu de vez: com o lote inteiro (e os anteriores)
+        # confirmado, a posição avança e os segmentos lidos podem ser apagados
+        with self._lock:
+            self._confirmar_lote(lote)
+
+    def put(self, item):
+        chat_id, mensagem = item
+        descartada = None
+        with self._lock:
+            if chat_id is None:
+                # O sinal de parada não conta no limite e fica depois do que
+                # já está na memória; o que está no disco continua lá
+                self._parada = True
+                self._itens.append(EntradaFila(None, None, time.monotonic(), 0))
+            elif self._no_disco or (self._em_memoria >= self.limite and self.politica == POLITICA_DISCO):
+                try:
+                    self._gravar_no_disco(chat_id, mensagem, 1, time.time())
+                except OSError as e:
+                    logger.error(f"Falha ao gravar no transbordo da fila do Telegram ({self.diretorio}): {e}. Descartando a mensagem mais antiga.")
+                    descartada = self._descartar_mais_antiga(chat_id)
+                    self._anexar(chat_id, mensagem, time.monotonic(), 1)
+            elif self._em_memoria < self.limite:
+                self._anexar(chat_id, mensagem, time.monotonic(), 1)
+            elif not (self.politica == POLITICA_MESCLAR and self._mesclar_na_ultima(chat_id, mensagem)):
+                descartada = self._descartar_mais_antiga(chat_id)
+                self._anexar(chat_id, mensagem, time.monotonic(), 1)
+            acordar = self._aguardando
+            self._aguardando = False
+        if descartada is not None and self.ao_descartar is not None:
+            self.ao_descartar(descartada.chat_id, descartada.quantidade)
+        if acordar:
+            self._loop.call_soon_threadsafe(self._evento.set)
+
+    def vincular_loop(self):
+        # Chamada pelo consumidor, de dentro do event loop que vai consumir a fila
+        self._loop = asyncio.get_running_loop()
+        self._evento = asyncio.Event()
+
+    async def get(self):
+        item, _ = await self.get_com_momento()
+        return item
+
+    async def get_com_momento(self):
+        # Sem confirmação de entrega: a entrada do transbordo é confirmada na hora
+        item, momento, _, lote = await self.get_entrada()
+        if lote is not None:
+            self.confirmar_disco(lote)
+        return item, momento
+
+    async def get_entrada(self):
+        # Devolve ((chat_id, mensagem), enfileirada_em, quantidade, lote); lote
+        # não None deve voltar em confirmar_disco() quando a mensagem sair de vez
+        while True:
+            with self._lock:
+                entrada = self._retirar()
+                if entrada is not None:
+                    if entrada.chat_id is None:
+                        self._parada = False
+                        return SINAL_PARADA, entrada.momento, 0, None
+                    return (entrada.chat_id, entrada.mensagem), entrada.momento, entrada.quantidade, entrada.lote
+                self._evento.clear()
+                self._aguardando = True
+            await self._evento.wait()
+
+    # --- Memória ---
+    # Devem ser chamadas com self._lock adquirido.
+
+    def _anexar(self, chat_id, mensagem, momento, quantidade, lote=None):
+        entrada = EntradaFila(chat_id, mensagem, momento, quantidade, lote)
+        self._itens.append(entrada)
+        self._por_chat.setdefault(chat_id, collections.deque()).append(entrada)
+        self._em_memoria += 1
+
+    def _retirar(self):
+        if self._no_disco and not self._parada and not self._disco_suspenso and self._em_memoria <= self.limite // 2:
+            self._carregar_do_disco()
+        while self._itens:
+            entrada = self._itens.popleft()
+            if not entrada.ativa:
+                self._inativas -= 1
+                continue
+            if entrada.chat_id is not None:
+                self._remover_do_chat(entrada)
+            return entrada
+        return None
+
+    def _remover_do_chat(self, entrada):
+        # A entrada é sempre a mais antiga do seu chat
+        do_chat = self._por_chat[entrada.chat_id]
+        do_chat.popleft()
+        if not do_chat:
+            del self._por_chat[entrada.chat_id]
+        self._em_memoria -= 1
+
+    def _mesclar_na_ultima(self, chat_id, mensagem):
+        do_chat = self._por_chat.get(chat_id)
+        if not do_chat:
+            return False
+        ultima = do_chat[-1]
+        if len(ultima.mensagem) + len(SEPARADOR_MENSAGENS) + len(mensagem) > TAMANHO_MAX_MENSAGEM:
+            return False
+        ultima.mensagem = f"{ultima.mensagem}{SEPARADOR_MENSAGENS}{mensagem}"
+        ultima.quantidade += 1
+        self.mescladas += 1
+        return True
+
+    def _descartar_mais_antiga(self, chat_id):
+        if not self._em_memoria:
+            return None
+        do_chat = self._por_chat.get(chat_id)
+        if do_chat:
+            vitima = do_chat[0]
+        else:
+            vitima = next(entrada for entrada in self._itens if entrada.ativa and entrada.chat_id is not None)
+        self._remover_do_chat(vitima)
+        vitima.ativa = False
+        self._inativas += 1
+        self.descartadas += vitima.quantidade
+        if vitima.lote is not None:
+            self._confirmar_lote(vitima.lote)
+        if self._inativas > self._em_memoria:
+            self._itens = collections.deque(entrada for entrada in self._itens if entrada.ativa)
+            self._inativas = 0
+        return vitima
+
+    # --- Transbordo em disco ---
+    # Devem ser chamadas com self._lock adquirido (ou antes de a fila ser usada).
+
+    def _caminho_segmento(self, numero):
+        return os.path.join(self.diretorio, f"{numero:010d}{EXTENSAO_SEGMENTO}")
+
+    def _gravar_no_disco(self, chat_id, mensagem, quantidade, ts):
+        if self._escritor is None:
+            os.makedirs(self.diretorio, exist_ok=True)
+            self._escritor = open(self._caminho_segmento(self._segmento_escrita), "ab")
+            self._tamanho_escrita = self._escritor.tell()
+        dados = json.dumps([chat_id, mensagem, quantidade, ts], ensure_ascii=False).encode("utf-8")
+        self._escritor.write(CABECALHO.pack(len(dados)) + dados)
+        # flush a cada mensagem: sobrevive à queda do processo (não à do sistema)
+        self._escritor.flush()
+        self._tamanho_escrita += CABECALHO.size + len(dados)
+        self._no_disco += 1
+        self.transbordadas += 1
+        if self._tamanho_escrita >= TAMANHO_SEGMENTO:
+            self._escritor.close()
+            self._escritor = None
+            self._segmento_escrita += 1
+
+    def _ler_registro(self):
+        # Devolve o próximo registro do segmento em leitura, ou None no fim dele
+        if self._leitor is None:
+            self._leitor = open(self._caminho_segmento(self._segmento_leitura), "rb")
+            self._leitor.seek(self._posicao_leitura)
+        cabecalho = self._leitor.read(CABECALHO.size)
+        if len(cabecalho) == CABECALHO.size:
+            (tamanho,) = CABECALHO.unpack(cabecalho)
+            dados = self._leitor.read(tamanho)
+            if len(dados) == tamanho:
+                self._posicao_leitura += CABECALHO.size + tamanho
+                return json.loads(dados)
+        # Fim do segmento ou registro incompleto (gravação interrompida)
+        self._leitor.seek(self._posicao_leitura)
+        return None
+
+    def _avancar_segmento(self):
+        # O segmento lido fica no disco até _confirmar_lote()
+        if self._segmento_leitura >= self._segmento_escrita:
+            return False
+        self._leitor.close()
+        self._leitor = None
+        self._segmento_leitura += 1
+        self._posicao_leitura = 0
+        return True
+
+    def _carregar_do_disco(self):
+        quantidade = min(LOTE_DISCO, self.limite - self._em_memoria)
+        agora, agora_monotonico = time.time(), time.monotonic()
+        lote = self._proximo_lote
+        carregadas = 0
+        try:
+            while quantidade > 0 and self._no_disco:
+                registro = self._ler_registro()
+                if registro is None:
+                    if self._avancar_segmento():
+                        continue
+                    logger.error(f"Transbordo da fila do Telegram terminou antes do esperado; {self._no_disco} mensagens perdidas.")
+                    self._no_disco = 0
+                    break
+                chat_id, mensagem, quantidade_registro, ts = registro
+                self._anexar(chat_id, mensagem, agora_monotonico - max(0.0, agora - ts), quantidade_registro, lote)
+                self._no_disco -= 1
+                quantidade -= 1
+                carregadas += 1
+        except (OSError, ValueError) as e:
+            logger.error(f"Falha ao ler o transbordo da fila do Telegram ({self.diretorio}): {e}. {self._no_disco} mensagens perdidas.")
+            self._no_disco = 0
+        if carregadas:
+            self._proximo_lote += 1
+            self._lotes[lote] = [carregadas, (self._segmento_leitura, self._posicao_leitura)]
+        elif not self._no_disco and not self._lotes:
+            self._limpar_transbordo()
+
+    def _confirmar_lote(self, lote):
+        pendente = self._lotes.get(lote)
+        if pendente is None:
+            return
+        pendente[0] -= 1
+        marca = None
+        while self._lotes and next(iter(self._lotes.values()))[0] <= 0:
+            marca = self._lotes.popitem(last=False)[1][1]
+        if marca is None:
+            return
+        try:
+            if not self._no_disco and not self._lotes:
+                self._limpar_transbordo()
+                return
+            segmento, posicao = marca
+            self._salvar_posicao(segmento, posicao)
+            for numero in range(self._segmento_confirmado, segmento):
+                if os.path.exists(self._caminho_segmento(numero)):
+                    os.remove(self._caminho_segmento(numero))
+            self._segmento_confirmado = segmento
+        except OSError as e:
+            logger.error(f"Falha ao atualizar o transbordo da fila do Telegram ({self.diretorio}): {e}")
+
+    def _salvar_posicao(self, segmento, posicao):
+        temporario = os.path.join(self.diretorio, f"{ARQUIVO_POSICAO}.tmp")
+        with open(temporario, "w") as arquivo:
+            json.dump([segmento, posicao], arquivo)
+        os.replace(temporario, os.path.join(self.diretorio, ARQUIVO_POSICAO))
+
+    def _fechar_arquivos(self):
+        for arquivo in (self._leitor, self._escritor):
+            if arquivo is not None:
+                arquivo.close()
+        self._leitor = self._escritor = None
+
+    def _limpar_transbordo(self):
+        # Disco vazio: apaga os segmentos e recomeça a numeração depois do último
+        self._fechar_arquivos()
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith(EXTENSAO_SEGMENTO) or nome.startswith(ARQUIVO_POSICAO):
+                os.remove(os.path.join(self.diretorio, nome))
+        self._segmento_escrita += 1
+        self._segmento_leitura = self._segmento_confirmado = self._segmento_escrita
+        self._posicao_leitura = 0
+        self._lotes.clear()
+
+    def _segmentos_no_disco(self):
+        if not self.diretorio or not os.path.isdir(self.diretorio):
+            return []
+        return sorted(int(nome[:-len(EXTENSAO_SEGMENTO)]) for nome in os.listdir(self.diretorio)
+                      if nome.endswith(EXTENSAO_SEGMENTO) and nome[:-len(EXTENSAO_SEGMENTO)].isdigit())
+
+    def descartar_transbordo(self):
+        # Com o SQLite ligado, as mensagens do transbordo voltam por ele
+        with self._lock:
+            if self._segmentos_no_disco():
+                logger.info(f"Transbordo da fila do Telegram em {self.diretorio} descartado: as mensagens pendentes vêm do banco.")
+                self._limpar_transbordo()
+
+    def retomar_transbordo(self):
+        # Depois de um reinício sem o SQLite: continua a leitura dos segmentos
+        # de onde ela parou. Deve ser chamada antes de a fila receber mensagens.
+        with self._lock:
+            segmentos = self._segmentos_no_disco()
+            if not segmentos:
+                return 0
+            segmento, posicao = segmentos[0], 0
+            try:
+                with open(os.path.join(self.diretorio, ARQUIVO_POSICAO)) as arquivo:
+                    salvo, posicao_salva = json.load(arquivo)
+                if salvo in segmentos:
+                    segmento, posicao = salvo, posicao_salva
+            except (OSError, ValueError):
+                pass
+            for antigo in segmentos:
+                if antigo < segmento:
+                    os.remove(self._caminho_segmento(antigo))
+
+            # Conta os registros completos que faltam ler
+            total = 0
+            for numero in range(segmento, segmentos[-1] + 1):
+                try:
+                    with open(self._caminho_segmento(numero), "rb") as arquivo:
+                        arquivo.seek(posicao if numero == segmento else 0)
+                        while True:
+                            cabecalho = arquivo.read(CABECALHO.size)
+                            if len(cabecalho) < CABECALHO.size:
+                                break
+                            (tamanho,) = CABECALHO.unpack(cabecalho)
+                            if len(arquivo.read(tamanho)) < tamanho:
+                                break
+                            total += 1
+                except FileNotFoundError:
+                    # Buraco na numeração: o segmento vazio é criado para a leitura avançar
+                    open(self._caminho_segmento(numero), "ab").close()
+
+            self._segmento_leitura, self._posicao_leitura = segmento, posicao
+            self._segmento_confirmado = segmento
+            # Novas mensagens vão para um segmento novo, depois de um possível registro incompleto
+            self._segmento_escrita = segmentos[-1] + 1
+            self._no_disco = total
+            if not total:
+                self._limpar_transbordo()
+        if total:
+            logger.info(f"{total} mensagens do Telegram retomadas do transbordo em {self.diretorio}.")
+        return total
+
+    def fechar(self):
+        # A posição gravada é a da última confirmação: o que foi lido do disco
+        # e não saiu volta no próximo retomar_transbordo()
+        with self._lock:
+            self._fechar_arquivos()
@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from servico_vaso import (registro_vasos, avisos_instrucao, metricas, processar_lote, ler_leitura_lote,
+                          instrucao_em_cache, MAX_LEITURAS_LOTE, ID_PROCESSO)
+from registro_vasos import normalizar_vaso_id
+from quadro_binario import ler_quadro, MAGICO_QUADRO
+from log_assincrono import amostragem
+from metricas import Coletor
+
+# --- GATEWAY MQTT ---
+# Alternativa ao POST /update_sensor_data a cada leitura: o ESP32 mantém uma
+# conexão MQTT aberta, publica as leituras em <prefixo>/<vaso_id>/leituras e
+# assina <prefixo>/<vaso_id>/instrucao, que o servidor publica com retain: ao
+# (re)conectar, o dispositivo recebe na hora a instrução atual do LCD.
+#
+# O payload das leituras é o JSON de /update_sensor_data ({"umidade",
+# "luminosidade" e "ts" opcional), uma lista desses objetos (leituras
+# acumuladas) ou um quadro binário (quadro_binario.py). O vaso_id vem sempre
+# do tópico.
+#
+# As mensagens chegam na thread de rede do paho e vão para uma fila limitada
+# (cheia, a mensagem é descartada: as leituras usam QoS 0). A thread do gateway
+# junta tudo o que chegou e passa pelo caminho vetorizado do lote
+# (servico_vaso.processar_lote), com a mesma decisão de tomar_decisao_planta():
+# com muitos dispositivos, cada volta avalia centenas de leituras de uma vez.
+# Cada leitura é validada (servico_vaso.ler_leitura_lote) antes de entrar no
+# lote: um payload ruim perde só as próprias leituras, e um erro inesperado em
+# um pedaço do lote não impede os outros pedaços nem a publicação das
+# instruções dos vasos já atualizados.
+#
+# A instrução é publicada quando muda, venha a mudança do MQTT, do HTTP ou do
+# bot (avisos_instrucao.ao_publicar), e na primeira leitura de cada vaso, com o
+# corpo de /get_instruction já serializado (QoS 1, retain). Roda nos modos Flask
+# e ASGI; no multiprocesso o estado quente fica na tabela compartilhada.
+#
+# Precisa do paho-mqtt (pip install paho-mqtt). Para testar sem um broker de
+# verdade: python benchmarks/broker_mqtt_local.py
+
+logger = logging.getLogger(__name__)
+
+# VASO_MQTT_BROKER vazio (padrão) deixa o gateway desligado
+BROKER_MQTT = os.environ.get('VASO_MQTT_BROKER', '')
+PORTA_MQTT = int(os.environ.get('VASO_MQTT_PORTA', '1883'))
+PREFIXO_MQTT = os.environ.get('VASO_MQTT_PREFIXO', 'vaso').strip('/')
+USUARIO_MQTT = os.environ.get('VASO_MQTT_USUARIO') or None
+SENHA_MQTT = os.environ.get('VASO_MQTT_SENHA') or None
+KEEPALIVE_MQTT = 60
+QOS_LEITURAS = 0
+QOS_INSTRUCAO = 1
+MAX_FILA_MQTT = 100000  # mensagens recebidas aguardando a thread do gateway
+TIMEOUT_ENCERRAMENTO = 5.0
+ORIGEM = "mqtt"  # no lugar do IP nos logs do lote
+
+# Itens da fila do gateway
+LEITURA = 0
+INSTRUCAO = 1
+RECONECTADO = 2
+
+
+class GatewayMQTT:
+    def __init__(self, broker, porta=PORTA_MQTT, prefixo=PREFIXO_MQTT, usuario=USUARIO_MQTT, senha=SENHA_MQTT,
+                 cliente_id=None):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            raise SystemExit("O gateway MQTT precisa do paho-mqtt: pip install paho-mqtt")
+        self.broker = broker
+        self.porta = porta
+        self.prefixo = prefixo
+        self._sufixo_leituras = "/leituras"
+        self._sucesso = mqtt.MQTT_ERR_SUCCESS
+        self._cliente = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2,
+                                    client_id=cliente_id or f"vaso-servidor-{ID_PROCESSO}")
+        if usuario:
+            self._cliente.username_pw_set(usuario, senha)
+        self._cliente.reconnect_delay_set(1, 30)
+        self._cliente.on_connect = self._ao_conectar
+        self._cliente.on_disconnect = self._ao_desconectar
+        self._cliente.on_message = self._ao_receber
+
+        self._fila = queue.Queue(MAX_FILA_MQTT)
+        self._publicadas = {}  # vaso_id -> versao_instrucao publicada (só a thread do gateway mexe)
+        self._thread = None
+        self.conectado = False
+
+        self.recebidas = 0
+        self.descartadas = 0
+        self.invalidas = 0
+        self.leituras = 0
+        self.publicadas = 0
+
+    # --- Thread de rede do paho ---
+
+    def _ao_conectar(self, cliente, dados, flags, codigo, propriedades):
+        if codigo.is_failure:
+            logger.error(f"Broker MQTT {self.broker}:{self.porta} recusou a conexão: {codigo}")
+            return
+        self.conectado = True
+        cliente.subscribe(f"{self.prefixo}/+{self._sufixo_leituras}", qos=QOS_LEITURAS)
+        # O broker pode ter perdido as mensagens retidas: republica na próxima leitura de cada vaso
+        self._enfileirar((RECONECTADO, None, None))
+        logger.info(f"Gateway MQTT conectado a {self.broker}:{self.porta}, assinando {self.prefixo}/+{self._sufixo_leituras}.")
+
+    def _ao_desconectar(self, cliente, dados, flags, codigo, propriedades):
+        self.conectado = False
+        if codigo.is_failure:
+            logger.warning(f"Gateway MQTT desconectado de {self.broker}:{self.porta} ({codigo}); reconectando.")
+
+    def _ao_receber(self, cliente, dados, mensagem):
+        self.recebidas += 1
+        topico = mensagem.topic
+        vaso_id = None
+        if topico.startswith(self.prefixo) and topico.endswith(self._sufixo_leituras):
+            vaso_id = normalizar_vaso_id(topico[len(self.prefixo) + 1:-len(self._sufixo_leituras)])
+        if vaso_id is None:
+            self.invalidas += 1
+            if amostragem.permitir("mqtt"):
+                logger.warning(f"Gateway MQTT: tópico sem vaso_id válido ignorado ({topico!r}).")
+            return
+        self._enfileirar((LEITURA, vaso_id, mensagem.payload))
+
+    def _enfileirar(self, item):
+        try:
+            self._fila.put_nowait(item)
+        except queue.Full:
+            self.descartadas += 1
+
+    # Chamada por avisos_instrucao com o lock do vaso adquirido: só anota o vaso
+    def instrucao_mudou(self, vaso_id):
+        self._enfileirar((INSTRUCAO, vaso_id, None))
+
+    # --- Thread do gateway ---
+
+    def _executar(self):
+        while True:
+            itens = [self._fila.get()]
+            while len(itens) < MAX_LEITURAS_LOTE:
+                try:
+                    itens.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            parar = None in itens
+            try:
+                self._processar([item for item in itens if item is not None])
+            except Exception as e:
+                logger.error(f"Gateway MQTT: erro ao processar {len(itens)} mensagens: {e}")
+            if parar:
+                return
+
+    def _processar(self, itens):
+        leituras = []
+        vasos = {}  # vaso_id -> None, na ordem de chegada
+        agora = time.time()
+        for tipo, vaso_id, payload in itens:
+            if tipo == RECONECTADO:
+                self._publicadas.clear()
+                continue
+            if tipo == LEITURA:
+                try:
+                    leituras.extend(self._validar(vaso_id, self._decodificar(vaso_id, payload), agora))
+                except ValueError as e:
+                    self.invalidas += 1
+                    if amostragem.permitir("mqtt"):
+                        logger.warning(f"Gateway MQTT: leitura inválida do vaso {vaso_id}: {e}")
+                    continue
+            vasos[vaso_id] = None
+
+        try:
+            for inicio in range(0, len(leituras), MAX_LEITURAS_LOTE):
+                parte = leituras[inicio:inicio + MAX_LEITURAS_LOTE]
+                try:
+                    corpo, status = processar_lote(lambda: (parte, None), ORIGEM)[:2]
+                except Exception as e:
+                    self.invalidas += len(parte)
+                    logger.error(f"Gateway MQTT: erro ao processar {len(parte)} leituras "
+                                 f"de {len({leitura['vaso_id'] for leitura in parte})} vasos: {e}")
+                    continue
+                if status == 200:
+                    self.leituras += corpo["leituras_processadas"]
+                    self.invalidas += len(corpo["erros"])
+                else:
+                    self.invalidas += len(parte)
+        finally:
+            # Mesmo com erro, os vasos atualizados antes dele recebem a instrução nova
+            for vaso_id in vasos:
+                try:
+                    self._publicar_instrucao(vaso_id)
+                except Exception as e:
+                    logger.error(f"Gateway MQTT: erro ao publicar a instrução do vaso {vaso_id}: {e}")
+
+    # Valida as leituras de um dispositivo; uma inválida descarta só ela
+    def _validar(self, vaso_id, leituras, agora):
+        validas = []
+        for leitura in leituras:
+            try:
+                _, ts, umidade, luminosidade = ler_leitura_lote(leitura, vaso_id, agora)
+            except ValueError as e:
+                self.invalidas += 1
+                if amostragem.permitir("mqtt"):
+                    logger.warning(f"Gateway MQTT: leitura inválida do vaso {vaso_id}: {e}")
+                continue
+            validas.append({"vaso_id": vaso_id, "ts": ts, "umidade": umidade, "luminosidade": luminosidade})
+        return validas
+
+    def _decodificar(self, vaso_id, payload):
+        if payload[:len(MAGICO_QUADRO)] == MAGICO_QUADRO:
+            quadro = ler_quadro(payload, MAX_LEITURAS_LOTE)
+            if normalizar_vaso_id(quadro.vaso_id) != vaso_id:
+                raise ValueError(f"quadro do vaso {quadro.vaso_id!r} publicado no tópico de outro vaso")
+            # As amostras seguem para _validar (ler_leitura_lote), que recusa
+            # as mais antigas que o histórico, como no lote JSON
+            timestamps, umidades, luminosidades = quadro.colunas(time.time())
+            return [{"vaso_id": vaso_id, "ts": ts, "umidade": umidade, "luminosidade": luminosidade}
+                    for ts, umidade, luminosidade in zip(timestamps.tolist(), umidades.tolist(), luminosidades.tolist())]
+        dados = json.loads(payload)
+        if isinstance(dados, dict):
+            dados = [dados]
+        if not isinstance(dados, list) or not all(isinstance(leitura, dict) for leitura in dados):
+            raise ValueError("envie um objeto JSON, uma lista de objetos ou um quadro binário")
+        for leitura in dados:
+            leitura["vaso_id"] = vaso_id
+        return dados
+
+    def _publicar_instrucao(self, vaso_id):
+        vaso = registro_vasos.obter(vaso_id)
+        if vaso is None or self._publicadas.get(vaso_id) == vaso.versao_instrucao:
+            return
+        versao, dados = instrucao_em_cache(vaso)
+        resultado = self._cliente.publish(f"{self.prefixo}/{vaso_id}/instrucao", dados, qos=QOS_INSTRUCAO, retain=True)
+        # Sem conexão o paho guarda a mensagem e envia ao reconectar
+        if resultado.rc == self._sucesso:
+            self._publicadas[vaso_id] = versao
+            self.publicadas += 1
+
+    # --- Início e fim ---
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._executar, name="gateway-mqtt", daemon=True)
+        self._thread.start()
+        avisos_instrucao.ao_publicar = self.instrucao_mudou
+        self._cliente.connect_async(self.broker, self.porta, KEEPALIVE_MQTT)
+        self._cliente.loop_start()
+        logger.info(f"Gateway MQTT iniciado: broker {self.broker}:{self.porta}, prefixo '{self.prefixo}'.")
+
+    def parar(self):
+        avisos_instrucao.ao_publicar = None
+        self._cliente.disconnect()
+        self._cliente.loop_stop()
+        try:
+            self._fila.put(None, timeout=TIMEOUT_ENCERRAMENTO)
+        except queue.Full:
+            pass
+        self._thread.join(TIMEOUT_ENCERRAMENTO)
+        logger.info(f"Gateway MQTT encerrado: {self.leituras} leituras, {self.publicadas} instruções publicadas.")
+
+    def pendentes(self):
+        return self._fila.qsize()
+
+
+# --- GATEWAY DO SERVIDOR ---
+# Usado por app_servidor.py e servidor_asgi.py: sobe o gateway se
+# VASO_MQTT_BROKER estiver definido. Deve vir depois de iniciar_persistencia().
+gateway = None
+
+def iniciar_gateway_mqtt(broker=BROKER_MQTT):
+    global gateway
+    if not broker:
+        return None
+    gateway = GatewayMQTT(broker)
+    gateway.iniciar()
+    return gateway
+
+def encerrar_gateway_mqtt():
+    global gateway
+    if gateway is not None:
+        gateway.parar()
+        gateway = None
+
+metricas.registrar(Coletor(
+    "vaso_mqtt_mensagens_total", "Mensagens recebidas pelo gateway MQTT, por resultado.",
+    lambda: {} if gateway is None else {("recebida",): gateway.recebidas, ("invalida",): gateway.invalidas,
+                                        ("descartada",): gateway.descartadas},
+    tipo="counter", rotulos=("resultado",)))
+metricas.registrar(Coletor(
+    "vaso_mqtt_leituras_total", "Leituras processadas pelo gateway MQTT.",
+    lambda: 0 if gateway is None else gateway.leituras, tipo="counter"))
+metricas.registrar(Coletor(
+    "vaso_mqtt_instrucoes_publicadas_total", "Instruções do LCD publicadas pelo gateway MQTT.",
+    lambda: 0 if gateway is None else gateway.publicadas, tipo="counter"))
+metricas.registrar(Coletor(
+    "vaso_mqtt_fila_mensagens", "Mensagens MQTT aguardando a thread do gateway.",
+    lambda: 0 if gateway is None else gateway.pendentes()))
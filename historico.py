@@ -0,0 +1,274 @@
+import json
+import math
+import os
+import struct
+
+import numpy as np
+
+# --- HISTÓRICO DE LEITURAS POR VASO ---
+# Cada vaso guarda um buffer circular de leituras brutas e três níveis de
+# agregados (minuto, hora, dia) em arrays NumPy. O consumo de memória por vaso
+# tem um teto, não importa há quanto tempo ele envia leituras: o que sai da
+# janela bruta continua disponível nos agregados. Os buffers começam com
+# CAPACIDADE_INICIAL registros e dobram conforme enchem, então um vaso novo (ou
+# que envia pouco) não paga pelo ano inteiro de agregados diários: o teto
+# (~52 KB por vaso com as capacidades padrão) só é atingido depois de um ano.
+# As capacidades podem ser reduzidas pelas variáveis VASO_HISTORICO_*.
+
+def _capacidade(variavel, padrao):
+    return max(1, int(os.environ.get(variavel, padrao)))
+
+CAPACIDADE_INICIAL = 16
+CAPACIDADE_BRUTA = _capacidade('VASO_HISTORICO_BRUTO', 900)          # 15 minutos a 1 leitura/s
+NIVEIS_AGREGADOS = (
+    ("minuto", 60, _capacidade('VASO_HISTORICO_MINUTOS', 360)),      # 6 horas
+    ("hora", 3600, _capacidade('VASO_HISTORICO_HORAS', 336)),        # 14 dias
+    ("dia", 86400, _capacidade('VASO_HISTORICO_DIAS', 365)),         # 1 ano
+)
+# Snapshots gravados antes do crescimento sob demanda guardam os buffers
+# inteiros com estas capacidades e não trazem "tamanhos" no cabeçalho
+TAMANHOS_LEGADO = {"bruto": 900, "minuto": 360, "hora": 336, "dia": 365}
+RESOLUCOES = ("bruto",) + tuple(nome for nome, _, _ in NIVEIS_AGREGADOS)
+# Até onde o nível mais grosso chega: leituras mais antigas não têm onde entrar
+JANELA_HISTORICO = NIVEIS_AGREGADOS[-1][1] * NIVEIS_AGREGADOS[-1][2]
+MAX_PONTOS_AUTO = 1000
+CAMPOS_ACUMULADORES = (
+    "leituras",
+    "soma_umidade", "min_umidade", "max_umidade",
+    "soma_luminosidade", "min_luminosidade", "max_luminosidade",
+)
+
+DTYPE_BRUTO = np.dtype([
+    ("ts", np.float64),
+    ("umidade", np.float32),
+    ("luminosidade", np.float32),
+])
+
+DTYPE_AGREGADO = np.dtype([
+    ("ts", np.float64),
+    ("leituras", np.uint32),
+    ("umidade_media", np.float32),
+    ("umidade_min", np.float32),
+    ("umidade_max", np.float32),
+    ("luminosidade_media", np.float32),
+    ("luminosidade_min", np.float32),
+    ("luminosidade_max", np.float32),
+])
+
+
+class BufferCircular:
+    __slots__ = ("dados", "capacidade", "posicao", "cheio")
+
+    def __init__(self, dtype, capacidade):
+        self.capacidade = capacidade
+        self.dados = np.zeros(min(capacidade, CAPACIDADE_INICIAL), dtype=dtype)
+        self.posicao = 0
+        self.cheio = False
+
+    def __len__(self):
+        return self.capacidade if self.cheio else self.posicao
+
+    def adicionar(self, registro):
+        self.dados[self.posicao] = registro
+        self.posicao += 1
+        if self.posicao == len(self.dados):
+            if len(self.dados) < self.capacidade:
+                self._crescer(self.posicao + 1)
+            else:
+                self.posicao = 0
+                self.cheio = True
+
+    def _crescer(self, minimo):
+        # Dobra o array (até a capacidade) até caberem "minimo" registros
+        tamanho = len(self.dados)
+        while tamanho < minimo and tamanho < self.capacidade:
+            tamanho = min(2 * tamanho, self.capacidade)
+        dados = np.zeros(tamanho, dtype=self.dados.dtype)
+        dados[:self.posicao] = self.dados[:self.posicao]
+        self.dados = dados
+
+    def preencher(self, registros):
+        # Carrega registros em ordem cronológica (snapshot); se a capacidade
+        # diminuiu, ficam os mais recentes
+        registros = registros[len(registros) - min(len(registros), self.capacidade):]
+        self.posicao = 0
+        self._crescer(len(registros) + 1)
+        self.dados[:len(registros)] = registros
+        self.cheio = len(registros) == self.capacidade
+        self.posicao = 0 if self.cheio else len(registros)
+
+    def ordenados(self):
+        if not self.cheio:
+            return self.dados[:self.posicao]
+        return np.concatenate((self.dados[self.posicao:], self.dados[:self.posicao]))
+
+    def ts_mais_antigo(self):
+        if len(self) == 0:
+            return math.inf
+        return float(self.dados["ts"][self.posicao if self.cheio else 0])
+
+
+class NivelAgregado:
+    __slots__ = (
+        "nome", "segundos", "buffer",
+        "inicio", "leituras",
+        "soma_umidade", "min_umidade", "max_umidade",
+        "soma_luminosidade", "min_luminosidade", "max_luminosidade",
+    )
+
+    def __init__(self, nome, segundos, capacidade):
+        self.nome = nome
+        self.segundos = segundos
+        self.buffer = BufferCircular(DTYPE_AGREGADO, capacidade)
+        self.inicio = None
+        self.leituras = 0
+
+    def adicionar(self, ts, umidade, luminosidade):
+        inicio = ts - ts % self.segundos
+        if self.inicio is None or inicio > self.inicio:
+            if self.inicio is not None:
+                self.buffer.adicionar(self.registro_atual())
+            self.inicio = inicio
+            self.leituras = 0
+            self.soma_umidade = self.soma_luminosidade = 0.0
+            self.min_umidade = self.max_umidade = umidade
+            self.min_luminosidade = self.max_luminosidade = luminosidade
+        # Leituras atrasadas (de um intervalo já fechado) entram no intervalo aberto
+        self.leituras += 1
+        self.soma_umidade += umidade
+        self.soma_luminosidade += luminosidade
+        if umidade < self.min_umidade:
+            self.min_umidade = umidade
+        elif umidade > self.max_umidade:
+            self.max_umidade = umidade
+        if luminosidade < self.min_luminosidade:
+            self.min_luminosidade = luminosidade
+        elif luminosidade > self.max_luminosidade:
+            self.max_luminosidade = luminosidade
+
+    def registro_atual(self):
+        return (
+            self.inicio, self.leituras,
+            self.soma_umidade / self.leituras, self.min_umidade, self.max_umidade,
+            self.soma_luminosidade / self.leituras, self.min_luminosidade, self.max_luminosidade,
+        )
+
+    def exportar_estado(self):
+        estado = {"posicao": self.buffer.posicao, "cheio": self.buffer.cheio, "inicio": self.inicio}
+        if self.inicio is not None:
+            estado.update({campo: getattr(self, campo) for campo in CAMPOS_ACUMULADORES})
+        return estado
+
+    def importar_estado(self, estado):
+        self.inicio = estado["inicio"]
+        if self.inicio is not None:
+            for campo in CAMPOS_ACUMULADORES:
+                setattr(self, campo, estado[campo])
+
+    def ordenados(self):
+        dados = self.buffer.ordenados()
+        if self.inicio is None:
+            return dados
+        atual = np.array([self.registro_atual()], dtype=DTYPE_AGREGADO)
+        return np.concatenate((dados, atual))
+
+    def ts_mais_antigo(self):
+        if len(self.buffer):
+            return self.buffer.ts_mais_antigo()
+        return math.inf if self.inicio is None else self.inicio
+
+
+class HistoricoVaso:
+    __slots__ = ("bruto", "niveis")
+
+    def __init__(self):
+        self.bruto = BufferCircular(DTYPE_BRUTO, CAPACIDADE_BRUTA)
+        self.niveis = {nome: NivelAgregado(nome, segundos, capacidade) for nome, segundos, capacidade in NIVEIS_AGREGADOS}
+
+    def adicionar(self, ts, umidade, luminosidade):
+        self.bruto.adicionar((ts, umidade, luminosidade))
+        for nivel in self.niveis.values():
+            nivel.adicionar(ts, umidade, luminosidade)
+
+    def escolher_resolucao(self, inicio, fim):
+        # A resolução mais fina que ainda cobre o início do intervalo (ou que
+        # ainda não descartou nada) e não devolve pontos demais.
+        if not self.bruto.cheio or self.bruto.ts_mais_antigo() <= inicio:
+            return "bruto"
+        for nome, segundos, _ in NIVEIS_AGREGADOS:
+            nivel = self.niveis[nome]
+            cobre_inicio = not nivel.buffer.cheio or nivel.ts_mais_antigo() <= inicio
+            if cobre_inicio and (fim - inicio) / segundos <= MAX_PONTOS_AUTO:
+                return nome
+        return NIVEIS_AGREGADOS[-1][0]
+
+    def consultar(self, inicio, fim, resolucao="auto"):
+        if resolucao == "auto":
+            resolucao = self.escolher_resolucao(inicio, fim)
+        if resolucao == "bruto":
+            dados = self.bruto.ordenados()
+            selecao = dados[(dados["ts"] >= inicio) & (dados["ts"] <= fim)]
+        else:
+            nivel = self.niveis[resolucao]
+            dados = nivel.ordenados()
+            # Inclui o intervalo agregado que começa antes de "inicio" mas o cobre
+            selecao = dados[(dados["ts"] > inicio - nivel.segundos) & (dados["ts"] <= fim)]
+        return resolucao, {campo: selecao[campo].tolist() for campo in selecao.dtype.names}
+
+    # --- Snapshot binário (persistência) ---
+    # Formato: tamanho do cabeçalho (uint32) + cabeçalho JSON com posições,
+    # tamanhos alocados e acumuladores + os arrays de cada buffer (só a parte
+    # alocada), na ordem de NIVEIS_AGREGADOS. Na importação os registros são
+    # recolocados em ordem, então as capacidades podem mudar entre reinícios.
+
+    def _buffers(self):
+        return [("bruto", self.bruto)] + [(nome, self.niveis[nome].buffer) for nome, _, _ in NIVEIS_AGREGADOS]
+
+    def exportar(self):
+        cabecalho = json.dumps({
+            "bruto": {"posicao": self.bruto.posicao, "cheio": self.bruto.cheio},
+            "niveis": {nome: nivel.exportar_estado() for nome, nivel in self.niveis.items()},
+            "tamanhos": {nome: len(buffer.dados) for nome, buffer in self._buffers()},
+        }).encode("utf-8")
+        partes = [struct.pack("<I", len(cabecalho)), cabecalho]
+        partes.extend(buffer.dados.tobytes() for _, buffer in self._buffers())
+        return b"".join(partes)
+
+    @classmethod
+    def importar(cls, dados):
+        # ValueError se o snapshot estiver truncado ou corrompido
+        dados = memoryview(dados)
+        if len(dados) < 4:
+            raise ValueError("snapshot de histórico truncado")
+        (tamanho_cabecalho,) = struct.unpack_from("<I", dados)
+        cabecalho = json.loads(bytes(dados[4:4 + tamanho_cabecalho]))
+        tamanhos = cabecalho.get("tamanhos", TAMANHOS_LEGADO)
+
+        historico = cls()
+        buffers = historico._buffers()
+        estados = [cabecalho["bruto"]] + [cabecalho["niveis"][nome] for nome, _, _ in NIVEIS_AGREGADOS]
+        esperado = 4 + tamanho_cabecalho + sum(tamanhos[nome] * buffer.dados.dtype.itemsize for nome, buffer in buffers)
+        if len(dados) != esperado:
+            raise ValueError("snapshot de histórico com tamanho incompatível")
+
+        posicao = 4 + tamanho_cabecalho
+        for (nome, buffer), estado in zip(buffers, estados):
+            dtype = buffer.dados.dtype
+            gravados = np.frombuffer(dados[posicao:posicao + tamanhos[nome] * dtype.itemsize], dtype=dtype)
+            posicao += tamanhos[nome] * dtype.itemsize
+            if estado["cheio"]:
+                gravados = np.concatenate((gravados[estado["posicao"]:], gravados[:estado["posicao"]]))
+            else:
+                gravados = gravados[:estado["posicao"]]
+            buffer.preencher(gravados)
+        for nome, nivel in historico.niveis.items():
+            nivel.importar_estado(cabecalho["niveis"][nome])
+        return historico
+
+
+def bytes_por_vaso():
+    # Teto de memória dos buffers de um vaso (todos cheios)
+    total = CAPACIDADE_BRUTA * DTYPE_BRUTO.itemsize
+    for _, _, capacidade in NIVEIS_AGREGADOS:
+        total += capacidade * DTYPE_AGREGADO.itemsize
+    return total
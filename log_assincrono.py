@@ -0,0 +1,171 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# --- LOG ASSÍNCRONO, AMOSTRADO E COM LIMITE DE REPETIÇÃO ---
+# Com milhares de ESP32, o log de cada requisição (formatar data/hora e gravar
+# no arquivo ou terminal) vira uma parte grande do tempo de resposta. Aqui:
+#
+# - ManipuladorFila: as threads das requisições só colocam o LogRecord em uma
+#   fila limitada; formatação e escrita ficam com a thread do QueueListener.
+#   Com a fila cheia o registro é descartado (e contado), nunca bloqueia.
+# - FiltroRepeticao: limite de mensagens por segundo para cada ponto do código
+#   que gera log (arquivo + linha). O excedente é suprimido e a próxima
+#   mensagem aceita daquele ponto informa quantas foram suprimidas.
+# - AmostragemLog: para as linhas de rotina das rotas mais chamadas, o código
+#   pergunta antes de montar a mensagem se esta requisição entra no log
+#   (1 a cada N por rota), sem criar o LogRecord nem formatar a f-string.
+#
+# Configuração por variáveis de ambiente:
+#   VASO_LOG_ASSINCRONO=0           grava direto, sem a fila (padrão: 1)
+#   VASO_LOG_AMOSTRAGEM=rota=N,...  ex.: "/get_instruction=100,decisao=1" (N=1 registra todas)
+#   VASO_LOG_LIMITE=20              mensagens por segundo por ponto do código (0 desliga)
+
+FORMATO_LOG = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+TAMANHO_FILA_LOG = 10000
+LIMITE_POR_SEGUNDO_PADRAO = 20.0
+RAJADA_POR_PONTO = 40
+
+# 1 a cada N registros de rotina por rota ("decisao" é o resumo de cada decisão da planta)
+AMOSTRAGEM_PADRAO = {
+    "/update_sensor_data": 5,
+    "/get_instruction": 20,
+    "/get_full_status": 5,
+    "decisao": 5,
+}
+
+
+class ManipuladorFila(logging.handlers.QueueHandler):
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.descartadas = 0
+
+    def prepare(self, record):
+        # O QueueHandler padrão chama format() aqui, na thread da requisição. A
+        # fila é só deste processo e as mensagens do servidor já chegam prontas
+        # (f-strings), então o registro segue como está e é formatado pelo listener.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartadas += 1
+
+
+class FiltroRepeticao(logging.Filter):
+    # Um balde de tokens por ponto do código. As atualizações não usam lock: com
+    # threads concorrentes a contagem é aproximada, o que basta para um limite de log.
+    def __init__(self, por_segundo=LIMITE_POR_SEGUNDO_PADRAO, rajada=RAJADA_POR_PONTO):
+        super().__init__()
+        self.por_segundo = por_segundo
+        self.rajada = rajada
+        self.suprimidas = 0
+        self._baldes = {}   # (arquivo, linha) -> [tokens, atualizado_em, suprimidas desde a última aceita]
+
+    def filter(self, record):
+        if self.por_segundo <= 0:
+            return True
+        chave = (record.pathname, record.lineno)
+        agora = time.monotonic()
+        balde = self._baldes.get(chave)
+        if balde is None:
+            balde = self._baldes.setdefault(chave, [self.rajada, agora, 0])
+        tokens = min(self.rajada, balde[0] + (agora - balde[1]) * self.por_segundo)
+        balde[1] = agora
+        if tokens < 1:
+            balde[0] = tokens
+            balde[2] += 1
+            self.suprimidas += 1
+            return False
+        balde[0] = tokens - 1
+        if balde[2]:
+            record.msg = f"{record.msg} (+{balde[2]} mensagens semelhantes suprimidas)"
+            balde[2] = 0
+        return True
+
+
+class AmostragemLog:
+    def __init__(self, taxas):
+        self.taxas = {chave: taxa for chave, taxa in taxas.items() if taxa > 1}
+        # itertools.count: next() é atômico no CPython, sem lock entre threads
+        self._contadores = {chave: itertools.count() for chave in self.taxas}
+        self.suprimidas = 0
+
+    def permitir(self, chave):
+        contador = self._contadores.get(chave)
+        if contador is None or next(contador) % self.taxas[chave] == 0:
+            return True
+        self.suprimidas += 1
+        return False
+
+
+def ler_amostragem(texto, padrao=AMOSTRAGEM_PADRAO):
+    taxas = dict(padrao)
+    for item in (texto or "").split(","):
+        if not item.strip():
+            continue
+        chave, _, valor = item.partition("=")
+        try:
+            taxas[chave.strip()] = max(1, int(valor))
+        except ValueError:
+            raise ValueError(f"VASO_LOG_AMOSTRAGEM: item inválido {item!r} (use rota=N)")
+    return taxas
+
+
+amostragem = AmostragemLog(ler_amostragem(os.environ.get('VASO_LOG_AMOSTRAGEM')))
+filtro_repeticao = FiltroRepeticao(float(os.environ.get('VASO_LOG_LIMITE', LIMITE_POR_SEGUNDO_PADRAO)))
+manipulador_fila = None
+_ouvinte = None
+_lock_configuracao = threading.Lock()
+
+
+def configurar_log(nivel=logging.INFO, assincrono=None):
+    global manipulador_fila, _ouvinte
+    if assincrono is None:
+        assincrono = os.environ.get('VASO_LOG_ASSINCRONO', '1') != '0'
+
+    with _lock_configuracao:
+        logging.basicConfig(format=FORMATO_LOG, level=nivel)
+        raiz = logging.getLogger()
+        if not assincrono or manipulador_fila is not None:
+            for manipulador in raiz.handlers:
+                if filtro_repeticao not in manipulador.filters:
+                    manipulador.addFilter(filtro_repeticao)
+            return
+
+        # Os manipuladores configurados (terminal, arquivo) passam para a thread
+        # do listener; na raiz fica só a fila
+        destinos = list(raiz.handlers)
+        fila = queue.Queue(TAMANHO_FILA_LOG)
+        manipulador_fila = ManipuladorFila(fila)
+        manipulador_fila.addFilter(filtro_repeticao)
+        for manipulador in destinos:
+            raiz.removeHandler(manipulador)
+        raiz.addHandler(manipulador_fila)
+        _ouvinte = logging.handlers.QueueListener(fila, *destinos, respect_handler_level=True)
+        _ouvinte.start()
+        # No encerramento o listener grava o que ainda estiver na fila
+        atexit.register(encerrar_log)
+
+
+# Para processos que saem sem passar pelo atexit (filhos do multiprocessing)
+def encerrar_log():
+    global _ouvinte
+    with _lock_configuracao:
+        if _ouvinte is not None:
+            _ouvinte.stop()
+            _ouvinte = None
+
+
+def registros_na_fila():
+    return 0 if manipulador_fila is None else manipulador_fila.queue.qsize()
+
+
+def registros_descartados():
+    return 0 if manipulador_fila is None else manipulador_fila.descartadas
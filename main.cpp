@@ -9,6 +9,20 @@
 const char* ssid = "NOME DO WIFI";
 const char* password = "SENHA DO WIFI";
 const char* serverUrl = "ENDEREÇO DO SERVIDOR";
+// Identificador único deste vaso na frota (vincule no bot com /vaso [ID])
+const char* vasoId = "padrao";
+
+// --- MQTT (OPCIONAL) ---
+// Com USAR_MQTT em 1 o vaso mantém uma conexão aberta com o broker em vez de
+// um POST por leitura: publica em vaso/[ID]/leituras e recebe a instrução do
+// LCD, retida pelo broker, em vaso/[ID]/instrucao (gateway_mqtt.py no servidor).
+#define USAR_MQTT 0
+#if USAR_MQTT
+#include <PubSubClient.h>
+const char* mqttBroker = "ENDEREÇO DO BROKER";
+const int mqttPorta = 1883;
+const int ESPERA_INSTRUCAO_MS = 1000;
+#endif
 
 // --- CONFIGURAÇÕES DOS PINOS ---
 const int umidadePin = 34;
@@ -26,6 +40,13 @@ const int UMIDADE_MIN_ADC = 400;
 // --- INICIALIZAÇÃO DOS COMPONENTES ---
 LiquidCrystal_I2C lcd(0x27, 16, 2);
 HTTPClient http;
+#if USAR_MQTT
+WiFiClient wifiClient;
+PubSubClient mqtt(wifiClient);
+String topicoLeituras = String("vaso/") + vasoId + "/leituras";
+String topicoInstrucao = String("vaso/") + vasoId + "/instrucao";
+char instrucaoMqtt[64] = "Aguardando dados...";
+#endif
 
 // --- FUNÇÕES DE LED (sem alterações) ---
 void blinkEnviandoDados() {
@@ -82,6 +103,28 @@ void conectaWifi() {
   }
 }
 
+#if USAR_MQTT
+// Instrução publicada pelo servidor: {"instrucao": ..., "versao_instrucao": ...}
+void aoReceberMqtt(char* topico, byte* payload, unsigned int tamanho) {
+  StaticJsonDocument<200> doc;
+  if (deserializeJson(doc, payload, tamanho)) return;
+  const char* instrucao = doc["instrucao"];
+  if (instrucao != nullptr) strlcpy(instrucaoMqtt, instrucao, sizeof(instrucaoMqtt));
+}
+
+bool conectaMqtt() {
+  if (mqtt.connected()) return true;
+  String clienteId = String("vaso-") + vasoId;
+  if (!mqtt.connect(clienteId.c_str())) {
+    Serial.printf("Falha ao conectar ao broker MQTT: %d\n", mqtt.state());
+    return false;
+  }
+  // QoS 1: a instrução retida chega logo depois da assinatura
+  mqtt.subscribe(topicoInstrucao.c_str(), 1);
+  return true;
+}
+#endif
+
 long mapear(long valor, long de_min, long de_max, long para_min, long para_max) {
   if (de_max - de_min == 0) return para_min;
   long valor_mapeado = (valor - de_min) * (para_max - para_min) / (de_max - de_min) + para_min;
@@ -111,6 +154,10 @@ void setup() {
   delay(2000);
 
   conectaWifi();
+#if USAR_MQTT
+  mqtt.setServer(mqttBroker, mqttPorta);
+  mqtt.setCallback(aoReceberMqtt);
+#endif
 }
 
 void loop() {
@@ -140,6 +187,7 @@ void loop() {
   Serial.printf("Leitura: Umidade RAW=%d -> %ld%% | Média Luz RAW=%d -> %ld%%\n", valorUmidadeRaw, umidadePercent, valorLuzRaw, luzPercent);
   
   StaticJsonDocument<200> doc;
+  doc["vaso_id"] = vasoId;
   doc["umidade"] = umidadePercent;
   doc["luminosidade"] = luzPercent;
   String requestBody;
@@ -148,7 +196,30 @@ void loop() {
   lcd.clear();
   lcd.setCursor(0, 0);
   lcd.print("Sincronizando dados...");
- 
+
+#if USAR_MQTT
+  Serial.println("Publicando dados no broker...");
+  blinkEnviandoDados();
+  bool publicado = conectaMqtt() && mqtt.publish(topicoLeituras.c_str(), requestBody.c_str());
+  // Dá tempo para a instrução nova chegar; se não mudar, fica a anterior
+  for (int espera = 0; publicado && espera < ESPERA_INSTRUCAO_MS; espera += 50) {
+    mqtt.loop();
+    delay(50);
+  }
+  int httpResponseCode = publicado ? 1 : -1;
+
+  lcd.clear();
+  if (publicado) {
+    lcd.setCursor(0, 0);
+    lcd.printf("U:%ld%% L:%ld%%", umidadePercent, luzPercent);
+    lcd.setCursor(0, 1);
+    lcd.print(instrucaoMqtt);
+  } else {
+    lcd.print("Erro Broker");
+    lcd.setCursor(0, 1);
+    lcd.printf("Cod: %d", mqtt.state());
+  }
+#else
   http.begin(serverUrl);
   http.addHeader("Content-Type", "application/json");
 
@@ -178,6 +249,7 @@ void loop() {
   }
 
   http.end();
+#endif
 
   Serial.println("Aguardando 5 segundos...");
   if (httpResponseCode > 0) {
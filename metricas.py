@@ -0,0 +1,316 @@
+import bisect
+import collections
+import math
+import os
+import sys
+import threading
+import time
+
+# --- MÉTRICAS (FORMATO TEXTO DO PROMETHEUS) ---
+# Contadores e histogramas baratos o bastante para ficarem sempre ligados nas
+# rotas mais chamadas. Cada thread escreve na sua própria fatia (indexada por
+# threading.get_ident()), então a atualização é um incremento em uma lista sem
+# lock nenhum; só a coleta em /metrics soma as fatias de todas as threads.
+# Os identificadores de thread são reaproveitados pelo sistema, o que limita o
+# número de fatias às threads vivas ao mesmo tempo (o Flask cria uma por
+# requisição).
+#
+# Valores que já existem em outro lugar (tamanho de fila, contadores do
+# despachante) entram como Coletor: uma função chamada só na hora da coleta.
+
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites (em segundos) dos histogramas de latência
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LIMITES_ATRASO = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+_get_ident = threading.get_ident
+
+
+def _formatar_valor(valor):
+    if isinstance(valor, int):
+        return str(valor)
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    return repr(float(valor))
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes, valores, extra=""):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class _ContadorSimples:
+    __slots__ = ("_fatias",)
+
+    def __init__(self):
+        self._fatias = {}
+
+    def incrementar(self, quantidade=1):
+        fatia = self._fatias.get(_get_ident())
+        if fatia is None:
+            fatia = self._fatias.setdefault(_get_ident(), [0])
+        fatia[0] += quantidade
+
+    def valor(self):
+        return sum(fatia[0] for fatia in list(self._fatias.values()))
+
+
+class _HistogramaSimples:
+    __slots__ = ("limites", "_fatias")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self._fatias = {}
+
+    def observar(self, valor):
+        # Fatia: uma contagem por faixa (a última é +Inf) seguida da soma
+        fatia = self._fatias.get(_get_ident())
+        if fatia is None:
+            fatia = self._fatias.setdefault(_get_ident(), [0] * (len(self.limites) + 1) + [0.0])
+        fatia[bisect.bisect_left(self.limites, valor)] += 1
+        fatia[-1] += valor
+
+    def somar(self):
+        total = [0] * (len(self.limites) + 1) + [0.0]
+        for fatia in list(self._fatias.values()):
+            for posicao, valor in enumerate(fatia):
+                total[posicao] += valor
+        return total
+
+
+class _Familia:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._filhos = {}
+        self._padrao = None if self.rotulos else self.rotulado()
+
+    def _novo_filho(self):
+        raise NotImplementedError
+
+    def rotulado(self, *valores):
+        filho = self._filhos.get(valores)
+        if filho is None:
+            if len(valores) != len(self.rotulos):
+                raise ValueError(f"{self.nome}: esperados os rótulos {self.rotulos}")
+            filho = self._filhos.setdefault(valores, self._novo_filho())
+        return filho
+
+    def linhas(self):
+        yield f"# HELP {self.nome} {self.ajuda}"
+        yield f"# TYPE {self.nome} {self.tipo}"
+        for valores, filho in sorted(list(self._filhos.items())):
+            yield from self._linhas_filho(valores, filho)
+
+
+class Contador(_Familia):
+    tipo = "counter"
+
+    def _novo_filho(self):
+        return _ContadorSimples()
+
+    def incrementar(self, quantidade=1):
+        self._padrao.incrementar(quantidade)
+
+    def _linhas_filho(self, valores, filho):
+        yield f"{self.nome}{_rotulos(self.rotulos, valores)} {_formatar_valor(filho.valor())}"
+
+
+class Histograma(_Familia):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_LATENCIA):
+        self.limites = tuple(sorted(limites))
+        super().__init__(nome, ajuda, rotulos)
+
+    def _novo_filho(self):
+        return _HistogramaSimples(self.limites)
+
+    def observar(self, valor):
+        self._padrao.observar(valor)
+
+    def _linhas_filho(self, valores, filho):
+        total = filho.somar()
+        acumulado = 0
+        for limite, contagem in zip(self.limites + (math.inf,), total):
+            acumulado += contagem
+            rotulos = _rotulos(self.rotulos, valores, f'le="{_formatar_valor(limite)}"')
+            yield f"{self.nome}_bucket{rotulos} {acumulado}"
+        rotulos = _rotulos(self.rotulos, valores)
+        yield f"{self.nome}_sum{rotulos} {_formatar_valor(total[-1])}"
+        yield f"{self.nome}_count{rotulos} {acumulado}"
+
+
+class Coletor:
+    # funcao() devolve um número ou, com rótulos, um dict {tupla de valores: número}
+    def __init__(self, nome, ajuda, funcao, tipo="gauge", rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+        self.tipo = tipo
+        self.rotulos = tuple(rotulos)
+
+    def linhas(self):
+        valores = self.funcao()
+        if not isinstance(valores, dict):
+            valores = {(): valores}
+        yield f"# HELP {self.nome} {self.ajuda}"
+        yield f"# TYPE {self.nome} {self.tipo}"
+        for chave, valor in sorted(valores.items()):
+            yield f"{self.nome}{_rotulos(self.rotulos, chave)} {_formatar_valor(valor)}"
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def exportar(self):
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.linhas())
+        linhas.append("")
+        return "\n".join(linhas)
+
+
+# --- VASOS ATIVOS ---
+# Conta chaves (vaso_id) vistas recentemente com dois conjuntos que se revezam a
+# cada "segundos": o resultado cobre entre uma e duas janelas. Marcar é um
+# set.add, sem lock; o lock só protege a troca das janelas.
+class JanelaAtividade:
+    def __init__(self, segundos):
+        self.segundos = segundos
+        self._atual = set()
+        self._anterior = set()
+        self._virada = time.monotonic() + segundos
+        self._lock = threading.Lock()
+
+    def marcar(self, chave):
+        if time.monotonic() >= self._virada:
+            self._girar()
+        self._atual.add(chave)
+
+    def _girar(self):
+        with self._lock:
+            agora = time.monotonic()
+            if agora < self._virada:
+                return
+            # Se passou mais de uma janela sem marcações, a anterior já expirou
+            self._anterior = self._atual if agora < self._virada + self.segundos else set()
+            self._atual = set()
+            self._virada = agora + self.segundos
+
+    def contar(self):
+        if time.monotonic() >= self._virada:
+            self._girar()
+        return len(self._anterior | self._atual)
+
+
+# --- PERFILADOR POR AMOSTRAGEM ---
+# Desligado por padrão e ligado/desligado em tempo de execução (rota
+# /perfilador). Enquanto ativo, uma thread lê as pilhas de todas as threads com
+# sys._current_frames() a cada "intervalo" e conta quantas vezes cada pilha
+# apareceu. É tempo de parede: threads paradas em espera também aparecem. O
+# relatório colapsado ("thread;arquivo:função;... contagem") serve direto para
+# flamegraph.pl ou speedscope.
+PROFUNDIDADE_MAX_PILHA = 64
+MAX_PILHAS_DISTINTAS = 20000
+PILHA_EXCEDENTE = "[outras pilhas]"
+
+
+class PerfiladorAmostragem:
+    def __init__(self, intervalo=0.01):
+        self.intervalo = intervalo
+        self.amostras = 0
+        self._pilhas = collections.Counter()
+        self._nomes_quadro = {}
+        self._thread = None
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self.iniciado_em = None
+
+    @property
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self, intervalo=None):
+        with self._lock:
+            if intervalo is not None:
+                self.intervalo = intervalo
+            if self.ativo:
+                return False
+            self._parar = threading.Event()
+            self._thread = threading.Thread(target=self._executar, args=(self._parar,), name="perfilador", daemon=True)
+            self.iniciado_em = time.time()
+            self._thread.start()
+            return True
+
+    def parar(self):
+        with self._lock:
+            if not self.ativo:
+                return False
+            self._parar.set()
+            self._thread.join()
+            self._thread = None
+            return True
+
+    def limpar(self):
+        with self._lock:
+            self._pilhas = collections.Counter()
+            self.amostras = 0
+
+    def _nome_quadro(self, codigo):
+        nome = self._nomes_quadro.get(codigo)
+        if nome is None:
+            nome = self._nomes_quadro[codigo] = f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}"
+        return nome
+
+    def _executar(self, parar):
+        proprio = threading.get_ident()
+        nomes_threads = {}
+        proxima_atualizacao = 0.0
+        while not parar.wait(self.intervalo):
+            agora = time.monotonic()
+            if agora >= proxima_atualizacao:
+                nomes_threads = {thread.ident: thread.name for thread in threading.enumerate()}
+                proxima_atualizacao = agora + 1.0
+            pilhas = self._pilhas
+            for ident, quadro in sys._current_frames().items():
+                if ident == proprio:
+                    continue
+                partes = []
+                while quadro is not None and len(partes) < PROFUNDIDADE_MAX_PILHA:
+                    partes.append(self._nome_quadro(quadro.f_code))
+                    quadro = quadro.f_back
+                partes.append(nomes_threads.get(ident, str(ident)))
+                chave = ";".join(reversed(partes))
+                if chave not in pilhas and len(pilhas) >= MAX_PILHAS_DISTINTAS:
+                    chave = PILHA_EXCEDENTE
+                pilhas[chave] += 1
+            self.amostras += 1
+
+    def relatorio(self, limite=50):
+        pilhas = self._pilhas.most_common(limite)
+        return {
+            "ativo": self.ativo,
+            "intervalo": self.intervalo,
+            "iniciado_em": self.iniciado_em,
+            "amostras": self.amostras,
+            "pilhas": [{"pilha": pilha, "amostras": contagem} for pilha, contagem in pilhas],
+        }
+
+    def colapsado(self):
+        return "".join(f"{pilha} {contagem}\n" for pilha, contagem in self._pilhas.most_common())
@@ -0,0 +1,273 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from historico import HistoricoVaso
+from alertas import EstadoAlertas
+
+# --- PERSISTÊNCIA DO ESTADO DOS VASOS (SQLITE EM MODO WAL) ---
+# As rotas só colocam eventos em uma fila em memória; uma thread escritora
+# junta o que chegar em até INTERVALO_COMMIT segundos e grava tudo em uma
+# única transação (group commit). Nada de disco no caminho da requisição.
+#
+# Tabelas:
+#   vasos      - snapshot do estado de cada vaso (planta, chat, LCD, alertas), upsert
+#   historicos - snapshot binário do HistoricoVaso de cada vaso, com a versão que cobre
+#   leituras   - log de leituras posteriores ao último snapshot de histórico (a "cauda")
+#   mensagens  - mensagens do Telegram enfileiradas e ainda não entregues
+#
+# O histórico é regravado a cada LEITURAS_POR_SNAPSHOT leituras do vaso e a
+# cauda anterior é apagada, então o reinício lê no máximo um snapshot e
+# LEITURAS_POR_SNAPSHOT leituras por vaso, por maior que seja o histórico.
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_COMMIT = 0.2          # segundos de espera para agrupar eventos
+MAX_EVENTOS_POR_COMMIT = 20000
+LEITURAS_POR_SNAPSHOT = 1000
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS vasos (
+    vaso_id TEXT PRIMARY KEY,
+    versao INTEGER NOT NULL,
+    planta TEXT NOT NULL,
+    chat_id TEXT,
+    umidade REAL,
+    luminosidade REAL,
+    instrucao TEXT,
+    ultima_notificacao TEXT,
+    alertas TEXT,
+    atualizado_em REAL
+);
+CREATE TABLE IF NOT EXISTS historicos (
+    vaso_id TEXT PRIMARY KEY,
+    versao INTEGER NOT NULL,
+    dados BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leituras (
+    vaso_id TEXT NOT NULL,
+    versao INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    umidade REAL NOT NULL,
+    luminosidade REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leituras_vaso_versao ON leituras (vaso_id, versao);
+CREATE TABLE IF NOT EXISTS mensagens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    texto TEXT NOT NULL
+);
+"""
+
+_PARAR = object()
+
+
+class PersistenciaVasos:
+    def __init__(self, caminho, registro):
+        self.caminho = caminho
+        self.registro = registro
+        self._eventos = queue.SimpleQueue()
+        self._thread = None
+        self._leituras_desde_snapshot = {}  # vaso_id -> leituras na cauda (só a thread escritora usa)
+        self.commits = 0
+        self.eventos_gravados = 0
+
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        conexao.executescript(ESQUEMA)
+        return conexao
+
+    # --- Caminho quente: só enfileira (chamadas com o lock do vaso adquirido) ---
+
+    def leitura(self, vaso, ts, umidade, luminosidade):
+        self._eventos.put(("leitura", vaso, vaso.versao, ts, umidade, luminosidade))
+
+    def estado(self, vaso):
+        self._eventos.put(("estado", vaso))
+
+    def mensagem(self, chat_id, texto):
+        self._eventos.put(("mensagem", json.dumps(chat_id), texto))
+
+    def mensagens_concluidas(self, chat_id, quantidade):
+        # Chamada pelo despachante quando as "quantidade" mensagens mais antigas
+        # do chat foram entregues (ou descartadas de vez)
+        self._eventos.put(("concluidas", json.dumps(chat_id), quantidade))
+
+    # --- Reinício ---
+
+    def restaurar(self):
+        # Reconstrói o registro a partir dos snapshots e da cauda de leituras.
+        # Devolve as mensagens do Telegram pendentes, na ordem original.
+        inicio = time.perf_counter()
+        conexao = self._conectar()
+        try:
+            historicos = {}
+            for vaso_id, versao, dados in conexao.execute("SELECT vaso_id, versao, dados FROM historicos"):
+                try:
+                    historicos[vaso_id] = (versao, HistoricoVaso.importar(dados))
+                except ValueError as e:
+                    logger.warning(f"Snapshot do histórico do vaso {vaso_id} ignorado: {e}")
+
+            for linha in conexao.execute(
+                "SELECT vaso_id, versao, planta, chat_id, umidade, luminosidade, instrucao, ultima_notificacao, alertas FROM vasos"
+            ):
+                vaso_id, versao, planta, chat_id, umidade, luminosidade, instrucao, ultima_notificacao, alertas = linha
+                vaso = self.registro.obter_ou_criar(vaso_id)
+                vaso.versao = versao
+                vaso.planta_selecionada = planta
+                vaso.chat_id_notificacao = json.loads(chat_id) if chat_id is not None else None
+                vaso.umidade_atual = umidade
+                vaso.luminosidade_atual = luminosidade
+                vaso.instrucao_para_lcd = instrucao
+                vaso.ultima_notificacao_telegram = ultima_notificacao
+                vaso.alertas = EstadoAlertas.importar(json.loads(alertas)) if alertas else None
+
+            leituras_reaplicadas = 0
+            for vaso_id, (versao, historico) in historicos.items():
+                self.registro.obter_ou_criar(vaso_id).historico = historico
+            for vaso_id, versao, ts, umidade, luminosidade in conexao.execute(
+                "SELECT l.vaso_id, l.versao, l.ts, l.umidade, l.luminosidade FROM leituras l "
+                "LEFT JOIN historicos h ON h.vaso_id = l.vaso_id "
+                "WHERE h.versao IS NULL OR l.versao > h.versao ORDER BY l.rowid"
+            ):
+                vaso = self.registro.obter_ou_criar(vaso_id)
+                if vaso.historico is None:
+                    vaso.historico = HistoricoVaso()
+                vaso.historico.adicionar(ts, umidade, luminosidade)
+                if versao > vaso.versao:
+                    vaso.versao = versao
+                    vaso.umidade_atual = umidade
+                    vaso.luminosidade_atual = luminosidade
+                self._leituras_desde_snapshot[vaso_id] = self._leituras_desde_snapshot.get(vaso_id, 0) + 1
+                leituras_reaplicadas += 1
+
+            pendentes = [(json.loads(chat_id), texto) for chat_id, texto in conexao.execute("SELECT chat_id, texto FROM mensagens ORDER BY id")]
+        finally:
+            conexao.close()
+
+        logger.info(f"Estado restaurado de {self.caminho} em {time.perf_counter() - inicio:.2f}s: "
+                    f"{len(self.registro)} vasos, {leituras_reaplicadas} leituras da cauda, {len(pendentes)} mensagens pendentes.")
+        return pendentes
+
+    # --- Thread escritora ---
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._executar, name="persistencia", daemon=True)
+        self._thread.start()
+        return self
+
+    def fechar(self, timeout=30.0):
+        if self._thread is None:
+            return
+        self._eventos.put(_PARAR)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _executar(self):
+        conexao = self._conectar()
+        try:
+            parar = False
+            while not parar:
+                lote = [self._eventos.get()]
+                limite = time.monotonic() + INTERVALO_COMMIT
+                while len(lote) < MAX_EVENTOS_POR_COMMIT:
+                    espera = limite - time.monotonic()
+                    try:
+                        lote.append(self._eventos.get(timeout=espera) if espera > 0 else self._eventos.get_nowait())
+                    except queue.Empty:
+                        break
+                if lote[-1] is _PARAR:
+                    lote.pop()
+                    parar = True
+                try:
+                    self._gravar(conexao, lote, snapshot_final=parar)
+                except sqlite3.Error as e:
+                    logger.error(f"Erro ao gravar {len(lote)} eventos no banco: {e}")
+            conexao.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conexao.close()
+        logger.info("Persistência encerrada.")
+
+    def _gravar(self, conexao, lote, snapshot_final=False):
+        leituras = []
+        sujos = {}
+        novas_mensagens = []
+        concluidas = []
+        for evento in lote:
+            tipo = evento[0]
+            if tipo == "leitura":
+                _, vaso, versao, ts, umidade, luminosidade = evento
+                leituras.append((vaso.vaso_id, versao, ts, umidade, luminosidade))
+                sujos[vaso.vaso_id] = vaso
+                self._leituras_desde_snapshot[vaso.vaso_id] = self._leituras_desde_snapshot.get(vaso.vaso_id, 0) + 1
+            elif tipo == "estado":
+                sujos[evento[1].vaso_id] = evento[1]
+            elif tipo == "mensagem":
+                novas_mensagens.append(evento[1:])
+            elif tipo == "concluidas":
+                concluidas.append(evento[1:])
+
+        # O estado é lido com o lock do vaso no momento do commit: vários
+        # eventos do mesmo vaso no lote viram um único upsert.
+        estados = []
+        snapshots = []
+        for vaso_id, vaso in sujos.items():
+            fazer_snapshot = self._leituras_desde_snapshot.get(vaso_id, 0) >= (1 if snapshot_final else LEITURAS_POR_SNAPSHOT)
+            with self.registro.lock_de(vaso_id):
+                estados.append((
+                    vaso_id, vaso.versao, vaso.planta_selecionada,
+                    json.dumps(vaso.chat_id_notificacao) if vaso.chat_id_notificacao is not None else None,
+                    vaso.umidade_atual, vaso.luminosidade_atual, vaso.instrucao_para_lcd,
+                    vaso.ultima_notificacao_telegram,
+                    json.dumps(vaso.alertas.exportar()) if vaso.alertas is not None else None,
+                    time.time(),
+                ))
+                if fazer_snapshot and vaso.historico is not None:
+                    snapshots.append((vaso_id, vaso.versao, vaso.historico.exportar()))
+        if snapshot_final:
+            # Vasos com cauda que não apareceram no último lote
+            for vaso_id, pendentes in self._leituras_desde_snapshot.items():
+                vaso = self.registro.obter(vaso_id)
+                if pendentes and vaso_id not in sujos and vaso is not None and vaso.historico is not None:
+                    with self.registro.lock_de(vaso_id):
+                        snapshots.append((vaso_id, vaso.versao, vaso.historico.exportar()))
+
+        with conexao:
+            if leituras:
+                conexao.executemany("INSERT INTO leituras (vaso_id, versao, ts, umidade, luminosidade) VALUES (?, ?, ?, ?, ?)", leituras)
+            if estados:
+                conexao.executemany(
+                    "INSERT INTO vasos (vaso_id, versao, planta, chat_id, umidade, luminosidade, instrucao, ultima_notificacao, alertas, atualizado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (vaso_id) DO UPDATE SET versao = excluded.versao, planta = excluded.planta, "
+                    "chat_id = excluded.chat_id, umidade = excluded.umidade, luminosidade = excluded.luminosidade, "
+                    "instrucao = excluded.instrucao, ultima_notificacao = excluded.ultima_notificacao, "
+                    "alertas = excluded.alertas, atualizado_em = excluded.atualizado_em",
+                    estados,
+                )
+            if snapshots:
+                conexao.executemany(
+                    "INSERT INTO historicos (vaso_id, versao, dados) VALUES (?, ?, ?) "
+                    "ON CONFLICT (vaso_id) DO UPDATE SET versao = excluded.versao, dados = excluded.dados",
+                    snapshots,
+                )
+                # A cauda coberta pelo snapshot não é mais necessária
+                conexao.executemany("DELETE FROM leituras WHERE vaso_id = ? AND versao <= ?", [(vaso_id, versao) for vaso_id, versao, _ in snapshots])
+            if novas_mensagens:
+                conexao.executemany("INSERT INTO mensagens (chat_id, texto) VALUES (?, ?)", novas_mensagens)
+            # Inserções antes das remoções: uma mensagem sempre é enfileirada antes de ser entregue
+            for chat_id, quantidade in concluidas:
+                conexao.execute(
+                    "DELETE FROM mensagens WHERE id IN (SELECT id FROM mensagens WHERE chat_id = ? ORDER BY id LIMIT ?)",
+                    (chat_id, quantidade),
+                )
+
+        for vaso_id, _, _ in snapshots:
+            self._leituras_desde_snapshot[vaso_id] = 0
+        self.commits += 1
+        self.eventos_gravados += len(lote)
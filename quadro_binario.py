@@ -0,0 +1,122 @@
+import struct
+
+import numpy as np
+
+# --- QUADRO BINÁRIO DE LEITURAS (ALTERNATIVA AO JSON) ---
+# Formato opcional para /update_sensor_data, enviado com
+# Content-Type: application/x-vaso-quadro. Tudo em little-endian:
+#
+#   cabeçalho (6 bytes): "VQ" | versão (u8, = 1) | tamanho do vaso_id (u8) | amostras (u16)
+#   vaso_id            : UTF-8, sem terminador
+#   cada amostra (8 B) : ts (u32, epoch em s; 0 = "agora") |
+#                        umidade em centésimos de % (u16) | luminosidade em décimos (u16)
+#
+# Uma leitura comum com vaso_id "padrao" ocupa 20 bytes (o JSON equivalente, ~60).
+# O servidor lê o quadro direto do buffer da requisição (memoryview/struct, e
+# numpy.frombuffer para várias amostras), sem copiar nem decodificar texto.
+#
+# A resposta também é binária:
+#
+#   "VR" | versão (u8) | status (u8) | código umidade (i8) | código luz (i8) |
+#   tamanho do texto (u8) | instrução do LCD em UTF-8
+#
+# status: 0 = ok, 1 = vaso sem planta/chat configurado (instrução de espera),
+# 2 = quadro inválido (o texto explica o erro). Os códigos são os mesmos da
+# decisão (-2 crítico abaixo ... 2 crítico acima), para o firmware que prefira
+# montar a própria mensagem.
+
+TIPO_CONTEUDO_QUADRO = "application/x-vaso-quadro"
+MAGICO_QUADRO = b"VQ"
+MAGICO_RESPOSTA = b"VR"
+VERSAO_QUADRO = 1
+
+CABECALHO = struct.Struct("<2sBBH")
+AMOSTRA = struct.Struct("<IHH")
+RESPOSTA = struct.Struct("<2sBBbbB")
+DTYPE_AMOSTRA = np.dtype([("ts", "<u4"), ("umidade", "<u2"), ("luminosidade", "<u2")])
+
+ESCALA_UMIDADE = 100
+ESCALA_LUMINOSIDADE = 10
+
+STATUS_OK = 0
+STATUS_AGUARDANDO = 1
+STATUS_INVALIDO = 2
+
+TAMANHO_MAX_TEXTO = 255
+
+
+class QuadroSensor:
+    __slots__ = ("vaso_id", "quantidade", "_visao", "_inicio")
+
+    def __init__(self, vaso_id, quantidade, visao, inicio):
+        self.vaso_id = vaso_id
+        self.quantidade = quantidade
+        self._visao = visao
+        self._inicio = inicio
+
+    def amostra(self, indice=0):
+        ts, umidade, luminosidade = AMOSTRA.unpack_from(self._visao, self._inicio + indice * AMOSTRA.size)
+        return float(ts), umidade / ESCALA_UMIDADE, luminosidade / ESCALA_LUMINOSIDADE
+
+    def colunas(self, agora):
+        # Visão estruturada sobre o próprio buffer; a cópia acontece só na
+        # conversão para float64, já em escala
+        amostras = np.frombuffer(self._visao, dtype=DTYPE_AMOSTRA, count=self.quantidade, offset=self._inicio)
+        timestamps = amostras["ts"].astype(np.float64)
+        timestamps[timestamps == 0] = agora
+        np.minimum(timestamps, agora, out=timestamps)
+        umidades = amostras["umidade"] / ESCALA_UMIDADE
+        luminosidades = amostras["luminosidade"] / ESCALA_LUMINOSIDADE
+        return timestamps, umidades, luminosidades
+
+    def ts_mais_antigo(self):
+        # Menor ts informado, ignorando os 0 ("agora"); None se todos forem 0
+        timestamps = np.frombuffer(self._visao, dtype=DTYPE_AMOSTRA, count=self.quantidade, offset=self._inicio)["ts"]
+        informados = timestamps[timestamps != 0]
+        return float(informados.min()) if informados.size else None
+
+
+def ler_quadro(dados, max_amostras):
+    # ValueError com a causa se o quadro não seguir o formato
+    visao = memoryview(dados)
+    if len(visao) < CABECALHO.size:
+        raise ValueError("quadro menor que o cabeçalho")
+    magico, versao, tamanho_id, quantidade = CABECALHO.unpack_from(visao)
+    if magico != MAGICO_QUADRO:
+        raise ValueError("assinatura do quadro inválida")
+    if versao != VERSAO_QUADRO:
+        raise ValueError(f"versão de quadro {versao} não suportada")
+    if quantidade == 0:
+        raise ValueError("quadro sem amostras")
+    if quantidade > max_amostras:
+        raise ValueError(f"máximo de {max_amostras} amostras por quadro")
+    inicio = CABECALHO.size + tamanho_id
+    if len(visao) != inicio + quantidade * AMOSTRA.size:
+        raise ValueError("tamanho do quadro não confere com o cabeçalho")
+    try:
+        vaso_id = str(visao[CABECALHO.size:inicio], "utf-8")
+    except UnicodeDecodeError:
+        raise ValueError("vaso_id não é UTF-8")
+    return QuadroSensor(vaso_id, quantidade, visao, inicio)
+
+
+def montar_quadro(vaso_id, amostras):
+    # amostras: [(ts, umidade, luminosidade), ...]; usado por clientes e benchmarks
+    id_bytes = vaso_id.encode("utf-8")
+    partes = [CABECALHO.pack(MAGICO_QUADRO, VERSAO_QUADRO, len(id_bytes), len(amostras)), id_bytes]
+    for ts, umidade, luminosidade in amostras:
+        partes.append(AMOSTRA.pack(int(ts), round(umidade * ESCALA_UMIDADE), round(luminosidade * ESCALA_LUMINOSIDADE)))
+    return b"".join(partes)
+
+
+def montar_resposta(status, codigo_umidade, codigo_luz, texto):
+    texto = texto.encode("utf-8")[:TAMANHO_MAX_TEXTO]
+    return RESPOSTA.pack(MAGICO_RESPOSTA, VERSAO_QUADRO, status, codigo_umidade, codigo_luz, len(texto)) + texto
+
+
+def ler_resposta(dados):
+    magico, versao, status, codigo_umidade, codigo_luz, tamanho = RESPOSTA.unpack_from(dados)
+    if magico != MAGICO_RESPOSTA:
+        raise ValueError("assinatura da resposta inválida")
+    texto = bytes(dados[RESPOSTA.size:RESPOSTA.size + tamanho]).decode("utf-8", "replace")
+    return status, codigo_umidade, codigo_luz, texto
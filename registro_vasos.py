@@ -0,0 +1,98 @@
+import threading
+
+# --- REGISTRO DE VASOS (FROTA) ---
+# Cada ESP32 se identifica por um "vaso_id". O estado de cada vaso fica em um
+# registro compacto (__slots__, sem __dict__ por instância) e o acesso é
+# protegido por lock striping: vasos diferentes quase nunca disputam o mesmo lock.
+
+VASO_ID_PADRAO = "padrao"
+TAMANHO_MAX_VASO_ID = 64
+NUM_LOCKS = 64
+INSTRUCAO_INICIAL = "Aguardando dados..."
+
+
+class EstadoVaso:
+    __slots__ = (
+        "vaso_id",
+        "versao",
+        "planta_selecionada",
+        "perfil",
+        "umidade_atual",
+        "luminosidade_atual",
+        "instrucao_para_lcd",
+        "versao_instrucao",
+        "ultima_notificacao_telegram",
+        "chat_id_notificacao",
+        "historico",
+        "tendencias",
+        "alertas",
+        "respostas",
+    )
+
+    def __init__(self, vaso_id):
+        self.vaso_id = vaso_id
+        self.versao = 0  # incrementada a cada mudança de estado (leitura ou planta)
+        self.planta_selecionada = "Nenhuma"
+        self.perfil = None  # PerfilPlanta compilado da planta, resolvido na primeira decisão
+        self.umidade_atual = 0
+        self.luminosidade_atual = 0
+        self.instrucao_para_lcd = INSTRUCAO_INICIAL
+        self.versao_instrucao = 0  # incrementada só quando a instrução do LCD muda
+        self.ultima_notificacao_telegram = ""
+        self.chat_id_notificacao = None
+        self.historico = None  # HistoricoVaso, criado na primeira leitura
+        self.tendencias = None  # TendenciasVaso (médias, tendência e previsão), criado na primeira leitura
+        self.alertas = None  # EstadoAlertas, criado na primeira decisão
+        self.respostas = {}  # rota -> (versão, corpo JSON em bytes), ver servico_vaso.resposta_em_cache
+
+    def para_dict(self):
+        return {
+            "vaso_id": self.vaso_id,
+            "versao": self.versao,
+            "planta_selecionada": self.planta_selecionada,
+            "umidade_atual": self.umidade_atual,
+            "luminosidade_atual": self.luminosidade_atual,
+            "instrucao_para_lcd": self.instrucao_para_lcd,
+            "ultima_notificacao_telegram": self.ultima_notificacao_telegram,
+            "chat_id_notificacao": self.chat_id_notificacao,
+        }
+
+
+class RegistroVasos:
+    def __init__(self, num_locks=NUM_LOCKS):
+        self._vasos = {}
+        self._locks = tuple(threading.Lock() for _ in range(num_locks))
+
+    def __len__(self):
+        return len(self._vasos)
+
+    def __contains__(self, vaso_id):
+        return vaso_id in self._vasos
+
+    def lock_de(self, vaso_id):
+        # Lock striping: o lock é escolhido pelo hash do ID, então atualizações
+        # de vasos diferentes raramente competem entre si.
+        return self._locks[hash(vaso_id) % len(self._locks)]
+
+    def obter(self, vaso_id):
+        return self._vasos.get(vaso_id)
+
+    def obter_ou_criar(self, vaso_id):
+        vaso = self._vasos.get(vaso_id)
+        if vaso is None:
+            # dict.setdefault é atômico no CPython: se duas requisições criarem o
+            # mesmo vaso ao mesmo tempo, ambas recebem a mesma instância.
+            vaso = self._vasos.setdefault(vaso_id, EstadoVaso(vaso_id))
+        return vaso
+
+    def ids(self):
+        return list(self._vasos)
+
+
+def normalizar_vaso_id(valor):
+    if valor is None or valor == "":
+        return VASO_ID_PADRAO
+    vaso_id = str(valor).strip()
+    if not vaso_id or len(vaso_id) > TAMANHO_MAX_VASO_ID:
+        return None
+    return vaso_id
@@ -0,0 +1,1043 @@
+from telegram import Bot
+from telegram.request import HTTPXRequest
+import asyncio
+import logging
+import json
+import math
+import time
+import os
+import threading
+from registro_vasos import RegistroVasos, normalizar_vaso_id
+from avaliacao_lote import classificar_encadeado
+from alertas import EstadoAlertas, aplicar_histerese
+from catalogo_plantas import carregar_catalogo, assinatura_arquivo
+from historico import HistoricoVaso, RESOLUCOES, JANELA_HISTORICO
+from tendencias import TendenciasVaso, recalcular_frota
+from fila_telegram import FilaTelegram, POLITICA_DISCO, POLITICA_DESCARTAR
+from despachante_telegram import DespachanteTelegram
+from persistencia import PersistenciaVasos
+from avisos_instrucao import AvisosInstrucao
+from quadro_binario import (ler_quadro, montar_resposta, TIPO_CONTEUDO_QUADRO,
+                            STATUS_OK, STATUS_AGUARDANDO, STATUS_INVALIDO)
+from log_assincrono import amostragem, filtro_repeticao, registros_na_fila, registros_descartados
+from metricas import (RegistroMetricas, Contador, Histograma, Coletor, JanelaAtividade,
+                      PerfiladorAmostragem, LIMITES_ATRASO, TIPO_CONTEUDO)
+
+# --- SERVIÇO DO VASO INTELIGENTE ---
+# Estado da frota, lógica de decisão e o tratamento de cada rota da API,
+# independentes do servidor HTTP. O app Flask (app_servidor.py) e o servidor
+# ASGI (servidor_asgi.py) só traduzem requisições e respostas.
+# Cada função de rota devolve (corpo, status_http) ou, quando precisa de
+# cabeçalhos extras (ETag, Cache-Control), (corpo, status_http, cabeçalhos).
+#
+# As linhas de log de rotina das rotas chamadas a cada poucos segundos por vaso
+# passam por amostragem.permitir(rota) (log_assincrono.py) antes de montar a
+# mensagem; avisos e erros são sempre registrados.
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURAÇÕES DO TELEGRAM ---
+# TELEGRAM_API_URL pode apontar para uma API falsa local (benchmarks/fake_bot_api.py)
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', 'YOUR TELEGRAM TOKEN')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+ENVIOS_SIMULTANEOS_TELEGRAM = 8
+bot = Bot(
+    token=TELEGRAM_BOT_TOKEN,
+    base_url=TELEGRAM_API_URL,
+    request=HTTPXRequest(connection_pool_size=ENVIOS_SIMULTANEOS_TELEGRAM),
+)
+
+TELEGRAM_CHAT_ID = 'CHAT ID' 
+
+# --- VARIÁVEIS DE ESTADO DOS VASOS ---
+# Um registro por ESP32, indexado pelo vaso_id enviado pelo dispositivo.
+registro_vasos = RegistroVasos()
+
+# Banco SQLite com o estado, o histórico e as mensagens pendentes. Defina
+# VASO_DB_PATH vazio para rodar só em memória.
+CAMINHO_BANCO = os.environ.get('VASO_DB_PATH', 'vaso_inteligente.db')
+persistencia = None
+
+# --- CATÁLOGO DE PLANTAS ---
+# Os perfis vêm de plantas.json (ou VASO_CATALOGO_PATH), compilados por
+# catalogo_plantas.py. "catalogo" é trocado inteiro ao recarregar o arquivo:
+# quem já leu a referência termina a requisição com o catálogo antigo.
+CAMINHO_CATALOGO = os.environ.get('VASO_CATALOGO_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plantas.json'))
+INTERVALO_VIGIA_CATALOGO = 2.0  # segundos entre verificações do arquivo
+
+catalogo = carregar_catalogo(CAMINHO_CATALOGO)
+_assinatura_catalogo = assinatura_arquivo(CAMINHO_CATALOGO)
+_lock_catalogo = threading.Lock()
+
+def recarregar_catalogo():
+    global catalogo, _assinatura_catalogo
+    with _lock_catalogo:
+        assinatura = assinatura_arquivo(CAMINHO_CATALOGO)
+        try:
+            novo = carregar_catalogo(CAMINHO_CATALOGO, catalogo.geracao + 1)
+        except (OSError, ValueError) as e:
+            _assinatura_catalogo = assinatura
+            logger.error(f"Catálogo de plantas {CAMINHO_CATALOGO} não recarregado, mantendo a versão {catalogo.versao}: {e}")
+            return False
+        catalogo = novo
+        _assinatura_catalogo = assinatura
+    logger.info(f"Catálogo de plantas recarregado: {len(novo)} plantas, versão {novo.versao}.")
+    return True
+
+def _vigiar_catalogo():
+    while True:
+        time.sleep(INTERVALO_VIGIA_CATALOGO)
+        # Nenhum erro de uma edição do arquivo pode encerrar a vigia
+        try:
+            if assinatura_arquivo(CAMINHO_CATALOGO) != _assinatura_catalogo:
+                recarregar_catalogo()
+        except Exception as e:
+            logger.error(f"Erro ao verificar o catálogo de plantas {CAMINHO_CATALOGO}: {e}")
+
+def iniciar_vigia_catalogo():
+    threading.Thread(target=_vigiar_catalogo, name="vigia-catalogo", daemon=True).start()
+    logger.info(f"Vigiando alterações em {CAMINHO_CATALOGO}.")
+
+# --- VERSÕES PARA CACHE (ETag) ---
+# O catálogo de plantas é versionado pelo conteúdo do arquivo e o status de cada
+# vaso pelo contador "versao" do registro. O prefixo aleatório por processo
+# garante que uma ETag emitida antes de um reinício nunca coincida com uma nova.
+ID_PROCESSO = os.urandom(4).hex()
+
+# Marca da instrução do LCD para long-poll e SSE: muda só quando o texto muda
+def marca_instrucao(vaso):
+    return f"{ID_PROCESSO}-{vaso.versao_instrucao}"
+
+def etag_confere(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for candidata in if_none_match.split(','):
+        candidata = candidata.strip()
+        if candidata == '*' or candidata.removeprefix('W/') == etag:
+            return True
+    return False
+
+# --- RESPOSTAS PRÉ-SERIALIZADAS ---
+# /get_instruction, /status e /get_full_status são lidos (ESP32s em polling e
+# usuários do bot) muito mais vezes do que o estado muda. O corpo JSON de cada
+# rota fica guardado já em bytes, junto com a versão de que saiu (vaso.versao,
+# versao_instrucao, geração do catálogo). A leitura compara a versão sem lock e
+# devolve os mesmos bytes; só depois de uma mudança o corpo é montado de novo,
+# com o lock do vaso. Por isso toda mudança de estado do vaso incrementa
+# vaso.versao (ou versao_instrucao) com o lock adquirido.
+CABECALHOS_JSON = {"Content-Type": "application/json"}
+
+def serializar_json(corpo):
+    return json.dumps(corpo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# "respostas" é o dicionário rota -> (versão, bytes) do vaso; versao_atual() e
+# montar() são chamadas com o lock na reconstrução. Devolve (versão, bytes).
+def resposta_em_cache(respostas, rota, lock, versao_atual, montar):
+    entrada = respostas.get(rota)
+    if entrada is not None and entrada[0] == versao_atual():
+        respostas_em_cache[rota].incrementar()
+        return entrada
+    with lock:
+        versao = versao_atual()
+        corpo = montar()
+    entrada = (versao, serializar_json(corpo))
+    # Sem lock: uma versão mais antiga gravada por último só causa outra reconstrução
+    respostas[rota] = entrada
+    respostas_reconstruidas[rota].incrementar()
+    return entrada
+
+# --- FILA DE MENSAGENS PARA O TELEGRAM E WORKER DEDICADO ---
+# A fila é limitada (fila_telegram.py): VASO_TELEGRAM_FILA_MAX mensagens em
+# memória e, acima disso, a política VASO_TELEGRAM_POLITICA. O padrão é
+# transbordar para o diretório VASO_TELEGRAM_TRANSBORDO (ao lado do banco);
+# rodando só em memória, sem diretório, descarta as mais antigas de cada chat.
+LIMITE_FILA_TELEGRAM = int(os.environ.get('VASO_TELEGRAM_FILA_MAX', '10000'))
+DIRETORIO_TRANSBORDO_TELEGRAM = os.environ.get('VASO_TELEGRAM_TRANSBORDO', f"{CAMINHO_BANCO}-telegram" if CAMINHO_BANCO else '')
+POLITICA_FILA_TELEGRAM = os.environ.get('VASO_TELEGRAM_POLITICA', POLITICA_DISCO if DIRETORIO_TRANSBORDO_TELEGRAM else POLITICA_DESCARTAR)
+# Mensagens com o despachante esperando a vez do chat; o resto espera na fila
+MAX_PENDENTES_DESPACHANTE = 1000
+
+telegram_message_queue = FilaTelegram(LIMITE_FILA_TELEGRAM, POLITICA_FILA_TELEGRAM, DIRETORIO_TRANSBORDO_TELEGRAM) 
+despachante_telegram = DespachanteTelegram(bot, telegram_message_queue, envios_simultaneos=ENVIOS_SIMULTANEOS_TELEGRAM,
+                                           max_pendentes=MAX_PENDENTES_DESPACHANTE)
+
+# Roda no event loop de quem consome a fila: a thread dedicada do modo Flask
+# (start_telegram_worker) ou o próprio loop do servidor ASGI.
+async def telegram_worker():
+    telegram_message_queue.vincular_loop()
+    logger.info("Worker do Telegram iniciado.")
+    await despachante_telegram.executar()
+
+def start_telegram_worker():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(telegram_worker())
+    loop.close() 
+
+def enfileirar_telegram(chat_id, mensagem):
+    telegram_message_queue.put((chat_id, mensagem))
+    if persistencia is not None:
+        persistencia.mensagem(chat_id, mensagem)
+
+# --- AVISOS DE MUDANÇA DA INSTRUÇÃO (LONG-POLL E SSE) ---
+# Só no modo ASGI (servidor_asgi.py), que vincula o avisos_instrucao ao seu
+# event loop: as conexões em espera ficam no loop, sem thread cada uma.
+TIMEOUT_ESPERA_PADRAO = 30.0
+TIMEOUT_ESPERA_MAX = 120.0
+INTERVALO_PING_SSE = 15.0
+# O fluxo SSE é encerrado depois deste tempo e o cliente reconecta (com
+# Last-Event-ID); assim nenhum fluxo segura o encerramento do servidor
+DURACAO_MAX_SSE = 300.0
+MAX_CONEXOES_AVISOS = 50000
+
+avisos_instrucao = AvisosInstrucao()
+
+def _chave_chat(chat_id):
+    # chat_id chega como número do bot e como texto na query string do SSE
+    return None if chat_id is None else str(chat_id)
+
+# Chamada pelo despachante quando um grupo vira supergrupo (ChatMigrated): os
+# vasos que notificavam o chat antigo passam a notificar o novo. Devolve os
+# vaso_ids migrados (o modo multiprocesso atualiza também a tabela).
+def migrar_chat(chat_antigo, chat_novo):
+    migrados = []
+    for vaso_id in registro_vasos.ids():
+        vaso = registro_vasos.obter(vaso_id)
+        if vaso is None:
+            continue
+        with registro_vasos.lock_de(vaso_id):
+            if _chave_chat(vaso.chat_id_notificacao) != _chave_chat(chat_antigo):
+                continue
+            vaso.chat_id_notificacao = chat_novo
+            vaso.versao += 1
+            if persistencia is not None:
+                persistencia.estado(vaso)
+        migrados.append(vaso_id)
+    logger.info(f"Chat {chat_antigo} migrou para {chat_novo}: {len(migrados)} vasos atualizados.")
+    return migrados
+
+# --- MÉTRICAS (/metrics) E PERFILADOR ---
+# Histogramas e contadores por thread (metricas.py): o custo no caminho de cada
+# requisição é um incremento sem lock. Fila, despachante e frota são lidos só
+# na hora da coleta.
+JANELA_VASOS_ATIVOS = 120  # segundos
+ROTA_DESCONHECIDA = "outras"  # rótulo de caminhos sem rota, para não criar uma série por URL
+
+metricas = RegistroMetricas()
+duracao_requisicoes = metricas.registrar(Histograma(
+    "vaso_http_requisicao_segundos", "Tempo de atendimento das requisições HTTP, por rota.", ("rota",)))
+respostas_http = metricas.registrar(Contador(
+    "vaso_http_respostas_total", "Respostas HTTP por rota e status.", ("rota", "status")))
+duracao_decisao = metricas.registrar(Histograma(
+    "vaso_decisao_segundos", "Tempo gasto em tomar_decisao_planta()."))
+atraso_telegram = metricas.registrar(Histograma(
+    "vaso_telegram_atraso_segundos", "Tempo entre enfileirar um alerta e entregá-lo ao Telegram.", limites=LIMITES_ATRASO))
+vasos_ativos = JanelaAtividade(JANELA_VASOS_ATIVOS)
+ROTAS_EM_CACHE = ("/get_instruction", "/status", "/get_full_status")
+_respostas_cache = metricas.registrar(Contador(
+    "vaso_respostas_cache_total", "Respostas das rotas de leitura servidas do cache ou remontadas, por rota.",
+    ("rota", "resultado")))
+respostas_em_cache = {rota: _respostas_cache.rotulado(rota, "cache") for rota in ROTAS_EM_CACHE}
+respostas_reconstruidas = {rota: _respostas_cache.rotulado(rota, "remontada") for rota in ROTAS_EM_CACHE}
+
+metricas.registrar(Coletor(
+    "vaso_telegram_fila_mensagens", "Mensagens em telegram_message_queue aguardando o despachante.",
+    lambda: telegram_message_queue.qsize()))
+metricas.registrar(Coletor(
+    "vaso_telegram_transbordo_mensagens", "Mensagens da fila do Telegram gravadas no transbordo em disco.",
+    lambda: telegram_message_queue.em_disco()))
+metricas.registrar(Coletor(
+    "vaso_telegram_fila_pressao", "Fração do limite da fila do Telegram ocupada (memória + disco).",
+    lambda: telegram_message_queue.pressao()))
+metricas.registrar(Coletor(
+    "vaso_telegram_fila_limite_total", "Mensagens que passaram do limite de memória da fila do Telegram, por destino.",
+    lambda: {("descartada",): telegram_message_queue.descartadas, ("mesclada",): telegram_message_queue.mescladas,
+             ("disco",): telegram_message_queue.transbordadas},
+    tipo="counter", rotulos=("destino",)))
+alertas_suprimidos = metricas.registrar(Contador(
+    "vaso_telegram_suprimidas_total", "Notificações não críticas não enfileiradas por causa da pressão na fila do Telegram."))
+metricas.registrar(Coletor(
+    "vaso_telegram_pendentes_mensagens", "Mensagens com o despachante aguardando a vez de envio do chat.",
+    lambda: despachante_telegram.pendentes()))
+metricas.registrar(Coletor(
+    "vaso_telegram_envios_total", "Envios ao Telegram por resultado.",
+    lambda: {("entregue",): despachante_telegram.enviadas, ("falha",): despachante_telegram.falhas,
+             ("adiada",): despachante_telegram.adiadas},
+    tipo="counter", rotulos=("resultado",)))
+metricas.registrar(Coletor(
+    "vaso_telegram_retentativas_total", "Novas tentativas de envio ao Telegram.",
+    lambda: despachante_telegram.retentativas, tipo="counter"))
+metricas.registrar(Coletor(
+    "vaso_telegram_mescladas_total", "Alertas entregues junto com outro do mesmo chat.",
+    lambda: despachante_telegram.mescladas, tipo="counter"))
+metricas.registrar(Coletor(
+    "vaso_vasos_ativos", f"Vasos que enviaram leituras nos últimos {JANELA_VASOS_ATIVOS} a {2 * JANELA_VASOS_ATIVOS} segundos.",
+    vasos_ativos.contar))
+metricas.registrar(Coletor(
+    "vaso_vasos_registrados", "Vasos conhecidos pelo servidor.", lambda: len(registro_vasos)))
+metricas.registrar(Coletor(
+    "vaso_avisos_conexoes", "Conexões abertas esperando mudanças de instrução, por tipo.",
+    lambda: {(tipo,): quantidade for tipo, quantidade in avisos_instrucao.conexoes.items()},
+    rotulos=("tipo",)))
+metricas.registrar(Coletor(
+    "vaso_log_fila_registros", "Registros de log aguardando a thread de escrita.", registros_na_fila))
+metricas.registrar(Coletor(
+    "vaso_log_suprimidos_total", "Registros de log não gravados, por motivo.",
+    lambda: {("amostragem",): amostragem.suprimidas, ("repeticao",): filtro_repeticao.suprimidas,
+             ("fila_cheia",): registros_descartados()},
+    tipo="counter", rotulos=("motivo",)))
+
+despachante_telegram.observar_atraso = atraso_telegram.observar
+despachante_telegram.ao_migrar = migrar_chat
+
+def registrar_requisicao(rota, status, duracao):
+    duracao_requisicoes.rotulado(rota).observar(duracao)
+    respostas_http.rotulado(rota, status).incrementar()
+
+# Perfilador por amostragem, desligado até ser ligado por /perfilador/controle
+perfilador = PerfiladorAmostragem()
+INTERVALO_MIN_PERFILADOR = 0.001
+INTERVALO_MAX_PERFILADOR = 1.0
+
+# --- PERSISTÊNCIA ---
+# Deve ser chamada antes de iniciar o worker do Telegram: restaura os vasos e
+# devolve à fila as mensagens que não chegaram a ser entregues.
+def iniciar_persistencia(caminho=CAMINHO_BANCO):
+    global persistencia
+    if not caminho:
+        logger.info("Persistência desativada (VASO_DB_PATH vazio).")
+        telegram_message_queue.retomar_transbordo()
+        return
+    # O banco guarda todas as mensagens pendentes, inclusive as que estavam no
+    # transbordo em disco: elas voltam por ele
+    telegram_message_queue.descartar_transbordo()
+    persistencia = PersistenciaVasos(caminho, registro_vasos)
+    telegram_message_queue.ao_descartar = persistencia.mensagens_concluidas
+    for chat_id, mensagem in persistencia.restaurar():
+        telegram_message_queue.put((chat_id, mensagem))
+    recalcular_tendencias()
+    despachante_telegram.ao_concluir = persistencia.mensagens_concluidas
+    persistencia.iniciar()
+
+def encerrar_persistencia():
+    telegram_message_queue.fechar()
+    if persistencia is not None:
+        persistencia.fechar()
+
+# --- TENDÊNCIAS (tendencias.py) ---
+# As estatísticas de cada vaso andam com as leituras (registrar_leitura) e não
+# são gravadas no banco: depois de restaurar, saem do histórico de uma vez para
+# a frota inteira. Deve rodar antes de o servidor atender leituras.
+def recalcular_tendencias():
+    inicio = time.perf_counter()
+    vasos = [vaso for vaso in map(registro_vasos.obter, registro_vasos.ids()) if vaso is not None]
+    recalculadas = recalcular_frota([vaso.historico for vaso in vasos])
+    for vaso, tendencias in zip(vasos, recalculadas):
+        with registro_vasos.lock_de(vaso.vaso_id):
+            vaso.tendencias = tendencias
+    logger.info(f"Tendências recalculadas do histórico para {sum(t is not None for t in recalculadas)} vasos em {time.perf_counter() - inicio:.2f}s.")
+
+# Deve ser chamada com o lock do vaso (registro_vasos.lock_de) adquirido.
+def analise_do_vaso(vaso):
+    if vaso.tendencias is None:
+        return None
+    return vaso.tendencias.resumo(perfil_do_vaso(vaso).umidade[0])
+
+# --- LÓGICA DE DECISÃO DA PLANTA ---
+# Instruções do LCD indexadas por [codigo_umidade + 2][codigo_luz + 2]; fora da
+# faixa crítica a instrução aparece em maiúsculas
+INSTRUCOES_LCD = tuple(
+    tuple(f"{texto_umidade}, {texto_luz}" for texto_luz in ("MAIS SOL", "mais sol", "luz ideal", "menos sol", "MENOS SOL"))
+    for texto_umidade in ("MAIS AGUA", "mais agua", "umidade ideal", "menos agua", "MENOS AGUA")
+)
+
+# Deve ser chamada com o lock do vaso (registro_vasos.lock_de) adquirido.
+def registrar_leitura(vaso, ts, umidade, luminosidade):
+    if vaso.historico is None:
+        vaso.historico = HistoricoVaso()
+    vaso.historico.adicionar(ts, umidade, luminosidade)
+    if vaso.tendencias is None:
+        vaso.tendencias = TendenciasVaso()
+    vaso.tendencias.adicionar(ts, umidade, luminosidade)
+    vaso.umidade_atual = umidade
+    vaso.luminosidade_atual = luminosidade
+    vaso.versao += 1
+    vasos_ativos.marcar(vaso.vaso_id)
+    if persistencia is not None:
+        persistencia.leitura(vaso, ts, umidade, luminosidade)
+
+def codigos_anteriores(vaso):
+    # Estado (já com histerese) da última decisão do vaso: (umidade, luz)
+    if vaso.alertas is None:
+        return 0, 0
+    return vaso.alertas.codigo_umidade, vaso.alertas.codigo_luz
+
+# O perfil compilado fica guardado no vaso e só é procurado de novo quando a
+# planta muda ou o catálogo é recarregado (geração diferente).
+def perfil_do_vaso(vaso):
+    perfil = vaso.perfil
+    if perfil is None or perfil.geracao != catalogo.geracao:
+        perfil = vaso.perfil = catalogo.perfil_de(vaso.planta_selecionada)
+    return perfil
+
+# Deve ser chamada com o lock do vaso (registro_vasos.lock_de) adquirido.
+def tomar_decisao_planta(vaso, ts=None):
+    inicio = time.perf_counter()
+    perfil = perfil_do_vaso(vaso)
+    anterior_umidade, anterior_luz = codigos_anteriores(vaso)
+    codigo_umidade = aplicar_histerese(anterior_umidade, vaso.umidade_atual, *perfil.umidade)
+    codigo_luz = aplicar_histerese(anterior_luz, vaso.luminosidade_atual, *perfil.luminosidade)
+    instrucao = aplicar_decisao(vaso, codigo_umidade, codigo_luz, ts)
+    duracao_decisao.observar(time.perf_counter() - inicio)
+    return instrucao
+
+# Atualiza o LCD e as notificações a partir dos códigos já classificados com
+# histerese (-2 crítico abaixo, -1 abaixo, 0 ideal, 1 acima, 2 crítico acima),
+# seja pela avaliação individual ou em lote. O LCD muda na hora; o Telegram só recebe mudanças de estado confirmadas
+# pela máquina de estados do vaso (permanência mínima e intervalo entre alertas).
+def aplicar_decisao(vaso, codigo_umidade, codigo_luz, ts=None):
+    planta = vaso.planta_selecionada
+    umidade = vaso.umidade_atual
+    luminosidade = vaso.luminosidade_atual
+    chat_id_para_notificar = vaso.chat_id_notificacao 
+    registrar_log = amostragem.permitir("decisao")
+
+    if chat_id_para_notificar is None:
+        if registrar_log:
+            logger.warning(f"Vaso {vaso.vaso_id}: nenhum chat ID configurado para notificações. Mensagem não será enviada para o Telegram.")
+        return vaso.instrucao_para_lcd
+
+    # Define a instrução final para o LCD; quem espera por mudanças (long-poll,
+    # SSE) só é avisado quando o texto muda de fato
+    instrucao_final_lcd = INSTRUCOES_LCD[codigo_umidade + 2][codigo_luz + 2]
+    if instrucao_final_lcd != vaso.instrucao_para_lcd:
+        vaso.instrucao_para_lcd = instrucao_final_lcd
+        vaso.versao_instrucao += 1
+        avisos_instrucao.publicar(vaso.vaso_id, _chave_chat(chat_id_para_notificar), marca_instrucao(vaso),
+                                  instrucao_final_lcd, planta)
+
+    perfil = perfil_do_vaso(vaso)
+    if vaso.alertas is None:
+        vaso.alertas = EstadoAlertas()
+    estado_notificar = vaso.alertas.avancar(
+        codigo_umidade, codigo_luz, time.time() if ts is None else ts,
+        perfil.permanencia_min, perfil.intervalo_alertas,
+    )
+    if estado_notificar is None:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Decisão para {planta} (Vaso: {vaso.vaso_id}): {instrucao_final_lcd}. Sem mudança a notificar.")
+        return instrucao_final_lcd
+    codigo_umidade, codigo_luz = estado_notificar
+
+    # Com a fila do Telegram sob pressão (API fora do ar), só alertas críticos
+    # são enfileirados; o estado conta como notificado e o status do vaso
+    # mostra a mensagem mesmo assim
+    enviar = (abs(codigo_umidade) >= 2 or abs(codigo_luz) >= 2) or not telegram_message_queue.sob_pressao()
+
+    notificacoes_telegram = [] 
+
+    # Lógica de Umidade
+    if codigo_umidade <= -2:
+        notificacoes_telegram.append(f"🆘 Urgente! Sua {planta} está secando e precisa ser regada agora. Umidade atual: {umidade}%.")
+    elif codigo_umidade < 0:
+        notificacoes_telegram.append(f"🚨 Atenção! Sua {planta} precisa ser regada. Umidade atual: {umidade}%.")
+    elif codigo_umidade >= 2:
+        notificacoes_telegram.append(f"🆘 Urgente! Sua {planta} está encharcada, risco de apodrecer as raízes: {umidade}%.")
+    elif codigo_umidade > 0:
+        notificacoes_telegram.append(f"💧 Excesso de água! Sua {planta} está com umidade muito alta: {umidade}%.")
+
+    # Lógica de Luminosidade
+    if codigo_luz <= -2:
+        notificacoes_telegram.append(f"🆘 Urgente! Sua {planta} está quase sem luz. Luminosidade atual: {luminosidade}.")
+    elif codigo_luz < 0:
+        notificacoes_telegram.append(f"☀️ Sua {planta} precisa de mais luz. Luminosidade atual: {luminosidade}.")
+    elif codigo_luz >= 2:
+        notificacoes_telegram.append(f"🆘 Urgente! Sua {planta} está sob sol forte demais. Luminosidade atual: {luminosidade}.")
+    elif codigo_luz > 0:
+        notificacoes_telegram.append(f"🔥 Sua {planta} está pegando muito sol. Luminosidade atual: {luminosidade}.")
+
+    # Lógica para as notificações do Telegram
+    if not notificacoes_telegram:
+        notificacao_telegram_final = f"✅ Sua {planta} está com condições perfeitas agora!"
+        vaso.ultima_notificacao_telegram = "✅ Tudo certo!"
+        if enviar:
+            enfileirar_telegram(chat_id_para_notificar, notificacao_telegram_final)
+            logger.info(f"Mensagem de 'tudo certo' enfileirada para Telegram (Vaso: {vaso.vaso_id}, Chat ID: {chat_id_para_notificar}).")
+    else:
+        notificacao_telegram_final = "\n".join(notificacoes_telegram) 
+        if enviar:
+            enfileirar_telegram(chat_id_para_notificar, notificacao_telegram_final)
+        vaso.ultima_notificacao_telegram = notificacao_telegram_final
+        if enviar:
+            logger.info(f"Mensagem enfileirada para Telegram (Vaso: {vaso.vaso_id}, Chat ID: {chat_id_para_notificar}): '{notificacao_telegram_final}'")
+
+    if not enviar:
+        alertas_suprimidos.incrementar()
+        if registrar_log:
+            logger.warning(f"Fila do Telegram sob pressão ({telegram_message_queue.qsize()} mensagens): notificação não crítica do vaso {vaso.vaso_id} não enfileirada.")
+
+
+    if registrar_log:
+        logger.info(f"Decisão para {planta} (Vaso: {vaso.vaso_id}): {instrucao_final_lcd}.")
+    return instrucao_final_lcd
+
+
+# --- TRATAMENTO DAS ROTAS DA API ---
+
+def _vaso_id_invalido(rota, valor):
+    logger.warning(f"Requisição {rota}: vaso_id inválido ({valor!r}).")
+    return {"status": "error", "message": "vaso_id inválido"}, 400
+
+def _vaso_nao_encontrado(rota, vaso_id):
+    logger.warning(f"Requisição {rota}: vaso '{vaso_id}' não encontrado.")
+    return {"status": "error", "message": f"Vaso '{vaso_id}' não encontrado. Ele precisa enviar dados ou ter uma planta definida primeiro."}, 404
+
+# Devolve (erro, vaso_id, umidade, luminosidade); com erro, a resposta 400 pronta.
+# Também usada pelos processos HTTP do modo multiprocesso.
+def validar_leitura(data):
+    if not data or not isinstance(data, dict):
+        logger.warning("Requisição /update_sensor_data: Nenhum dado JSON recebido.")
+        return ({"status": "error", "message": "Nenhum dado JSON recebido"}, 400), None, None, None
+
+    vaso_id = normalizar_vaso_id(data.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/update_sensor_data', data.get('vaso_id')), None, None, None
+
+    umidade = data.get('umidade')
+    luminosidade = data.get('luminosidade')
+
+    if umidade is None or luminosidade is None:
+        logger.warning(f"Requisição /update_sensor_data: Dados ausentes - umidade={umidade}, luminosidade={luminosidade}")
+        return ({"status": "error", "message": "Dados de umidade ou luminosidade ausentes"}, 400), None, None, None
+
+    try:
+        umidade = float(umidade)
+        luminosidade = float(luminosidade)
+    except (TypeError, ValueError):
+        logger.error(f"Requisição /update_sensor_data: Valores inválidos - umidade={umidade}, luminosidade={luminosidade}")
+        return ({"status": "error", "message": "Valores de umidade/luminosidade inválidos"}, 400), None, None, None
+
+    # O JSON aceita NaN e Infinity, que corromperiam o histórico e as tendências
+    if not (math.isfinite(umidade) and math.isfinite(luminosidade)):
+        logger.error(f"Requisição /update_sensor_data: Valores não finitos - umidade={umidade}, luminosidade={luminosidade}")
+        return ({"status": "error", "message": "Valores de umidade/luminosidade inválidos"}, 400), None, None, None
+
+    return None, vaso_id, umidade, luminosidade
+
+def processar_leitura(data, ip):
+    registrar_log = amostragem.permitir('/update_sensor_data')
+    if registrar_log:
+        logger.info(f"CONFIRMAÇÃO: Conexão recebida do ESP32 no IP {ip}")
+
+    erro, vaso_id, umidade, luminosidade = validar_leitura(data)
+    if erro is not None:
+        return erro
+
+    vaso = registro_vasos.obter_ou_criar(vaso_id)
+    agora = time.time()
+    with registro_vasos.lock_de(vaso_id):
+        registrar_leitura(vaso, agora, umidade, luminosidade)
+        if registrar_log:
+            logger.info(f"--> Dados recebidos do vaso {vaso_id}: Umidade={umidade}%, Luminosidade={luminosidade}")
+
+        instrucao = tomar_decisao_planta(vaso, agora)
+
+    return {"status": "success", "message": "Dados recebidos", "instrucao": instrucao}, 200
+
+
+# Limite de leituras por requisição em lote (também por quadro binário)
+MAX_LEITURAS_LOTE = 10000
+
+# --- QUADRO BINÁRIO (quadro_binario.py) ---
+# Alternativa compacta ao JSON em /update_sensor_data: o corpo é lido sem
+# cópia e a resposta é o quadro de instrução binário, sem JSON.
+CABECALHOS_QUADRO = {"Content-Type": TIPO_CONTEUDO_QUADRO}
+
+def _quadro_invalido(mensagem):
+    logger.warning(f"Requisição /update_sensor_data: quadro binário inválido - {mensagem}")
+    return montar_resposta(STATUS_INVALIDO, 0, 0, mensagem), 400, CABECALHOS_QUADRO
+
+# Mesma janela de ler_leitura_lote: amostra mais antiga que o histórico recusa
+# o quadro inteiro (status 2), nos dois modos de servidor
+def quadro_fora_da_janela(quadro, agora):
+    mais_antigo = quadro.ts_mais_antigo()
+    return mais_antigo is not None and mais_antigo < agora - JANELA_HISTORICO
+
+def processar_quadro(corpo, ip):
+    try:
+        quadro = ler_quadro(corpo, MAX_LEITURAS_LOTE)
+    except ValueError as e:
+        return _quadro_invalido(str(e))
+
+    vaso_id = normalizar_vaso_id(quadro.vaso_id)
+    if vaso_id is None:
+        return _quadro_invalido("vaso_id inválido")
+
+    agora = time.time()
+    if quadro_fora_da_janela(quadro, agora):
+        return _quadro_invalido("ts mais antigo que o histórico")
+
+    vaso = registro_vasos.obter_ou_criar(vaso_id)
+    if quadro.quantidade == 1:
+        ts, umidade, luminosidade = quadro.amostra()
+        ts = agora if ts == 0 else min(ts, agora)
+        with registro_vasos.lock_de(vaso_id):
+            registrar_leitura(vaso, ts, umidade, luminosidade)
+            instrucao = tomar_decisao_planta(vaso, ts)
+    else:
+        # Amostras acumuladas pelo dispositivo: o mesmo caminho vetorizado do lote
+        timestamps, umidades, luminosidades = quadro.colunas(agora)
+        indice = perfil_do_vaso(vaso).indice
+        anterior_umidade, anterior_luz = codigos_anteriores(vaso)
+        n = quadro.quantidade
+        resultados = avaliar_lote([vaso] * n, [indice] * n, [anterior_umidade] * n, [anterior_luz] * n,
+                                  timestamps.tolist(), umidades.tolist(), luminosidades.tolist())
+        instrucao = resultados[vaso_id]["instrucao"]
+
+    with registro_vasos.lock_de(vaso_id):
+        codigo_umidade, codigo_luz = codigos_anteriores(vaso)
+        status = STATUS_OK if vaso.chat_id_notificacao is not None else STATUS_AGUARDANDO
+    if amostragem.permitir('/update_sensor_data'):
+        logger.info(f"--> Quadro binário do vaso {vaso_id} (IP {ip}): {quadro.quantidade} amostras, Umidade={vaso.umidade_atual}%, Luminosidade={vaso.luminosidade_atual}")
+    return montar_resposta(status, codigo_umidade, codigo_luz, instrucao), 200, CABECALHOS_QUADRO
+
+# Formatos aceitos pelo lote: NDJSON (uma leitura por linha), uma lista JSON de
+# leituras ou um objeto {"vaso_id": ..., "leituras": [...]} com leituras
+# acumuladas de um vaso. Cada leitura pode trazer "ts" (epoch em segundos) de
+# quando foi medida.
+TIPOS_NDJSON = ('application/x-ndjson', 'application/jsonl')
+
+def carregar_lote_ndjson(linhas):
+    leituras = []
+    for linha in linhas:
+        if linha.strip():
+            leituras.append(json.loads(linha))
+        if len(leituras) > MAX_LEITURAS_LOTE:
+            break
+    return leituras, None
+
+def carregar_lote_json(data):
+    if isinstance(data, list):
+        return data, None
+    if isinstance(data, dict) and isinstance(data.get('leituras'), list):
+        return data['leituras'], data.get('vaso_id')
+    raise ValueError("Envie uma lista JSON de leituras, um objeto com 'leituras' ou NDJSON")
+
+# Valida uma leitura do lote e devolve (vaso_id, ts, umidade, luminosidade);
+# ValueError com a mensagem que vai para "erros". Também usada pelo gateway
+# MQTT, que valida as leituras de cada dispositivo antes de juntá-las.
+def ler_leitura_lote(leitura, vaso_id_lote, agora):
+    if not isinstance(leitura, dict):
+        raise ValueError("Leitura deve ser um objeto JSON")
+    vaso_id = normalizar_vaso_id(leitura.get('vaso_id', vaso_id_lote))
+    if vaso_id is None:
+        raise ValueError("vaso_id inválido")
+    try:
+        umidade = float(leitura['umidade'])
+        luminosidade = float(leitura['luminosidade'])
+        ts = float(leitura.get('ts', agora))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Valores de umidade/luminosidade/ts ausentes ou inválidos")
+    if not (math.isfinite(umidade) and math.isfinite(luminosidade)):
+        raise ValueError("Valores de umidade/luminosidade não finitos")
+    # ts no futuro vira "agora"; não finito ou mais antigo que o histórico é recusado
+    if not math.isfinite(ts) or ts < agora - JANELA_HISTORICO:
+        raise ValueError("ts não finito ou mais antigo que o histórico")
+    return vaso_id, min(ts, agora), umidade, luminosidade
+
+def processar_lote(carregar, ip):
+    try:
+        leituras, vaso_id_lote = carregar()
+    except ValueError as e:
+        logger.warning(f"Requisição /update_sensor_data_batch: Lote inválido - {e}")
+        return {"status": "error", "message": f"Lote inválido: {e}"}, 400
+
+    if len(leituras) > MAX_LEITURAS_LOTE:
+        logger.warning(f"Requisição /update_sensor_data_batch: Lote acima do limite de {MAX_LEITURAS_LOTE} leituras.")
+        return {"status": "error", "message": f"Máximo de {MAX_LEITURAS_LOTE} leituras por lote"}, 413
+
+    # Monta as colunas do lote, descartando leituras inválidas
+    agora = time.time()
+    vasos = []
+    indices_planta = []
+    anteriores_umidade = []
+    anteriores_luz = []
+    timestamps = []
+    umidades = []
+    luminosidades = []
+    erros = []
+    for posicao, leitura in enumerate(leituras):
+        try:
+            vaso_id, ts, umidade, luminosidade = ler_leitura_lote(leitura, vaso_id_lote, agora)
+        except ValueError as e:
+            erros.append({"indice": posicao, "message": str(e)})
+            continue
+
+        vaso = registro_vasos.obter_ou_criar(vaso_id)
+        vasos.append(vaso)
+        indices_planta.append(perfil_do_vaso(vaso).indice)
+        anterior_umidade, anterior_luz = codigos_anteriores(vaso)
+        anteriores_umidade.append(anterior_umidade)
+        anteriores_luz.append(anterior_luz)
+        timestamps.append(ts)
+        umidades.append(umidade)
+        luminosidades.append(luminosidade)
+
+    if not vasos:
+        logger.warning(f"Requisição /update_sensor_data_batch: Nenhuma leitura válida ({len(erros)} erros).")
+        return {"status": "error", "message": "Nenhuma leitura válida no lote", "erros": erros}, 400
+
+    resultados = avaliar_lote(vasos, indices_planta, anteriores_umidade, anteriores_luz, timestamps, umidades, luminosidades)
+
+    logger.info(f"--> Lote recebido do IP {ip}: {len(vasos)} leituras de {len(resultados)} vasos, {len(erros)} inválidas")
+    return {
+        "status": "success",
+        "message": "Lote recebido",
+        "leituras_processadas": len(vasos),
+        "resultados": resultados,
+        "erros": erros
+    }, 200
+
+# Avalia colunas de leituras já validadas (uma posição por leitura) e devolve
+# {vaso_id: {"instrucao": ..., "leituras": n}}. Usada pelo lote JSON/NDJSON e
+# pelos quadros binários com várias amostras.
+def avaliar_lote(vasos, indices_planta, anteriores_umidade, anteriores_luz, timestamps, umidades, luminosidades):
+    # Leituras acumuladas de um mesmo vaso chegam em ordem: agrupadas por vaso,
+    # a histerese de cada leitura parte do código da leitura anterior, como se
+    # tivessem chegado uma a uma
+    posicoes_por_vaso = {}
+    for posicao, vaso in enumerate(vasos):
+        posicoes_por_vaso.setdefault(vaso, []).append(posicao)
+    ordem = []
+    inicios = []
+    for posicoes in posicoes_por_vaso.values():
+        inicios.append(len(ordem))
+        ordem.extend(posicoes)
+    primeiras = [posicoes[0] for posicoes in posicoes_por_vaso.values()]
+
+    # Uma única passada vetorizada classifica todas as leituras do lote
+    catalogo_lote = catalogo
+    codigos_umidade, codigos_luz = classificar_encadeado(
+        catalogo_lote.tabela, [indices_planta[posicao] for posicao in ordem],
+        [umidades[posicao] for posicao in ordem], [luminosidades[posicao] for posicao in ordem], inicios,
+        [anteriores_umidade[posicao] for posicao in primeiras], [anteriores_luz[posicao] for posicao in primeiras])
+    codigos_umidade = codigos_umidade.tolist()
+    codigos_luz = codigos_luz.tolist()
+
+    resultados = {}
+    for inicio, (vaso, posicoes) in zip(inicios, posicoes_por_vaso.items()):
+        primeira = posicoes[0]
+        with registro_vasos.lock_de(vaso.vaso_id):
+            perfil = perfil_do_vaso(vaso)
+            if (perfil.geracao == catalogo_lote.geracao and perfil.indice == indices_planta[primeira]
+                    and codigos_anteriores(vaso) == (anteriores_umidade[primeira], anteriores_luz[primeira])):
+                # Cada leitura passa pela máquina de alertas e pelo LCD, como no caminho individual
+                for deslocamento, posicao in enumerate(posicoes):
+                    registrar_leitura(vaso, timestamps[posicao], umidades[posicao], luminosidades[posicao])
+                    instrucao = aplicar_decisao(vaso, codigos_umidade[inicio + deslocamento],
+                                                codigos_luz[inicio + deslocamento], timestamps[posicao])
+            else:
+                # A planta, o catálogo ou o estado do vaso mudou enquanto o lote
+                # era avaliado: reavalia este vaso leitura a leitura
+                for posicao in posicoes:
+                    registrar_leitura(vaso, timestamps[posicao], umidades[posicao], luminosidades[posicao])
+                    instrucao = tomar_decisao_planta(vaso, timestamps[posicao])
+        resultados[vaso.vaso_id] = {"instrucao": instrucao, "leituras": len(posicoes)}
+    return resultados
+
+
+def obter_instrucao(args):
+    vaso_id = normalizar_vaso_id(args.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/get_instruction', args.get('vaso_id'))
+
+    vaso = registro_vasos.obter(vaso_id)
+    if vaso is None:
+        return _vaso_nao_encontrado('/get_instruction', vaso_id)
+
+    _, dados = instrucao_em_cache(vaso)
+    if amostragem.permitir('/get_instruction'):
+        logger.info(f"ESP32 (vaso {vaso_id}) solicitou instrução para LCD: '{vaso.instrucao_para_lcd}'")
+    return dados, 200, CABECALHOS_JSON
+
+# (versao_instrucao, corpo de /get_instruction); também publicado pelo gateway MQTT
+def instrucao_em_cache(vaso):
+    return resposta_em_cache(
+        vaso.respostas, '/get_instruction', registro_vasos.lock_de(vaso.vaso_id),
+        lambda: vaso.versao_instrucao,
+        lambda: {"instrucao": vaso.instrucao_para_lcd, "versao_instrucao": marca_instrucao(vaso)})
+
+# Long-poll: com "versao" igual à versao_instrucao atual, a resposta espera até
+# a instrução mudar ou o timeout vencer (304). Com versão diferente (ou sem
+# versão) responde na hora, como /get_instruction.
+async def aguardar_instrucao(args):
+    vaso_id = normalizar_vaso_id(args.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/aguardar_instrucao', args.get('vaso_id'))
+
+    vaso = registro_vasos.obter(vaso_id)
+    if vaso is None:
+        return _vaso_nao_encontrado('/aguardar_instrucao', vaso_id)
+
+    try:
+        timeout = min(float(args.get('timeout', TIMEOUT_ESPERA_PADRAO)), TIMEOUT_ESPERA_MAX)
+    except ValueError:
+        return {"status": "error", "message": "timeout deve ser um número de segundos"}, 400
+
+    versao = args.get('versao')
+    if versao == marca_instrucao(vaso) and timeout > 0:
+        if avisos_instrucao.total() >= MAX_CONEXOES_AVISOS:
+            logger.warning(f"Requisição /aguardar_instrucao: limite de {MAX_CONEXOES_AVISOS} conexões em espera atingido.")
+            return {"status": "error", "message": "Servidor ocupado, tente /get_instruction"}, 503, {"Retry-After": "5"}
+        assinatura = avisos_instrucao.assinar("long_poll", vaso_id=vaso_id)
+        try:
+            if versao == marca_instrucao(vaso):
+                await asyncio.wait_for(assinatura.evento.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            avisos_instrucao.cancelar(assinatura)
+        if versao == marca_instrucao(vaso):
+            return None, 304, {"ETag": f'"{versao}"'}
+
+    marca = marca_instrucao(vaso)
+    return instrucao_em_cache(vaso)[1], 200, {"ETag": f'"{marca}"', **CABECALHOS_JSON}
+
+# SSE: um fluxo por vaso (vaso_id) ou por chat (chat_id, todos os vasos que
+# notificam aquele chat). Devolve (erro, assinatura, avisos iniciais); o servidor
+# ASGI cuida do fluxo e deve chamar avisos_instrucao.cancelar(assinatura) no fim.
+def abrir_eventos(args, ultimo_id=None):
+    chat_id = _chave_chat(args.get('chat_id'))
+    if chat_id is None:
+        vaso_id = normalizar_vaso_id(args.get('vaso_id'))
+        if vaso_id is None:
+            return _vaso_id_invalido('/eventos', args.get('vaso_id')), None, None
+        vaso = registro_vasos.obter(vaso_id)
+        if vaso is None:
+            return _vaso_nao_encontrado('/eventos', vaso_id), None, None
+        vasos = [vaso]
+    else:
+        vaso_id = None
+        # Uma varredura da frota por conexão aberta, não por aviso
+        vasos = [vaso for vaso in map(registro_vasos.obter, registro_vasos.ids())
+                 if vaso is not None and _chave_chat(vaso.chat_id_notificacao) == chat_id]
+
+    if avisos_instrucao.total() >= MAX_CONEXOES_AVISOS:
+        logger.warning(f"Requisição /eventos: limite de {MAX_CONEXOES_AVISOS} conexões em espera atingido.")
+        return ({"status": "error", "message": "Servidor ocupado, tente novamente"}, 503, {"Retry-After": "5"}), None, None
+
+    assinatura = avisos_instrucao.assinar("sse", vaso_id=vaso_id, chat_id=chat_id)
+    iniciais = []
+    for vaso in vasos:
+        with registro_vasos.lock_de(vaso.vaso_id):
+            aviso = (vaso.vaso_id, marca_instrucao(vaso), vaso.instrucao_para_lcd, vaso.planta_selecionada)
+        # Reconexão (Last-Event-ID) de um vaso que não mudou não repete o aviso
+        if chat_id is not None or aviso[1] != ultimo_id:
+            iniciais.append(aviso)
+    logger.info(f"Fluxo de eventos aberto para {'o chat ' + chat_id if chat_id else 'o vaso ' + vaso_id} ({len(vasos)} vasos).")
+    return None, assinatura, iniciais
+
+def formatar_evento(aviso, com_id=True):
+    vaso_id, marca, instrucao, planta = aviso
+    dados = json.dumps({"vaso_id": vaso_id, "versao_instrucao": marca, "instrucao": instrucao, "planta": planta},
+                       ensure_ascii=False, separators=(",", ":"))
+    return f"id: {marca}\nevent: instrucao\ndata: {dados}\n\n" if com_id else f"event: instrucao\ndata: {dados}\n\n"
+
+# O catálogo de plantas não muda com as leituras: o bot guarda uma cópia e só
+# a baixa de novo quando "versao_catalogo" do status muda (ou com If-None-Match).
+def obter_catalogo(if_none_match=None):
+    atual = catalogo
+    etag = f'"{atual.versao}"'
+    cabecalhos = {"ETag": etag, "Cache-Control": "max-age=3600"}
+    if etag_confere(if_none_match, etag):
+        logger.debug("Requisição /plantas: catálogo inalterado (304).")
+        return None, 304, cabecalhos
+    logger.info("Requisição /plantas: enviando catálogo de plantas.")
+    return {"versao": atual.versao, "plantas": atual.publico}, 200, cabecalhos
+
+def obter_status_completo(args, if_none_match=None):
+    vaso_id = normalizar_vaso_id(args.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/get_full_status', args.get('vaso_id'))
+
+    vaso = registro_vasos.obter(vaso_id)
+    if vaso is None:
+        return _vaso_nao_encontrado('/get_full_status', vaso_id)
+
+    atual = catalogo
+    # A geração do catálogo entra na ETag: recarregar o arquivo muda "versao_catalogo"
+    etag = f'"{ID_PROCESSO}-{atual.geracao}-{vaso.versao}"'
+    if etag_confere(if_none_match, etag):
+        logger.debug(f"Bot solicitou status do vaso {vaso_id}: inalterado (304).")
+        return None, 304, {"ETag": etag}
+
+    def montar():
+        return {
+            "vaso_id": vaso_id,
+            "versao": vaso.versao,
+            "planta_selecionada": vaso.planta_selecionada,
+            "umidade_atual": vaso.umidade_atual,
+            "luminosidade_atual": vaso.luminosidade_atual,
+            "instrucao_para_lcd": vaso.instrucao_para_lcd,
+            "versao_catalogo": catalogo.versao,
+            "analise": analise_do_vaso(vaso)
+        }
+
+    (versao, geracao), dados = resposta_em_cache(vaso.respostas, '/get_full_status', registro_vasos.lock_de(vaso_id),
+                                                 lambda: (vaso.versao, catalogo.geracao), montar)
+    if amostragem.permitir('/get_full_status'):
+        logger.info(f"Bot solicitou status completo do vaso {vaso_id}.")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Status completo do vaso {vaso_id}: {dados.decode('utf-8')}")
+    # A ETag sai da versão do corpo devolvido, lida com o lock na montagem
+    return dados, 200, {"ETag": f'"{ID_PROCESSO}-{geracao}-{versao}"', "Cache-Control": "no-cache", **CABECALHOS_JSON}
+
+
+MENSAGEM_PLANTA_DEFINIDA = "Planta definida e notificações ativadas para este chat."
+
+# Devolve (erro, vaso_id, planta, chat_id), como validar_leitura
+def validar_planta(data):
+    if not data or not isinstance(data, dict) or 'planta' not in data or 'chat_id' not in data:
+        logger.warning("Requisição /set_plant: Dados ausentes (planta ou chat_id).")
+        return ({"status": "error", "message": "Nome da planta ou chat_id ausente"}, 400), None, None, None
+
+    vaso_id = normalizar_vaso_id(data.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/set_plant', data.get('vaso_id')), None, None, None
+
+    nova_planta = str(data['planta']).strip()
+    atual = catalogo
+    if nova_planta not in atual:
+        logger.warning(f"Requisição /set_plant: Planta '{nova_planta}' não encontrada nos parâmetros.")
+        return ({"status": "error", "message": f"Planta '{nova_planta}' não encontrada na base de dados. Plantas disponíveis: {', '.join(atual.nomes)}"}, 404), None, None, None
+
+    return None, vaso_id, nova_planta, data['chat_id']
+
+def definir_planta(data):
+    erro, vaso_id, nova_planta, novo_chat_id = validar_planta(data)
+    if erro is not None:
+        return erro
+
+    vaso = registro_vasos.obter_ou_criar(vaso_id)
+    with registro_vasos.lock_de(vaso_id):
+        aplicar_planta(vaso, nova_planta, novo_chat_id)
+    return {"status": "success", "message": f"Planta definida para {nova_planta}. O bot enviará a confirmação."}, 200
+
+# Deve ser chamada com o lock do vaso (registro_vasos.lock_de) adquirido.
+# Também usada pelo coordenador do modo multiprocesso (servidor_multiprocesso.py).
+def aplicar_planta(vaso, nova_planta, novo_chat_id):
+    vaso.planta_selecionada = nova_planta
+    vaso.perfil = None
+    vaso.chat_id_notificacao = novo_chat_id
+    vaso.versao += 1
+    # Planta nova, limites novos: a máquina de alertas recomeça e o
+    # estado atual é notificado na hora, como confirmação
+    vaso.alertas = None
+
+    vaso.ultima_notificacao_telegram = MENSAGEM_PLANTA_DEFINIDA
+    logger.info(f"Planta do vaso {vaso.vaso_id} atualizada para: {nova_planta}. Notificações para chat ID: {novo_chat_id}")
+
+    # A decisão vale para a última leitura do vaso e leva o ts dela: o relógio
+    # da máquina de alertas é o das leituras, que podem chegar com ts no
+    # passado (lotes e quadros acumulados). Com a hora do relógio, o candidato
+    # ficaria à frente das próximas leituras e a permanência mínima e o
+    # intervalo entre alertas dependeriam de quando a planta foi definida.
+    # Sem leituras ainda, o relógio começa em 0.
+    tendencias = vaso.tendencias
+    tomar_decisao_planta(vaso, tendencias.ts if tendencias is not None and tendencias.ts is not None else 0.0)
+    if persistencia is not None:
+        persistencia.estado(vaso)
+
+def obter_status(args):
+    vaso_id = normalizar_vaso_id(args.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/status', args.get('vaso_id'))
+
+    vaso = registro_vasos.obter(vaso_id)
+    if vaso is None:
+        return _vaso_nao_encontrado('/status', vaso_id)
+
+    logger.info(f"Requisição /status: Retornando estado atual do vaso {vaso_id}.")
+
+    def montar():
+        estado = vaso.para_dict()
+        estado["analise"] = analise_do_vaso(vaso)
+        return estado
+
+    _, dados = resposta_em_cache(vaso.respostas, '/status', registro_vasos.lock_de(vaso_id),
+                                 lambda: (vaso.versao, catalogo.geracao), montar)
+    return dados, 200, CABECALHOS_JSON
+
+# Janela padrão de /history quando "inicio" não é informado
+JANELA_HISTORICO_PADRAO = 3600
+
+def obter_historico(args):
+    vaso_id = normalizar_vaso_id(args.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/history', args.get('vaso_id'))
+
+    vaso = registro_vasos.obter(vaso_id)
+    if vaso is None:
+        return _vaso_nao_encontrado('/history', vaso_id)
+
+    resolucao = args.get('resolucao', 'auto')
+    if resolucao != 'auto' and resolucao not in RESOLUCOES:
+        logger.warning(f"Requisição /history: resolução '{resolucao}' inválida.")
+        return {"status": "error", "message": f"Resolução inválida. Use auto, {', '.join(RESOLUCOES)}"}, 400
+
+    try:
+        fim = float(args.get('fim', time.time()))
+        inicio = float(args.get('inicio', fim - JANELA_HISTORICO_PADRAO))
+    except ValueError:
+        logger.warning("Requisição /history: inicio/fim inválidos.")
+        return {"status": "error", "message": "inicio e fim devem ser timestamps em segundos"}, 400
+
+    with registro_vasos.lock_de(vaso_id):
+        if vaso.historico is None:
+            resolucao = "bruto" if resolucao == "auto" else resolucao
+            serie = {}
+        else:
+            resolucao, serie = vaso.historico.consultar(inicio, fim, resolucao)
+
+    logger.info(f"Requisição /history: vaso {vaso_id}, resolução {resolucao}, {len(serie.get('ts', []))} pontos.")
+    return {"vaso_id": vaso_id, "inicio": inicio, "fim": fim, "resolucao": resolucao, "serie": serie}, 200
+
+
+def exportar_metricas():
+    return metricas.exportar(), 200, {"Content-Type": TIPO_CONTEUDO, "Cache-Control": "no-store"}
+
+def obter_perfilador(args):
+    if args.get('formato') == 'colapsado':
+        # Uma linha por pilha ("thread;arquivo:função;... amostras"), para flamegraph.pl/speedscope
+        return perfilador.colapsado(), 200, {"Content-Type": "text/plain; charset=utf-8"}
+    try:
+        limite = int(args.get('limite', 50))
+    except ValueError:
+        return {"status": "error", "message": "limite deve ser um número inteiro"}, 400
+    return perfilador.relatorio(limite), 200
+
+def controlar_perfilador(data):
+    if not data or not isinstance(data, dict):
+        return {"status": "error", "message": "Envie um objeto JSON com 'ativo', 'intervalo' e/ou 'limpar'"}, 400
+
+    intervalo = data.get('intervalo')
+    if intervalo is not None:
+        try:
+            intervalo = float(intervalo)
+        except (TypeError, ValueError):
+            intervalo = None
+        if intervalo is None or not INTERVALO_MIN_PERFILADOR <= intervalo <= INTERVALO_MAX_PERFILADOR:
+            return {"status": "error", "message": f"intervalo deve estar entre {INTERVALO_MIN_PERFILADOR} e {INTERVALO_MAX_PERFILADOR} segundos"}, 400
+
+    if data.get('limpar'):
+        perfilador.limpar()
+    if 'ativo' in data:
+        if data['ativo']:
+            if perfilador.iniciar(intervalo):
+                logger.info(f"Perfilador por amostragem ligado (intervalo de {perfilador.intervalo}s).")
+        elif perfilador.parar():
+            logger.info(f"Perfilador por amostragem desligado após {perfilador.amostras} amostras.")
+    elif intervalo is not None:
+        perfilador.intervalo = intervalo
+
+    return {"status": "success", "ativo": perfilador.ativo, "intervalo": perfilador.intervalo, "amostras": perfilador.amostras}, 200
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import parse_qsl
+import servico_vaso
+from log_assincrono import configurar_log
+from gateway_mqtt import iniciar_gateway_mqtt, encerrar_gateway_mqtt
+from servico_vaso import registrar_requisicao, ROTA_DESCONHECIDA, avisos_instrucao, INTERVALO_PING_SSE, DURACAO_MAX_SSE, telegram_worker, telegram_message_queue, iniciar_persistencia, encerrar_persistencia, iniciar_vigia_catalogo, TIPOS_NDJSON, TIPO_CONTEUDO_QUADRO, carregar_lote_ndjson, carregar_lote_json
+
+# --- SERVIDOR ASSÍNCRONO (ASGI) ---
+# Alternativa ao app Flask para frotas grandes: as mesmas rotas, servidas em um
+# único event loop junto com o worker do Telegram (uma task do próprio loop, sem
+# thread dedicada). Milhares de ESP32 podem manter conexões keep-alive abertas
+# sem ocupar uma thread cada.
+#
+# Só neste modo existem as rotas de aviso de mudança da instrução do LCD:
+# /aguardar_instrucao (long-poll) e /eventos (Server-Sent Events). As conexões
+# em espera são corrotinas paradas no loop e custam só alguns KB cada.
+#
+# Para rodar: python servidor_asgi.py  (requer: pip install uvicorn)
+# ou:         uvicorn servidor_asgi:app --host 0.0.0.0 --port 5000
+
+configurar_log(logging.INFO)
+logger = logging.getLogger(__name__)
+
+HOST = '0.0.0.0'
+PORTA = 5000
+TAMANHO_MAX_CORPO = 8 * 1024 * 1024
+TIMEOUT_KEEP_ALIVE = 75
+BACKLOG = 4096
+TIMEOUT_ENCERRAMENTO = 10
+
+# --- UTILITÁRIOS HTTP ---
+
+async def _ler_corpo(receive):
+    partes = []
+    tamanho = 0
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "http.disconnect":
+            return None
+        parte = mensagem.get("body", b"")
+        tamanho += len(parte)
+        if tamanho > TAMANHO_MAX_CORPO:
+            raise ValueError("Corpo da requisição muito grande")
+        partes.append(parte)
+        if not mensagem.get("more_body", False):
+            return b"".join(partes)
+
+def _json_ou_none(corpo):
+    try:
+        return json.loads(corpo)
+    except ValueError:
+        return None
+
+def _cabecalho(scope, nome):
+    for chave, valor in scope["headers"]:
+        if chave == nome:
+            return valor.decode("latin-1")
+    return None
+
+def _tipo_conteudo(scope):
+    return (_cabecalho(scope, b"content-type") or "").split(";")[0].strip().lower()
+
+async def _enviar_json(send, corpo, status, cabecalhos=None):
+    lista_cabecalhos = [(nome.lower().encode("latin-1"), valor.encode("latin-1")) for nome, valor in (cabecalhos or {}).items()]
+    if corpo is None:
+        dados = b""
+    elif isinstance(corpo, bytes):
+        # Quadro binário; o Content-Type vem nos cabeçalhos
+        dados = corpo
+    elif isinstance(corpo, str):
+        # Texto já formatado (ex.: /metrics); o Content-Type vem nos cabeçalhos
+        dados = corpo.encode("utf-8")
+    else:
+        dados = json.dumps(corpo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        lista_cabecalhos.append((b"content-type", b"application/json"))
+    lista_cabecalhos.append((b"content-length", str(len(dados)).encode("ascii")))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": lista_cabecalhos,
+    })
+    await send({"type": "http.response.body", "body": dados})
+
+# --- ROTAS ---
+# Cada rota recebe (scope, corpo, args, ip) e devolve o resultado de servico_vaso:
+# (corpo, status_http) ou (corpo, status_http, cabeçalhos).
+
+def _update_sensor_data(scope, corpo, args, ip):
+    if _tipo_conteudo(scope) == TIPO_CONTEUDO_QUADRO:
+        return servico_vaso.processar_quadro(corpo, ip)
+    return servico_vaso.processar_leitura(_json_ou_none(corpo), ip)
+
+def _update_sensor_data_batch(scope, corpo, args, ip):
+    if _tipo_conteudo(scope) in TIPOS_NDJSON:
+        carregar = lambda: carregar_lote_ndjson(corpo.splitlines())
+    else:
+        carregar = lambda: carregar_lote_json(_json_ou_none(corpo))
+    return servico_vaso.processar_lote(carregar, ip)
+
+def _set_plant(scope, corpo, args, ip):
+    return servico_vaso.definir_planta(_json_ou_none(corpo))
+
+ROTAS = {
+    '/update_sensor_data': ('POST', _update_sensor_data),
+    '/update_sensor_data_batch': ('POST', _update_sensor_data_batch),
+    '/get_instruction': ('GET', lambda scope, corpo, args, ip: servico_vaso.obter_instrucao(args)),
+    '/get_full_status': ('GET', lambda scope, corpo, args, ip: servico_vaso.obter_status_completo(args, _cabecalho(scope, b"if-none-match"))),
+    '/plantas': ('GET', lambda scope, corpo, args, ip: servico_vaso.obter_catalogo(_cabecalho(scope, b"if-none-match"))),
+    '/set_plant': ('POST', _set_plant),
+    '/status': ('GET', lambda scope, corpo, args, ip: servico_vaso.obter_status(args)),
+    '/history': ('GET', lambda scope, corpo, args, ip: servico_vaso.obter_historico(args)),
+    '/metrics': ('GET', lambda scope, corpo, args, ip: servico_vaso.exportar_metricas()),
+    '/perfilador': ('GET', lambda scope, corpo, args, ip: servico_vaso.obter_perfilador(args)),
+    '/perfilador/controle': ('POST', lambda scope, corpo, args, ip: servico_vaso.controlar_perfilador(_json_ou_none(corpo))),
+}
+
+# --- ROTAS DE AVISO (LONG-POLL E SSE) ---
+# Recebem (scope, receive, send, args), respondem por conta própria e devolvem o
+# status enviado.
+
+async def _aguardar_instrucao(scope, receive, send, args):
+    resposta, status, *cabecalhos = await servico_vaso.aguardar_instrucao(args)
+    await _enviar_json(send, resposta, status, cabecalhos[0] if cabecalhos else None)
+    return status
+
+async def _vigiar_desconexao(receive, assinatura):
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "http.disconnect":
+            assinatura.encerrar()
+            return
+
+async def _eventos(scope, receive, send, args):
+    erro, assinatura, iniciais = servico_vaso.abrir_eventos(args, _cabecalho(scope, b"last-event-id"))
+    if erro is not None:
+        resposta, status, *cabecalhos = erro
+        await _enviar_json(send, resposta, status, cabecalhos[0] if cabecalhos else None)
+        return status
+
+    # Com vários vasos (fluxo de um chat) o id do evento não serve para retomar
+    com_id = assinatura.vaso_id is not None
+    vigia = asyncio.create_task(_vigiar_desconexao(receive, assinatura))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        partes = [f"retry: {int(INTERVALO_PING_SSE * 1000)}\n\n"]
+        partes.extend(servico_vaso.formatar_evento(aviso, com_id) for aviso in iniciais)
+        await send({"type": "http.response.body", "body": "".join(partes).encode("utf-8"), "more_body": True})
+        limite = time.monotonic() + DURACAO_MAX_SSE
+        while not assinatura.encerrada and time.monotonic() < limite:
+            try:
+                await asyncio.wait_for(assinatura.evento.wait(), min(INTERVALO_PING_SSE, max(0.0, limite - time.monotonic())))
+            except asyncio.TimeoutError:
+                # Comentário SSE: mantém proxies e NAT com a conexão aberta
+                await send({"type": "http.response.body", "body": b": ping\n\n", "more_body": True})
+                continue
+            avisos = assinatura.retirar_avisos()
+            if avisos:
+                corpo = "".join(servico_vaso.formatar_evento(aviso, com_id) for aviso in avisos)
+                await send({"type": "http.response.body", "body": corpo.encode("utf-8"), "more_body": True})
+        if not assinatura.encerrada:
+            await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        pass
+    finally:
+        vigia.cancel()
+        avisos_instrucao.cancelar(assinatura)
+    return 200
+
+ROTAS_AVISOS = {
+    '/aguardar_instrucao': _aguardar_instrucao,
+    '/eventos': _eventos,
+}
+
+# --- APLICAÇÃO ASGI ---
+
+async def _ciclo_de_vida(receive, send):
+    worker = None
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "lifespan.startup":
+            avisos_instrucao.vincular_loop()
+            iniciar_persistencia()
+            iniciar_vigia_catalogo()
+            iniciar_gateway_mqtt()
+            worker = asyncio.create_task(telegram_worker())
+            logger.info("Worker do Telegram iniciado como task do event loop.")
+            await send({"type": "lifespan.startup.complete"})
+        elif mensagem["type"] == "lifespan.shutdown":
+            # Antes do worker: as leituras que o gateway ainda processa podem gerar alertas
+            await asyncio.to_thread(encerrar_gateway_mqtt)
+            if worker is not None:
+                telegram_message_queue.put((None, None))
+                try:
+                    await asyncio.wait_for(worker, timeout=5)
+                except asyncio.TimeoutError:
+                    logger.warning("Worker do Telegram não terminou a tempo; cancelando.")
+                    worker.cancel()
+            # Depois do worker: as confirmações de envio também vão para o banco
+            await asyncio.to_thread(encerrar_persistencia)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _ciclo_de_vida(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    # Latência e status de cada requisição para /metrics
+    inicio = time.perf_counter()
+    status = await _atender(scope, receive, send)
+    if status is not None:
+        rota = scope["path"] if scope["path"] in ROTAS or scope["path"] in ROTAS_AVISOS else ROTA_DESCONHECIDA
+        registrar_requisicao(rota, status, time.perf_counter() - inicio)
+
+# Devolve o status enviado, ou None se o cliente desconectou antes da resposta
+async def _atender(scope, receive, send):
+    aviso = ROTAS_AVISOS.get(scope["path"])
+    if aviso is not None:
+        if scope["method"] != 'GET':
+            await _enviar_json(send, {"status": "error", "message": "Método não permitido"}, 405)
+            return 405
+        return await aviso(scope, receive, send, dict(parse_qsl(scope["query_string"].decode("latin-1"))))
+
+    rota = ROTAS.get(scope["path"])
+    if rota is None:
+        await _enviar_json(send, {"status": "error", "message": "Rota não encontrada"}, 404)
+        return 404
+    metodo, tratar = rota
+    if scope["method"] != metodo:
+        await _enviar_json(send, {"status": "error", "message": "Método não permitido"}, 405)
+        return 405
+
+    try:
+        corpo = await _ler_corpo(receive)
+    except ValueError as e:
+        await _enviar_json(send, {"status": "error", "message": str(e)}, 413)
+        return 413
+    if corpo is None:
+        return None
+
+    args = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+    ip = scope["client"][0] if scope.get("client") else None
+    try:
+        resposta, status, *cabecalhos = tratar(scope, corpo, args, ip)
+    except Exception as e:
+        logger.error(f"Erro inesperado em {scope['path']}: {e}")
+        resposta, status, cabecalhos = {"status": "error", "message": "Erro interno do servidor"}, 500, []
+    await _enviar_json(send, resposta, status, cabecalhos[0] if cabecalhos else None)
+    return status
+
+# --- INICIALIZAÇÃO DO SERVIDOR ASGI ---
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("O modo assíncrono precisa do uvicorn: pip install uvicorn (uvloop/httptools são usados se instalados)")
+
+    uvicorn.run(
+        app,
+        host=HOST,
+        port=PORTA,
+        backlog=BACKLOG,
+        timeout_keep_alive=TIMEOUT_KEEP_ALIVE,
+        timeout_graceful_shutdown=TIMEOUT_ENCERRAMENTO,
+        access_log=False,
+    )
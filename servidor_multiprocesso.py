@@ -0,0 +1,574 @@
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from collections import deque
+
+import servico_vaso
+from servico_vaso import (registro_vasos, validar_leitura, validar_planta, codigos_anteriores, etag_confere,
+                          _vaso_id_invalido, _vaso_nao_encontrado, _quadro_invalido, INSTRUCOES_LCD, ID_PROCESSO,
+                          MAX_LEITURAS_LOTE, CABECALHOS_QUADRO, MENSAGEM_PLANTA_DEFINIDA, telegram_message_queue,
+                          resposta_em_cache, quadro_fora_da_janela, CABECALHOS_JSON)
+from registro_vasos import normalizar_vaso_id, INSTRUCAO_INICIAL
+from alertas import aplicar_histerese
+from avaliacao_lote import classificar_encadeado
+from quadro_binario import ler_quadro, montar_resposta, STATUS_OK, STATUS_AGUARDANDO, STATUS_INVALIDO
+from tabela_vasos import TabelaVasos, texto_fixo, CAPACIDADE_PADRAO, SEM_INSTRUCAO, TAMANHO_PLANTA, TAMANHO_NOTIFICACAO
+from tendencias import CAMPOS_RESUMO
+from log_assincrono import amostragem, configurar_log, encerrar_log
+
+# --- MODO MULTIPROCESSO ---
+# Vários processos HTTP (o servidor ASGI, um por núcleo) aceitando conexões no
+# mesmo socket, com o estado quente da frota na tabela compartilhada
+# (tabela_vasos.py): leituras, planta, chat e instrução do LCD. Qualquer
+# processo responde por qualquer vaso e todos veem a mesma instrução.
+#
+# O processo principal é o coordenador e o único que fala com o Telegram. Os
+# processos HTTP mandam para ele, em lotes, um evento por leitura (com os
+# códigos já decididos) e por /set_plant; o coordenador os aplica no
+# registro_vasos dele com as mesmas funções do modo de processo único
+# (registrar_leitura, aplicar_decisao, aplicar_planta). Assim a máquina de
+# alertas, o histórico, o SQLite e o despachante do Telegram existem uma vez
+# só, e um alerta nunca é enviado em dobro por processos diferentes.
+#
+# As tendências de cada vaso (tendencias.py) também são calculadas no
+# coordenador, que copia o resumo para a tabela no máximo a cada
+# INTERVALO_ANALISE segundos de leituras por vaso.
+#
+# Neste modo não existem /update_sensor_data_batch (use quadros binários com
+# várias amostras), /history, /aguardar_instrucao e /eventos: dependem de
+# estado que fica só no coordenador. /metrics e /perfilador mostram o processo
+# que atendeu a requisição.
+#
+# Para rodar: python servidor_multiprocesso.py --processos 4  (requer uvicorn, Linux)
+
+logger = logging.getLogger(__name__)
+
+HOST = '0.0.0.0'
+PORTA = 5000
+BACKLOG = 4096
+INTERVALO_ENVIO_EVENTOS = 0.01  # segundos entre lotes de eventos de cada processo HTTP
+INTERVALO_ANALISE = 10.0  # segundos de leituras entre cópias da análise de um vaso para a tabela
+TIMEOUT_ENCERRAMENTO = 15
+
+INSTRUCOES_PLANAS = tuple(texto for linha in INSTRUCOES_LCD for texto in linha)
+INDICE_INSTRUCAO = {texto: indice for indice, texto in enumerate(INSTRUCOES_PLANAS)}
+
+tabela = None
+encaminhador = None
+_perfis = {}  # registro -> (versao_planta, PerfilPlanta), por processo HTTP
+_notificacoes_publicadas = {}  # vaso_id -> última notificação copiada para a tabela (coordenador)
+_analises_publicadas = {}  # vaso_id -> ts da leitura da última análise copiada (coordenador)
+CAMPOS_INTEIROS_ANALISE = ("amostras", "previsao_umidade_min")
+
+# --- PROCESSOS HTTP ---
+
+class EncaminhadorEventos:
+    # Junta os eventos do processo e manda ao coordenador em lotes: uma escrita
+    # no pipe a cada INTERVALO_ENVIO_EVENTOS, não uma por leitura
+    def __init__(self, fila, intervalo=INTERVALO_ENVIO_EVENTOS):
+        self._fila = fila
+        self._intervalo = intervalo
+        self._pendentes = deque()
+        self.enviar = self._pendentes.append
+
+    def iniciar(self):
+        threading.Thread(target=self._executar, name="encaminhador-eventos", daemon=True).start()
+
+    def _executar(self):
+        while True:
+            time.sleep(self._intervalo)
+            self.descarregar()
+
+    def descarregar(self):
+        pendentes = self._pendentes
+        if pendentes:
+            self._fila.put([pendentes.popleft() for _ in range(len(pendentes))])
+
+def _texto_instrucao(indice):
+    return INSTRUCAO_INICIAL if indice == SEM_INSTRUCAO else INSTRUCOES_PLANAS[indice]
+
+def _marca(slot):
+    return f"{ID_PROCESSO}-{int(tabela.versao_instrucao[slot])}"
+
+# Como perfil_do_vaso: guardado por registro até a planta mudar ou o catálogo
+# deste processo ser recarregado
+def _perfil(slot):
+    versao_planta = int(tabela.versao_planta[slot])
+    guardado = _perfis.get(slot)
+    if guardado is not None and guardado[0] == versao_planta and guardado[1].geracao == servico_vaso.catalogo.geracao:
+        return guardado[1]
+    perfil = servico_vaso.catalogo.perfil_de(tabela.planta[slot].decode("utf-8"))
+    _perfis[slot] = (versao_planta, perfil)
+    return perfil
+
+# Deve ser chamada com o lock do registro (tabela.lock_do_slot) adquirido. A
+# mesma decisão de tomar_decisao_planta, só para o LCD: as notificações ficam
+# com o coordenador.
+def _decidir(slot):
+    perfil = _perfil(slot)
+    codigo_umidade = aplicar_histerese(int(tabela.codigo_umidade[slot]), float(tabela.umidade[slot]), *perfil.umidade)
+    codigo_luz = aplicar_histerese(int(tabela.codigo_luz[slot]), float(tabela.luminosidade[slot]), *perfil.luminosidade)
+    _aplicar_codigos(slot, codigo_umidade, codigo_luz)
+    return codigo_umidade, codigo_luz
+
+# Grava os códigos já classificados e a instrução do LCD que sai deles; com o lock do registro adquirido
+def _aplicar_codigos(slot, codigo_umidade, codigo_luz):
+    tabela.codigo_umidade[slot] = codigo_umidade
+    tabela.codigo_luz[slot] = codigo_luz
+    indice = (codigo_umidade + 2) * 5 + codigo_luz + 2
+    if tabela.instrucao[slot] != indice:
+        tabela.instrucao[slot] = indice
+        tabela.versao_instrucao[slot] += 1
+
+# Devolve (instrução, código umidade, código luz); códigos None se o vaso ainda
+# não tem chat, como em aplicar_decisao
+def _registrar(vaso_id, slot, ts, umidade, luminosidade):
+    with tabela.lock_do_slot(slot):
+        tabela.umidade[slot] = umidade
+        tabela.luminosidade[slot] = luminosidade
+        tabela.ts[slot] = ts
+        tabela.versao[slot] += 1
+        if tabela.tem_chat[slot]:
+            codigo_umidade, codigo_luz = _decidir(slot)
+        else:
+            codigo_umidade = codigo_luz = None
+        # Dentro do lock: os eventos de um vaso saem deste processo na ordem das leituras
+        encaminhador.enviar(("leitura", vaso_id, ts, umidade, luminosidade, codigo_umidade, codigo_luz))
+        instrucao = _texto_instrucao(int(tabela.instrucao[slot]))
+    return instrucao, codigo_umidade, codigo_luz
+
+# Amostras acumuladas pelo dispositivo: a histerese encadeada amostra a amostra
+# de avaliacao_lote, a mesma dos quadros e do lote no modo de um processo. Cada
+# amostra vira um evento para o histórico e a máquina de alertas do coordenador.
+def _registrar_amostras(vaso_id, slot, timestamps, umidades, luminosidades):
+    catalogo = servico_vaso.catalogo
+    quantidade = len(timestamps)
+    with tabela.lock_do_slot(slot):
+        if tabela.tem_chat[slot]:
+            perfil = catalogo.perfil_de(tabela.planta[slot].decode("utf-8"))
+            codigos_umidade, codigos_luz = classificar_encadeado(
+                catalogo.tabela, perfil.indice, umidades, luminosidades, [0],
+                [int(tabela.codigo_umidade[slot])], [int(tabela.codigo_luz[slot])])
+            codigos_umidade = codigos_umidade.tolist()
+            codigos_luz = codigos_luz.tolist()
+        else:
+            codigos_umidade = codigos_luz = [None] * quantidade
+        for ts, umidade, luminosidade, codigo_umidade, codigo_luz in zip(
+                timestamps.tolist(), umidades.tolist(), luminosidades.tolist(), codigos_umidade, codigos_luz):
+            tabela.umidade[slot] = umidade
+            tabela.luminosidade[slot] = luminosidade
+            tabela.ts[slot] = ts
+            tabela.versao[slot] += 1
+            if codigo_umidade is not None:
+                _aplicar_codigos(slot, codigo_umidade, codigo_luz)
+            encaminhador.enviar(("leitura", vaso_id, ts, umidade, luminosidade, codigo_umidade, codigo_luz))
+        instrucao = _texto_instrucao(int(tabela.instrucao[slot]))
+    return instrucao, codigos_umidade[-1], codigos_luz[-1]
+
+def _tabela_cheia(rota, vaso_id):
+    logger.error(f"Requisição {rota}: tabela compartilhada sem espaço para o vaso '{vaso_id}' (capacidade {tabela.capacidade}).")
+    return {"status": "error", "message": "Capacidade de vasos do servidor esgotada"}, 503
+
+def processar_leitura(data, ip):
+    registrar_log = amostragem.permitir('/update_sensor_data')
+    erro, vaso_id, umidade, luminosidade = validar_leitura(data)
+    if erro is not None:
+        return erro
+
+    slot = tabela.localizar(vaso_id, criar=True)
+    if slot is None:
+        return _tabela_cheia('/update_sensor_data', vaso_id)
+    instrucao, _, _ = _registrar(vaso_id, slot, time.time(), umidade, luminosidade)
+    if registrar_log:
+        logger.info(f"--> Dados recebidos do vaso {vaso_id} (IP {ip}, processo {os.getpid()}): Umidade={umidade}%, Luminosidade={luminosidade}")
+    return {"status": "success", "message": "Dados recebidos", "instrucao": instrucao}, 200
+
+def processar_quadro(corpo, ip):
+    try:
+        quadro = ler_quadro(corpo, MAX_LEITURAS_LOTE)
+    except ValueError as e:
+        return _quadro_invalido(str(e))
+
+    vaso_id = normalizar_vaso_id(quadro.vaso_id)
+    if vaso_id is None:
+        return _quadro_invalido("vaso_id inválido")
+    agora = time.time()
+    if quadro_fora_da_janela(quadro, agora):
+        return _quadro_invalido("ts mais antigo que o histórico")
+    slot = tabela.localizar(vaso_id, criar=True)
+    if slot is None:
+        _tabela_cheia('/update_sensor_data', vaso_id)
+        return montar_resposta(STATUS_INVALIDO, 0, 0, "capacidade de vasos esgotada"), 503, CABECALHOS_QUADRO
+
+    if quadro.quantidade == 1:
+        ts, umidade, luminosidade = quadro.amostra()
+        ts = agora if ts == 0 else min(ts, agora)
+        instrucao, codigo_umidade, codigo_luz = _registrar(vaso_id, slot, ts, umidade, luminosidade)
+    else:
+        instrucao, codigo_umidade, codigo_luz = _registrar_amostras(vaso_id, slot, *quadro.colunas(agora))
+    if codigo_umidade is None:
+        return montar_resposta(STATUS_AGUARDANDO, 0, 0, instrucao), 200, CABECALHOS_QUADRO
+    if amostragem.permitir('/update_sensor_data'):
+        logger.info(f"--> Quadro binário do vaso {vaso_id} (IP {ip}, processo {os.getpid()}): {quadro.quantidade} amostras")
+    return montar_resposta(STATUS_OK, codigo_umidade, codigo_luz, instrucao), 200, CABECALHOS_QUADRO
+
+# Corpo de /get_instruction já serializado, por slot e por processo
+# (servico_vaso.resposta_em_cache). Toda troca de instrução na tabela incrementa
+# versao_instrucao. /status e /get_full_status não entram: a notificação e a
+# análise são publicadas pelo coordenador sem mudar a versão do slot.
+_respostas_por_slot = {}
+
+def obter_instrucao(args):
+    vaso_id = normalizar_vaso_id(args.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/get_instruction', args.get('vaso_id'))
+    slot = tabela.localizar(vaso_id)
+    if slot is None:
+        return _vaso_nao_encontrado('/get_instruction', vaso_id)
+
+    respostas = _respostas_por_slot.get(slot)
+    if respostas is None:
+        respostas = _respostas_por_slot[slot] = {}
+    _, dados = resposta_em_cache(
+        respostas, '/get_instruction', tabela.lock_do_slot(slot),
+        lambda: int(tabela.versao_instrucao[slot]),
+        lambda: {"instrucao": _texto_instrucao(int(tabela.instrucao[slot])), "versao_instrucao": _marca(slot)})
+    if amostragem.permitir('/get_instruction'):
+        logger.info(f"ESP32 (vaso {vaso_id}) solicitou instrução para LCD: '{_texto_instrucao(int(tabela.instrucao[slot]))}'")
+    return dados, 200, CABECALHOS_JSON
+
+def _analise(slot):
+    valores = tabela.analise[slot].tolist()
+    if math.isnan(valores[0]):
+        return None
+    analise = {}
+    for campo, valor in zip(CAMPOS_RESUMO, valores):
+        if math.isnan(valor):
+            analise[campo] = None
+        else:
+            analise[campo] = int(valor) if campo in CAMPOS_INTEIROS_ANALISE else valor
+    return analise
+
+def _estado(slot):
+    # Campos de EstadoVaso.para_dict lidos da tabela; com o lock do registro
+    return {
+        "vaso_id": tabela.vaso_id[slot].decode("utf-8"),
+        "versao": int(tabela.versao[slot]),
+        "planta_selecionada": tabela.planta[slot].decode("utf-8"),
+        "umidade_atual": float(tabela.umidade[slot]),
+        "luminosidade_atual": float(tabela.luminosidade[slot]),
+        "instrucao_para_lcd": _texto_instrucao(int(tabela.instrucao[slot])),
+        "ultima_notificacao_telegram": tabela.ultima_notificacao[slot].decode("utf-8"),
+        "chat_id_notificacao": int(tabela.chat_id[slot]) if tabela.tem_chat[slot] else None,
+        "analise": _analise(slot),
+    }
+
+def obter_status_completo(args, if_none_match=None):
+    vaso_id = normalizar_vaso_id(args.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/get_full_status', args.get('vaso_id'))
+    slot = tabela.localizar(vaso_id)
+    if slot is None:
+        return _vaso_nao_encontrado('/get_full_status', vaso_id)
+
+    # Cada processo conta as recargas do catálogo por conta própria: a ETag usa
+    # a versão (hash do conteúdo), igual em todos
+    atual = servico_vaso.catalogo
+    with tabela.lock_do_slot(slot):
+        etag = f'"{ID_PROCESSO}-{atual.versao}-{int(tabela.versao[slot])}"'
+        if etag_confere(if_none_match, etag):
+            return None, 304, {"ETag": etag}
+        estado = _estado(slot)
+    current_status = {
+        "vaso_id": vaso_id,
+        "versao": estado["versao"],
+        "planta_selecionada": estado["planta_selecionada"],
+        "umidade_atual": estado["umidade_atual"],
+        "luminosidade_atual": estado["luminosidade_atual"],
+        "instrucao_para_lcd": estado["instrucao_para_lcd"],
+        "versao_catalogo": atual.versao,
+        "analise": estado["analise"]
+    }
+    if amostragem.permitir('/get_full_status'):
+        logger.info(f"Bot solicitou status completo do vaso {vaso_id}.")
+    return current_status, 200, {"ETag": etag, "Cache-Control": "no-cache"}
+
+def obter_status(args):
+    vaso_id = normalizar_vaso_id(args.get('vaso_id'))
+    if vaso_id is None:
+        return _vaso_id_invalido('/status', args.get('vaso_id'))
+    slot = tabela.localizar(vaso_id)
+    if slot is None:
+        return _vaso_nao_encontrado('/status', vaso_id)
+    with tabela.lock_do_slot(slot):
+        return _estado(slot), 200
+
+def definir_planta(data):
+    erro, vaso_id, nova_planta, novo_chat_id = validar_planta(data)
+    if erro is not None:
+        return erro
+    # A tabela guarda o chat como inteiro (o id numérico do Telegram)
+    try:
+        novo_chat_id = int(novo_chat_id)
+    except (TypeError, ValueError):
+        logger.warning(f"Requisição /set_plant: chat_id não numérico ({novo_chat_id!r}) no modo multiprocesso.")
+        return {"status": "error", "message": "chat_id deve ser numérico"}, 400
+
+    slot = tabela.localizar(vaso_id, criar=True)
+    if slot is None:
+        return _tabela_cheia('/set_plant', vaso_id)
+    with tabela.lock_do_slot(slot):
+        tabela.planta[slot] = texto_fixo(nova_planta, TAMANHO_PLANTA)
+        tabela.versao_planta[slot] += 1
+        tabela.chat_id[slot] = novo_chat_id
+        tabela.tem_chat[slot] = 1
+        tabela.versao[slot] += 1
+        # Planta nova: a histerese recomeça do ideal, como com vaso.alertas = None
+        tabela.codigo_umidade[slot] = 0
+        tabela.codigo_luz[slot] = 0
+        tabela.ultima_notificacao[slot] = texto_fixo(MENSAGEM_PLANTA_DEFINIDA, TAMANHO_NOTIFICACAO)
+        _decidir(slot)
+        encaminhador.enviar(("planta", vaso_id, nova_planta, novo_chat_id))
+    logger.info(f"Planta do vaso {vaso_id} atualizada para: {nova_planta}. Notificações para chat ID: {novo_chat_id}")
+    return {"status": "success", "message": f"Planta definida para {nova_planta}. O bot enviará a confirmação."}, 200
+
+def _indisponivel(rota):
+    def tratar(scope, corpo, args, ip):
+        return {"status": "error", "message": f"{rota} não está disponível no modo multiprocesso"}, 501
+    return tratar
+
+# Substituem as rotas de servidor_asgi que dependem do registro_vasos local
+def _rotas(servidor_asgi):
+    def update_sensor_data(scope, corpo, args, ip):
+        if servidor_asgi._tipo_conteudo(scope) == servico_vaso.TIPO_CONTEUDO_QUADRO:
+            return processar_quadro(corpo, ip)
+        return processar_leitura(servidor_asgi._json_ou_none(corpo), ip)
+
+    return {
+        '/update_sensor_data': ('POST', update_sensor_data),
+        '/update_sensor_data_batch': ('POST', _indisponivel('/update_sensor_data_batch')),
+        '/get_instruction': ('GET', lambda scope, corpo, args, ip: obter_instrucao(args)),
+        '/get_full_status': ('GET', lambda scope, corpo, args, ip: obter_status_completo(args, servidor_asgi._cabecalho(scope, b"if-none-match"))),
+        '/set_plant': ('POST', lambda scope, corpo, args, ip: definir_planta(servidor_asgi._json_ou_none(corpo))),
+        '/status': ('GET', lambda scope, corpo, args, ip: obter_status(args)),
+        '/history': ('GET', _indisponivel('/history')),
+        '/aguardar_instrucao': ('GET', _indisponivel('/aguardar_instrucao')),
+        '/eventos': ('GET', _indisponivel('/eventos')),
+    }
+
+def _executar_processo_http(numero, sock, tabela_compartilhada, fila, pronto):
+    global tabela, encaminhador
+    # Espera o coordenador restaurar o banco e preencher a tabela
+    pronto.wait()
+
+    import uvicorn
+    import servidor_asgi  # configura o log deste processo
+
+    tabela = tabela_compartilhada
+    encaminhador = EncaminhadorEventos(fila)
+    encaminhador.iniciar()
+    servidor_asgi.ROTAS_AVISOS.clear()
+    servidor_asgi.ROTAS.update(_rotas(servidor_asgi))
+    servico_vaso.iniciar_vigia_catalogo()
+
+    # Sem lifespan: persistência e Telegram ficam com o coordenador
+    config = uvicorn.Config(
+        servidor_asgi.app,
+        lifespan="off",
+        timeout_keep_alive=servidor_asgi.TIMEOUT_KEEP_ALIVE,
+        timeout_graceful_shutdown=servidor_asgi.TIMEOUT_ENCERRAMENTO,
+        access_log=False,
+    )
+    logger.info(f"Processo HTTP {numero} (pid {os.getpid()}) atendendo.")
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    finally:
+        encaminhador.descarregar()
+        fila.close()
+        fila.join_thread()
+        tabela.fechar()
+        encerrar_log()
+
+# --- COORDENADOR (PROCESSO PRINCIPAL) ---
+
+def _publicar_notificacao(vaso_id, notificacao):
+    # A última notificação sai do coordenador; /status dos processos HTTP a lê da tabela
+    if notificacao == _notificacoes_publicadas.get(vaso_id):
+        return
+    _notificacoes_publicadas[vaso_id] = notificacao
+    slot = tabela.localizar(vaso_id)
+    if slot is not None:
+        with tabela.lock_do_slot(slot):
+            tabela.ultima_notificacao[slot] = texto_fixo(notificacao, TAMANHO_NOTIFICACAO)
+
+def _publicar_analise(vaso_id, valores):
+    slot = tabela.localizar(vaso_id)
+    if slot is not None and valores is not None:
+        with tabela.lock_do_slot(slot):
+            tabela.analise[slot] = [math.nan if valor is None else valor for valor in valores]
+
+def _valores_analise(vaso):
+    # Com o lock do vaso no registro_vasos do coordenador
+    if vaso.tendencias is None:
+        return None
+    return vaso.tendencias.valores(servico_vaso.perfil_do_vaso(vaso).umidade[0])
+
+def _aplicar_evento(evento):
+    tipo, vaso_id = evento[0], evento[1]
+    vaso = registro_vasos.obter_ou_criar(vaso_id)
+    analise = None
+    with registro_vasos.lock_de(vaso_id):
+        if tipo == "leitura":
+            _, _, ts, umidade, luminosidade, codigo_umidade, codigo_luz = evento
+            servico_vaso.registrar_leitura(vaso, ts, umidade, luminosidade)
+            if codigo_umidade is not None:
+                servico_vaso.aplicar_decisao(vaso, codigo_umidade, codigo_luz, ts)
+            if ts - _analises_publicadas.get(vaso_id, -math.inf) >= INTERVALO_ANALISE:
+                _analises_publicadas[vaso_id] = ts
+                analise = _valores_analise(vaso)
+        else:
+            _, _, planta, chat_id = evento
+            servico_vaso.aplicar_planta(vaso, planta, chat_id)
+            # A previsão usa o mínimo de umidade da planta nova
+            analise = _valores_analise(vaso)
+        notificacao = vaso.ultima_notificacao_telegram
+    _publicar_notificacao(vaso_id, notificacao)
+    _publicar_analise(vaso_id, analise)
+
+def _consumir_eventos(fila):
+    while True:
+        lote = fila.get()
+        if lote is None:
+            return
+        for evento in lote:
+            try:
+                _aplicar_evento(evento)
+            except Exception as e:
+                logger.error(f"Coordenador: erro ao aplicar evento '{evento[0]}' do vaso {evento[1]}: {e}")
+
+def _migrar_chat(chat_antigo, chat_novo):
+    # ChatMigrated no despachante: registro do coordenador e tabela compartilhada
+    for vaso_id in servico_vaso.migrar_chat(chat_antigo, chat_novo):
+        slot = tabela.localizar(vaso_id)
+        if slot is not None:
+            with tabela.lock_do_slot(slot):
+                tabela.chat_id[slot] = int(chat_novo)
+                tabela.versao[slot] += 1
+
+def preencher_tabela():
+    # Copia para a tabela os vasos restaurados do banco, antes de liberar os processos HTTP
+    copiados = 0
+    for vaso_id in registro_vasos.ids():
+        vaso = registro_vasos.obter(vaso_id)
+        slot = tabela.localizar(vaso_id, criar=True)
+        if slot is None:
+            logger.error(f"Tabela compartilhada cheia: {len(registro_vasos) - copiados} vasos restaurados ficaram de fora.")
+            break
+        codigo_umidade, codigo_luz = codigos_anteriores(vaso)
+        tabela.planta[slot] = texto_fixo(vaso.planta_selecionada, TAMANHO_PLANTA)
+        tabela.umidade[slot] = vaso.umidade_atual
+        tabela.luminosidade[slot] = vaso.luminosidade_atual
+        tabela.versao[slot] = vaso.versao
+        tabela.versao_instrucao[slot] = vaso.versao_instrucao
+        tabela.codigo_umidade[slot] = codigo_umidade
+        tabela.codigo_luz[slot] = codigo_luz
+        tabela.instrucao[slot] = INDICE_INSTRUCAO.get(vaso.instrucao_para_lcd, SEM_INSTRUCAO)
+        try:
+            tabela.chat_id[slot] = int(vaso.chat_id_notificacao)
+            tabela.tem_chat[slot] = 1
+        except (TypeError, ValueError):
+            if vaso.chat_id_notificacao is not None:
+                logger.warning(f"Vaso {vaso_id}: chat_id {vaso.chat_id_notificacao!r} não numérico, ignorado no modo multiprocesso.")
+        tabela.ultima_notificacao[slot] = texto_fixo(vaso.ultima_notificacao_telegram, TAMANHO_NOTIFICACAO)
+        _notificacoes_publicadas[vaso_id] = vaso.ultima_notificacao_telegram
+        _publicar_analise(vaso_id, _valores_analise(vaso))
+        copiados += 1
+    logger.info(f"Tabela compartilhada preenchida com {copiados} vasos restaurados.")
+
+# --- INICIALIZAÇÃO DO MODO MULTIPROCESSO ---
+
+def abrir_socket(host, porta):
+    # proto=IPPROTO_TCP explícito: o asyncio só liga TCP_NODELAY nas conexões
+    # aceitas quando o socket declara o protocolo (com 0, cada resposta pequena
+    # esperaria o ACK atrasado do cliente, ~40 ms)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, porta))
+    sock.listen(BACKLOG)
+    return sock
+
+def main():
+    global tabela
+    parser = argparse.ArgumentParser(description="Servidor do Vaso Inteligente com vários processos HTTP")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1, help="processos HTTP (padrão: um por núcleo)")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--capacidade", type=int, default=CAPACIDADE_PADRAO, help="vasos na tabela compartilhada")
+    args = parser.parse_args()
+
+    # fork: os processos HTTP herdam a tabela, os locks, a fila e o socket.
+    # Tudo que cria threads no processo principal vem depois do fork.
+    contexto = multiprocessing.get_context("fork")
+    tabela = TabelaVasos.criar(contexto, args.capacidade)
+    fila = contexto.Queue()
+    pronto = contexto.Event()
+    sock = abrir_socket(args.host, args.porta)
+    processos = [
+        contexto.Process(target=_executar_processo_http, args=(numero, sock, tabela, fila, pronto), name=f"http-{numero}")
+        for numero in range(max(1, args.processos))
+    ]
+    for processo in processos:
+        processo.start()
+
+    configurar_log(logging.INFO)
+    servico_vaso.iniciar_persistencia()
+    preencher_tabela()
+    consumidor = threading.Thread(target=_consumir_eventos, args=(fila,), name="coordenador-eventos", daemon=True)
+    consumidor.start()
+    servico_vaso.iniciar_vigia_catalogo()
+    if os.environ.get('VASO_MQTT_BROKER'):
+        # As leituras do gateway não passariam pela tabela compartilhada dos processos HTTP
+        logger.warning("O gateway MQTT não roda no modo multiprocesso; use app_servidor.py ou servidor_asgi.py.")
+    servico_vaso.despachante_telegram.ao_migrar = _migrar_chat
+    telegram_thread = threading.Thread(target=servico_vaso.start_telegram_worker, name="worker-telegram", daemon=True)
+    telegram_thread.start()
+    pronto.set()
+    logger.info(f"Modo multiprocesso: {len(processos)} processos HTTP em {args.host}:{args.porta}, "
+                f"tabela de {args.capacidade} vasos ({tabela.memoria.size / 1e6:.1f} MB).")
+
+    encerrar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: encerrar.set())
+    signal.signal(signal.SIGINT, lambda *_: encerrar.set())
+    try:
+        while not encerrar.wait(1.0):
+            if not any(processo.is_alive() for processo in processos):
+                logger.error("Todos os processos HTTP terminaram; encerrando.")
+                break
+    finally:
+        for processo in processos:
+            if processo.is_alive():
+                processo.terminate()
+        for processo in processos:
+            processo.join(TIMEOUT_ENCERRAMENTO)
+            if processo.is_alive():
+                logger.warning(f"Processo {processo.name} não terminou a tempo; finalizando.")
+                processo.kill()
+        # Os processos HTTP já esvaziaram seus eventos na fila: o sinal de fim vem depois deles
+        fila.put(None)
+        consumidor.join()
+        telegram_message_queue.put((None, None))
+        telegram_thread.join(TIMEOUT_ENCERRAMENTO)
+        servico_vaso.encerrar_persistencia()
+        sock.close()
+        tabela.fechar(remover=True)
+        logger.info("Modo multiprocesso encerrado.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from avaliacao_lote import TabelaLimites, NUM_CODIGOS, funcoes_histerese, encadear_histerese
+from catalogo_plantas import compilar_perfil
+
+# --- SIMULADOR DE LIMITES (BACKTEST OFFLINE) ---
+# Reproduz um log de leituras gravado (CSV ou Parquet) com um perfil de planta
+# candidato e conta o que o servidor teria feito: alertas e mensagens de "tudo
+# certo" enviados ao Telegram, trocas de estado de cada sensor e mudanças no
+# LCD. Vale a mesma lógica de tomar_decisao_planta()/aplicar_decisao():
+# histerese de aplicar_histerese (via classificar_lote), permanência mínima e
+# intervalo entre alertas de EstadoAlertas.avancar. Cada vaso começa como um
+# vaso novo, com o chat já configurado.
+#
+#   python simulador_limites.py leituras.csv --planta Samambaia \
+#       --variar umidade_min=60,65,70 --variar histerese_umidade=1:5:1 --processos 4
+#
+# O arquivo precisa das colunas vaso_id, ts, umidade e luminosidade (outras
+# são ignoradas), com as leituras de cada vaso na ordem em que chegaram. Ele é
+# lido em blocos e convertido uma vez para colunas binárias num diretório
+# temporário; cada processo do pool abre essas colunas com np.memmap e avalia
+# um grupo de combinações de limites, bloco a bloco. A memória não depende do
+# tamanho do arquivo.
+#
+# Como a avaliação fica vetorizada, mesmo sendo sequencial por natureza:
+#   1. Histerese: encadeada leitura a leitura sem laço em Python, com as
+#      funções "código anterior -> código novo" compostas por dobramento
+#      (avaliacao_lote.funcoes_histerese e encadear_histerese, as mesmas do
+#      lote do servidor).
+#   2. Alertas: o estado candidato só muda quando o par de códigos muda; a
+#      confirmação de cada trecho (permanência mínima) sai de uma redução
+#      vetorizada. Só as confirmações, bem menos numerosas que as leituras,
+#      passam por um laço em Python para aplicar o intervalo entre alertas.
+
+TAMANHO_BLOCO = 1_000_000
+COLUNAS = ("vaso_id", "ts", "umidade", "luminosidade")
+DTYPE_CSV = np.dtype([("vaso_id", "U64"), ("ts", "f8"), ("umidade", "f8"), ("luminosidade", "f8")])
+# Colunas binárias do diretório de trabalho: nome do arquivo e tipo
+DTYPES_COLUNAS = (("vaso", np.int32), ("ts", np.float64), ("umidade", np.float64), ("luminosidade", np.float64))
+
+# Campos do perfil que --variar aceita (os mesmos do plantas.json)
+CAMPOS_VARIAVEIS = (
+    "umidade_min", "umidade_max", "umidade_critica_min", "umidade_critica_max",
+    "luminosidade_min", "luminosidade_max", "luminosidade_critica_min", "luminosidade_critica_max",
+    "histerese_umidade", "histerese_luminosidade", "permanencia_min_s", "intervalo_alertas_s",
+)
+CAMPOS_RESULTADO = (
+    "leituras", "vasos", "alertas", "mensagens_tudo_certo",
+    "trocas_umidade", "trocas_luz", "mudancas_lcd", "alertas_por_vaso_dia",
+)
+
+# Estados do par (código umidade, código luz) como índice (u + 2) * 5 + (l + 2)
+ESTADO_IDEAL = 2 * NUM_CODIGOS + 2
+SEM_ESTADO = -1
+
+
+# --- LEITURA DO ARQUIVO DE ENTRADA ---
+
+def ler_csv(caminho, tamanho_bloco):
+    with open(caminho, encoding="utf-8", newline="") as f:
+        cabecalho = [nome.strip() for nome in f.readline().split(",")]
+        faltando = [coluna for coluna in COLUNAS if coluna not in cabecalho]
+        if faltando:
+            raise ValueError(f"colunas ausentes no CSV: {', '.join(faltando)}")
+        usecols = [cabecalho.index(coluna) for coluna in COLUNAS]
+        while True:
+            linhas = list(itertools.islice(f, tamanho_bloco))
+            if not linhas:
+                return
+            bloco = np.loadtxt(linhas, delimiter=",", dtype=DTYPE_CSV, usecols=usecols, ndmin=1)
+            yield tuple(bloco[coluna] for coluna in COLUNAS)
+
+
+def ler_parquet(caminho, tamanho_bloco):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Arquivos Parquet precisam do pyarrow: pip install pyarrow")
+
+    arquivo = pq.ParquetFile(caminho)
+    for lote in arquivo.iter_batches(batch_size=tamanho_bloco, columns=list(COLUNAS)):
+        vaso_ids, ts, umidades, luminosidades = (lote.column(coluna).to_numpy(zero_copy_only=False) for coluna in COLUNAS)
+        yield (vaso_ids.astype(str), ts.astype(np.float64), umidades.astype(np.float64), luminosidades.astype(np.float64))
+
+
+def converter_leituras(caminho, diretorio, tamanho_bloco=TAMANHO_BLOCO):
+    # Passa o arquivo, bloco a bloco, para as colunas binárias de `diretorio`.
+    # Devolve (quantidade de leituras, vaso_ids na ordem dos índices, leituras
+    # descartadas por valores não finitos).
+    ler = ler_parquet if caminho.lower().endswith((".parquet", ".pq")) else ler_csv
+    indices = {}
+    quantidade = 0
+    descartadas = 0
+    arquivos = {nome: open(os.path.join(diretorio, nome), "wb") for nome, _ in DTYPES_COLUNAS}
+    try:
+        for vaso_ids, ts, umidades, luminosidades in ler(caminho, tamanho_bloco):
+            validas = np.isfinite(ts) & np.isfinite(umidades) & np.isfinite(luminosidades)
+            descartadas += len(validas) - int(validas.sum())
+            vaso_ids, ts, umidades, luminosidades = (coluna[validas] for coluna in (vaso_ids, ts, umidades, luminosidades))
+            # Um dicionário sai bem mais barato que np.unique (ordenar textos)
+            np.array([indices.setdefault(vaso_id, len(indices)) for vaso_id in vaso_ids.tolist()], dtype=np.int32).tofile(arquivos["vaso"])
+            ts.tofile(arquivos["ts"])
+            umidades.tofile(arquivos["umidade"])
+            luminosidades.tofile(arquivos["luminosidade"])
+            quantidade += len(ts)
+    finally:
+        for arquivo in arquivos.values():
+            arquivo.close()
+    return quantidade, list(indices), descartadas
+
+
+def abrir_colunas(diretorio, quantidade):
+    return tuple(np.memmap(os.path.join(diretorio, nome), dtype=dtype, mode="r", shape=(quantidade,))
+                 for nome, dtype in DTYPES_COLUNAS)
+
+
+class BlocoOrdenado:
+    # Leituras de um bloco agrupadas por vaso (ordenação estável: cada vaso
+    # mantém a ordem de chegada). Montado uma vez e avaliado por todas as
+    # combinações do processo.
+    __slots__ = ("ts", "umidades", "luminosidades", "inicios", "fins", "vasos")
+
+    def __init__(self, vasos, ts, umidades, luminosidades):
+        ordem = np.argsort(vasos, kind="stable")
+        vasos = vasos[ordem]
+        self.ts = np.ascontiguousarray(ts[ordem])
+        self.umidades = np.ascontiguousarray(umidades[ordem])
+        self.luminosidades = np.ascontiguousarray(luminosidades[ordem])
+        novo = np.ones(len(vasos), dtype=bool)
+        novo[1:] = vasos[1:] != vasos[:-1]
+        self.inicios = np.flatnonzero(novo)
+        self.fins = np.append(self.inicios[1:], len(vasos))
+        self.vasos = vasos[self.inicios].astype(np.intp)
+
+
+# --- SIMULAÇÃO DE UM PERFIL ---
+
+class SimulacaoPerfil:
+    def __init__(self, perfil, num_vasos):
+        self.perfil = perfil
+        self.tabela = TabelaLimites([perfil])
+        # Estado carregado de um bloco para o outro, por vaso
+        self.indice_umidade = np.full(num_vasos, 2, dtype=np.int8)   # código 0, como um vaso novo
+        self.indice_luz = np.full(num_vasos, 2, dtype=np.int8)
+        self.visto = np.zeros(num_vasos, dtype=bool)
+        self.candidato = np.full(num_vasos, SEM_ESTADO, dtype=np.int16)
+        self.candidato_desde = np.zeros(num_vasos)
+        self.confirmado = np.full(num_vasos, SEM_ESTADO, dtype=np.int16)
+        self.notificado = np.full(num_vasos, SEM_ESTADO, dtype=np.int16)
+        self.ultimos_alertas = np.full((num_vasos, NUM_CODIGOS * NUM_CODIGOS), np.nan)
+        self.primeiro_ts = np.full(num_vasos, np.nan)
+        self.ultimo_ts = np.full(num_vasos, np.nan)
+        self.contagens = dict.fromkeys(("leituras", "alertas", "mensagens_tudo_certo", "trocas_umidade", "trocas_luz", "mudancas_lcd"), 0)
+
+    def avaliar(self, bloco):
+        vasos = bloco.vasos
+        inicios = bloco.inicios
+        quantidade = len(bloco.ts)
+        funcoes_umidade, funcoes_luz = funcoes_histerese(self.tabela, 0, bloco.umidades, bloco.luminosidades)
+        indices_umidade = encadear_histerese(funcoes_umidade, inicios, self.indice_umidade[vasos])
+        indices_luz = encadear_histerese(funcoes_luz, inicios, self.indice_luz[vasos])
+        estados = indices_umidade.astype(np.int16) * NUM_CODIGOS + indices_luz
+
+        # Trocas de código e de instrução do LCD (uma instrução por par de códigos).
+        # Na primeira leitura de um vaso o LCD sai de "Aguardando dados...".
+        ja_visto = self.visto[vasos]
+        continua = np.ones(quantidade, dtype=bool)
+        continua[inicios] = ja_visto
+        for indices, anteriores_bloco, chave in ((indices_umidade, self.indice_umidade, "trocas_umidade"),
+                                                 (indices_luz, self.indice_luz, "trocas_luz")):
+            anteriores = np.empty_like(indices)
+            anteriores[1:] = indices[:-1]
+            anteriores[inicios] = anteriores_bloco[vasos]
+            self.contagens[chave] += int(((indices != anteriores) & continua).sum())
+        estados_anteriores = np.empty_like(estados)
+        estados_anteriores[1:] = estados[:-1]
+        estados_anteriores[inicios] = self.indice_umidade[vasos].astype(np.int16) * NUM_CODIGOS + self.indice_luz[vasos]
+        self.contagens["mudancas_lcd"] += int(((estados != estados_anteriores) & continua).sum()) + int((~ja_visto).sum())
+
+        self._alertas(bloco, estados, ja_visto)
+
+        fins = bloco.fins - 1
+        self.indice_umidade[vasos] = indices_umidade[fins]
+        self.indice_luz[vasos] = indices_luz[fins]
+        self.primeiro_ts[vasos[~ja_visto]] = bloco.ts[inicios[~ja_visto]]
+        self.ultimo_ts[vasos] = bloco.ts[fins]
+        self.visto[vasos] = True
+        self.contagens["leituras"] += quantidade
+
+    def _alertas(self, bloco, estados, ja_visto):
+        # Equivale a chamar EstadoAlertas.avancar leitura a leitura
+        ts = bloco.ts
+        vasos = bloco.vasos
+        inicios = bloco.inicios
+        quantidade = len(ts)
+        permanencia_min = self.perfil.permanencia_min
+        intervalo_alertas = self.perfil.intervalo_alertas
+
+        # Trechos com o mesmo candidato; o primeiro trecho de cada vaso herda o
+        # candidato_desde do bloco anterior se o estado não mudou
+        novo = np.ones(quantidade, dtype=bool)
+        novo[1:] = estados[1:] != estados[:-1]
+        novo[inicios] = True
+        trechos = np.flatnonzero(novo)
+        vaso_do_trecho = np.repeat(np.arange(len(vasos)), np.diff(np.searchsorted(trechos, np.append(inicios, quantidade))))
+        desde = ts[trechos]
+        primeiros = np.searchsorted(trechos, inicios)
+        herdados = self.candidato[vasos] == estados[inicios]
+        desde[primeiros[herdados]] = self.candidato_desde[vasos[herdados]]
+
+        # Primeira leitura de cada trecho que cumpre a permanência mínima; a
+        # primeira leitura de um vaso novo confirma na hora
+        tamanhos = np.diff(np.append(trechos, quantidade))
+        cumpre = ts - np.repeat(desde, tamanhos) >= permanencia_min
+        confirmacao = np.minimum.reduceat(np.where(cumpre, np.arange(quantidade), quantidade), trechos)
+        confirmacao[primeiros[~ja_visto]] = inicios[~ja_visto]
+        confirmados = confirmacao < quantidade
+
+        ultimos = np.append(primeiros[1:] - 1, len(trechos) - 1)
+        self.candidato[vasos] = estados[trechos[ultimos]]
+        self.candidato_desde[vasos] = desde[ultimos]
+
+        # Eventos (leitura, estado confirmado, vaso no bloco). Um estado
+        # confirmado ainda não notificado (barrado pelo intervalo entre alertas)
+        # continua valendo a partir do início do bloco.
+        pendentes = np.flatnonzero((self.confirmado[vasos] != SEM_ESTADO) & (self.confirmado[vasos] != self.notificado[vasos]))
+        leituras = np.concatenate((inicios[pendentes], confirmacao[confirmados]))
+        ordem = np.argsort(leituras, kind="stable")
+        leituras = leituras[ordem]
+        estados_evento = np.concatenate((self.confirmado[vasos[pendentes]], estados[trechos[confirmados]]))[ordem]
+        vasos_evento = np.concatenate((pendentes, vaso_do_trecho[confirmados]))[ordem]
+        # Cada estado vale até o próximo evento do mesmo vaso ou o fim do vaso no bloco
+        limites = bloco.fins[vasos_evento]
+        if len(leituras) > 1:
+            mesmo_vaso = vasos_evento[1:] == vasos_evento[:-1]
+            limites[:-1][mesmo_vaso] = leituras[1:][mesmo_vaso]
+
+        confirmado = self.confirmado
+        notificado = self.notificado
+        ultimos_alertas = self.ultimos_alertas
+        alertas = tudo_certo = 0
+        for leitura, estado, fim, vaso in zip(leituras.tolist(), estados_evento.tolist(), limites.tolist(), vasos[vasos_evento].tolist()):
+            confirmado[vaso] = estado
+            # fim == leitura: outro estado foi confirmado já nesta leitura
+            if estado == notificado[vaso] or fim == leitura:
+                continue
+            ultimo_envio = ultimos_alertas[vaso, estado]
+            if estado != ESTADO_IDEAL and not math.isnan(ultimo_envio) and ts[leitura] - ultimo_envio < intervalo_alertas:
+                liberado = np.flatnonzero(ts[leitura:fim] - ultimo_envio >= intervalo_alertas)
+                if not len(liberado):
+                    continue
+                leitura += int(liberado[0])
+            notificado[vaso] = estado
+            ultimos_alertas[vaso, estado] = ts[leitura]
+            if estado == ESTADO_IDEAL:
+                tudo_certo += 1
+            else:
+                alertas += 1
+        self.contagens["alertas"] += alertas
+        self.contagens["mensagens_tudo_certo"] += tudo_certo
+
+    def resultado(self):
+        resultado = dict(self.contagens)
+        resultado["vasos"] = int(self.visto.sum())
+        dias = float(np.nansum(self.ultimo_ts - self.primeiro_ts)) / 86400
+        resultado["alertas_por_vaso_dia"] = round(resultado["alertas"] / dias, 3) if dias > 0 else None
+        return resultado
+
+
+# --- VARREDURA DE COMBINAÇÕES ---
+
+def interpretar_variacao(texto):
+    # "campo=v1,v2,..." ou "campo=inicio:fim:passo" (fim incluído)
+    campo, separador, valores = texto.partition("=")
+    campo = campo.strip()
+    if not separador or campo not in CAMPOS_VARIAVEIS:
+        raise ValueError(f"use campo=valores com um destes campos: {', '.join(CAMPOS_VARIAVEIS)}")
+    if ":" in valores:
+        inicio, fim, passo = (float(parte) for parte in valores.split(":"))
+        if passo <= 0:
+            raise ValueError(f"{campo}: o passo deve ser positivo")
+        quantidade = int(math.floor((fim - inicio) / passo + 1e-9)) + 1
+        return campo, [round(inicio + passo * i, 10) for i in range(quantidade)]
+    return campo, [float(valor) for valor in valores.split(",") if valor.strip()]
+
+
+def montar_combinacoes(planta, campos_base, variacoes):
+    # Devolve [(parâmetros variados, perfil compilado)] e as combinações
+    # inválidas (faixas fora de ordem etc.) com o motivo
+    nomes = [campo for campo, _ in variacoes]
+    validas = []
+    invalidas = []
+    for valores in itertools.product(*(valores for _, valores in variacoes)):
+        parametros = dict(zip(nomes, valores))
+        try:
+            validas.append((parametros, compilar_perfil(planta, {**campos_base, **parametros})))
+        except ValueError as e:
+            invalidas.append((parametros, str(e)))
+    return validas, invalidas
+
+
+def simular_grupo(diretorio, quantidade, num_vasos, perfis, tamanho_bloco):
+    colunas = abrir_colunas(diretorio, quantidade)
+    simulacoes = [SimulacaoPerfil(perfil, num_vasos) for perfil in perfis]
+    for inicio in range(0, quantidade, tamanho_bloco):
+        bloco = BlocoOrdenado(*(coluna[inicio:inicio + tamanho_bloco] for coluna in colunas))
+        for simulacao in simulacoes:
+            simulacao.avaliar(bloco)
+    return [simulacao.resultado() for simulacao in simulacoes]
+
+
+def simular(diretorio, quantidade, num_vasos, perfis, tamanho_bloco=TAMANHO_BLOCO, processos=1):
+    if processos <= 1 or len(perfis) == 1:
+        return simular_grupo(diretorio, quantidade, num_vasos, perfis, tamanho_bloco)
+    # Grupos menores que perfis/processos equilibram a carga quando as
+    # combinações têm custos diferentes (muitas confirmações, por exemplo)
+    tamanho_grupo = max(1, math.ceil(len(perfis) / (processos * 4)))
+    grupos = [perfis[i:i + tamanho_grupo] for i in range(0, len(perfis), tamanho_grupo)]
+    contexto = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as pool:
+        tarefas = [pool.submit(simular_grupo, diretorio, quantidade, num_vasos, grupo, tamanho_bloco) for grupo in grupos]
+        return [resultado for tarefa in tarefas for resultado in tarefa.result()]
+
+
+# --- LINHA DE COMANDO ---
+
+def _formatar(valor):
+    if valor is None:
+        return "-"
+    if isinstance(valor, float):
+        return f"{valor:g}"
+    return str(valor)
+
+
+def imprimir_tabela(linhas, colunas, limite):
+    larguras = {coluna: max(len(coluna), *(len(_formatar(linha.get(coluna))) for linha in linhas)) for coluna in colunas}
+    print("  ".join(coluna.rjust(larguras[coluna]) for coluna in colunas))
+    for linha in linhas[:limite]:
+        print("  ".join(_formatar(linha.get(coluna)).rjust(larguras[coluna]) for coluna in colunas))
+    if len(linhas) > limite:
+        print(f"... mais {len(linhas) - limite} combinações (use --saida para ver todas)")
+
+
+def gravar_resultados(caminho, linhas, colunas):
+    if caminho.lower().endswith(".csv"):
+        with open(caminho, "w", encoding="utf-8", newline="") as f:
+            escritor = csv.DictWriter(f, fieldnames=colunas)
+            escritor.writeheader()
+            escritor.writerows(linhas)
+    else:
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(linhas, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula limites de plantas sobre um log de leituras gravado")
+    parser.add_argument("arquivo", help="CSV ou Parquet com vaso_id, ts, umidade e luminosidade")
+    parser.add_argument("--planta", required=True, help="perfil do catálogo usado como base")
+    parser.add_argument("--catalogo", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "plantas.json"))
+    parser.add_argument("--variar", action="append", default=[], metavar="CAMPO=VALORES",
+                        help="valores de um campo do perfil: v1,v2,... ou inicio:fim:passo (pode repetir)")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--bloco", type=int, default=TAMANHO_BLOCO, help="leituras por bloco")
+    parser.add_argument("--ordenar", default="alertas", choices=CAMPOS_RESULTADO)
+    parser.add_argument("--mostrar", type=int, default=20, help="combinações exibidas")
+    parser.add_argument("--saida", help="grava todos os resultados (.csv ou .json)")
+    parser.add_argument("--dir-trabalho", help="onde gravar as colunas convertidas (padrão: diretório temporário)")
+    args = parser.parse_args()
+
+    with open(args.catalogo, encoding="utf-8") as f:
+        plantas = json.load(f)["plantas"]
+    if args.planta not in plantas:
+        raise SystemExit(f"Planta '{args.planta}' não está em {args.catalogo}. Disponíveis: {', '.join(plantas)}")
+    try:
+        variacoes = [interpretar_variacao(texto) for texto in args.variar]
+    except ValueError as e:
+        raise SystemExit(f"--variar: {e}")
+    combinacoes, invalidas = montar_combinacoes(args.planta, plantas[args.planta], variacoes)
+    for parametros, motivo in invalidas:
+        print(f"Combinação ignorada {parametros}: {motivo}", file=sys.stderr)
+    if not combinacoes:
+        raise SystemExit("Nenhuma combinação válida para simular.")
+
+    with tempfile.TemporaryDirectory(prefix="simulador-", dir=args.dir_trabalho) as diretorio:
+        inicio = time.perf_counter()
+        try:
+            quantidade, vaso_ids, descartadas = converter_leituras(args.arquivo, diretorio, args.bloco)
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"Não foi possível ler {args.arquivo}: {e}")
+        conversao = time.perf_counter() - inicio
+        if not quantidade:
+            raise SystemExit("O arquivo não tem leituras válidas.")
+        print(f"{quantidade} leituras de {len(vaso_ids)} vasos convertidas em {conversao:.1f}s"
+              + (f" ({descartadas} descartadas por valores inválidos)" if descartadas else "") + ".", file=sys.stderr)
+
+        inicio = time.perf_counter()
+        perfis = [perfil for _, perfil in combinacoes]
+        resultados = simular(diretorio, quantidade, len(vaso_ids), perfis, args.bloco, args.processos)
+        duracao = time.perf_counter() - inicio
+    print(f"{len(perfis)} combinações simuladas em {duracao:.1f}s "
+          f"({quantidade * len(perfis) / duracao / 1e6:.1f} milhões de leituras avaliadas por segundo).", file=sys.stderr)
+
+    campos_variados = [campo for campo, _ in variacoes]
+    linhas = [{**parametros, **resultado} for (parametros, _), resultado in zip(combinacoes, resultados)]
+    linhas.sort(key=lambda linha: (linha[args.ordenar] is None, linha[args.ordenar]))
+    colunas = campos_variados + list(CAMPOS_RESULTADO)
+    imprimir_tabela(linhas, colunas, args.mostrar)
+    if args.saida:
+        gravar_resultados(args.saida, linhas, colunas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from tendencias import CAMPOS_RESUMO
+
+# --- TABELA DE VASOS EM MEMÓRIA COMPARTILHADA (MODO MULTIPROCESSO) ---
+# Estado quente da frota (leituras, instrução do LCD, planta, chat) em um bloco
+# de multiprocessing.shared_memory visto por todos os processos HTTP como um
+# array estruturado do numpy, um registro de tamanho fixo por vaso.
+#
+# Endereçamento aberto: o vaso ocupa o primeiro registro livre a partir de
+# zlib.crc32(vaso_id) % capacidade (hash estável entre processos, ao contrário
+# de hash()). Registros nunca são removidos nem mudam de lugar, então cada
+# processo guarda vaso_id -> registro em um dicionário local depois da primeira
+# busca. Só a criação de registros passa pelo lock de alocação; o resto usa
+# lock striping por registro, com locks de multiprocessing.
+#
+# Textos ficam em UTF-8 de tamanho fixo; a instrução do LCD é guardada como o
+# índice em INSTRUCOES_LCD ([codigo_umidade + 2] * 5 + [codigo_luz + 2]). A
+# análise (tendencias.py) fica na ordem de CAMPOS_RESUMO, com NaN para None.
+
+CAPACIDADE_PADRAO = 50000
+NUM_LOCKS = 64
+OCUPACAO_MAXIMA = 0.9  # acima disso a sondagem linear fica longa demais
+
+TAMANHO_ID = 256           # 64 caracteres de vaso_id em UTF-8
+TAMANHO_PLANTA = 64
+TAMANHO_NOTIFICACAO = 512
+SEM_INSTRUCAO = 255        # "Aguardando dados...": vaso ainda sem decisão
+TAMANHO_CABECALHO = 64     # contador de registros ocupados (int64) + reserva
+
+DTYPE_REGISTRO = np.dtype([
+    ("ocupado", "u1"),
+    ("tem_chat", "u1"),
+    ("codigo_umidade", "i1"),
+    ("codigo_luz", "i1"),
+    ("instrucao", "u1"),
+    ("versao", "<u8"),
+    ("versao_instrucao", "<u8"),
+    ("versao_planta", "<u8"),  # muda a cada /set_plant; invalida o perfil guardado por processo
+    ("chat_id", "<i8"),
+    ("umidade", "<f8"),
+    ("luminosidade", "<f8"),
+    ("ts", "<f8"),
+    ("analise", "<f8", (len(CAMPOS_RESUMO),)),
+    ("vaso_id", f"S{TAMANHO_ID}"),
+    ("planta", f"S{TAMANHO_PLANTA}"),
+    ("ultima_notificacao", f"S{TAMANHO_NOTIFICACAO}"),
+], align=True)
+
+
+def texto_fixo(texto, tamanho):
+    # Corta no limite de bytes sem deixar um caractere UTF-8 pela metade
+    return texto.encode("utf-8")[:tamanho].decode("utf-8", "ignore").encode("utf-8")
+
+
+class TabelaVasos:
+    def __init__(self, memoria, capacidade, locks, lock_alocacao):
+        self.memoria = memoria
+        self.capacidade = capacidade
+        self._locks = locks
+        self._lock_alocacao = lock_alocacao
+        self._slots = {}  # vaso_id -> registro, local a cada processo
+        self._ocupados = np.ndarray((1,), dtype="<i8", buffer=memoria.buf)
+        self.registros = np.ndarray((capacidade,), dtype=DTYPE_REGISTRO, buffer=memoria.buf, offset=TAMANHO_CABECALHO)
+        # Uma visão por campo: tabela.umidade[slot] evita montar o registro inteiro
+        for campo in DTYPE_REGISTRO.names:
+            setattr(self, campo, self.registros[campo])
+
+    @classmethod
+    def criar(cls, contexto, capacidade=CAPACIDADE_PADRAO, num_locks=NUM_LOCKS):
+        # Deve ser chamada no processo principal, antes de criar os processos
+        # filhos (que herdam o bloco e os locks)
+        tamanho = TAMANHO_CABECALHO + DTYPE_REGISTRO.itemsize * capacidade
+        memoria = shared_memory.SharedMemory(create=True, size=tamanho)
+        locks = tuple(contexto.Lock() for _ in range(num_locks))
+        return cls(memoria, capacidade, locks, contexto.Lock())
+
+    def __len__(self):
+        return int(self._ocupados[0])
+
+    def lock_do_slot(self, slot):
+        return self._locks[slot % len(self._locks)]
+
+    def localizar(self, vaso_id, criar=False):
+        # Devolve o registro do vaso, ou None se ele não existe (criar=False) ou
+        # se a tabela está cheia
+        slot = self._slots.get(vaso_id)
+        if slot is not None:
+            return slot
+        chave = vaso_id.encode("utf-8")
+        if len(chave) > TAMANHO_ID:
+            return None
+        inicio = zlib.crc32(chave) % self.capacidade
+        slot = self._sondar(chave, inicio)
+        if slot is None or not self.ocupado[slot]:
+            if not criar:
+                return None
+            with self._lock_alocacao:
+                # Outro processo pode ter criado o vaso (ou ocupado o registro) antes do lock
+                slot = self._sondar(chave, inicio)
+                if slot is None:
+                    return None
+                if not self.ocupado[slot]:
+                    if self._ocupados[0] >= self.capacidade * OCUPACAO_MAXIMA:
+                        return None
+                    self._inicializar(slot, chave)
+                    self._ocupados[0] += 1
+        self._slots[vaso_id] = slot
+        return slot
+
+    def _sondar(self, chave, inicio):
+        # Primeiro registro com este vaso_id ou o primeiro livre no caminho
+        for passo in range(self.capacidade):
+            slot = (inicio + passo) % self.capacidade
+            if not self.ocupado[slot] or self.vaso_id[slot] == chave:
+                return slot
+        return None
+
+    def _inicializar(self, slot, chave):
+        self.vaso_id[slot] = chave
+        self.planta[slot] = b"Nenhuma"
+        self.instrucao[slot] = SEM_INSTRUCAO
+        self.analise[slot] = np.nan
+        # Por último: quem sonda sem o lock só vê o registro já preenchido
+        self.ocupado[slot] = 1
+
+    def ids(self):
+        return [vaso_id.decode("utf-8") for vaso_id in self.vaso_id[self.ocupado == 1]]
+
+    def fechar(self, remover=False):
+        # As visões do numpy precisam sair antes: o bloco não fecha com buffers exportados
+        for campo in DTYPE_REGISTRO.names:
+            delattr(self, campo)
+        self.registros = None
+        self._ocupados = None
+        self.memoria.close()
+        if remover:
+            self.memoria.unlink()
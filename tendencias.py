@@ -0,0 +1,285 @@
+import math
+
+import numpy as np
+
+# --- TENDÊNCIAS POR VASO (ESTATÍSTICAS INCREMENTAIS) ---
+# Cada leitura atualiza, em tempo constante, somas ponderadas com peso
+# exp(-idade / tau) de cada amostra:
+#   - média e desvio exponenciais (EWMA) de umidade e luminosidade, com TAU_MEDIA;
+#   - regressão linear ponderada da umidade no tempo, com TAU_TENDENCIA: a
+#     inclinação é a velocidade de secagem e o nível ajustado é o ponto de
+#     partida da previsão de quando a umidade chega ao mínimo da planta;
+#   - mínimo e máximo da última hora, em NUM_BALDES baldes de SEGUNDOS_BALDE.
+# O tempo da regressão é contado a partir da leitura mais recente, então as
+# somas nunca crescem com o epoch e não perdem precisão.
+#
+# Como tudo é soma ponderada, o mesmo estado pode ser calculado de uma vez a
+# partir do histórico: recalcular_frota() faz isso para a frota inteira em
+# operações vetorizadas (backfill depois de restaurar o banco).
+
+TAU_MEDIA = 600.0              # segundos (~10 min de memória para média e desvio)
+TAU_TENDENCIA = 3 * 3600.0     # segundos (~3 h de memória para a velocidade de secagem)
+SEGUNDOS_BALDE = 300           # múltiplo do minuto dos agregados do histórico
+SEGUNDOS_MINUTO = 60
+NUM_BALDES = 12                # mínimo/máximo da última hora
+MIN_AMOSTRAS_PREVISAO = 10
+MIN_ESPALHAMENTO = 600.0       # s: a regressão precisa cobrir ~10 min de leituras
+QUEDA_MINIMA = 0.05 / 3600     # %/s: queda mais lenta que isso é umidade estável
+PREVISAO_MAXIMA = 14 * 86400   # previsões além disso não são informadas
+VASOS_POR_BLOCO = 1024         # recalcular_frota: ~23 MB de matrizes por bloco com 6 h de minutos
+
+# Ordem dos valores de TendenciasVaso.valores(); None vira NaN fora do dict
+CAMPOS_RESUMO = (
+    "amostras",
+    "umidade_media", "umidade_desvio", "umidade_min_1h", "umidade_max_1h",
+    "luminosidade_media", "luminosidade_desvio", "luminosidade_min_1h", "luminosidade_max_1h",
+    "umidade_tendencia_por_hora", "previsao_umidade_min",
+)
+
+
+def _desvio(soma, soma2, peso):
+    media = soma / peso
+    return math.sqrt(max(0.0, soma2 / peso - media * media))
+
+
+def _arredondar(valor):
+    return None if valor is None or math.isinf(valor) else round(float(valor), 2)
+
+
+class TendenciasVaso:
+    __slots__ = (
+        "ts", "amostras",
+        # média e desvio (TAU_MEDIA)
+        "peso_media", "soma_umidade", "soma_umidade2", "soma_luminosidade", "soma_luminosidade2",
+        # regressão da umidade (TAU_TENDENCIA), tempo relativo à leitura mais recente
+        "peso_tendencia", "soma_t", "soma_tt", "soma_x", "soma_tx",
+        # mínimo/máximo por balde; "baldes" guarda o número (ts // SEGUNDOS_BALDE) de cada posição
+        "baldes", "min_umidade", "max_umidade", "min_luminosidade", "max_luminosidade",
+    )
+
+    def __init__(self):
+        self.ts = None
+        self.amostras = 0
+        self.peso_media = self.soma_umidade = self.soma_umidade2 = 0.0
+        self.soma_luminosidade = self.soma_luminosidade2 = 0.0
+        self.peso_tendencia = self.soma_t = self.soma_tt = self.soma_x = self.soma_tx = 0.0
+        self.baldes = [-1] * NUM_BALDES
+        self.min_umidade = [math.inf] * NUM_BALDES
+        self.max_umidade = [-math.inf] * NUM_BALDES
+        self.min_luminosidade = [math.inf] * NUM_BALDES
+        self.max_luminosidade = [-math.inf] * NUM_BALDES
+
+    def adicionar(self, ts, umidade, luminosidade):
+        # Valida antes de mexer no estado: um NaN/inf contaminaria as somas para sempre
+        ts, umidade, luminosidade = float(ts), float(umidade), float(luminosidade)
+        if not (math.isfinite(ts) and math.isfinite(umidade) and math.isfinite(luminosidade)):
+            raise ValueError(f"Leitura não finita: ts={ts}, umidade={umidade}, luminosidade={luminosidade}")
+        # Leituras atrasadas (ts anterior à última) ficam só no histórico: as
+        # somas andam apenas para frente
+        if self.ts is not None:
+            dt = ts - self.ts
+            if dt < 0:
+                return False
+            if dt > 0:
+                fator = math.exp(-dt / TAU_MEDIA)
+                self.peso_media *= fator
+                self.soma_umidade *= fator
+                self.soma_umidade2 *= fator
+                self.soma_luminosidade *= fator
+                self.soma_luminosidade2 *= fator
+                # Origem do tempo passa para a leitura nova: t -> t - dt
+                self.soma_tx -= dt * self.soma_x
+                self.soma_tt += dt * (dt * self.peso_tendencia - 2 * self.soma_t)
+                self.soma_t -= dt * self.peso_tendencia
+                fator = math.exp(-dt / TAU_TENDENCIA)
+                self.peso_tendencia *= fator
+                self.soma_t *= fator
+                self.soma_tt *= fator
+                self.soma_x *= fator
+                self.soma_tx *= fator
+        self.ts = ts
+        self.amostras += 1
+        self.peso_media += 1.0
+        self.soma_umidade += umidade
+        self.soma_umidade2 += umidade * umidade
+        self.soma_luminosidade += luminosidade
+        self.soma_luminosidade2 += luminosidade * luminosidade
+        # A amostra nova está em t = 0: soma_t, soma_tt e soma_tx não mudam
+        self.peso_tendencia += 1.0
+        self.soma_x += umidade
+
+        balde = int(ts // SEGUNDOS_BALDE)
+        posicao = balde % NUM_BALDES
+        if self.baldes[posicao] != balde:
+            self.baldes[posicao] = balde
+            self.min_umidade[posicao] = self.max_umidade[posicao] = umidade
+            self.min_luminosidade[posicao] = self.max_luminosidade[posicao] = luminosidade
+        else:
+            if umidade < self.min_umidade[posicao]:
+                self.min_umidade[posicao] = umidade
+            elif umidade > self.max_umidade[posicao]:
+                self.max_umidade[posicao] = umidade
+            if luminosidade < self.min_luminosidade[posicao]:
+                self.min_luminosidade[posicao] = luminosidade
+            elif luminosidade > self.max_luminosidade[posicao]:
+                self.max_luminosidade[posicao] = luminosidade
+        return True
+
+    def regressao(self):
+        # (inclinação em %/s, umidade ajustada na última leitura), ou None se as
+        # leituras ainda não cobrem tempo suficiente para uma tendência
+        if self.amostras < MIN_AMOSTRAS_PREVISAO:
+            return None
+        peso = self.peso_tendencia
+        determinante = peso * self.soma_tt - self.soma_t * self.soma_t
+        # determinante / peso² é a variância ponderada do tempo das leituras
+        if determinante <= (MIN_ESPALHAMENTO * peso) ** 2:
+            return None
+        inclinacao = (peso * self.soma_tx - self.soma_t * self.soma_x) / determinante
+        nivel = (self.soma_x - inclinacao * self.soma_t) / peso
+        return inclinacao, nivel
+
+    def previsao_umidade_min(self, umidade_min, regressao=None):
+        # Epoch em que a umidade ajustada chega a umidade_min mantida a
+        # velocidade atual; None se estável, subindo ou longe demais
+        if regressao is None:
+            regressao = self.regressao()
+        if regressao is None:
+            return None
+        inclinacao, nivel = regressao
+        if nivel <= umidade_min:
+            return round(self.ts)
+        if inclinacao > -QUEDA_MINIMA:
+            return None
+        segundos = (nivel - umidade_min) / -inclinacao
+        return round(self.ts + segundos) if segundos <= PREVISAO_MAXIMA else None
+
+    def _extremos(self):
+        # (mín. umidade, máx. umidade, mín. luminosidade, máx. luminosidade) dos baldes da última hora
+        atual = int(self.ts // SEGUNDOS_BALDE)
+        validos = [posicao for posicao, balde in enumerate(self.baldes) if balde > atual - NUM_BALDES]
+        if not validos:
+            return None, None, None, None
+        return (min(self.min_umidade[posicao] for posicao in validos), max(self.max_umidade[posicao] for posicao in validos),
+                min(self.min_luminosidade[posicao] for posicao in validos), max(self.max_luminosidade[posicao] for posicao in validos))
+
+    def valores(self, umidade_min):
+        # Tupla na ordem de CAMPOS_RESUMO (usada também pela tabela do modo multiprocesso)
+        if self.ts is None:
+            return None
+        min_umidade, max_umidade, min_luminosidade, max_luminosidade = self._extremos()
+        regressao = self.regressao()
+        return (
+            self.amostras,
+            _arredondar(self.soma_umidade / self.peso_media),
+            _arredondar(_desvio(self.soma_umidade, self.soma_umidade2, self.peso_media)),
+            _arredondar(min_umidade), _arredondar(max_umidade),
+            _arredondar(self.soma_luminosidade / self.peso_media),
+            _arredondar(_desvio(self.soma_luminosidade, self.soma_luminosidade2, self.peso_media)),
+            _arredondar(min_luminosidade), _arredondar(max_luminosidade),
+            None if regressao is None else _arredondar(regressao[0] * 3600),
+            self.previsao_umidade_min(umidade_min, regressao),
+        )
+
+    def resumo(self, umidade_min):
+        valores = self.valores(umidade_min)
+        return None if valores is None else dict(zip(CAMPOS_RESUMO, valores))
+
+
+# --- RECÁLCULO VETORIZADO (BACKFILL) ---
+# Monta o estado de vários vasos de uma vez a partir dos agregados por minuto
+# do histórico (6 horas): cada minuto entra como suas N leituras com a média do
+# minuto, no meio do intervalo. O desvio sai só da variação entre minutos, um
+# pouco menor que o das leituras brutas; ele converge para o valor incremental
+# depois de alguns TAU_MEDIA de leituras novas. A frota é processada em blocos
+# de VASOS_POR_BLOCO vasos, para a memória das matrizes não crescer com ela.
+
+def recalcular_frota(historicos):
+    # historicos: lista de HistoricoVaso (ou None). Devolve uma TendenciasVaso
+    # (ou None, sem leituras) por posição.
+    agregados = [None if historico is None or not len(historico.bruto) else historico.niveis["minuto"].ordenados()
+                 for historico in historicos]
+    com_dados = [indice for indice, dados in enumerate(agregados) if dados is not None and len(dados)]
+    resultado = [None] * len(historicos)
+    for inicio in range(0, len(com_dados), VASOS_POR_BLOCO):
+        bloco = com_dados[inicio:inicio + VASOS_POR_BLOCO]
+        for indice, tendencias in zip(bloco, _recalcular_bloco([agregados[indice] for indice in bloco],
+                                                               [historicos[indice] for indice in bloco])):
+            resultado[indice] = tendencias
+    return resultado
+
+
+def _recalcular_bloco(agregados, historicos):
+    # Agregados por minuto (não vazios) e históricos de cada vaso do bloco;
+    # devolve uma TendenciasVaso por vaso, na mesma ordem
+    vasos = len(agregados)
+
+    # Matriz vasos x minutos, alinhada à direita (o minuto mais recente na última coluna)
+    colunas = max(len(dados) for dados in agregados)
+    campos = ("ts", "leituras", "umidade_media", "umidade_min", "umidade_max",
+              "luminosidade_media", "luminosidade_min", "luminosidade_max")
+    matriz = {campo: np.zeros((vasos, colunas)) for campo in campos}
+    ts_final = np.empty(vasos)
+    for linha, dados in enumerate(agregados):
+        for campo in campos:
+            matriz[campo][linha, colunas - len(dados):] = dados[campo]
+        bruto = historicos[linha].bruto
+        ts_final[linha] = bruto.dados["ts"][bruto.posicao - 1]
+
+    leituras = matriz["leituras"]
+    presente = leituras > 0
+    # Meio de cada minuto, sem passar da leitura mais recente (o minuto aberto)
+    ts = np.where(presente, np.minimum(matriz["ts"] + SEGUNDOS_MINUTO / 2, ts_final[:, None]), 0.0)
+    dt = np.where(presente, ts_final[:, None] - ts, 0.0)
+    umidade = matriz["umidade_media"]
+    luminosidade = matriz["luminosidade_media"]
+
+    peso_media = leituras * np.exp(-dt / TAU_MEDIA)
+    peso_tendencia = leituras * np.exp(-dt / TAU_TENDENCIA)
+    somas = {
+        "peso_media": peso_media.sum(axis=1),
+        "soma_umidade": (peso_media * umidade).sum(axis=1),
+        "soma_umidade2": (peso_media * umidade * umidade).sum(axis=1),
+        "soma_luminosidade": (peso_media * luminosidade).sum(axis=1),
+        "soma_luminosidade2": (peso_media * luminosidade * luminosidade).sum(axis=1),
+        "peso_tendencia": peso_tendencia.sum(axis=1),
+        "soma_t": (peso_tendencia * -dt).sum(axis=1),
+        "soma_tt": (peso_tendencia * dt * dt).sum(axis=1),
+        "soma_x": (peso_tendencia * umidade).sum(axis=1),
+        "soma_tx": (peso_tendencia * -dt * umidade).sum(axis=1),
+    }
+    amostras = leituras.sum(axis=1).astype(np.int64)
+
+    # Baldes da última hora: posição = número do balde % NUM_BALDES
+    balde = np.floor_divide(matriz["ts"], SEGUNDOS_BALDE).astype(np.int64)
+    balde_final = np.floor_divide(ts_final, SEGUNDOS_BALDE).astype(np.int64)
+    na_janela = presente & (balde > balde_final[:, None] - NUM_BALDES)
+    linhas, minutos = np.nonzero(na_janela)
+    posicoes = balde[linhas, minutos] % NUM_BALDES
+    extremos = {}
+    for nome, campo, inicial, reduzir in (
+        ("min_umidade", "umidade_min", np.inf, np.minimum),
+        ("max_umidade", "umidade_max", -np.inf, np.maximum),
+        ("min_luminosidade", "luminosidade_min", np.inf, np.minimum),
+        ("max_luminosidade", "luminosidade_max", -np.inf, np.maximum),
+    ):
+        valores = np.full((vasos, NUM_BALDES), inicial)
+        reduzir.at(valores, (linhas, posicoes), matriz[campo][linhas, minutos])
+        extremos[nome] = valores
+    # Número do balde de cada posição: o mais recente <= balde_final com aquele resto
+    numeros = balde_final[:, None] - (balde_final[:, None] - np.arange(NUM_BALDES)) % NUM_BALDES
+    numeros = np.where(np.isinf(extremos["min_umidade"]), -1, numeros)
+
+    resultado = []
+    for linha in range(vasos):
+        tendencias = TendenciasVaso()
+        tendencias.ts = float(ts_final[linha])
+        tendencias.amostras = int(amostras[linha])
+        for campo, valores in somas.items():
+            setattr(tendencias, campo, float(valores[linha]))
+        tendencias.baldes = numeros[linha].tolist()
+        for campo, valores in extremos.items():
+            setattr(tendencias, campo, valores[linha].tolist())
+        resultado.append(tendencias)
+    return resultado
+